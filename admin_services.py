@@ -127,3 +127,42 @@ def delete_content_admin(content_id, admin_id, app_logger):
         app_logger.error(f"Failed to delete content_id: {content_id} by admin {admin_id}. Reason: {delete_result.get('message')}")
         # Propagate the error message and code from the utility function
         return delete_result
+
+
+BULK_ACTION_STATUSES = {'approve': 'published', 'reject': 'rejected'}
+
+
+def bulk_moderate_content(action, content_ids, admin_id, app_logger):
+    """
+    Applies one moderation action ('approve', 'reject' or 'delete') to many content items.
+    Returns a dictionary with status, per-item results and code.
+    """
+    if action not in BULK_ACTION_STATUSES and action != 'delete':
+        app_logger.warning(f"Bulk moderation: unsupported action '{action}' by admin {admin_id}.")
+        return {'status': 'error', 'message': f"Unsupported action '{action}'", 'code': 400}
+
+    if not isinstance(content_ids, list) or not content_ids:
+        app_logger.warning(f"Bulk moderation: no content IDs provided by admin {admin_id}.")
+        return {'status': 'error', 'message': 'contentIds must be a non-empty list', 'code': 400}
+
+    if not all(isinstance(content_id, str) and content_id for content_id in content_ids):
+        app_logger.warning(f"Bulk moderation: admin {admin_id} sent content IDs that are not non-empty strings.")
+        return {'status': 'error', 'message': 'contentIds must contain only non-empty strings', 'code': 400}
+
+    if len(content_ids) > firestore_utils.MAX_BULK_CONTENT_IDS:
+        app_logger.warning(f"Bulk moderation: admin {admin_id} sent {len(content_ids)} IDs, "
+                           f"limit is {firestore_utils.MAX_BULK_CONTENT_IDS}.")
+        return {'status': 'error',
+                'message': f'At most {firestore_utils.MAX_BULK_CONTENT_IDS} items can be moderated at once',
+                'code': 400}
+
+    app_logger.info(f"Admin {admin_id} starting bulk '{action}' for {len(content_ids)} items.")
+    if action == 'delete':
+        result = firestore_utils.bulk_delete_content_items(content_ids, app_logger)
+    else:
+        result = firestore_utils.bulk_update_content_status(
+            content_ids, BULK_ACTION_STATUSES[action], admin_id, app_logger
+        )
+
+    result['code'] = 500 if result['status'] == 'error' else 200
+    return result
@@ -1,74 +1,37 @@
 import os
 from flask_cors import CORS
-from datetime import datetime
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from flask import Flask, request, jsonify, current_app, \
-    render_template, session, redirect, url_for, flash  # Added flash
-import firebase_admin
-from firebase_admin import credentials, firestore, storage, auth
-
-import logging
-from logging.handlers import RotatingFileHandler
+    render_template, session, redirect, url_for, flash, abort, send_file  # Added flash
 from google.cloud.firestore import SERVER_TIMESTAMP
 
+import assets
+import compression
+import direct_uploads
 import firestore_utils
+import identity_map
+from firebase_clients import get_db, get_bucket, get_storage_bucket_name
+from logging_utils import configure_logging
+import map_events
+import map_snapshot
+import metrics
+import profiling
 
 load_dotenv()
 
-# Firebase Initialization
-FIREBASE_STORAGE_BUCKET = os.environ.get('FIREBASE_STORAGE_BUCKET', 'your-project.appspot.com')
-
-if not firebase_admin._apps:
-    if os.environ.get('TEST_ENV') == 'true':
-        # Use mock credentials for testing
-        from google.auth import credentials as google_auth_credentials
-
-        cred = google_auth_credentials.AnonymousCredentials()
-        firebase_admin.initialize_app(cred, {
-            'projectId': 'mock-project',  # Required for mock credentials
-            'storageBucket': FIREBASE_STORAGE_BUCKET
-        })
-        print("INFO: Firebase initialized with MOCK credentials for TEST_ENV.")
-    else:
-        # Original initialization for production/development
-        try:
-            cred = credentials.ApplicationDefault()
-            firebase_admin.initialize_app(cred, {
-                'storageBucket': FIREBASE_STORAGE_BUCKET
-            })
-        except Exception as e:
-            print(f"CRITICAL: Failed to initialize Firebase Admin SDK: {e}")
-            # Consider exiting if Firebase is critical
-            # import sys
-        # sys.exit(1)
-
-# Initialize db and bucket after Firebase app initialization
-if os.environ.get('TEST_ENV') == 'true':
-    # In test_env, firebase_admin.initialize_app was called with mock credentials
-    # So, firestore.client() and storage.bucket() will use that mock app.
-    db = firestore.client()
-    bucket = storage.bucket()  # This might also need careful handling if it makes external calls
-    print("INFO: Firestore db and Storage bucket initialized using MOCK Firebase app.")
-else:
-    try:
-        db = firestore.client()
-        bucket = storage.bucket()
-    except Exception as e:
-        print(f"CRITICAL: Failed to create Firestore/Storage clients: {e}")
-        # import sys
-        # sys.exit(1)
-
-# Project-specific imports (after Firebase init)
+# Project-specific imports
 from email_utils import create_email_notification_record, send_pending_notification
 from webhook_handlers import handle_postmark_webhook_request
 from admin_services import (
     verify_admin_id_token, get_dashboard_items,
-    approve_content, reject_content, delete_content_admin
+    approve_content, reject_content, delete_content_admin, bulk_moderate_content
 )
 from api_services import (
     create_new_content_from_api,
     process_content_vote,
     process_content_report,
+    get_content_batch,
     update_content_item as api_update_content_item  # Alias to avoid naming conflict if any
 )
 from view_services import (
@@ -80,47 +43,45 @@ from firestore_utils import \
     delete_content_item  # Only delete_content_item might be needed directly if not part of a service
 # create_user, get_user_by_email, get_user, migrate_content_ownership are now handled by UserService
 from user_service import UserService
-
-app = Flask(__name__, static_folder='static')
-CORS(app)
-app.jinja_env.filters['datetime'] = view_format_datetime_filter
-
-# Logging setup
-app.logger.setLevel(logging.INFO)
-file_handler = RotatingFileHandler('app.log', maxBytes=10000000, backupCount=5)
-file_handler.setFormatter(logging.Formatter(
-    '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-))
-app.logger.addHandler(file_handler)
-app.logger.info('Flask app startup')
+from upload_stream import UploadRejected, parse_photo_form
 
 # App Configuration
+FIREBASE_STORAGE_BUCKET = get_storage_bucket_name()
 INBOUND_URL_TOKEN = os.environ.get('INBOUND_URL_TOKEN', 'DEFAULT_INBOUND_TOKEN_IF_NOT_SET')
 GOOGLE_MAPS_API_KEY = os.environ.get('GOOGLE_MAPS_API_KEY', '')
-app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'default-secret-key-for-development')
 ALLOWED_IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif'}
 MAX_IMAGE_SIZE = 6 * 1024 * 1024  # 6MB
 PHOTO_UPLOAD_LIMIT = int(os.environ.get('PHOTO_UPLOAD_LIMIT', 5))
-app.config['PHOTO_UPLOAD_LIMIT'] = PHOTO_UPLOAD_LIMIT
+
+# View functions are collected here by @route and registered on every app built by create_app(),
+# keeping the endpoint names (url_for('home'), ...) identical to plain @app.route registration.
+_routes = []
 
 
-@app.route('/.well-known/appspecific/com.chrome.devtools.json')
+def route(rule, **options):
+    """Records a view function for registration by create_app()."""
+    def decorator(view_func):
+        _routes.append((rule, view_func, options))
+        return view_func
+    return decorator
+
+
+@route('/.well-known/appspecific/com.chrome.devtools.json')
 def chrome_devtools():
     return jsonify({})
 
 
-@app.before_request
 def before_request_funcs():
     original_host = request.environ.get('HTTP_HOST')
     if original_host and ',' in original_host:
         new_host = original_host.split(',', 1)[0]
         request.environ['HTTP_HOST'] = new_host
-        current_app.logger.info(f"Sanitizing HTTP_HOST: Original '{original_host}', New: '{new_host}'")
+        current_app.logger.info("Sanitizing HTTP_HOST: Original '%s', New: '%s'", original_host, new_host)
 
     if request.method in ['POST', 'PUT', 'PATCH', 'DELETE']:
         if request.content_length is None and request.headers.get('Transfer-Encoding', '').lower() != 'chunked':
             current_app.logger.warning(
-                f"Request to {request.path} from {request.remote_addr} without Content-Length or chunked encoding."
+                "Request to %s from %s without Content-Length or chunked encoding.", request.path, request.remote_addr
             )
             pass
 
@@ -136,43 +97,39 @@ def show_server_urls():
         print(f" * Running on http://{local_ip}:{os.environ.get('PORT', 8080)}")
         print("Press CTRL+C to quit\n")
     except Exception as e:
-        app.logger.error(f"Could not determine local IP: {e}")
-
+        app.logger.error("Could not determine local IP: %s", e)
 
-with app.app_context():
-    pass
 
-
-@app.route('/webhook/postmark', methods=['POST'])
+@route('/webhook/postmark', methods=['POST'])
 def postmark_webhook():
     token_from_query = request.args.get('token')
-    app.logger.info(f"Postmark webhook called. Token from query: {token_from_query}")
+    current_app.logger.info("Postmark webhook called. Token in query: %s", bool(token_from_query))
     try:
         request_json_data = request.get_json(force=True)
         if not request_json_data:
-            app.logger.warning(f"No JSON data received in Postmark webhook from {request.remote_addr}.")
+            current_app.logger.warning("No JSON data received in Postmark webhook from %s.", request.remote_addr)
             return jsonify({'status': 'error', 'message': 'No JSON data received'}), 200
     except Exception as e:
-        app.logger.error(f"Error parsing JSON data in Postmark webhook: {e}", exc_info=True)
+        current_app.logger.error("Error parsing JSON data in Postmark webhook: %s", e, exc_info=True)
         return jsonify({'status': 'error', 'message': f'Error parsing request data: {str(e)}'}), 200
 
     result_dict = handle_postmark_webhook_request(
         request_json_data=request_json_data,
         query_token=token_from_query,
         app_logger=current_app.logger,
-        db_client=db,
-        bucket=bucket,
-        app_context=app.app_context(),
+        db_client=get_db(),
+        bucket=get_bucket(),
+        app_context=current_app._get_current_object().app_context(),
         inbound_url_token_config=INBOUND_URL_TOKEN,
-        allowed_image_extensions_config=ALLOWED_IMAGE_EXTENSIONS,
-        max_image_size_config=MAX_IMAGE_SIZE,
+        allowed_image_extensions_config=current_app.config['ALLOWED_IMAGE_EXTENSIONS'],
+        max_image_size_config=current_app.config['MAX_IMAGE_SIZE'],
         app_config=current_app.config  # Pass the app's config
     )
     http_status_code = result_dict.pop('http_status_code', 200)
     return jsonify(result_dict), http_status_code
 
 
-@app.route('/admin/login', methods=['GET', 'POST'])
+@route('/admin/login', methods=['GET', 'POST'])
 def admin_login():
     if request.method == 'POST':
         try:
@@ -189,14 +146,14 @@ def admin_login():
                 session['admin_id'] = admin_info['uid']  # Changed to 'uid'
                 session['admin_email'] = admin_info['email']
                 current_app.logger.info(
-                    f"Admin '{admin_info['email']}' logged in successfully using ID token. UID: {admin_info['uid']}")
+                    "Admin '%s' logged in successfully using ID token. UID: %s", admin_info['email'], admin_info['uid'])
                 return jsonify({'status': 'success', 'message': 'Admin login successful',
                                 'redirect_url': url_for('admin_dashboard')}), 200
             else:
                 current_app.logger.warning(f"/admin/login POST: Admin authentication failed for token.")
                 return jsonify({'status': 'error', 'message': 'Invalid credentials or not an admin'}), 401
         except Exception as e:
-            current_app.logger.error(f"Error in /admin/login POST: {e}", exc_info=True)
+            current_app.logger.error("Error in /admin/login POST: %s", e, exc_info=True)
             return jsonify({'status': 'error', 'message': 'An unexpected error occurred'}), 500
 
     # GET request part remains the same
@@ -205,16 +162,16 @@ def admin_login():
     return render_template('admin/login.html')
 
 
-@app.route('/admin/logout')
+@route('/admin/logout')
 def admin_logout():
     admin_email = session.get('admin_email', 'Unknown admin')
     session.pop('admin_id', None)
     session.pop('admin_email', None)
-    app.logger.info(f"Admin '{admin_email}' logged out.")
+    current_app.logger.info("Admin '%s' logged out.", admin_email)
     return redirect(url_for('admin_login'))
 
 
-@app.route('/admin/dashboard')
+@route('/admin/dashboard')
 def admin_dashboard():
     if 'admin_id' not in session:
         return redirect(url_for('admin_login'))
@@ -261,11 +218,11 @@ def admin_dashboard():
                                )
     except Exception as e:
         error_desc = f"status: {status_filter_from_query}, view: {view_type}"
-        app.logger.error(f"Error loading admin dashboard ({error_desc}): {e}", exc_info=True)
+        current_app.logger.error("Error loading admin dashboard (%s): %s", error_desc, e, exc_info=True)
         return render_template('500.html'), 500
 
 
-@app.route('/admin/api/content/<content_id>/approve', methods=['POST'])
+@route('/admin/api/content/<content_id>/approve', methods=['POST'])
 def admin_approve_content(content_id):
     if 'admin_id' not in session:
         return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
@@ -276,7 +233,7 @@ def admin_approve_content(content_id):
         return jsonify({'status': 'error', 'message': 'Failed to approve post'}), 500
 
 
-@app.route('/admin/api/content/<content_id>/reject', methods=['POST'])
+@route('/admin/api/content/<content_id>/reject', methods=['POST'])
 def admin_reject_content(content_id):
     if 'admin_id' not in session:
         return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
@@ -287,30 +244,66 @@ def admin_reject_content(content_id):
         return jsonify({'status': 'error', 'message': 'Failed to reject post'}), 500
 
 
-@app.route('/admin/api/content/<content_id>/delete', methods=['POST'])
+@route('/admin/api/content/<content_id>/delete', methods=['POST'])
 def admin_delete_content(content_id):
     if 'admin_id' not in session:
-        current_app.logger.warning(f"Unauthorized attempt to delete content {content_id}. No admin in session.")
+        current_app.logger.warning("Unauthorized attempt to delete content %s. No admin in session.", content_id)
         return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
 
     admin_id = session.get('admin_id')
-    current_app.logger.info(f"Admin {admin_id} attempting to delete content {content_id} via API.")
+    current_app.logger.info("Admin %s attempting to delete content %s via API.", admin_id, content_id)
 
     # Call the service function for deletion
     result = delete_content_admin(content_id, admin_id, current_app.logger)
 
     if result.get('status') == 'success':
-        current_app.logger.info(f"Content {content_id} successfully deleted by admin {admin_id}.")
+        current_app.logger.info("Content %s successfully deleted by admin %s.", content_id, admin_id)
         return jsonify({'status': 'success', 'message': result.get('message', 'Post deleted successfully')})
     else:
         current_app.logger.error(
-            f"Failed to delete content {content_id} by admin {admin_id}. API Error: {result.get('message')}")
+            "Failed to delete content %s by admin %s. API Error: %s", content_id, admin_id, result.get('message'))
         # Propagate the status code from the service if available, otherwise default to 500
         status_code = result.get('code', 500)
         return jsonify({'status': 'error', 'message': result.get('message', 'Failed to delete post')}), status_code
 
 
-@app.template_filter('datetime')
+@route('/admin/profiles')
+def admin_profiles():
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_login'))
+
+    profiles = profiling.list_profiles(profiling.get_profile_dir(current_app))
+    return render_template('admin/profiles.html',
+                           profiles=profiles,
+                           admin_email=session.get('admin_email'),
+                           profiling_enabled=current_app.config.get('PROFILING_ENABLED'),
+                           sample_rate=current_app.config.get('PROFILING_SAMPLE_RATE'),
+                           slow_threshold_ms=current_app.config.get('PROFILING_SLOW_THRESHOLD_MS'))
+
+
+@route('/admin/profiles/<name>')
+def admin_profile_download(name):
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_login'))
+
+    path = profiling.profile_path(profiling.get_profile_dir(current_app), name)
+    if not path:
+        abort(404)
+    return send_file(path, mimetype='text/plain', as_attachment=True, download_name=name + '.folded')
+
+
+@route('/admin/api/content/bulk', methods=['POST'])
+def admin_bulk_moderate_content():
+    if 'admin_id' not in session:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+
+    data = request.get_json(silent=True) or {}
+    admin_id = session.get('admin_id')
+    result = bulk_moderate_content(data.get('action'), data.get('contentIds'), admin_id, current_app.logger)
+    status_code = result.pop('code', 500)
+    return jsonify(result), status_code
+
+
 def format_datetime_filter(timestamp):
     if not timestamp: return ''
     if isinstance(timestamp, dict):
@@ -322,7 +315,7 @@ def format_datetime_filter(timestamp):
     return str(timestamp)
 
 
-@app.route('/')
+@route('/')
 def home():
     # Получаем userId из URL-параметра
     filtered_user_id = request.args.get('userId', None)
@@ -334,18 +327,48 @@ def home():
                                  logged_in_user_id=current_logged_in_user_id,
                                  photo_upload_limit=current_app.config['PHOTO_UPLOAD_LIMIT'])
 
-    app.logger.debug(f"Home page: Loaded {len(context.get('items', []))} items for map" +
-                     (f" filtered by user {filtered_user_id}" if filtered_user_id else ""))
+    current_app.logger.debug("Home page: Loaded %d items for map (user filter: %s)",
+                             len(context.get('items', [])), filtered_user_id)
 
     # Pass user session info and filter info to the template
     context['user_id_session'] = session.get('user_id')
     context['user_displayName_session'] = session.get('user_displayName')
     context['filtered_user_id'] = filtered_user_id  # Для отображения активного фильтра
+    context['map_events_url'] = _map_events_url(filtered_user_id)
 
     return render_template('index.html', **context)
 
 
-@app.route('/help')
+def _map_events_url(filtered_user_id):
+    """Live updates are pushed for the unfiltered map only."""
+    if filtered_user_id or map_events.get_hub() is None:
+        return None
+    return url_for('map_events_stream')
+
+
+@route('/api/map/events')
+def map_events_stream():
+    return map_events.events_response()
+
+
+@route('/api/map/items')
+def get_api_map_items():
+    """Published map items as JSON (optionally ?userId=...); map.js reloads them after a resync."""
+    items = firestore_utils.get_published_items_for_map(current_app.logger, user_id=request.args.get('userId'))
+    return jsonify({'status': 'success', 'items': items}), 200
+
+
+@route('/assets/<path:filename>')
+def asset_file(filename):
+    return assets.asset_response(filename)
+
+
+@route('/map-snapshots/<name>')
+def map_snapshot_file(name):
+    return map_snapshot.snapshot_response(name)
+
+
+@route('/help')
 def help_page():
     POSTMARK_FROM_EMAIL = os.environ.get('POSTMARK_FROM_EMAIL', 'default_email@example.com')
     base_url_from_env = os.environ.get('BASE_URL', 'https://mailmap.store')
@@ -356,13 +379,13 @@ def help_page():
     return render_template('help_page.html', postmark_from_email=POSTMARK_FROM_EMAIL, base_url=base_url_to_template)
 
 
-@app.route('/api/content/<content_id>/vote', methods=['POST'])
+@route('/api/content/<content_id>/vote', methods=['POST'])
 def vote_content(content_id):
-    app.logger.info(f"Vote request for content_id: {content_id}")
+    current_app.logger.info("Vote request for content_id: %s", content_id)
     try:
         data = request.get_json()
         if not data or 'vote' not in data:
-            app.logger.warning(f"Missing 'vote' parameter for content_id: {content_id}. Data: {data}")
+            current_app.logger.warning("Missing 'vote' parameter for content_id: %s.", content_id)
             return jsonify({'status': 'error', 'message': 'Missing vote parameter'}), 400
         vote_value = data.get('vote')
         user_id = data.get('userId') or request.headers.get('X-User-ID')
@@ -374,13 +397,14 @@ def vote_content(content_id):
         http_status_code = result.pop('http_code', 500 if result.get('status') == 'error' else 200)
         return jsonify(result), http_status_code
     except Exception as e:
-        app.logger.error(f"Unexpected error in /api/content/.../vote route for {content_id}: {e}", exc_info=True)
+        current_app.logger.error("Unexpected error in /api/content/.../vote route for %s: %s",
+                                 content_id, e, exc_info=True)
         return jsonify({'status': 'error', 'message': "An unexpected error occurred."}), 500
 
 
-@app.route('/api/content/<content_id>/report', methods=['POST'])
+@route('/api/content/<content_id>/report', methods=['POST'])
 def report_content(content_id):
-    app.logger.info(f"Report request for content_id: {content_id}")
+    current_app.logger.info("Report request for content_id: %s", content_id)
     try:
         data = request.get_json()
         reason = data.get('reason', 'Not specified')
@@ -389,69 +413,110 @@ def report_content(content_id):
         http_status_code = result.pop('http_code', 500 if result.get('status') == 'error' else 200)
         return jsonify(result), http_status_code
     except Exception as e:
-        app.logger.error(f"Unexpected error in /api/content/.../report route for {content_id}: {e}", exc_info=True)
+        current_app.logger.error("Unexpected error in /api/content/.../report route for %s: %s",
+                                 content_id, e, exc_info=True)
         return jsonify({'status': 'error', 'message': "An unexpected error occurred."}), 500
 
 
-@app.route('/api/content/create', methods=['POST'])
+@route('/api/content/create', methods=['POST'])
 def create_content():
-    app.logger.info("Received request to /api/content/create")
+    current_app.logger.info("Received request to /api/content/create")
+    files = None
     try:
-        user_id = request.form.get('userId') or request.headers.get('X-User-ID')
+        if request.mimetype == 'multipart/form-data':
+            # Streamed so that an oversized or mislabeled photo is refused before it is fully received
+            try:
+                form_data, files = parse_photo_form(
+                    request.stream, request.mimetype_params.get('boundary'), request.content_length,
+                    current_app.logger,
+                    allowed_extensions=current_app.config['ALLOWED_IMAGE_EXTENSIONS'],
+                    max_image_size=current_app.config['MAX_IMAGE_SIZE'])
+            except UploadRejected as e:
+                return jsonify({'status': 'error', 'message': e.message}), e.http_code
+        else:
+            form_data, files = request.form, request.files
+        user_id = form_data.get('userId') or request.headers.get('X-User-ID')
         result = create_new_content_from_api(
-            form_data=request.form,
-            files=request.files,
+            form_data=form_data,
+            files=files,
             user_id=user_id,
             app_logger=current_app.logger,
-            bucket_client=bucket,
-            allowed_extensions=ALLOWED_IMAGE_EXTENSIONS,
-            max_image_size=MAX_IMAGE_SIZE
+            bucket_client=get_bucket(),
+            allowed_extensions=current_app.config['ALLOWED_IMAGE_EXTENSIONS'],
+            max_image_size=current_app.config['MAX_IMAGE_SIZE'],
+            trust_client_exif=current_app.config['TRUST_CLIENT_EXIF_COORDINATES']
         )
         http_status_code = result.pop('http_code', 500 if result.get('status') == 'error' else 200)
         if http_status_code == 201 and 'contentId' not in result:
-            app.logger.error("API create content: service returned success but no contentId.")
+            current_app.logger.error("API create content: service returned success but no contentId.")
             return jsonify({'status': 'error', 'message': 'Content creation succeeded but contentId missing.'}), 500
         return jsonify(result), http_status_code
     except Exception as e:
-        app.logger.error(f"Unexpected error in /api/content/create route: {e}", exc_info=True)
+        current_app.logger.error("Unexpected error in /api/content/create route: %s", e, exc_info=True)
         return jsonify({'status': 'error', 'message': "An unexpected error occurred."}), 500
-
-
-@app.route('/api/content/<content_id>/delete', methods=['DELETE'])
+    finally:
+        for file_storage in (files.values() if files else []):
+            file_storage.close()
+
+
+@route('/api/uploads', methods=['POST'])
+def reserve_direct_upload():
+    data = request.get_json(silent=True) or {}
+    user_id = data.get('userId') or request.headers.get('X-User-ID')
+    result = direct_uploads.reserve_upload(
+        user_id, data.get('filename'), data.get('size'), current_app.logger, get_bucket(),
+        allowed_extensions=current_app.config['ALLOWED_IMAGE_EXTENSIONS'],
+        max_image_size=current_app.config['MAX_IMAGE_SIZE'],
+        photo_upload_limit=current_app.config['PHOTO_UPLOAD_LIMIT'],
+        url_expiration=timedelta(seconds=current_app.config['UPLOAD_URL_EXPIRATION_SECONDS']))
+    return jsonify(result), result.pop('http_code', 500 if result.get('status') == 'error' else 200)
+
+
+@route('/api/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_direct_upload(upload_id):
+    data = request.get_json(silent=True) or {}
+    user_id = data.get('userId') or request.headers.get('X-User-ID')
+    result = direct_uploads.finalize_upload(upload_id, user_id, data, current_app.logger, get_bucket(),
+                                            trust_client_exif=current_app.config['TRUST_CLIENT_EXIF_COORDINATES'])
+    return jsonify(result), result.pop('http_code', 500 if result.get('status') == 'error' else 200)
+
+
+@route('/api/content/<content_id>/delete', methods=['DELETE'])
 def api_delete_content(content_id):
     user_id = session.get('user_id')
     if not user_id:
-        current_app.logger.warning(f"Unauthorized attempt to delete content {content_id}. No user in session.")
+        current_app.logger.warning("Unauthorized attempt to delete content %s. No user in session.", content_id)
         return jsonify({'status': 'error', 'message': 'User not authenticated'}), 401
 
-    current_app.logger.info(f"User {user_id} attempting to delete content {content_id}.")
+    current_app.logger.info("User %s attempting to delete content %s.", user_id, content_id)
 
     result = delete_content_item(content_id, user_id, current_app.logger)
 
     current_app.logger.info(
-        f"Deletion attempt for content {content_id} by user {user_id}. Result: {result.get('message')}, Code: {result.get('code')}")
+        "Deletion attempt for content %s by user %s. Result: %s, Code: %s",
+        content_id, user_id, result.get('message'), result.get('code'))
 
     return jsonify(result), result.get('code', 500)
 
 
-@app.route('/api/content/<content_id>/edit', methods=['PUT'])
+@route('/api/content/<content_id>/edit', methods=['PUT'])
 def api_edit_content(content_id):
     user_id = request.headers.get('X-User-ID')
     if not user_id:
-        current_app.logger.warning(f"Edit attempt for content {content_id} without X-User-ID.")
+        current_app.logger.warning("Edit attempt for content %s without X-User-ID.", content_id)
         return jsonify({'status': 'error', 'message': 'User authentication required (X-User-ID header missing).'}), 401
 
     try:
         data = request.get_json()
         if not data:
-            current_app.logger.warning(f"Edit attempt for content {content_id} by user {user_id} with no JSON data.")
+            current_app.logger.warning("Edit attempt for content %s by user %s with no JSON data.", content_id, user_id)
             return jsonify({'status': 'error', 'message': 'No data provided for update.'}), 400
     except Exception as e:
-        current_app.logger.error(f"Error parsing JSON for content {content_id} edit by user {user_id}: {e}",
+        current_app.logger.error("Error parsing JSON for content %s edit by user %s: %s", content_id, user_id, e,
                                  exc_info=True)
         return jsonify({'status': 'error', 'message': 'Invalid JSON format.'}), 400
 
-    current_app.logger.info(f"User {user_id} attempting to edit content {content_id} with data: {data}")
+    current_app.logger.info("User %s attempting to edit content %s.", user_id, content_id)
 
     # Call the placeholder service function
     # Note: MAX_IMAGE_SIZE is used as MAX_IMAGE_SIZE_BYTES is not explicitly defined in app.config
@@ -460,7 +525,7 @@ def api_edit_content(content_id):
         user_id=user_id,
         data=data,
         app_logger=current_app.logger,
-        gcs_bucket_name=current_app.config.get('FIREBASE_STORAGE_BUCKET'),  # Corrected bucket name
+        gcs_bucket_name=current_app.config.get('FIREBASE_STORAGE_BUCKET'),
         allowed_extensions=current_app.config.get('ALLOWED_IMAGE_EXTENSIONS'),
         max_image_size_bytes=current_app.config.get('MAX_IMAGE_SIZE')
     )
@@ -469,27 +534,44 @@ def api_edit_content(content_id):
     return jsonify(result), http_status_code
 
 
-@app.route('/api/content/<content_id>', methods=['GET'])
+@route('/api/content/batch', methods=['GET', 'POST'])
+def get_api_content_batch():
+    """
+    Fetches several content items at once: GET ?ids=a,b,c[&fields=latitude,longitude] or POST
+    {"ids": [...], "fields": [...]}. Items come back in the requested order, null where missing.
+    """
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        content_ids, fields = data.get('ids'), data.get('fields')
+    else:
+        content_ids = [content_id for content_id in request.args.get('ids', '').split(',') if content_id]
+        fields = [field for field in request.args.get('fields', '').split(',') if field] or None
+    result = get_content_batch(content_ids, fields, current_app.logger)
+    http_status_code = result.pop('http_code', 500 if result.get('status') == 'error' else 200)
+    return jsonify(result), http_status_code
+
+
+@route('/api/content/<content_id>', methods=['GET'])
 def get_api_content_item(content_id):
-    current_app.logger.info(f"Request to fetch content item with ID: {content_id}")
+    current_app.logger.info("Request to fetch content item with ID: %s", content_id)
     try:
         item_data = firestore_utils.get_content_item(content_id, current_app.logger)
 
         if item_data:
             # The 'itemId' is already part of item_data as returned by get_content_item
-            current_app.logger.info(f"Content item {content_id} found.")
+            current_app.logger.info("Content item %s found.", content_id)
             # Optionally, remove sensitive data or reformat before sending
             # For now, sending all data as is.
             return jsonify({'status': 'success', 'content': item_data}), 200
         else:
-            current_app.logger.warning(f"Content item {content_id} not found when fetching via API.")
+            current_app.logger.warning("Content item %s not found when fetching via API.", content_id)
             return jsonify({'status': 'error', 'message': 'Content not found'}), 404
     except Exception as e:
-        current_app.logger.error(f"Error fetching content item {content_id} via API: {e}", exc_info=True)
+        current_app.logger.error("Error fetching content item %s via API: %s", content_id, e, exc_info=True)
         return jsonify({'status': 'error', 'message': 'An internal server error occurred'}), 500
 
 
-@app.route('/post/<item_id>')
+@route('/post/<item_id>')
 def post_view(item_id):
     # Получаем userId из URL-параметра
     filtered_user_id = request.args.get('userId', None)
@@ -502,17 +584,18 @@ def post_view(item_id):
     context['user_id_session'] = session.get('user_id')
     context['user_displayName_session'] = session.get('user_displayName')
     context['filtered_user_id'] = filtered_user_id  # Для отображения активного фильтра
+    context['map_events_url'] = _map_events_url(filtered_user_id)
 
-    app.logger.debug(f"Post page {item_id}: Loaded {len(context.get('items', []))} items for map" +
-                     (f" filtered by user {filtered_user_id}" if filtered_user_id else ""))
+    current_app.logger.debug("Post page %s: Loaded %d items for map (user filter: %s)",
+                             item_id, len(context.get('items', [])), filtered_user_id)
 
     if not context.get('target_item_data'):
-        app.logger.warning(f"Post page: Target item {item_id} not found.")
+        current_app.logger.warning("Post page: Target item %s not found.", item_id)
 
     return render_template('index.html', **context)
 
 
-@app.route('/register', methods=['GET', 'POST'])
+@route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         email = request.form.get('email')
@@ -530,7 +613,8 @@ def register():
 
             if registration_result['status'] == 'success':
                 current_app.logger.info(
-                    f"User {registration_result['user']['uid']} ({email}) registered successfully via UserService. Message: {registration_result.get('message')}")
+                    "User %s (%s) registered successfully via UserService. Message: %s",
+                    registration_result['user']['uid'], email, registration_result.get('message'))
                 # Flash message based on the outcome of sending the verification email
                 message_from_service = registration_result.get('message', '')
                 if 'Please check your email to verify your account' in message_from_service:
@@ -550,7 +634,7 @@ def register():
                 return redirect(url_for('login'))  # Redirect to login page after successful registration
             else:
                 error = registration_result.get('message', 'An unknown error occurred during registration.')
-                current_app.logger.warning(f"Registration failed for {email}: {error}")
+                current_app.logger.warning("Registration failed for %s: %s", email, error)
 
         # If error is set either by initial checks or by UserService response
         if error:
@@ -559,7 +643,7 @@ def register():
     return render_template('register.html')
 
 
-@app.route('/login', methods=['GET', 'POST'])  # Now handles GET and POST
+@route('/login', methods=['GET', 'POST'])  # Now handles GET and POST
 def login():
     if request.method == 'GET':
         if session.get('user_id'):
@@ -587,38 +671,38 @@ def login():
             session['user_email'] = user_data['email']
             session['user_displayName'] = user_data.get('displayName', user_data.get('email'))  # Fallback to email
 
-            current_app.logger.info(f"User {user_data['uid']} ({user_data['email']}) logged in via ID token (POST).")
+            current_app.logger.info("User %s (%s) logged in via ID token (POST).", user_data['uid'], user_data['email'])
             return jsonify({'status': 'success', 'message': 'Login successful', 'redirect_url': url_for('home')}), 200
         else:
             # Log the specific error message from the service
             error_message = login_response.get('message', 'Login failed. Invalid token or user issue.')
             current_app.logger.warning(
-                f"Login failed for token (POST). Service message: {error_message}")  # Avoid logging token itself
+                "Login failed for token (POST). Service message: %s", error_message)  # Avoid logging token itself
             return jsonify({'status': 'error', 'message': error_message}), 401
 
     except Exception as e:
         # General exception handling for unexpected errors
-        current_app.logger.error(f"Unexpected error in /login POST route: {e}", exc_info=True)
+        current_app.logger.error("Unexpected error in /login POST route: %s", e, exc_info=True)
         return jsonify({'status': 'error', 'message': 'An unexpected error occurred during login.'}), 500
 
 
-@app.route('/logout')
+@route('/logout')
 def logout():
     user_email = session.get('user_email', 'Unknown user')  # For logging
     session.pop('user_id', None)
     session.pop('user_email', None)
     session.pop('user_displayName', None)
-    current_app.logger.info(f"User '{user_email}' logged out from server session.")
+    current_app.logger.info("User '%s' logged out from server session.", user_email)
     # Перенаправляем на домашнюю страницу
     return redirect(url_for('home'))
 
 
-@app.route('/client_logout')
+@route('/client_logout')
 def client_logout_page():
     return render_template('client_logout.html')
 
 
-@app.route('/google_login', methods=['GET'])
+@route('/google_login', methods=['GET'])
 def google_login():
     # This route is a placeholder.
     # Actual Google Sign-In is initiated client-side.
@@ -628,7 +712,7 @@ def google_login():
     return redirect(url_for('home'))
 
 
-@app.route('/google_callback', methods=['POST'])
+@route('/google_callback', methods=['POST'])
 def google_callback():
     current_app.logger.info("Attempting Google Sign-In via /google_callback.")
     try:
@@ -648,7 +732,7 @@ def google_callback():
             session['user_email'] = user_data['email']
             session['user_displayName'] = user_data.get('displayName', user_data.get('email'))  # Fallback to email
 
-            current_app.logger.info(f"User {user_data['uid']} ({user_data['email']}) processed via Google Sign-In.")
+            current_app.logger.info("User %s (%s) processed via Google Sign-In.", user_data['uid'], user_data['email'])
             return jsonify(
                 {'status': 'success', 'message': 'Google Sign-In successful', 'redirect_url': url_for('home')}), 200
         else:
@@ -662,18 +746,18 @@ def google_callback():
             else:
                 status_code = 401  # Default to 401 for other auth-related issues
 
-            current_app.logger.warning(f"Google Sign-In failed. Service message: {error_message}")
+            current_app.logger.warning("Google Sign-In failed. Service message: %s", error_message)
             return jsonify({'status': 'error', 'message': error_message}), status_code
 
     # Removed specific Firebase exception handling (ExpiredIdTokenError, InvalidIdTokenError)
     # as these are now caught within user_service.handle_google_signin and returned as error statuses.
     except Exception as e:
         # General exception handling for unexpected errors during request processing in the route itself
-        current_app.logger.error(f"Unexpected error in /google_callback route: {e}", exc_info=True)
+        current_app.logger.error("Unexpected error in /google_callback route: %s", e, exc_info=True)
         return jsonify({'status': 'error', 'message': 'An unexpected error occurred during Google Sign-In.'}), 500
 
 
-@app.route('/apple_callback', methods=['POST'])
+@route('/apple_callback', methods=['POST'])
 def apple_callback():
     current_app.logger.info("Attempting Apple Sign-In via /apple_callback.")
     try:
@@ -695,7 +779,7 @@ def apple_callback():
             # Apple might not always provide a display name, fallback to email or a placeholder
             session['user_displayName'] = user_data.get('displayName', user_data.get('email', 'User'))
 
-            current_app.logger.info(f"User {user_data['uid']} ({user_data['email']}) processed via Apple Sign-In.")
+            current_app.logger.info("User %s (%s) processed via Apple Sign-In.", user_data['uid'], user_data['email'])
             return jsonify({
                 'status': 'success',
                 'message': 'Apple Sign-In successful',
@@ -705,15 +789,15 @@ def apple_callback():
             error_message = apple_signin_response.get('message', 'Apple Sign-In failed.')
             status_code = apple_signin_response.get('status_code', 401)  # Get status_code from service or default
 
-            current_app.logger.warning(f"Apple Sign-In failed. Service message: {error_message}")
+            current_app.logger.warning("Apple Sign-In failed. Service message: %s", error_message)
             return jsonify({'status': 'error', 'message': error_message}), status_code
 
     except Exception as e:
-        current_app.logger.error(f"Unexpected error in /apple_callback route: {e}", exc_info=True)
+        current_app.logger.error("Unexpected error in /apple_callback route: %s", e, exc_info=True)
         return jsonify({'status': 'error', 'message': 'An unexpected error occurred during Apple Sign-In.'}), 500
 
 
-@app.route('/auth/action', methods=['GET'])
+@route('/auth/action', methods=['GET'])
 def handle_auth_action():
     """
     Handles actions like email verification or password reset redirects from Firebase.
@@ -725,7 +809,7 @@ def handle_auth_action():
     # lang = request.args.get('lang', 'en') # Optional
 
     current_app.logger.info(
-        f"Auth action called with mode: {mode}, oobCode: {'present' if action_code else 'missing'}.")
+        "Auth action called with mode: %s, oobCode: %s.", mode, 'present' if action_code else 'missing')
 
     # Here you could potentially verify the oobCode with Firebase Admin SDK
     # auth.verify_password_reset_code(action_code) or similar for email verification if needed,
@@ -738,25 +822,104 @@ def handle_auth_action():
         # So, we just confirm to the user.
         flash('Your email has been successfully verified! You can now log in.', 'success')
         current_app.logger.info(
-            f"Email verification action completed for user (oobCode: {'present' if action_code else 'N/A'}).")
+            "Email verification action completed for user (oobCode: %s).", 'present' if action_code else 'N/A')
     elif mode == 'resetPassword':
         # For password reset, Firebase handles the reset page. This is if it redirects back to our app.
         # Typically, you'd guide the user to a page to enter a new password if this link was for that.
         # But if Firebase handles the password entry and this is just a confirmation redirect:
         flash('Password reset successful. You can now log in with your new password.', 'success')
-        current_app.logger.info(f"Password reset action completed (oobCode: {'present' if action_code else 'N/A'}).")
+        current_app.logger.info("Password reset action completed (oobCode: %s).", 'present' if action_code else 'N/A')
     elif mode == 'recoverEmail':
         flash('Your email has been recovered. Please check your inbox for further instructions or try logging in.',
               'info')
-        current_app.logger.info(f"Email recovery action processed (oobCode: {'present' if action_code else 'N/A'}).")
+        current_app.logger.info("Email recovery action processed (oobCode: %s).", 'present' if action_code else 'N/A')
     else:
         # Generic message for other actions or if mode is unknown
         flash('The requested action has been completed.', 'info')
-        current_app.logger.info(f"Unknown or generic auth action completed with mode: {mode}.")
+        current_app.logger.info("Unknown or generic auth action completed with mode: %s.", mode)
 
     return redirect(url_for('login'))
 
 
+def create_app(config=None):
+    """
+    Builds and configures a Flask application.
+
+    Firebase is not touched here: Firestore and Storage clients are created lazily by
+    firebase_clients on the first request that needs them.
+    """
+    app = Flask(__name__, static_folder='static')
+    CORS(app)
+    app.jinja_env.filters['datetime'] = view_format_datetime_filter
+
+    app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'default-secret-key-for-development')
+    app.config['LOG_LEVEL'] = os.environ.get('LOG_LEVEL', 'INFO')
+    app.config['LOG_FILE'] = os.environ.get('LOG_FILE', 'app.log')
+    app.config['LOG_INFO_SAMPLE_RATE'] = float(os.environ.get('LOG_INFO_SAMPLE_RATE', 1.0))
+    app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+    app.config['PROFILING_ENABLED'] = os.environ.get('PROFILING_ENABLED', 'false').lower() == 'true'
+    app.config['PROFILING_SAMPLE_RATE'] = float(os.environ.get('PROFILING_SAMPLE_RATE', 0.01))
+    app.config['PROFILING_SLOW_THRESHOLD_MS'] = float(os.environ.get('PROFILING_SLOW_THRESHOLD_MS', 500))
+    app.config['PROFILING_DIR'] = os.environ.get('PROFILING_DIR', os.path.join(app.root_path, 'profiles'))
+    app.config['PROFILING_MAX_FILES'] = int(os.environ.get('PROFILING_MAX_FILES', 50))
+    app.config['FIREBASE_STORAGE_BUCKET'] = FIREBASE_STORAGE_BUCKET
+    app.config['ALLOWED_IMAGE_EXTENSIONS'] = ALLOWED_IMAGE_EXTENSIONS
+    app.config['MAX_IMAGE_SIZE'] = MAX_IMAGE_SIZE
+    # Any larger request body gets a 413 before it is read. Postmark sends inbound emails of up
+    # to 35 MB, attachments included; photo uploads have their own, tighter limit.
+    app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 40 * 1024 * 1024))
+    app.config['PHOTO_UPLOAD_LIMIT'] = PHOTO_UPLOAD_LIMIT
+    app.config['UPLOAD_URL_EXPIRATION_SECONDS'] = int(os.environ.get('UPLOAD_URL_EXPIRATION_SECONDS', 900))
+    app.config['PHOTO_MAX_DIMENSION'] = int(os.environ.get('PHOTO_MAX_DIMENSION', 2048))
+    app.config['PHOTO_JPEG_QUALITY'] = float(os.environ.get('PHOTO_JPEG_QUALITY', 0.85))
+    app.config['TRUST_CLIENT_EXIF_COORDINATES'] = os.environ.get('TRUST_CLIENT_EXIF_COORDINATES', 'false').lower() == 'true'
+    app.config['MAP_SNAPSHOT_ENABLED'] = os.environ.get('MAP_SNAPSHOT_ENABLED', 'false').lower() == 'true'
+    app.config['MAP_SNAPSHOT_BUILDER'] = os.environ.get('MAP_SNAPSHOT_BUILDER', 'false').lower() == 'true'
+    app.config['MAP_SNAPSHOT_STORAGE'] = os.environ.get('MAP_SNAPSHOT_STORAGE', 'local')
+    app.config['MAP_SNAPSHOT_DIR'] = os.environ.get('MAP_SNAPSHOT_DIR')
+    app.config['MAP_SNAPSHOT_DEBOUNCE_SECONDS'] = float(os.environ.get('MAP_SNAPSHOT_DEBOUNCE_SECONDS', 2))
+    app.config['MAP_SNAPSHOT_FULL_REBUILD_SECONDS'] = float(os.environ.get('MAP_SNAPSHOT_FULL_REBUILD_SECONDS', 3600))
+    app.config['MAP_SNAPSHOT_POLL_SECONDS'] = float(os.environ.get('MAP_SNAPSHOT_POLL_SECONDS', 5))
+    app.config['MAP_EVENTS_ENABLED'] = os.environ.get('MAP_EVENTS_ENABLED', 'false').lower() == 'true'
+    app.config['MAP_EVENTS_QUEUE_SIZE'] = int(os.environ.get('MAP_EVENTS_QUEUE_SIZE', 100))
+    app.config['MAP_EVENTS_MAX_SUBSCRIBERS'] = int(os.environ.get('MAP_EVENTS_MAX_SUBSCRIBERS', 5000))
+    app.config['MAP_EVENTS_HEARTBEAT_SECONDS'] = float(os.environ.get('MAP_EVENTS_HEARTBEAT_SECONDS', 15))
+    app.config['COMPRESSION_ENABLED'] = os.environ.get('COMPRESSION_ENABLED', 'true').lower() == 'true'
+    app.config['COMPRESSION_MIN_SIZE'] = int(os.environ.get('COMPRESSION_MIN_SIZE', 500))
+    app.config['IDENTITY_MAP_ENABLED'] = os.environ.get('IDENTITY_MAP_ENABLED', 'true').lower() == 'true'
+    app.config['FANOUT_TIMEOUT_SECONDS'] = float(os.environ.get('FANOUT_TIMEOUT_SECONDS', 5))
+    if config:
+        app.config.update(config)
+
+    # Logging setup: JSON records are written to app.log by a background listener thread
+    configure_logging(app)
+    # Route/dependency latency histograms and Firestore document counters, served at /metrics
+    metrics.init_app(app)
+    # Sampling profiler for a fraction of requests (or on demand for admins), see profiling.py
+    profiling.init_app(app)
+    # Each Firestore document is read at most once per request, see identity_map.py
+    identity_map.init_app(app)
+    # Public map served from precompressed, versioned JSON files, see map_snapshot.py
+    map_snapshot.init_app(app)
+    # Live map changes pushed over Server-Sent Events from one Firestore listener, see map_events.py
+    map_events.init_app(app)
+    # Fingerprinted static assets (asset_url in templates) and gzip/brotli response compression
+    assets.init_app(app)
+    compression.init_app(app)
+
+    app.before_request(before_request_funcs)
+    app.add_template_filter(format_datetime_filter, 'datetime')
+    for rule, view_func, options in _routes:
+        app.add_url_rule(rule, view_func=view_func, **options)
+
+    app.logger.info('Flask app startup')
+    return app
+
+
+app = create_app()
+
+
 if __name__ == '__main__':
     if os.environ.get("WERKZEUG_RUN_MAIN") != "true":
         show_server_urls()
@@ -0,0 +1,243 @@
+"""
+ASGI application serving the hot JSON endpoints on the async Firestore client.
+
+The Flask app runs under a WSGI server, where every request holds a worker thread for its whole
+Firestore round trip. This app serves the read-heavy endpoints from one event loop with the
+coroutines in firestore_async, so one worker keeps hundreds of requests in flight:
+
+    GET  /api/content/<content_id>
+    GET  /api/content/batch?ids=<id>,<id>[&fields=<field>,<field>]  (or POST {"ids", "fields"})
+    POST /api/content/<content_id>/vote
+    POST /api/content/<content_id>/report
+    GET  /api/map/items[?userId=<user_id>]
+    GET  /api/map/events  (Server-Sent Events, see map_events)
+
+The content endpoints answer like the Flask routes of the same path (the validation and
+response mapping come from api_services); /api/map/items returns the published map items as
+{'status': 'success', 'items': [...]}. Everything else gets a 404, so the load balancer or
+reverse proxy must send only these paths here and the rest to Gunicorn. Run it with any ASGI
+server, e.g. `uvicorn asgi_app:app --workers 1`.
+
+Each request gets its own identity map, as Flask requests do. Flask-only features (sessions,
+metrics, profiling, compression) are not available on this app.
+"""
+
+import asyncio
+import json
+import logging
+import re
+from urllib.parse import parse_qs
+
+from flask.json.provider import DefaultJSONProvider
+
+import api_services
+import firestore_async
+import identity_map
+import map_events
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 64 * 1024
+
+
+class _Request:
+    def __init__(self, scope, body):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.query = {key: values[-1] for key, values in parse_qs(scope.get('query_string', b'').decode('latin-1')).items()}
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope.get('headers', [])}
+        self.body = body
+
+    def json(self):
+        """The decoded JSON body, or None when it is missing or not a JSON object."""
+        try:
+            data = json.loads(self.body or b'null')
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+
+    def user_id(self, data):
+        return (data or {}).get('userId') or self.headers.get('x-user-id')
+
+
+async def get_content(request, content_id):
+    logger.info("Request to fetch content item with ID: %s", content_id)
+    item_data = await firestore_async.get_content_item(content_id, logger)
+    if item_data:
+        logger.info("Content item %s found.", content_id)
+        return {'status': 'success', 'content': item_data}, 200
+    logger.warning("Content item %s not found when fetching via API.", content_id)
+    return {'status': 'error', 'message': 'Content not found'}, 404
+
+
+async def get_content_batch(request):
+    if request.method == 'POST':
+        data = request.json() or {}
+        content_ids, fields = data.get('ids'), data.get('fields')
+    else:
+        content_ids = [content_id for content_id in request.query.get('ids', '').split(',') if content_id]
+        fields = [field for field in request.query.get('fields', '').split(',') if field] or None
+    result = api_services.check_content_batch_request(content_ids, fields, logger)
+    if result is None:
+        items = await firestore_async.get_content_items_by_ids(content_ids, logger, fields=fields or None)
+        result = api_services.content_batch_response(content_ids, items, logger)
+    return result, result.pop('http_code', 500 if result.get('status') == 'error' else 200)
+
+
+async def vote_content(request, content_id):
+    logger.info("Vote request for content_id: %s", content_id)
+    data = request.json()
+    if not data or 'vote' not in data:
+        logger.warning("Missing 'vote' parameter for content_id: %s.", content_id)
+        return {'status': 'error', 'message': 'Missing vote parameter'}, 400
+    vote_value = data.get('vote')
+    user_id = request.user_id(data)
+    result = api_services.check_vote_request(content_id, user_id, vote_value, logger)
+    if result is None:
+        vote_result = await firestore_async.record_vote(content_id, user_id, vote_value, logger)
+        result = api_services.vote_response(content_id, vote_result, logger)
+    return result, result.pop('http_code', 500 if result.get('status') == 'error' else 200)
+
+
+async def report_content(request, content_id):
+    logger.info("Report request for content_id: %s", content_id)
+    data = request.json()
+    if data is None:
+        return {'status': 'error', 'message': 'Invalid JSON body'}, 400
+    reason = data.get('reason', 'Not specified')
+    user_id = request.user_id(data)
+    result = api_services.check_report_request(content_id, user_id, reason, logger)
+    if result is None:
+        report_result = await firestore_async.record_report(content_id, user_id, reason, logger)
+        result = api_services.report_response(content_id, report_result, logger)
+    return result, result.pop('http_code', 500 if result.get('status') == 'error' else 200)
+
+
+async def map_items(request):
+    items = await firestore_async.get_published_items_for_map(logger, user_id=request.query.get('userId'))
+    return {'status': 'success', 'items': items}, 200
+
+
+ROUTES = [
+    ('GET', re.compile(r'^/api/content/batch$'), get_content_batch),
+    ('POST', re.compile(r'^/api/content/batch$'), get_content_batch),
+    ('GET', re.compile(r'^/api/content/(?P<content_id>[^/]+)$'), get_content),
+    ('POST', re.compile(r'^/api/content/(?P<content_id>[^/]+)/vote$'), vote_content),
+    ('POST', re.compile(r'^/api/content/(?P<content_id>[^/]+)/report$'), report_content),
+    ('GET', re.compile(r'^/api/map/items$'), map_items),
+]
+
+
+def _match(method, path):
+    """Returns (handler, path parameters), or (None, status) for 404/405."""
+    allowed = False
+    for route_method, pattern, handler in ROUTES:
+        match = pattern.match(path)
+        if match:
+            if route_method == method:
+                return handler, match.groupdict()
+            allowed = True
+    return None, 405 if allowed else 404
+
+
+async def _read_body(receive):
+    """Returns the request body, or None if it is larger than MAX_BODY_BYTES."""
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            return None
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+async def _send_json(send, payload, status):
+    body = json.dumps(payload, default=DefaultJSONProvider.default, sort_keys=True).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def _stream_map_events(scope, receive, send):
+    """Streams map_events to the client until it disconnects; one coroutine per open map tab."""
+    hub = map_events.get_hub()
+    if hub is None:
+        await _send_json(send, {'status': 'error', 'message': 'Map events are disabled'}, 404)
+        return
+    last_event_id = _Request(scope, b'').headers.get('last-event-id')
+    subscription = hub.subscribe(last_event_id, loop=asyncio.get_running_loop())
+    if subscription is None:
+        logger.warning("Map events: subscriber limit reached.")
+        await _send_json(send, {'status': 'error', 'message': 'Too many open map streams'}, 503)
+        return
+
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'),
+                                (b'x-accel-buffering', b'no')]})
+        await send({'type': 'http.response.body', 'body': map_events.OPENING_MESSAGE, 'more_body': True})
+        while True:
+            pending = asyncio.ensure_future(subscription.next(hub.heartbeat_seconds))
+            await asyncio.wait({pending, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if disconnected.done():
+                pending.cancel()
+                break
+            messages = pending.result()
+            await send({'type': 'http.response.body', 'body': b''.join(messages) or map_events.HEARTBEAT_MESSAGE,
+                        'more_body': True})
+    except OSError:
+        pass  # The client went away while a message was being sent
+    finally:
+        disconnected.cancel()
+        subscription.close()
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+    if scope['path'] == '/api/map/events' and scope['method'] == 'GET':
+        await _stream_map_events(scope, receive, send)
+        return
+
+    handler, params = _match(scope['method'], scope['path'])
+    if handler is None:
+        message = 'Not found' if params == 404 else 'Method not allowed'
+        await _send_json(send, {'status': 'error', 'message': message}, params)
+        return
+    body = await _read_body(receive)
+    if body is None:
+        await _send_json(send, {'status': 'error', 'message': 'Request body too large'}, 413)
+        return
+
+    try:
+        with identity_map.scope():
+            payload, status = await handler(_Request(scope, body), **params)
+    except Exception as e:
+        logger.error("Unexpected error in %s %s: %s", scope['method'], scope['path'], e, exc_info=True)
+        payload, status = {'status': 'error', 'message': 'An unexpected error occurred.'}, 500
+    await _send_json(send, payload, status)
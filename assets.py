@@ -0,0 +1,156 @@
+"""
+Fingerprinted, precompressed static assets.
+
+`python assets.py build` copies the JavaScript, CSS and SVG files under static/ to static/dist/
+with a content hash in their name (js/map.js -> js/map.3f2a1b9c0d.js), writes gzip and, when the
+optional `brotli` package is installed, brotli variants next to them, and records the mapping in
+static/dist/manifest.json. Run it as part of the deployment build.
+
+Templates reference assets with {{ asset_url('js/map.js') }}. When the manifest lists the file,
+that is the hashed URL under /assets/, served with the precompressed variant the client accepts
+and Cache-Control: immutable, so repeat visits do not transfer it again; a changed file gets a
+new name. Without a manifest (e.g. in development) the plain /static/ URL is used.
+
+Usage:
+    python assets.py build [--static-dir static] [--clean]
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import sys
+
+from flask import abort, current_app, url_for
+from werkzeug.security import safe_join
+
+import compression
+
+logger = logging.getLogger(__name__)
+
+ASSET_EXTENSIONS = ('.js', '.css', '.svg')
+DIST_DIRNAME = 'dist'
+MANIFEST_NAME = 'manifest.json'
+SKIPPED_DIRNAMES = frozenset({DIST_DIRNAME, 'snapshots'})
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+HASH_LENGTH = 10
+FINGERPRINTED_NAME_PATTERN = re.compile(rf'.+\.[0-9a-f]{{{HASH_LENGTH}}}(\.js|\.css|\.svg)')
+
+
+def fingerprinted_name(path, content):
+    """Returns path with the first HASH_LENGTH hex digits of the content hash before the extension."""
+    stem, extension = os.path.splitext(path)
+    return f'{stem}.{hashlib.sha256(content).hexdigest()[:HASH_LENGTH]}{extension}'
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f'{path}.tmp'
+    with open(temporary_path, 'wb') as output_file:
+        output_file.write(data)
+    os.replace(temporary_path, path)
+
+
+def build_assets(static_dir, clean=False):
+    """
+    Writes the fingerprinted and precompressed copies of the assets under static_dir to
+    static_dir/dist and returns the manifest ({source path: fingerprinted path}). Files of
+    earlier builds are kept, so pages rendered before a deployment keep working, unless clean is set.
+    """
+    dist_dir = os.path.join(static_dir, DIST_DIRNAME)
+    manifest = {}
+    for root, dirnames, filenames in os.walk(static_dir):
+        dirnames[:] = sorted(name for name in dirnames
+                             if not (root == static_dir and name in SKIPPED_DIRNAMES))
+        for filename in sorted(filenames):
+            if not filename.endswith(ASSET_EXTENSIONS):
+                continue
+            source_path = os.path.join(root, filename)
+            relative_path = os.path.relpath(source_path, static_dir).replace(os.sep, '/')
+            with open(source_path, 'rb') as source_file:
+                content = source_file.read()
+            hashed_path = fingerprinted_name(relative_path, content)
+            output_path = os.path.join(dist_dir, *hashed_path.split('/'))
+            _write(output_path, content)
+            _write(output_path + compression.PRECOMPRESSED_SUFFIXES['gzip'],
+                   gzip.compress(content, compresslevel=9, mtime=0))
+            if compression.brotli is not None:
+                _write(output_path + compression.PRECOMPRESSED_SUFFIXES['br'],
+                       compression.brotli.compress(content, quality=11))
+            manifest[relative_path] = hashed_path
+
+    if clean:
+        current_files = {hashed_path + suffix for hashed_path in manifest.values()
+                         for suffix in ('', *compression.PRECOMPRESSED_SUFFIXES.values())}
+        for root, _, filenames in os.walk(dist_dir):
+            for filename in filenames:
+                relative_path = os.path.relpath(os.path.join(root, filename), dist_dir).replace(os.sep, '/')
+                if relative_path != MANIFEST_NAME and relative_path not in current_files:
+                    os.remove(os.path.join(root, filename))
+
+    _write(os.path.join(dist_dir, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    logger.info("Built %d fingerprinted assets in %s", len(manifest), dist_dir)
+    return manifest
+
+
+def load_manifest(static_dir):
+    """Returns the manifest written by build_assets, or {} when there is none."""
+    try:
+        with open(os.path.join(static_dir, DIST_DIRNAME, MANIFEST_NAME)) as manifest_file:
+            return json.load(manifest_file)
+    except FileNotFoundError:
+        return {}
+
+
+def asset_url(path):
+    """Template helper: the fingerprinted URL of a static file, or its plain static URL."""
+    hashed_path = current_app.extensions['assets_manifest'].get(path)
+    if hashed_path:
+        return url_for('asset_file', filename=hashed_path)
+    return url_for('static', filename=path)
+
+
+def asset_response(filename):
+    """
+    Serves a fingerprinted asset, precompressed and cached forever. Files of earlier builds are
+    served too, for pages rendered by instances that still run the previous deployment.
+    """
+    path = safe_join(os.path.join(current_app.static_folder, DIST_DIRNAME), filename)
+    if path is None or not FINGERPRINTED_NAME_PATTERN.fullmatch(filename):
+        abort(404)
+    response = compression.send_precompressed(path, mimetypes.guess_type(filename)[0], CACHE_CONTROL)
+    if response is None:
+        abort(404)
+    return response
+
+
+def init_app(app):
+    """Loads the asset manifest (unless ASSETS_MANIFEST_ENABLED is false) and adds asset_url to templates."""
+    manifest = load_manifest(app.static_folder) if app.config.get('ASSETS_MANIFEST_ENABLED', True) else {}
+    app.extensions['assets_manifest'] = manifest
+    app.jinja_env.globals['asset_url'] = asset_url
+    if manifest:
+        app.logger.info("Serving %d fingerprinted static assets.", len(manifest))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fingerprint and precompress static assets.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help='Write static/dist and its manifest.')
+    build_parser.add_argument('--static-dir', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'))
+    build_parser.add_argument('--clean', action='store_true', help='Remove files of earlier builds.')
+    args = parser.parse_args(argv)
+
+    manifest = build_assets(args.static_dir, clean=args.clean)
+    for source_path, hashed_path in sorted(manifest.items()):
+        print(f"{source_path} -> {hashed_path}")
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+    sys.exit(main())
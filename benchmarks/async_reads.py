@@ -0,0 +1,141 @@
+"""
+Compares the synchronous (Flask/WSGI) and asynchronous (asgi_app) read paths under load.
+
+Both paths read the same seeded FakeFirestore with the same injected per-RPC latency. The sync
+path drives the Flask app's GET /api/content/<id> from --threads threads, the way a Gunicorn
+worker with that many threads would serve it: at most --threads reads are in flight. The async
+path drives asgi_app's GET /api/content/<id> with --concurrency requests in flight on a single
+event loop, over FakeAsyncFirestore, whose latency is awaited instead of blocking a thread.
+
+Reports throughput and latency percentiles for each path. With latency dominating, throughput
+grows with the number of reads in flight: roughly threads / latency for the sync path.
+
+Usage:
+    python benchmarks/async_reads.py [--requests 2000] [--latency-ms 20] [--threads 8]
+                                     [--concurrency 200] [--items 500] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('TEST_ENV', 'true')
+
+import firebase_clients
+from benchmarks.run_flows import _percentile
+from fake_backends import FakeAsyncFirestore, FakeBucket, FakeFirestore
+
+
+def seed_items(db, items):
+    item_ids = []
+    for index in range(items):
+        item_id = f'item-{index}'
+        db.put_document('contentItems', item_id, {
+            'itemId': item_id, 'userId': f'user-{index % 50}', 'text': f'Synthetic post {index}',
+            'latitude': 1.0, 'longitude': 2.0, 'status': 'published', 'voteCount': 0,
+        })
+        item_ids.append(item_id)
+    return item_ids
+
+
+def _summary(latencies, elapsed, errors):
+    return {
+        'requests': len(latencies),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies), 2),
+        'p99_ms': round(_percentile(latencies, 0.99), 2),
+        'errors': errors,
+    }
+
+
+def run_sync(item_ids, requests, threads):
+    import app as app_module
+
+    flask_app = app_module.create_app({'TESTING': True, 'LOG_LEVEL': 'WARNING', 'METRICS_ENABLED': False})
+
+    def fetch(index):
+        client = flask_app.test_client()
+        started = time.perf_counter()
+        response = client.get(f'/api/content/{item_ids[index % len(item_ids)]}')
+        return (time.perf_counter() - started) * 1000, response.status_code != 200
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        outcomes = list(executor.map(fetch, range(requests)))
+    elapsed = time.perf_counter() - started
+    return _summary([latency for latency, _ in outcomes], elapsed, sum(failed for _, failed in outcomes))
+
+
+async def _run_async(item_ids, requests, concurrency):
+    import asgi_app
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(index):
+        scope = {'type': 'http', 'method': 'GET', 'path': f'/api/content/{item_ids[index % len(item_ids)]}',
+                 'query_string': b'', 'headers': []}
+        statuses = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses.append(message['status'])
+
+        async with semaphore:
+            started = time.perf_counter()
+            await asgi_app.app(scope, receive, send)
+            return (time.perf_counter() - started) * 1000, statuses != [200]
+
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(*(fetch(index) for index in range(requests)))
+    elapsed = time.perf_counter() - started
+    return _summary([latency for latency, _ in outcomes], elapsed, sum(failed for _, failed in outcomes))
+
+
+def run_benchmark(requests=2000, latency_ms=20.0, threads=8, concurrency=200, items=500):
+    """Returns {'sync': summary, 'async': summary} for the same reads over both paths."""
+    db = FakeFirestore(latency=latency_ms / 1000.0)
+    item_ids = seed_items(db, items)
+    firebase_clients.use_clients(db=db, bucket=FakeBucket('bench-bucket'), async_db=FakeAsyncFirestore(db))
+    try:
+        results = {'sync': run_sync(item_ids, requests, threads)}
+        results['async'] = asyncio.run(_run_async(item_ids, requests, concurrency))
+        return results
+    finally:
+        firebase_clients.use_clients()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the sync and async Firestore read paths.')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='Latency injected into every fake RPC.')
+    parser.add_argument('--threads', type=int, default=8, help='Threads of the simulated WSGI worker.')
+    parser.add_argument('--concurrency', type=int, default=200, help='Requests in flight on the event loop.')
+    parser.add_argument('--items', type=int, default=500)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(requests=args.requests, latency_ms=args.latency_ms, threads=args.threads,
+                            concurrency=args.concurrency, items=args.items)
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+        return 0
+    print(f"{'path':<8}{'in flight':>10}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name, in_flight in (('sync', args.threads), ('async', args.concurrency)):
+        result = results[name]
+        print(f"{name:<8}{in_flight:>10}{result['throughput_rps']:>10}{result['p50_ms']:>10}"
+              f"{result['p99_ms']:>10}{result['errors']:>8}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""
+Size and parse-time comparison of the map item encodings.
+
+Generates synthetic published content items and compares
+  * tojson   - the full documents as index.html inlines them ({{ items|tojson }}),
+  * json     - the slim snapshot rows written by map_snapshot (one object per item),
+  * columns  - the columnar snapshot encoding (map_snapshot.encode_columns),
+reporting raw, gzip and (if the `brotli` package is installed) brotli sizes, the encode time,
+and the time to parse the payload back into item objects (json.loads, plus decode_columns for the
+columnar form). Python parse times are a proxy for the browser: both are dominated by the number
+of objects and strings the parser has to create.
+
+Usage:
+    python benchmarks/map_encoding.py [--sizes 10000,100000] [--image-ratio 0.7] [--json]
+"""
+
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('TEST_ENV', 'true')
+
+import map_snapshot
+
+
+def make_items(count, image_ratio=0.7, users=None, seed=42):
+    """Returns `count` published content documents (with itemId) in map order."""
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    user_ids = [f'user-{index:05d}-{rng.getrandbits(40):010x}' for index in range(users or max(1, count // 20))]
+    items = []
+    for index in range(count):
+        user_id = rng.choice(user_ids)
+        image_url = None
+        if rng.random() < image_ratio:
+            image_url = (f'https://storage.googleapis.com/mailmap-bench.appspot.com/'
+                         f'{user_id}/{rng.getrandbits(64):016x}.jpg')
+        items.append({
+            'itemId': f'{rng.getrandbits(100):025x}'[:20],
+            'text': f'Synthetic post {index} ' + 'x' * rng.randint(0, 80),
+            'latitude': rng.uniform(-60, 60),
+            'longitude': rng.uniform(-170, 170),
+            'status': 'published',
+            'userId': user_id,
+            'voteCount': rng.randint(0, 50),
+            'reportedCount': 0,
+            'voters': {f'voter-{voter}': 1 for voter in range(rng.randint(0, 3))},
+            'reporters': [],
+            'imageUrl': image_url,
+            'timestamp': now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600)),
+            'isAnonymous': False,
+            'notificationSent': True,
+            'shortUrl': None,
+        })
+    items.sort(key=lambda item: item['timestamp'], reverse=True)
+    items.sort(key=lambda item: item['voteCount'])
+    return items
+
+
+def _timed(function, repeat):
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 2), result
+
+
+def _sizes(payload):
+    sizes = {'raw_bytes': len(payload), 'gzip_bytes': len(gzip.compress(payload, compresslevel=9))}
+    try:
+        import brotli
+    except ImportError:
+        sizes['br_bytes'] = None
+    else:
+        sizes['br_bytes'] = len(brotli.compress(payload, quality=11))
+    return sizes
+
+
+def compare_encodings(count, image_ratio=0.7, repeat=3, seed=42):
+    """Returns {encoding: {'raw_bytes', 'gzip_bytes', 'br_bytes', 'encode_ms', 'parse_ms'}}."""
+    from flask import Flask
+
+    documents = make_items(count, image_ratio=image_ratio, seed=seed)
+    rows = [map_snapshot._snapshot_item(item['itemId'], item) for item in documents]
+    flask_json = Flask(__name__).json
+
+    encoders = {
+        'tojson': (lambda: flask_json.dumps(documents).encode('utf-8'), json.loads),
+        'json': (lambda: map_snapshot._dumps(rows), json.loads),
+        'columns': (lambda: map_snapshot._dumps(map_snapshot.encode_columns(rows)),
+                    lambda payload: map_snapshot.decode_columns(json.loads(payload))),
+    }
+    results = {}
+    for name, (encode, parse) in encoders.items():
+        encode_ms, payload = _timed(encode, repeat)
+        parse_ms, parsed = _timed(lambda: parse(payload), repeat)
+        assert len(parsed) == count
+        results[name] = dict(_sizes(payload), encode_ms=encode_ms, parse_ms=parse_ms)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare map item payload encodings.')
+    parser.add_argument('--sizes', default='10000,100000', help='Comma-separated item counts.')
+    parser.add_argument('--image-ratio', type=float, default=0.7)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+    args = parser.parse_args(argv)
+
+    all_results = {}
+    for count in (int(size) for size in args.sizes.split(',')):
+        all_results[count] = compare_encodings(count, image_ratio=args.image_ratio, repeat=args.repeat)
+
+    if args.json:
+        print(json.dumps(all_results, indent=2))
+        return 0
+    print(f"{'items':>8} {'encoding':<10}{'raw KB':>10}{'gzip KB':>10}{'br KB':>10}{'encode ms':>11}{'parse ms':>10}")
+    for count, results in all_results.items():
+        for name, result in results.items():
+            br_kb = f"{result['br_bytes'] / 1024:.1f}" if result['br_bytes'] is not None else '-'
+            print(f"{count:>8} {name:<10}{result['raw_bytes'] / 1024:>10.1f}{result['gzip_bytes'] / 1024:>10.1f}"
+                  f"{br_kb:>10}{result['encode_ms']:>11}{result['parse_ms']:>10}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
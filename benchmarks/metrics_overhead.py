@@ -0,0 +1,83 @@
+"""
+Measures the cost of the metrics layer (metrics.py).
+
+Reports, per call, the overhead of a timed() wrapper with metrics enabled and disabled, and the
+added latency of a minimal Flask request with the request/document hooks installed versus a bare
+app. Run:
+
+    python benchmarks/metrics_overhead.py [--calls 200000] [--requests 5000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+
+import metrics
+
+
+def _per_call_us(func, calls):
+    started = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def measure_wrapper_overhead(calls):
+    def noop():
+        return None
+
+    wrapped = metrics.timed('benchmark', 'noop')(noop)
+    baseline = _per_call_us(noop, calls)
+    metrics.set_enabled(True)
+    enabled = _per_call_us(wrapped, calls)
+    metrics.set_enabled(False)
+    disabled = _per_call_us(wrapped, calls)
+    metrics.set_enabled(True)
+    return {'raw_us': baseline, 'enabled_us': enabled, 'disabled_us': disabled}
+
+
+def _build_app(with_metrics):
+    app = Flask(__name__)
+    if with_metrics:
+        metrics.init_app(app)
+
+    @app.route('/ping')
+    def ping():
+        return 'ok'
+
+    return app
+
+
+def measure_request_overhead(requests_count):
+    results = {}
+    for label, with_metrics in (('bare', False), ('metrics', True)):
+        client = _build_app(with_metrics).test_client()
+        client.get('/ping')  # warm up
+        results[label] = _per_call_us(lambda: client.get('/ping'), requests_count)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure metrics instrumentation overhead.')
+    parser.add_argument('--calls', type=int, default=200000)
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    wrapper = measure_wrapper_overhead(args.calls)
+    print(f"timed() wrapper: raw {wrapper['raw_us']:.3f} us/call, "
+          f"enabled +{wrapper['enabled_us'] - wrapper['raw_us']:.3f} us, "
+          f"disabled +{wrapper['disabled_us'] - wrapper['raw_us']:.3f} us")
+
+    request_times = measure_request_overhead(args.requests)
+    overhead = request_times['metrics'] - request_times['bare']
+    print(f"Flask request: bare {request_times['bare']:.1f} us, with metrics {request_times['metrics']:.1f} us "
+          f"(+{overhead:.1f} us, {overhead / request_times['bare'] * 100:.1f}%)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,308 @@
+"""
+End-to-end benchmark of the main request flows against the in-memory Firestore/GCS stand-ins.
+
+Seeds fake_backends.FakeFirestore and FakeBucket with a synthetic data set, then drives the home
+page, vote, report, create, webhook and dashboard flows through the Flask test client. For each
+flow it reports p50/p99 latency and the average number of RPCs and Firestore documents read per
+request, and compares them with flows_budget.json. RPC and document counts are deterministic for a
+given data set, so they are the primary regression gate; latency budgets are deliberately loose.
+Each flow runs a few untimed warm-up requests first, and every timed request runs with the garbage
+collector disabled after a full collection, so a collector pause cannot become the p99 sample.
+
+Usage:
+    python benchmarks/run_flows.py [--items 2000] [--users 200] [--iterations 100] [--warmup 5]
+                                   [--latency-ms 0] [--flows home,vote] [--update-budget]
+
+Exits with status 1 when a flow exceeds its budget.
+"""
+
+import argparse
+import base64
+import gc
+import io
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('TEST_ENV', 'true')
+
+import firebase_clients
+import firestore_utils
+from fake_backends import FakeBucket, FakeFirestore
+
+DEFAULT_BUDGET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'flows_budget.json')
+ADMIN_ID = 'bench-admin'
+
+
+def make_jpeg(width=64, height=48, color=(30, 120, 200)):
+    """Returns the bytes of a small solid-colour JPEG."""
+    from PIL import Image
+
+    output = io.BytesIO()
+    Image.new('RGB', (width, height), color=color).save(output, format='JPEG', quality=80)
+    return output.getvalue()
+
+
+def seed_data(db, items, users, seed=42):
+    """
+    Fills db with `users` users and `items` content items (about 80% published, 15% for
+    moderation, 5% rejected; 10% reported with one to three report documents) plus the
+    users' post index documents.
+    Returns {'user_ids': [...], 'published_ids': [...], 'emails': [...]}.
+    """
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    user_ids, emails = [], []
+    for index in range(users):
+        uid = f'user-{index}'
+        email = f'user{index}@example.com'
+        db.put_document('users', uid, {
+            'uid': uid, 'email': email, 'displayName': f'User {index}', 'provider': 'password',
+            'photo_upload_count_current_month': 0, 'createdAt': now,
+        })
+        user_ids.append(uid)
+        emails.append(email)
+
+    published_ids = []
+    post_indexes = {}
+    for index in range(items):
+        content_id = f'item-{index}'
+        roll = rng.random()
+        status = 'published' if roll < 0.80 else ('for_moderation' if roll < 0.95 else 'rejected')
+        reported = rng.random() < 0.10
+        report_count = rng.randint(1, 3) if reported else 0
+        item = {
+            'text': f'Synthetic post {index}',
+            'latitude': rng.uniform(-60, 60),
+            'longitude': rng.uniform(-170, 170),
+            'status': status,
+            'userId': rng.choice(user_ids) if user_ids else None,
+            'voteCount': rng.randint(0, 50),
+            'reportedCount': report_count,
+            'voters': {},
+            'reporters': [],
+            'imageUrl': None,
+            'timestamp': now - timedelta(minutes=index),
+            'isAnonymous': False,
+        }
+        db.put_document('contentItems', content_id, item)
+        if item['userId']:
+            post_indexes.setdefault(item['userId'], {})[content_id] = \
+                firestore_utils._post_index_entry(content_id, item)
+        for report_index in range(report_count):
+            db.put_document('reports', f'{content_id}-r{report_index}', {
+                'contentId': content_id, 'reason': 'spam', 'userId': rng.choice(user_ids) if user_ids else None,
+                'timestamp': now,
+            })
+        if status == 'published':
+            published_ids.append(content_id)
+    # The app keeps these up to date on every write; seed them as a running deployment has them.
+    for uid, posts in post_indexes.items():
+        db.put_document(firestore_utils.POST_INDEX_COLLECTION, uid,
+                        {'userId': uid, 'posts': posts, 'complete': True, 'updatedAt': now})
+    return {'user_ids': user_ids, 'published_ids': published_ids, 'emails': emails}
+
+
+def _postmark_payload(sender, jpeg_bytes, index):
+    return {
+        'FromFull': {'Email': sender, 'Name': 'Bench'},
+        'Subject': f'Benchmark post {index} lat:48.8566,lng:2.3522',
+        'TextBody': f'Benchmark webhook body {index}',
+        'HtmlBody': '',
+        'Attachments': [{
+            'Name': f'photo-{index}.jpg', 'ContentType': 'image/jpeg',
+            'Content': base64.b64encode(jpeg_bytes).decode('ascii'), 'ContentLength': len(jpeg_bytes),
+        }],
+    }
+
+
+def build_flows(app_module, data):
+    """Returns {flow name: callable(client, iteration) -> response}."""
+    jpeg_bytes = make_jpeg()
+    published = data['published_ids']
+    users = data['user_ids']
+    token = app_module.INBOUND_URL_TOKEN
+
+    def home(client, i):
+        return client.get('/')
+
+    def home_filtered(client, i):
+        return client.get(f'/?userId={users[i % len(users)]}')
+
+    def vote(client, i):
+        return client.post(f'/api/content/{published[i % len(published)]}/vote',
+                           json={'vote': 1, 'userId': f'voter-{i}'})
+
+    def report(client, i):
+        return client.post(f'/api/content/{published[(i * 7) % len(published)]}/report',
+                           json={'reason': 'spam', 'userId': f'reporter-{i}'})
+
+    def create(client, i):
+        return client.post('/api/content/create', data={
+            'text': f'Created in benchmark {i}', 'latitude': '48.85', 'longitude': '2.35',
+            'userId': users[i % len(users)], 'image': (io.BytesIO(jpeg_bytes), f'bench-{i}.jpg', 'image/jpeg'),
+        }, content_type='multipart/form-data')
+
+    def webhook(client, i):
+        return client.post(f'/webhook/postmark?token={token}',
+                           json=_postmark_payload(data['emails'][i % len(data['emails'])], jpeg_bytes, i))
+
+    def dashboard(client, i):
+        return client.get('/admin/dashboard?status=for_moderation')
+
+    def dashboard_reported(client, i):
+        return client.get('/admin/dashboard?view=reported')
+
+    return {
+        'home': home, 'home_filtered': home_filtered, 'vote': vote, 'report': report, 'create': create,
+        'webhook': webhook, 'dashboard': dashboard, 'dashboard_reported': dashboard_reported,
+    }
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _timed_request(flow, client, iteration):
+    """Runs one request with the garbage collector off; returns (response, elapsed ms)."""
+    gc.collect()
+    gc.disable()
+    try:
+        started = time.perf_counter()
+        response = flow(client, iteration)
+        return response, (time.perf_counter() - started) * 1000
+    finally:
+        gc.enable()
+
+
+def run_benchmark(items=2000, users=200, iterations=100, latency_ms=0.0, flows=None, seed=42, warmup=5):
+    """
+    Runs the selected flows and returns {flow: {'p50_ms', 'p99_ms', 'rpcs_per_op',
+    'documents_read_per_op', 'errors'}}. The `warmup` requests of each flow are not measured.
+    """
+    latency = latency_ms / 1000.0
+    db = FakeFirestore(latency=latency)
+    bucket = FakeBucket('bench-bucket', latency=latency)
+    data = seed_data(db, items, users, seed=seed)
+    firebase_clients.use_clients(db=db, bucket=bucket)
+    try:
+        import app as app_module
+
+        flask_app = app_module.create_app({
+            'TESTING': True, 'PHOTO_UPLOAD_LIMIT': 10 ** 6, 'LOG_LEVEL': 'WARNING', 'METRICS_ENABLED': False,
+        })
+        client = flask_app.test_client()
+        with client.session_transaction() as session:
+            session['admin_id'] = ADMIN_ID
+            session['admin_email'] = 'admin@example.com'
+
+        available = build_flows(app_module, data)
+        results = {}
+        for name in (flows or available):
+            flow = available[name]
+            for iteration in range(warmup):
+                flow(client, iterations + iteration)
+            latencies, rpcs, documents_read, errors = [], 0, 0, 0
+            for iteration in range(iterations):
+                rpcs_before = db.total_rpcs() + bucket.total_rpcs()
+                reads_before = db.rpc_counts.get('firestore.documents_read', 0)
+                response, elapsed_ms = _timed_request(flow, client, iteration)
+                latencies.append(elapsed_ms)
+                rpcs += db.total_rpcs() + bucket.total_rpcs() - rpcs_before
+                documents_read += db.rpc_counts.get('firestore.documents_read', 0) - reads_before
+                if response.status_code >= 400:
+                    errors += 1
+            results[name] = {
+                'p50_ms': round(statistics.median(latencies), 2),
+                'p99_ms': round(_percentile(latencies, 0.99), 2),
+                'rpcs_per_op': round(rpcs / iterations, 2),
+                'documents_read_per_op': round(documents_read / iterations, 2),
+                'errors': errors,
+            }
+        return results
+    finally:
+        firebase_clients.use_clients()
+
+
+def check_budget(results, budget):
+    """Returns a list of human-readable budget violations."""
+    violations = []
+    for name, result in results.items():
+        limits = budget.get(name)
+        if not limits:
+            continue
+        if result['errors']:
+            violations.append(f"{name}: {result['errors']} requests failed")
+        for key, limit_key in (('rpcs_per_op', 'max_rpcs_per_op'),
+                               ('documents_read_per_op', 'max_documents_read_per_op'),
+                               ('p99_ms', 'max_p99_ms')):
+            limit = limits.get(limit_key)
+            if limit is not None and result[key] > limit:
+                violations.append(f"{name}: {key} {result[key]} exceeds {limit_key} {limit}")
+    return violations
+
+
+def budget_from_results(results):
+    """Derives a budget with headroom: 10% on counts, 3x (+5 ms) on p99 latency."""
+    return {
+        name: {
+            'max_rpcs_per_op': math.ceil(result['rpcs_per_op'] * 1.1),
+            'max_documents_read_per_op': math.ceil(result['documents_read_per_op'] * 1.1),
+            'max_p99_ms': round(result['p99_ms'] * 3 + 5),
+        }
+        for name, result in results.items()
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark request flows against in-memory backends.')
+    parser.add_argument('--items', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per flow before measuring.')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Latency injected into every fake RPC.')
+    parser.add_argument('--flows', default=None, help='Comma-separated subset of flows to run.')
+    parser.add_argument('--budget', default=DEFAULT_BUDGET_PATH)
+    parser.add_argument('--update-budget', action='store_true', help='Write the budget from this run.')
+    args = parser.parse_args(argv)
+
+    flows = args.flows.split(',') if args.flows else None
+    results = run_benchmark(items=args.items, users=args.users, iterations=args.iterations,
+                            latency_ms=args.latency_ms, flows=flows, warmup=args.warmup)
+
+    print(f"{'flow':<20}{'p50 ms':>10}{'p99 ms':>10}{'RPCs/op':>10}{'docs/op':>10}{'errors':>8}")
+    for name, result in results.items():
+        print(f"{name:<20}{result['p50_ms']:>10}{result['p99_ms']:>10}{result['rpcs_per_op']:>10}"
+              f"{result['documents_read_per_op']:>10}{result['errors']:>8}")
+
+    if args.update_budget:
+        with open(args.budget, 'w') as budget_file:
+            json.dump(budget_from_results(results), budget_file, indent=2, sort_keys=True)
+            budget_file.write('\n')
+        print(f"Budget written to {args.budget}")
+        return 0
+
+    if not os.path.exists(args.budget):
+        print(f"No budget file at {args.budget}; run with --update-budget to create one.")
+        return 0
+    with open(args.budget) as budget_file:
+        violations = check_budget(results, json.load(budget_file))
+    if violations:
+        print("Flow budget exceeded:")
+        for violation in violations:
+            print(f"  - {violation}")
+        return 1
+    print("All flows within budget.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Startup import-time benchmark.
+
+Runs ``python -X importtime -c "import app"`` in fresh interpreters, reports the slowest modules and
+compares the result against the regression budget in startup_budget.json:
+
+  * max_cumulative_ms: median cumulative import time of the measured module.
+  * forbidden_modules: modules that must not be imported at startup (they are loaded on first use).
+
+Usage:
+    python benchmarks/startup_importtime.py [--runs 5] [--top 15] [--module app] [--budget PATH]
+
+Exits with status 1 when the budget is exceeded, so it can run as a CI step.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DEFAULT_BUDGET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'startup_budget.json')
+
+
+def parse_importtime(stderr_text):
+    """
+    Parses ``-X importtime`` output into a list of (module, self_us, cumulative_us), in import order.
+    """
+    rows = []
+    for line in stderr_text.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+            rows.append((name.strip(), int(self_us), int(cumulative_us)))
+        except ValueError:
+            continue
+    return rows
+
+
+def measure_once(module_name):
+    """Imports module_name in a fresh interpreter and returns its parsed importtime rows."""
+    env = dict(os.environ)
+    # Mock credentials keep the measurement independent of the machine's Google credentials.
+    env.setdefault('TEST_ENV', 'true')
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module_name}'],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module_name} failed:\n{completed.stderr[-2000:]}")
+    return parse_importtime(completed.stderr)
+
+
+def run_benchmark(module_name, runs):
+    """
+    Returns {'cumulative_ms': median, 'samples_ms': [...], 'modules': set, 'top': [(name, self_ms)]}
+    aggregated over `runs` fresh interpreters.
+    """
+    samples_ms = []
+    self_times = {}
+    imported = set()
+    for _ in range(runs):
+        rows = measure_once(module_name)
+        cumulative = next((cum for name, _, cum in rows if name == module_name), None)
+        if cumulative is None:
+            raise RuntimeError(f"No importtime entry for {module_name}.")
+        samples_ms.append(cumulative / 1000.0)
+        for name, self_us, _ in rows:
+            imported.add(name)
+            self_times.setdefault(name, []).append(self_us / 1000.0)
+
+    top = sorted(((name, statistics.median(times)) for name, times in self_times.items()),
+                 key=lambda item: item[1], reverse=True)
+    return {
+        'cumulative_ms': statistics.median(samples_ms),
+        'samples_ms': samples_ms,
+        'modules': imported,
+        'top': top,
+    }
+
+
+def check_budget(result, budget):
+    """Returns a list of human-readable budget violations (empty when within budget)."""
+    violations = []
+    max_ms = budget.get('max_cumulative_ms')
+    if max_ms is not None and result['cumulative_ms'] > max_ms:
+        violations.append(f"cumulative import time {result['cumulative_ms']:.1f} ms exceeds budget {max_ms} ms")
+    for forbidden in budget.get('forbidden_modules', []):
+        if forbidden in result['modules']:
+            violations.append(f"module '{forbidden}' is imported at startup")
+    return violations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure startup import time against the regression budget.')
+    parser.add_argument('--module', default='app', help='Module to import (default: app).')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters to sample; the median is used.')
+    parser.add_argument('--top', type=int, default=15, help='Number of slowest modules (self time) to list.')
+    parser.add_argument('--budget', default=DEFAULT_BUDGET_PATH, help='Path to the budget JSON file.')
+    args = parser.parse_args(argv)
+
+    with open(args.budget) as budget_file:
+        budget = json.load(budget_file)
+
+    result = run_benchmark(args.module, max(1, args.runs))
+    print(f"import {args.module}: median {result['cumulative_ms']:.1f} ms "
+          f"over {len(result['samples_ms'])} runs "
+          f"(min {min(result['samples_ms']):.1f} ms, max {max(result['samples_ms']):.1f} ms)")
+    print(f"Top {args.top} modules by self time:")
+    for name, self_ms in result['top'][:args.top]:
+        print(f"  {self_ms:8.1f} ms  {name}")
+
+    violations = check_budget(result, budget)
+    if violations:
+        print("Startup budget exceeded:")
+        for violation in violations:
+            print(f"  - {violation}")
+        return 1
+    print(f"Within budget ({budget.get('max_cumulative_ms')} ms).")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,308 @@
+"""
+Load generator for the Postmark inbound webhook.
+
+Synthesizes Postmark inbound JSON payloads (real JPEG attachments of a configurable size, most of
+them carrying GPS EXIF tags) and replays them against /webhook/postmark at a target request rate
+with a bounded number of concurrent requests, the way a newsletter reply storm would arrive. The
+app runs in-process against the in-memory Firestore, GCS and SMTP stand-ins from fake_backends,
+optionally with injected per-RPC latency.
+
+Reports throughput, latency percentiles, the memory high-water mark and a breakdown of the
+handler's result dicts (status and message) for failed or partial requests.
+
+Usage:
+    python benchmarks/webhook_load.py [--requests 200] [--rps 20] [--concurrency 8]
+                                      [--attachments 2] [--attachment-kb 200] [--gps-ratio 0.8]
+                                      [--senders 50] [--new-sender-ratio 0.2] [--latency-ms 5]
+                                      [--smtp-latency-ms 20] [--tracemalloc] [--json]
+"""
+
+import argparse
+import base64
+import io
+import json
+import math
+import os
+import random
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('TEST_ENV', 'true')
+
+import firebase_clients
+from fake_backends import FakeBucket, FakeFirestore, FakeSMTPServer
+
+GPS_IFD_TAG = 0x8825
+
+
+def _to_dms(value):
+    value = abs(value)
+    degrees = int(value)
+    minutes = int((value - degrees) * 60)
+    seconds = round((value - degrees - minutes / 60) * 3600, 4)
+    return float(degrees), float(minutes), float(seconds)
+
+
+def make_gps_jpeg(target_bytes, latitude=None, longitude=None, rng=None):
+    """
+    Returns a JPEG of roughly target_bytes. Noise pixels keep the encoder from compressing the
+    image below the requested size. GPS EXIF tags are written when latitude/longitude are given.
+    """
+    from PIL import Image
+
+    rng = rng or random.Random()
+    exif = Image.Exif()
+    if latitude is not None and longitude is not None:
+        exif[GPS_IFD_TAG] = {
+            1: 'N' if latitude >= 0 else 'S', 2: _to_dms(latitude),
+            3: 'E' if longitude >= 0 else 'W', 4: _to_dms(longitude),
+        }
+
+    def encode(side):
+        image = Image.frombytes('RGB', (side, side), rng.randbytes(side * side * 3))
+        output = io.BytesIO()
+        image.save(output, format='JPEG', quality=85, exif=exif)
+        return output.getvalue()
+
+    side = max(16, int(math.sqrt(target_bytes / 0.9)))
+    data = encode(side)
+    # One correction step is enough: JPEG size of noise grows linearly with the pixel count.
+    corrected = max(16, int(side * math.sqrt(target_bytes / len(data))))
+    return encode(corrected) if abs(corrected - side) > 1 else data
+
+
+def build_image_pool(size, attachment_bytes, gps_ratio, seed=42):
+    """Returns `size` base64-encoded JPEGs; about gps_ratio of them carry GPS EXIF tags."""
+    rng = random.Random(seed)
+    pool = []
+    for _ in range(size):
+        if rng.random() < gps_ratio:
+            jpeg = make_gps_jpeg(attachment_bytes, rng.uniform(-60, 60), rng.uniform(-170, 170), rng)
+        else:
+            jpeg = make_gps_jpeg(attachment_bytes, rng=rng)
+        pool.append((base64.b64encode(jpeg).decode('ascii'), len(jpeg)))
+    return pool
+
+
+def make_postmark_payload(sender, index, image_pool, attachments, rng, subject_location=True):
+    """
+    Builds an inbound payload shaped like Postmark's: FromFull, Subject, TextBody, HtmlBody and
+    Attachments with base64 Content. Images without GPS EXIF fall back to the subject coordinates
+    when subject_location is set.
+    """
+    subject = f'Reply {index}'
+    if subject_location:
+        subject += f' lat:{rng.uniform(-60, 60):.5f},lng:{rng.uniform(-170, 170):.5f}'
+    items = []
+    for number in range(attachments):
+        content, length = image_pool[rng.randrange(len(image_pool))]
+        items.append({
+            'Name': f'IMG_{index:05d}_{number}.jpg', 'ContentType': 'image/jpeg',
+            'Content': content, 'ContentLength': length, 'ContentID': '',
+        })
+    return {
+        'From': sender, 'FromName': sender.split('@')[0], 'FromFull': {'Email': sender, 'Name': sender.split('@')[0]},
+        'To': 'inbound@example.com', 'Subject': subject,
+        'MessageID': f'load-{index:06d}', 'Date': datetime.now(timezone.utc).strftime('%a, %d %b %Y %H:%M:%S %z'),
+        'TextBody': f'Synthetic inbound email {index}', 'HtmlBody': f'<p>Synthetic inbound email {index}</p>',
+        'Attachments': items,
+    }
+
+
+def _percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+
+def _max_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def _outcome(response):
+    """Classifies a response by the handler's result dict: (is_success, breakdown key)."""
+    try:
+        body = response.get_json(silent=True) or {}
+    except Exception:
+        body = {}
+    status = body.get('status', 'no_json')
+    if response.status_code == 200 and status == 'success':
+        return True, None
+    return False, f"{response.status_code} {status}: {body.get('message', '')}"
+
+
+def run_load(requests=200, rps=20.0, concurrency=8, attachments=2, attachment_kb=200, gps_ratio=0.8,
+             senders=50, new_sender_ratio=0.2, latency_ms=0.0, smtp_latency_ms=0.0, image_pool_size=16,
+             subject_location=True, trace_memory=False, seed=42):
+    """Runs one load test and returns a dict of results."""
+    rng = random.Random(seed)
+    latency = latency_ms / 1000.0
+    db = FakeFirestore(latency=latency)
+    bucket = FakeBucket('load-bucket', latency=latency)
+    smtp = FakeSMTPServer(latency=smtp_latency_ms / 1000.0)
+
+    known = [f'sender{index}@example.com' for index in range(senders)]
+    for index, email in enumerate(known):
+        db.put_document('users', f'sender-{index}', {
+            'uid': f'sender-{index}', 'email': email, 'displayName': f'Sender {index}',
+            'provider': 'email_webhook', 'photo_upload_count_current_month': 0,
+        })
+
+    image_pool = build_image_pool(image_pool_size, attachment_kb * 1024, gps_ratio, seed)
+    payloads = []
+    for index in range(requests):
+        sender = (f'new{index}@example.com' if rng.random() < new_sender_ratio else rng.choice(known))
+        payloads.append(make_postmark_payload(sender, index, image_pool, attachments, rng, subject_location))
+
+    firebase_clients.use_clients(db=db, bucket=bucket)
+    import app as app_module
+    import email_utils
+
+    patches = [
+        mock.patch('smtplib.SMTP', smtp.connect),
+        mock.patch.object(email_utils, 'SMTP_USERNAME', 'load-test'),
+        mock.patch.object(email_utils, 'SMTP_PASSWORD', 'load-test'),
+    ]
+    for patcher in patches:
+        patcher.start()
+    try:
+        flask_app = app_module.create_app({
+            'TESTING': True, 'PHOTO_UPLOAD_LIMIT': 10 ** 6, 'LOG_LEVEL': 'WARNING', 'METRICS_ENABLED': False,
+        })
+        url = f'/webhook/postmark?token={app_module.INBOUND_URL_TOKEN}'
+        local = threading.local()
+        lock = threading.Lock()
+        latencies, lags, breakdown = [], [], Counter()
+        totals = {'succeeded': 0, 'failed': 0, 'content_items': 0}
+
+        def send(payload, scheduled):
+            client = getattr(local, 'client', None)
+            if client is None:
+                client = local.client = flask_app.test_client()
+            started = time.perf_counter()
+            try:
+                response = client.post(url, json=payload)
+                ok, key = _outcome(response)
+                body = response.get_json(silent=True) or {}
+            except Exception as e:
+                ok, key, body = False, f'exception {type(e).__name__}: {e}', {}
+            finished = time.perf_counter()
+            with lock:
+                latencies.append((finished - started) * 1000)
+                lags.append(max(0.0, started - scheduled) * 1000)
+                totals['succeeded' if ok else 'failed'] += 1
+                totals['content_items'] += len(body.get('contentIds') or ())
+                if key:
+                    breakdown[key] += 1
+
+        rss_before = _max_rss_mb()
+        if trace_memory:
+            tracemalloc.start()
+        interval = 1.0 / rps if rps > 0 else 0.0
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='webhook-load') as executor:
+            for index, payload in enumerate(payloads):
+                scheduled = started + index * interval
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(send, payload, scheduled)
+        elapsed = time.perf_counter() - started
+        traced_peak_mb = None
+        if trace_memory:
+            traced_peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            tracemalloc.stop()
+    finally:
+        for patcher in reversed(patches):
+            patcher.stop()
+        firebase_clients.use_clients()
+
+    return {
+        'requests': requests,
+        'elapsed_s': round(elapsed, 3),
+        'target_rps': rps,
+        'throughput_rps': round(requests / elapsed, 2) if elapsed else 0.0,
+        'latency_ms': {
+            'p50': round(_percentile(latencies, 0.50), 2),
+            'p90': round(_percentile(latencies, 0.90), 2),
+            'p99': round(_percentile(latencies, 0.99), 2),
+            'max': round(max(latencies, default=0.0), 2),
+        },
+        'schedule_lag_ms_p99': round(_percentile(lags, 0.99), 2),
+        'succeeded': totals['succeeded'],
+        'failed': totals['failed'],
+        'content_items_created': totals['content_items'],
+        'emails_sent': len(smtp.messages),
+        'errors': dict(breakdown.most_common()),
+        'max_rss_mb': round(_max_rss_mb(), 1),
+        'max_rss_growth_mb': round(_max_rss_mb() - rss_before, 1),
+        'traced_peak_mb': round(traced_peak_mb, 1) if traced_peak_mb is not None else None,
+        'rpc_counts': {**db.rpc_counts, **bucket.rpc_counts, **smtp.rpc_counts},
+    }
+
+
+def print_report(result):
+    latency = result['latency_ms']
+    print(f"Requests:        {result['requests']} in {result['elapsed_s']} s "
+          f"({result['throughput_rps']} req/s, target {result['target_rps']})")
+    print(f"Latency ms:      p50 {latency['p50']}  p90 {latency['p90']}  p99 {latency['p99']}  max {latency['max']}")
+    print(f"Schedule lag:    p99 {result['schedule_lag_ms_p99']} ms (requests waiting for a free worker)")
+    print(f"Outcome:         {result['succeeded']} succeeded, {result['failed']} failed or partial; "
+          f"{result['content_items_created']} items created, {result['emails_sent']} emails sent")
+    memory = f"Memory:          max RSS {result['max_rss_mb']} MB (+{result['max_rss_growth_mb']} MB during the run)"
+    if result['traced_peak_mb'] is not None:
+        memory += f", traced Python peak {result['traced_peak_mb']} MB"
+    print(memory)
+    if result['errors']:
+        print("Error breakdown:")
+        for key, count in result['errors'].items():
+            print(f"  {count:>6}  {key}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay synthetic Postmark inbound emails against the webhook.')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--rps', type=float, default=20.0, help='Target request rate (0 = as fast as possible).')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--attachments', type=int, default=2, help='Image attachments per email.')
+    parser.add_argument('--attachment-kb', type=int, default=200, help='Approximate size of each JPEG.')
+    parser.add_argument('--gps-ratio', type=float, default=0.8, help='Share of images carrying GPS EXIF.')
+    parser.add_argument('--no-subject-location', action='store_true',
+                        help='Omit subject coordinates so images without GPS EXIF are rejected.')
+    parser.add_argument('--senders', type=int, default=50, help='Existing users sending emails.')
+    parser.add_argument('--new-sender-ratio', type=float, default=0.2, help='Share of emails from unknown senders.')
+    parser.add_argument('--image-pool', type=int, default=16, help='Distinct JPEGs to generate.')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Latency of each Firestore/GCS RPC.')
+    parser.add_argument('--smtp-latency-ms', type=float, default=0.0, help='Latency of each SMTP command.')
+    parser.add_argument('--tracemalloc', action='store_true', help='Also report the traced Python heap peak (slower).')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', action='store_true', help='Print the result as JSON.')
+    args = parser.parse_args(argv)
+
+    result = run_load(
+        requests=args.requests, rps=args.rps, concurrency=args.concurrency, attachments=args.attachments,
+        attachment_kb=args.attachment_kb, gps_ratio=args.gps_ratio, senders=args.senders,
+        new_sender_ratio=args.new_sender_ratio, latency_ms=args.latency_ms, smtp_latency_ms=args.smtp_latency_ms,
+        image_pool_size=args.image_pool, subject_location=not args.no_subject_location,
+        trace_memory=args.tracemalloc, seed=args.seed,
+    )
+    if args.json:
+        print(json.dumps(result, indent=2, sort_keys=True))
+    else:
+        print_report(result)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+Response compression.
+
+init_app installs an after_request hook that gzip- or brotli-encodes text responses (HTML with
+the inline map JSON, JSON API responses, ...) for clients that accept it. Small bodies are left
+alone (COMPRESSION_MIN_SIZE), and streamed responses are compressed chunk by chunk with a sync
+flush after each chunk, so every chunk still reaches the client as soon as it is produced.
+File responses (send_file) are not touched: static assets and map snapshots are compressed
+ahead of time and served with send_precompressed instead.
+
+brotli is used when the optional `brotli` package is installed and the client accepts it.
+"""
+
+import gzip
+import os
+import zlib
+
+from flask import request, send_file
+
+DEFAULT_MIN_SIZE = 500
+DEFAULT_GZIP_LEVEL = 6
+DEFAULT_BROTLI_QUALITY = 5  # Fast enough for on-the-fly compression
+COMPRESSIBLE_MIMETYPES = frozenset({
+    'application/json', 'application/javascript', 'application/xml', 'image/svg+xml',
+    'application/vnd.mailmap.map-columns+json',
+})
+PRECOMPRESSED_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def _is_compressible(mimetype):
+    return bool(mimetype) and (mimetype.startswith('text/') or mimetype in COMPRESSIBLE_MIMETYPES)
+
+
+def choose_encoding(accept_encodings, available=('br', 'gzip')):
+    """Returns the preferred encoding among `available` that the client accepts, or None."""
+    for encoding in available:
+        if encoding == 'br' and brotli is None:
+            continue
+        if accept_encodings[encoding]:
+            return encoding
+    return None
+
+
+def _compress(data, encoding, config):
+    if encoding == 'br':
+        return brotli.compress(data, quality=int(config.get('COMPRESSION_BROTLI_QUALITY', DEFAULT_BROTLI_QUALITY)))
+    return gzip.compress(data, compresslevel=int(config.get('COMPRESSION_GZIP_LEVEL', DEFAULT_GZIP_LEVEL)))
+
+
+def _compress_stream(chunks, encoding, config):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=int(config.get('COMPRESSION_BROTLI_QUALITY', DEFAULT_BROTLI_QUALITY)))
+        for chunk in chunks:
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+        return
+    # wbits 16 + MAX_WBITS writes a gzip header and trailer
+    compressor = zlib.compressobj(int(config.get('COMPRESSION_GZIP_LEVEL', DEFAULT_GZIP_LEVEL)),
+                                  zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def compress_response(response, config):
+    """Compresses response in place when the client, the content type and the size allow it."""
+    if (response.direct_passthrough or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers or not _is_compressible(response.mimetype)):
+        return response
+    if request.method == 'HEAD':
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding, config)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < int(config.get('COMPRESSION_MIN_SIZE', DEFAULT_MIN_SIZE)):
+            return response
+        response.set_data(_compress(data, encoding, config))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f'{etag}-{encoding}', weak=weak)
+    return response
+
+
+def send_precompressed(path, mimetype, cache_control=None):
+    """
+    Sends the file at path, or its .br/.gz sibling written at build time when the client accepts
+    that encoding. Returns None if path does not exist.
+    """
+    available = [encoding for encoding, suffix in PRECOMPRESSED_SUFFIXES.items() if os.path.exists(path + suffix)]
+    encoding = None
+    for candidate in available:
+        if request.accept_encodings[candidate]:
+            encoding = candidate
+            break
+    if encoding is None and not os.path.exists(path):
+        return None
+    response = send_file(path + PRECOMPRESSED_SUFFIXES[encoding] if encoding else path,
+                         mimetype=mimetype, conditional=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if cache_control:
+        response.headers['Cache-Control'] = cache_control
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_app(app):
+    """Installs the compression hook unless COMPRESSION_ENABLED is false."""
+
+    @app.after_request
+    def _compress_response(response):
+        if not app.config.get('COMPRESSION_ENABLED', True):
+            return response
+        return compress_response(response, app.config)
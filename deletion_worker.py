@@ -0,0 +1,175 @@
+"""
+Finishes content deletions recorded as tombstones in the 'contentDeletions' collection.
+
+firestore_utils.delete_content_item deletes the content document and writes a tombstone
+in the same batch. This module then deletes the Storage blob (a missing blob counts as
+deleted, so there is no exists() probe) and releases the author's photo quota in a
+transaction. Both steps are idempotent, so a tombstone is simply retried until it is
+gone. Failed tombstones are retried in-process with backoff; anything left over is
+picked up by running this module as a script (e.g. from cron):
+
+    python deletion_worker.py [limit]
+"""
+
+import logging
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from google.api_core.exceptions import NotFound
+
+import firebase_clients
+import firestore_utils
+import identity_map
+from firestore_utils import firestore, DELETION_TOMBSTONE_COLLECTION
+
+logger = logging.getLogger(__name__)
+
+STORAGE_DELETE_WORKERS = 16
+MAX_INLINE_ATTEMPTS = 5
+RETRY_BASE_DELAY_SECONDS = 2
+
+# Shared pool for deletions scheduled from request handlers.
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='deletion-worker')
+
+
+def _delete_blob(image_path, app_logger):
+    """
+    Deletes a blob without checking that it exists first. NotFound is treated as success.
+    Returns True when the blob is gone.
+    """
+    try:
+        firebase_clients.get_bucket().blob(image_path).delete()
+        app_logger.info(f"Image {image_path} deleted from Firebase Storage.")
+        return True
+    except NotFound:
+        app_logger.info(f"Image {image_path} was already missing from Firebase Storage.")
+        return True
+    except Exception as e:
+        app_logger.error(f"Error deleting image {image_path} from Firebase Storage: {e}", exc_info=True)
+        return False
+
+
+def _release_photo_quota(db, tombstone_ref, author_id):
+    """
+    Decrements the author's photo counter (never below zero) and flags the tombstone
+    as released in one transaction, so the decrement happens exactly once.
+    """
+    @firestore.transactional
+    def release(transaction):
+        tombstone_snapshot = tombstone_ref.get(transaction=transaction)
+        if not tombstone_snapshot.exists or tombstone_snapshot.to_dict().get('quotaReleased'):
+            return
+        user_ref = db.collection('users').document(author_id) if author_id else None
+        user_snapshot = user_ref.get(transaction=transaction) if user_ref else None
+        # All reads must happen before the first write in a transaction.
+        if user_snapshot and user_snapshot.exists and \
+                user_snapshot.to_dict().get('photo_upload_count_current_month', 0) > 0:
+            transaction.update(user_ref, {'photo_upload_count_current_month': firestore.Increment(-1)})
+        transaction.update(tombstone_ref, {'quotaReleased': True})
+
+    release(db.transaction())
+    if author_id:
+        identity_map.forget('users', author_id)
+
+
+def process_tombstone(content_id, app_logger, tombstone_data=None):
+    """
+    Performs the outstanding cleanup for one tombstone and deletes it when done.
+    Pass tombstone_data when the caller already holds it to skip the read.
+    Returns a dictionary with 'status' ('done', 'pending' or 'missing') and 'imageDeleted'.
+    """
+    db = firestore_utils.get_db_client()
+    tombstone_ref = db.collection(DELETION_TOMBSTONE_COLLECTION).document(content_id)
+    try:
+        if tombstone_data is None:
+            tombstone_snapshot = tombstone_ref.get()
+            if not tombstone_snapshot.exists:
+                return {'status': 'missing', 'imageDeleted': False}
+            tombstone_data = tombstone_snapshot.to_dict()
+
+        storage_deleted = tombstone_data.get('storageDeleted', False)
+        if not storage_deleted:
+            storage_deleted = _delete_blob(tombstone_data.get('imagePath'), app_logger)
+
+        quota_released = tombstone_data.get('quotaReleased', False)
+        quota_error = None
+        if not quota_released:
+            try:
+                _release_photo_quota(db, tombstone_ref, tombstone_data.get('userId'))
+                quota_released = True
+            except Exception as e:
+                quota_error = e
+                app_logger.error(f"Error releasing photo quota for deleted content {content_id}: {e}", exc_info=True)
+
+        if storage_deleted and quota_released:
+            tombstone_ref.delete()
+            app_logger.info(f"Deletion of content {content_id} completed.")
+            return {'status': 'done', 'imageDeleted': bool(tombstone_data.get('imagePath'))}
+
+        tombstone_ref.update({
+            'storageDeleted': storage_deleted,
+            'attempts': firestore.Increment(1),
+            'lastError': str(quota_error) if quota_error else 'Storage delete failed'
+        })
+        return {'status': 'pending', 'imageDeleted': False}
+    except Exception as e:
+        app_logger.error(f"Error processing deletion tombstone for content {content_id}: {e}", exc_info=True)
+        return {'status': 'pending', 'imageDeleted': False}
+
+
+def process_tombstones(tombstones, app_logger):
+    """
+    Processes {content_id: tombstone_data} in parallel.
+    Returns {content_id: result} as produced by process_tombstone.
+    """
+    if not tombstones:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(STORAGE_DELETE_WORKERS, len(tombstones))) as executor:
+        futures = {content_id: executor.submit(process_tombstone, content_id, app_logger, data)
+                   for content_id, data in tombstones.items()}
+        return {content_id: future.result() for content_id, future in futures.items()}
+
+
+def schedule_deletion(content_id, app_logger, attempt=1):
+    """
+    Processes a tombstone in the background. Retries with exponential backoff up to
+    MAX_INLINE_ATTEMPTS; after that the tombstone waits for process_pending_deletions.
+    """
+    def run():
+        result = process_tombstone(content_id, app_logger)
+        if result['status'] != 'pending':
+            return
+        if attempt >= MAX_INLINE_ATTEMPTS:
+            app_logger.warning(f"Deletion of content {content_id} still pending after {attempt} attempts; "
+                               f"leaving it for the next sweep.")
+            return
+        timer = threading.Timer(RETRY_BASE_DELAY_SECONDS * 2 ** (attempt - 1),
+                                schedule_deletion, args=(content_id, app_logger, attempt + 1))
+        timer.daemon = True
+        timer.start()
+
+    return _executor.submit(run)
+
+
+def process_pending_deletions(app_logger, limit=500):
+    """
+    Sweeps leftover tombstones (crashes, exhausted retries) and processes them in parallel.
+    Returns a dictionary with counts per result status.
+    """
+    db = firestore_utils.get_db_client()
+    tombstone_docs = db.collection(DELETION_TOMBSTONE_COLLECTION).limit(limit).stream()
+    tombstones = {doc.id: doc.to_dict() for doc in tombstone_docs}
+    results = process_tombstones(tombstones, app_logger)
+    counts = {'done': 0, 'pending': 0, 'missing': 0}
+    for result in results.values():
+        counts[result['status']] += 1
+    app_logger.info(f"Deletion sweep processed {len(results)} tombstones: {counts}")
+    return counts
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+
+    sweep_limit = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    process_pending_deletions(logger, limit=sweep_limit)
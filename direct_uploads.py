@@ -0,0 +1,358 @@
+"""
+Photo uploads that go from the browser straight to Storage.
+
+POST /api/content/create streams the image through a Flask worker, which holds it in memory and
+uploads it to Storage again. With direct uploads the worker only signs and checks:
+
+1. reserve_upload (POST /api/uploads) validates the declared file name and size, takes one photo
+   of the user's monthly quota in a transaction that also records the reservation in
+   'uploadReservations', and returns a V4 signed PUT URL for a new object name. Storage itself
+   enforces the signed Content-Type, through the signed x-goog-content-length-range header the
+   size limit and, through x-goog-if-generation-match: 0, that the object is only created once.
+2. The browser PUTs the file to that URL.
+3. finalize_upload (POST /api/uploads/<upload_id>/finalize) checks the stored object: its size,
+   content type and magic bytes, read with one ranged download of the first EXIF_READ_BYTES,
+   which also hold the EXIF GPS position used when the client sends no coordinates. It then
+   creates the post and deletes the reservation in one transaction, which first checks that the
+   reservation is still claimed by this call; the quota was already counted.
+
+An object that fails the checks is deleted and its quota given back. Reservations that are never
+finalized are released once they expire, and reservations left 'finalizing' by a process that
+died are released FINALIZE_CLAIM_TIMEOUT after they were claimed, by running this module as a
+script (e.g. from cron):
+
+    python direct_uploads.py [limit]
+
+Signing needs credentials with a private key (a service account key file); plain Compute Engine
+or Cloud Run credentials cannot sign V4 URLs.
+"""
+
+import logging
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from google.api_core.exceptions import NotFound
+from werkzeug.utils import secure_filename
+
+import firebase_clients
+import firestore_utils
+import identity_map
+import image_utils
+import unit_of_work
+from firestore_utils import firestore
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_RESERVATION_COLLECTION = 'uploadReservations'
+DEFAULT_URL_EXPIRATION = timedelta(minutes=15)
+# A reservation can still be finalized this long after its URL expired (an upload started at the
+# last moment), and is only released after that.
+FINALIZE_GRACE_PERIOD = timedelta(minutes=15)
+# A finalize call takes seconds; a claim this old belongs to a call that will never finish.
+FINALIZE_CLAIM_TIMEOUT = timedelta(minutes=10)
+# EXIF (APP1) is at the start of a JPEG and at most 64 KB long.
+EXIF_READ_BYTES = 128 * 1024
+
+CONTENT_TYPES = image_utils.IMAGE_CONTENT_TYPES
+
+
+def _error(message, http_code):
+    return {'status': 'error', 'message': message, 'http_code': http_code}
+
+
+def reserve_upload(user_id, filename, size, app_logger, bucket, allowed_extensions, max_image_size,
+                   photo_upload_limit, url_expiration=DEFAULT_URL_EXPIRATION):
+    """
+    Reserves one photo of the user's quota and returns the signed URL to PUT the file to.
+    Returns a dictionary with status and either the upload details or an error, plus http_code.
+    """
+    if not user_id:
+        app_logger.warning("Upload reservation: User ID missing.")
+        return _error('User ID is required.', 400)
+    file_extension = os.path.splitext(secure_filename(filename or ''))[1].lower().lstrip('.')
+    if file_extension not in allowed_extensions or file_extension not in CONTENT_TYPES:
+        app_logger.warning("Upload reservation: Unsupported image type %r from user %s.", filename, user_id)
+        return _error('Unsupported image type.', 400)
+    if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+        return _error('The file size is required.', 400)
+    if size > max_image_size:
+        app_logger.warning("Upload reservation: Image %r from user %s too large: %s bytes.", filename, user_id, size)
+        return _error(f'Image size exceeds limit of {max_image_size // (1024 * 1024)}MB.', 400)
+
+    upload_id = uuid.uuid4().hex
+    object_name = f"{user_id}/{upload_id}.{file_extension}"
+    content_type = CONTENT_TYPES[file_extension]
+    upload_headers = {'Content-Type': content_type, 'x-goog-content-length-range': f'0,{max_image_size}',
+                      'x-goog-if-generation-match': '0'}
+    url_expires_at = datetime.now(timezone.utc) + url_expiration
+    try:
+        # Signing is local, so it happens before any quota is taken.
+        upload_url = bucket.blob(object_name).generate_signed_url(
+            version='v4', expiration=url_expires_at, method='PUT', content_type=content_type,
+            headers={name: value for name, value in upload_headers.items() if name != 'Content-Type'})
+    except Exception as e:
+        app_logger.error("Upload reservation: Could not sign an upload URL for %s: %s", object_name, e, exc_info=True)
+        return _error('Direct uploads are not available.', 500)
+
+    db = firestore_utils.get_db_client()
+    user_ref = db.collection('users').document(user_id)
+    reservation_ref = db.collection(UPLOAD_RESERVATION_COLLECTION).document(upload_id)
+
+    @firestore.transactional
+    def reserve(transaction):
+        user_snapshot = user_ref.get(transaction=transaction)
+        if not user_snapshot.exists:
+            return _error('User not found.', 404)
+        photo_count = user_snapshot.to_dict().get('photo_upload_count_current_month', 0)
+        if photo_count >= photo_upload_limit:
+            app_logger.warning("Upload reservation: User %s reached photo upload limit (%s/%s).",
+                               user_id, photo_count, photo_upload_limit)
+            return _error(f"Photo upload limit of {photo_upload_limit} reached for this month.", 403)
+        transaction.update(user_ref, {'photo_upload_count_current_month': firestore.Increment(1)})
+        transaction.set(reservation_ref, {
+            'userId': user_id, 'objectName': object_name, 'contentType': content_type,
+            'maxBytes': max_image_size, 'status': 'pending', 'createdAt': firestore.SERVER_TIMESTAMP,
+            'expiresAt': url_expires_at + FINALIZE_GRACE_PERIOD,
+        })
+        return None
+
+    try:
+        error = reserve(db.transaction())
+    except Exception as e:
+        app_logger.error("Upload reservation: Transaction failed for user %s: %s", user_id, e, exc_info=True)
+        return _error('Could not reserve the upload.', 500)
+    identity_map.forget('users', user_id)
+    if error:
+        return error
+
+    app_logger.info("Upload reservation %s created for user %s: %s.", upload_id, user_id, object_name)
+    return {'status': 'success', 'uploadId': upload_id, 'objectName': object_name, 'uploadUrl': upload_url,
+            'uploadHeaders': upload_headers, 'expiresAt': url_expires_at.isoformat(), 'http_code': 201}
+
+
+def _check_object(blob, head, reservation):
+    """Returns why the uploaded object cannot be published, or None."""
+    if not blob.size or blob.size > reservation['maxBytes']:
+        return f"size {blob.size}"
+    if blob.content_type != reservation['contentType']:
+        return f"content type {blob.content_type}"
+    if image_utils.sniff_image_type(head) != reservation['contentType']:
+        return "content does not match its type"
+    return None
+
+
+def _claim_reservation(db, reservation_ref, user_id):
+    """
+    Moves a pending reservation of user_id to 'finalizing' so that concurrent finalize calls
+    cannot create two posts from one upload. Its claimedAt identifies this claim and lets the
+    sweep release it if the call never finishes. Returns (reservation data, error response).
+    """
+    @firestore.transactional
+    def claim(transaction):
+        snapshot = reservation_ref.get(transaction=transaction)
+        if not snapshot.exists:
+            return None, _error('Upload not found.', 404)
+        reservation = snapshot.to_dict()
+        if reservation.get('userId') != user_id:
+            return None, _error('This upload belongs to another user.', 403)
+        if reservation['expiresAt'] <= datetime.now(timezone.utc):
+            return None, _error('The upload has expired.', 410)
+        if reservation.get('status') != 'pending':
+            return None, _error('The upload is already being finalized.', 409)
+        claimed_at = datetime.now(timezone.utc)
+        transaction.update(reservation_ref, {'status': 'finalizing', 'claimedAt': claimed_at})
+        return dict(reservation, status='finalizing', claimedAt=claimed_at), None
+
+    return claim(db.transaction())
+
+
+def _is_claim(snapshot, reservation):
+    """Whether the stored reservation is still in the state (status and claim) of reservation."""
+    if not snapshot.exists:
+        return False
+    data = snapshot.to_dict()
+    return data.get('status') == reservation['status'] and data.get('claimedAt') == reservation.get('claimedAt')
+
+
+def _commit_finalized(db, reservation_ref, reservation, writes):
+    """
+    Commits the collected post writes and the deletion of the reservation in one transaction,
+    if the reservation is still claimed by this call. Returns whether they were committed.
+    """
+    @firestore.transactional
+    def commit(transaction):
+        if not _is_claim(reservation_ref.get(transaction=transaction), reservation):
+            return False
+        writes.write_to(transaction)
+        transaction.delete(reservation_ref)
+        return True
+
+    return commit(db.transaction())
+
+
+def _reopen_reservation(db, reservation_ref, reservation):
+    """Moves a reservation still claimed by this call back to 'pending'."""
+    @firestore.transactional
+    def reopen(transaction):
+        if _is_claim(reservation_ref.get(transaction=transaction), reservation):
+            transaction.update(reservation_ref, {'status': 'pending', 'claimedAt': firestore.DELETE_FIELD})
+
+    reopen(db.transaction())
+
+
+def finalize_upload(upload_id, user_id, form_data, app_logger, bucket, trust_client_exif=False):
+    """
+    Verifies the uploaded object of a reservation and creates the post from it.
+    form_data may hold 'text', 'latitude' and 'longitude'; without coordinates the EXIF GPS
+    position of the photo is used: the one the browser read ('exifLatitude'/'exifLongitude') if
+    trust_client_exif is set, else the one read here. Returns the same dictionary as
+    create_new_content_from_api.
+    """
+    if not user_id:
+        app_logger.warning("Upload finalize: User ID missing for upload %s.", upload_id)
+        return _error('User ID is required.', 400)
+    db = firestore_utils.get_db_client()
+    reservation_ref = db.collection(UPLOAD_RESERVATION_COLLECTION).document(upload_id)
+    try:
+        reservation, error = _claim_reservation(db, reservation_ref, user_id)
+    except Exception as e:
+        app_logger.error("Upload finalize: Could not read reservation %s: %s", upload_id, e, exc_info=True)
+        return _error('An unexpected error occurred.', 500)
+    if error:
+        app_logger.warning("Upload finalize: Reservation %s of user %s: %s", upload_id, user_id, error['message'])
+        return error
+
+    content_id = None
+    try:
+        object_name = reservation['objectName']
+        blob = bucket.get_blob(object_name)
+        if blob is None:
+            app_logger.info("Upload finalize: %s has not been uploaded yet.", object_name)
+            return _error('The file has not been uploaded yet.', 409)
+
+        head = blob.download_as_bytes(start=0, end=EXIF_READ_BYTES - 1)
+        problem = _check_object(blob, head, reservation)
+        if problem:
+            app_logger.warning("Upload finalize: Rejected %s of user %s: %s.", object_name, user_id, problem)
+            _release_reservation(db, bucket, reservation_ref, reservation, app_logger, expected_status='finalizing')
+            reservation = None
+            return _error('The uploaded file is not a valid image within the size limit.', 400)
+
+        try:
+            latitude = float(form_data.get('latitude'))
+            longitude = float(form_data.get('longitude'))
+        except (TypeError, ValueError):
+            latitude = longitude = None
+            if trust_client_exif:
+                latitude, longitude = image_utils.validate_client_coordinates(
+                    form_data.get('exifLatitude'), form_data.get('exifLongitude'))
+            if latitude is None:
+                latitude, longitude = image_utils.extract_gps_coordinates(head)
+        if latitude is None or longitude is None:
+            app_logger.warning("Upload finalize: No coordinates for upload %s.", upload_id)
+            return _error('Latitude and longitude are required and must be numbers.', 400)
+
+        blob.make_public()
+        new_content_data = {
+            'text': form_data.get('text', ''),
+            'imageUrl': blob.public_url,
+            'latitude': latitude,
+            'longitude': longitude,
+            'userId': user_id,
+            'isAnonymous': True,
+        }
+        # The post, its index entry and the end of the reservation are committed together
+        with unit_of_work.collect(db) as writes:
+            content_id = firestore_utils.create_web_content_item(new_content_data, app_logger)
+        if content_id and not _commit_finalized(db, reservation_ref, reservation, writes):
+            app_logger.warning("Upload finalize: Reservation %s was released while it was being finalized.",
+                               upload_id)
+            content_id = reservation = None
+            return _error('The upload has expired.', 410)
+    except Exception as e:
+        app_logger.error("Upload finalize: Unexpected error for upload %s: %s", upload_id, e, exc_info=True)
+        content_id = None
+    finally:
+        if reservation is not None and not content_id:
+            # Lets the client retry (e.g. after uploading the file or adding coordinates)
+            try:
+                _reopen_reservation(db, reservation_ref, reservation)
+            except Exception as e:
+                app_logger.error("Upload finalize: Could not reopen reservation %s: %s", upload_id, e, exc_info=True)
+
+    if not content_id:
+        return _error('Failed to save content.', 500)
+    app_logger.info("Upload finalize: Content %s created from upload %s by user %s.", content_id, upload_id, user_id)
+    return {'status': 'success', 'message': 'Content created successfully', 'contentId': content_id,
+            'http_code': 201}
+
+
+def _release_reservation(db, bucket, reservation_ref, reservation, app_logger, expected_status='pending'):
+    """
+    Gives the photo back to the user's quota (never below zero) and deletes the reservation in
+    one transaction, if the reservation still has expected_status and the claim of reservation,
+    so the quota is returned exactly once and a reservation being finalized is left alone. The
+    uploaded object is only deleted once that transaction has committed. Returns whether the
+    reservation was released.
+    """
+    user_ref = db.collection('users').document(reservation['userId'])
+    expected = dict(reservation, status=expected_status)
+
+    @firestore.transactional
+    def release(transaction):
+        if not _is_claim(reservation_ref.get(transaction=transaction), expected):
+            return False
+        user_snapshot = user_ref.get(transaction=transaction)
+        # All reads must happen before the first write in a transaction.
+        if user_snapshot.exists and user_snapshot.to_dict().get('photo_upload_count_current_month', 0) > 0:
+            transaction.update(user_ref, {'photo_upload_count_current_month': firestore.Increment(-1)})
+        transaction.delete(reservation_ref)
+        return True
+
+    if not release(db.transaction()):
+        app_logger.info("Upload reservation %s is no longer %s; not released.", reservation_ref.id, expected_status)
+        return False
+    identity_map.forget('users', reservation['userId'])
+    try:
+        bucket.blob(reservation['objectName']).delete()
+    except NotFound:
+        pass
+    app_logger.info("Upload reservation %s released for user %s.", reservation_ref.id, reservation['userId'])
+    return True
+
+
+def release_expired_reservations(app_logger, limit=500, bucket=None):
+    """
+    Releases pending reservations that expired without being finalized and 'finalizing' ones
+    claimed more than FINALIZE_CLAIM_TIMEOUT ago, oldest first, up to limit of each.
+    Returns the number released.
+    """
+    db = firestore_utils.get_db_client()
+    bucket = bucket or firebase_clients.get_bucket()
+    now = datetime.now(timezone.utc)
+    released = 0
+    sweeps = (('pending', 'expiresAt', now), ('finalizing', 'claimedAt', now - FINALIZE_CLAIM_TIMEOUT))
+    for status, field, cutoff in sweeps:
+        # Filtered by status so that rows the sweep must leave alone never use up the limit
+        stale = db.collection(UPLOAD_RESERVATION_COLLECTION) \
+            .where(field_path='status', op_string='==', value=status) \
+            .where(field_path=field, op_string='<', value=cutoff) \
+            .order_by(field).limit(limit).stream()
+        for snapshot in stale:
+            try:
+                if _release_reservation(db, bucket, snapshot.reference, snapshot.to_dict(), app_logger,
+                                        expected_status=status):
+                    released += 1
+            except Exception as e:
+                app_logger.error("Error releasing upload reservation %s: %s", snapshot.id, e, exc_info=True)
+    app_logger.info("Released %s expired upload reservations.", released)
+    return released
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+
+    sweep_limit = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    release_expired_reservations(logger, limit=sweep_limit)
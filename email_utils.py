@@ -19,14 +19,11 @@ logger = logging.getLogger(__name__)
 #     logger.addHandler(ch)
 
 
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.header import Header
-from email.utils import formataddr
-
 from flask import render_template
 
+import metrics
+import unit_of_work
+
 # Environment variables for email configuration
 POSTMARK_SERVER_TOKEN = os.environ.get("POSTMARK_SERVER_TOKEN", "YOUR_POSTMARK_SERVER_TOKEN_HERE")
 SENDER_EMAIL_ADDRESS = os.environ.get("SENDER_EMAIL_ADDRESS", "noreply@example.com")
@@ -49,8 +46,24 @@ SMTP_USERNAME = os.environ.get("SMTP_USERNAME", POSTMARK_SERVER_TOKEN)  # Defaul
 SMTP_PASSWORD = os.environ.get("SMTP_PASSWORD", POSTMARK_SERVER_TOKEN)  # Default to POSTMARK_SERVER_TOKEN
 
 
+def _smtp_imports():
+    """
+    Imports smtplib and the MIME helpers on first use; they are only needed when an email
+    is actually sent, so importing this module stays cheap.
+    """
+    import smtplib
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+    from email.header import Header
+    from email.utils import formataddr
+    return smtplib, MIMEMultipart, MIMEText, Header, formataddr
+
+
 def create_email_notification_record(db_client, content_id, recipient_email):
-    """Creates a record in Firestore about the need to send an email notification."""
+    """
+    Creates a record in Firestore about the need to send an email notification. Inside
+    unit_of_work.begin() the write joins the current unit of work.
+    """
     try:
         if not all([db_client, content_id, recipient_email]):
             logger.error("Missing required parameters for creating email notification record.")
@@ -72,7 +85,8 @@ def create_email_notification_record(db_client, content_id, recipient_email):
             }
         }
         doc_ref = db_client.collection('emailNotifications').document()
-        doc_ref.set(notification_data)
+        with unit_of_work.begin(db_client) as batch:
+            batch.set(doc_ref, notification_data)
         logger.info(f"Email notification record created: {doc_ref.id} for {recipient_email}")
         return doc_ref.id
     except Exception as e:
@@ -80,10 +94,12 @@ def create_email_notification_record(db_client, content_id, recipient_email):
         return None
 
 
+@metrics.timed('smtp', 'send_pending_notification')
 def send_pending_notification(db_client, notification_id, app_context=None):
     """
     Loads a pending notification, sends an email using an HTML template, and updates its status.
     """
+    smtplib, MIMEMultipart, MIMEText, Header, formataddr = _smtp_imports()
     notification_ref = db_client.collection('emailNotifications').document(notification_id)
     notification_doc = None
     try:
@@ -268,6 +284,7 @@ def send_verification_email(recipient_email, verification_link, app_context=None
         verification_link (str): The email verification link.
         app_context: Flask application context, required for render_template.
     """
+    smtplib, MIMEMultipart, MIMEText, Header, formataddr = _smtp_imports()
     subject_text = "Verify your email for MailMap"
     logger.info(f"Preparing to send verification email to {recipient_email} using link: {verification_link}")
 
@@ -0,0 +1,1096 @@
+"""
+In-memory stand-ins for the Google Cloud services used by MailMap.
+
+They implement only the subset of the client APIs that this code base calls and are
+meant for tests, benchmarks and local tooling runs, not for production use.
+
+Both fakes count the RPCs a real client would make (``rpc_counts``) and can inject a
+per-RPC latency, in seconds or as a callable of the operation name, so that benchmarks
+reflect the round trips of a data access pattern and not only its CPU cost.
+
+FakeAsyncFirestore exposes a FakeFirestore through the google.cloud.firestore.AsyncClient
+interface; its latency is awaited (asyncio.sleep) instead of blocking the calling thread.
+"""
+
+import asyncio
+import contextvars
+import copy
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from google.api_core.exceptions import AlreadyExists, InvalidArgument, NotFound
+from google.cloud.firestore_v1 import transforms
+from google.cloud.firestore_v1.watch import ChangeType, DocumentChange
+
+MAX_BATCH_WRITES = 500
+
+# False while FakeAsyncFirestore runs a synchronous operation; it then awaits the latency itself.
+_blocking_latency = contextvars.ContextVar('blocking_latency', default=True)
+
+
+class _RpcRecorder:
+    """Thread-safe RPC counters plus optional latency injection shared by the fakes."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.rpc_counts = {}
+        self._lock = threading.RLock()
+
+    def _record(self, operation, amount=1, rpc=True):
+        with self._lock:
+            self.rpc_counts[operation] = self.rpc_counts.get(operation, 0) + amount
+        if rpc and _blocking_latency.get():
+            delay = self._delay(operation)
+            if delay:
+                time.sleep(delay)
+
+    def _delay(self, operation):
+        if not self.latency:
+            return 0
+        return self.latency(operation) if callable(self.latency) else self.latency
+
+    def reset_rpc_counts(self):
+        with self._lock:
+            self.rpc_counts = {}
+
+    def total_rpcs(self):
+        """Number of round trips recorded so far (document counters are not RPCs)."""
+        with self._lock:
+            return sum(count for operation, count in self.rpc_counts.items()
+                       if not operation.endswith('.documents_read') and not operation.endswith('.documents_written'))
+
+
+class FakeBlob:
+    """Subset of google.cloud.storage.Blob backed by a FakeBucket."""
+
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.size = None
+        self.content_type = None
+        self.time_created = None
+
+    @property
+    def public_url(self):
+        return f"https://storage.googleapis.com/{self.bucket.name}/{self.name}"
+
+    def exists(self):
+        self.bucket._record('storage.exists')
+        return self.name in self.bucket._objects
+
+    def upload_from_string(self, data, content_type=None):
+        self.bucket._record('storage.upload')
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.bucket._store(self.name, data, content_type or 'application/octet-stream')
+        self.reload()
+
+    def make_public(self):
+        self.bucket._record('storage.make_public')
+
+    def reload(self):
+        stored = self.bucket._objects.get(self.name)
+        if stored is None:
+            raise NotFound(f"No such object: {self.bucket.name}/{self.name}")
+        self.size = len(stored['data'])
+        self.content_type = stored['content_type']
+        self.time_created = stored['time_created']
+
+    def download_as_bytes(self, start=None, end=None):
+        self.bucket._record('storage.download')
+        stored = self.bucket._objects.get(self.name)
+        if stored is None:
+            raise NotFound(f"No such object: {self.bucket.name}/{self.name}")
+        data = stored['data']
+        if start is not None or end is not None:
+            # Like the real client, `end` is inclusive.
+            data = data[start or 0:(end + 1) if end is not None else None]
+        return data
+
+    def delete(self):
+        self.bucket._record('storage.delete')
+        with self.bucket._lock:
+            if self.bucket._objects.pop(self.name, None) is None:
+                raise NotFound(f"No such object: {self.bucket.name}/{self.name}")
+
+    def generate_signed_url(self, expiration, method='GET', content_type=None, headers=None, version=None,
+                            **kwargs):
+        """
+        Returns a URL that FakeBucket.put_signed_url accepts until `expiration` (a timedelta or
+        an aware datetime). Signing is local in the real client too, so no RPC is counted.
+        """
+        if isinstance(expiration, timedelta):
+            expiration = datetime.now(timezone.utc) + expiration
+        token = uuid.uuid4().hex
+        with self.bucket._lock:
+            self.bucket._signed_urls[token] = {
+                'name': self.name, 'method': method, 'content_type': content_type,
+                'headers': {name.lower(): value for name, value in (headers or {}).items()},
+                'expiration': expiration,
+            }
+        return f"{self.public_url}?X-Goog-Algorithm=GOOG4-RSA-SHA256&X-Goog-Signature={token}"
+
+
+class _FakeBlobIterator:
+    """Mimics the paged HTTPIterator returned by Bucket.list_blobs()."""
+
+    def __init__(self, bucket, names, page_size):
+        self._bucket = bucket
+        self._names = names
+        self._page_size = page_size
+
+    @property
+    def pages(self):
+        for start in range(0, len(self._names), self._page_size):
+            self._bucket._record('storage.list')
+            page = []
+            for name in self._names[start:start + self._page_size]:
+                blob = FakeBlob(self._bucket, name)
+                try:
+                    blob.reload()
+                except NotFound:
+                    continue  # Deleted while listing
+                page.append(blob)
+            yield page
+
+    def __iter__(self):
+        for page in self.pages:
+            yield from page
+
+
+class FakeBucket(_RpcRecorder):
+    """Thread-safe, in-memory subset of google.cloud.storage.Bucket."""
+
+    def __init__(self, name='fake-bucket', latency=0.0):
+        super().__init__(latency)
+        self.name = name
+        self._objects = {}
+        self._signed_urls = {}  # signature -> what FakeBlob.generate_signed_url signed
+
+    def _store(self, name, data, content_type, time_created=None):
+        with self._lock:
+            self._objects[name] = {
+                'data': data,
+                'content_type': content_type,
+                'time_created': time_created or datetime.now(timezone.utc)
+            }
+
+    def put_signed_url(self, url, data, headers=None):
+        """
+        Test helper: performs the browser's PUT to a URL from FakeBlob.generate_signed_url and
+        returns the HTTP status Storage would answer with. Like Storage, it rejects expired or
+        unknown signatures, a Content-Type or signed header that differs from the signed one
+        (403), a body outside a signed x-goog-content-length-range (400) and, with a signed
+        x-goog-if-generation-match of 0, a PUT to an object that already exists (412).
+        """
+        self._record('storage.upload')
+        headers = {name.lower(): value for name, value in (headers or {}).items()}
+        token = url.partition('X-Goog-Signature=')[2]
+        with self._lock:
+            signed = self._signed_urls.get(token)
+        if signed is None or signed['method'] != 'PUT' or signed['expiration'] <= datetime.now(timezone.utc):
+            return 403
+        if signed['content_type'] and headers.get('content-type') != signed['content_type']:
+            return 403
+        if any(headers.get(name) != value for name, value in signed['headers'].items()):
+            return 403
+        length_range = signed['headers'].get('x-goog-content-length-range')
+        if length_range:
+            low, high = (int(bound) for bound in length_range.split(','))
+            if not low <= len(data) <= high:
+                return 400
+        with self._lock:
+            if signed['headers'].get('x-goog-if-generation-match') == '0' and signed['name'] in self._objects:
+                return 412
+            self._store(signed['name'], data, headers.get('content-type') or 'application/octet-stream')
+        return 200
+
+    def put_object(self, name, data=b'', content_type='application/octet-stream', time_created=None):
+        """Test helper: stores an object directly, optionally backdating it."""
+        self._store(name, data, content_type, time_created)
+        return FakeBlob(self, name)
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+    def get_blob(self, name):
+        blob = FakeBlob(self, name)
+        try:
+            blob.reload()
+        except NotFound:
+            return None
+        return blob
+
+    def list_blobs(self, prefix=None, page_size=1000):
+        with self._lock:
+            names = sorted(name for name in self._objects if not prefix or name.startswith(prefix))
+        return _FakeBlobIterator(self, names, page_size)
+
+    def object_names(self):
+        with self._lock:
+            return sorted(self._objects)
+
+
+# --- Firestore ---
+
+_MISSING = object()
+
+# Firestore orders values of different types by type first.
+_TYPE_ORDER = ((type(None), 0), (bool, 1), (int, 2), (float, 2), (datetime, 3), (str, 4), (bytes, 5),
+               (list, 7), (dict, 8))
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _type_rank(value):
+    for value_type, rank in _TYPE_ORDER:
+        if isinstance(value, value_type):
+            return rank
+    return 9
+
+
+def _sort_key(value):
+    return (_type_rank(value), value)
+
+
+def _normalize(value):
+    """Copies a value the way Firestore stores it (naive datetimes are UTC, tuples become lists)."""
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    return copy.deepcopy(value)
+
+
+def _resolve(value, current=_MISSING):
+    """Applies a field transform (SERVER_TIMESTAMP, Increment, ArrayUnion...) to the current value."""
+    if value is transforms.SERVER_TIMESTAMP:
+        return _now()
+    if isinstance(value, transforms.Increment):
+        base = current if isinstance(current, (int, float)) and not isinstance(current, bool) else 0
+        return base + value.value
+    if isinstance(value, transforms.Maximum):
+        return value.value if current is _MISSING or not isinstance(current, (int, float)) else max(current, value.value)
+    if isinstance(value, transforms.Minimum):
+        return value.value if current is _MISSING or not isinstance(current, (int, float)) else min(current, value.value)
+    if isinstance(value, transforms.ArrayUnion):
+        result = list(current) if isinstance(current, list) else []
+        result.extend(_normalize(item) for item in value.values if item not in result)
+        return result
+    if isinstance(value, transforms.ArrayRemove):
+        return [item for item in current if item not in value.values] if isinstance(current, list) else []
+    if isinstance(value, dict):
+        return {key: _resolve(item) for key, item in value.items() if item is not transforms.DELETE_FIELD}
+    return _normalize(value)
+
+
+def _get_path(data, path):
+    for part in path:
+        if not isinstance(data, dict) or part not in data:
+            return _MISSING
+        data = data[part]
+    return data
+
+
+def _set_path(data, path, value):
+    for part in path[:-1]:
+        child = data.get(part)
+        if not isinstance(child, dict):
+            child = data[part] = {}
+        data = child
+    if value is transforms.DELETE_FIELD:
+        data.pop(path[-1], None)
+    else:
+        data[path[-1]] = _resolve(value, data.get(path[-1], _MISSING))
+
+
+def _leaf_items(data, prefix=()):
+    """Yields (path, value) for every leaf of a nested dict (empty dicts are leaves)."""
+    for key, value in data.items():
+        path = prefix + (key,)
+        if isinstance(value, dict) and value:
+            yield from _leaf_items(value, path)
+        else:
+            yield path, value
+
+
+def _split_field_path(field_path):
+    return tuple(field_path.split('.'))
+
+
+class FakeWriteResult:
+    def __init__(self, update_time):
+        self.update_time = update_time
+
+
+class FakeDocumentSnapshot:
+    """Subset of google.cloud.firestore_v1.DocumentSnapshot."""
+
+    def __init__(self, reference, data, create_time=None, update_time=None):
+        self.reference = reference
+        self._data = data
+        self.create_time = create_time
+        self.update_time = update_time
+        self.read_time = _now()
+
+    @property
+    def id(self):
+        return self.reference.id
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path):
+        value = _get_path(self._data or {}, _split_field_path(field_path))
+        if value is _MISSING:
+            raise KeyError(field_path)
+        return copy.deepcopy(value)
+
+
+class FakeDocumentReference:
+    """Subset of google.cloud.firestore_v1.DocumentReference."""
+
+    def __init__(self, client, collection_path, document_id):
+        self._client = client
+        self._collection_path = collection_path
+        self.id = document_id
+
+    @property
+    def path(self):
+        return f"{self._collection_path}/{self.id}"
+
+    @property
+    def parent(self):
+        return FakeCollectionReference(self._client, self._collection_path)
+
+    def __eq__(self, other):
+        return isinstance(other, FakeDocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def collection(self, collection_id):
+        return FakeCollectionReference(self._client, f"{self.path}/{collection_id}")
+
+    def get(self, field_paths=None, transaction=None, **kwargs):
+        self._client._record('firestore.get')
+        snapshot = self._client._snapshot(self, field_paths)
+        self._client._record('firestore.documents_read', rpc=False)
+        return snapshot
+
+    def create(self, document_data):
+        return self._single_write('create', document_data)
+
+    def set(self, document_data, merge=False):
+        return self._single_write('set', document_data, merge=merge)
+
+    def update(self, field_updates):
+        return self._single_write('update', field_updates)
+
+    def delete(self):
+        return self._single_write('delete', None)
+
+    def _single_write(self, kind, data, merge=False):
+        batch = FakeWriteBatch(self._client)
+        batch._add(kind, self, data, merge)
+        return batch.commit()[0]
+
+
+class FakeQuery:
+    """Subset of google.cloud.firestore_v1.Query: where/order_by/limit/offset/select/stream/get."""
+
+    ASCENDING = 'ASCENDING'
+    DESCENDING = 'DESCENDING'
+
+    def __init__(self, client, collection_path, filters=(), orders=(), limit=None, offset=0, projection=None):
+        self._client = client
+        self._collection_path = collection_path
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._offset = offset
+        self._projection = projection
+
+    def _copy(self, **changes):
+        state = dict(filters=self._filters, orders=self._orders, limit=self._limit, offset=self._offset,
+                     projection=self._projection)
+        state.update(changes)
+        return FakeQuery(self._client, self._collection_path, **state)
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction=ASCENDING):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def offset(self, num_to_skip):
+        return self._copy(offset=num_to_skip)
+
+    def select(self, field_paths):
+        return self._copy(projection=tuple(field_paths))
+
+    @staticmethod
+    def _matches(data, field_path, op_string, value):
+        current = _get_path(data, _split_field_path(field_path))
+        if current is _MISSING:
+            return False
+        if op_string == '==':
+            return current == value and _type_rank(current) == _type_rank(value)
+        if op_string == '!=':
+            return current != value
+        if op_string == 'in':
+            return current in value
+        if op_string == 'not-in':
+            return current not in value
+        if op_string == 'array-contains':
+            return isinstance(current, list) and value in current
+        if op_string == 'array-contains-any':
+            return isinstance(current, list) and any(item in current for item in value)
+        if _type_rank(current) != _type_rank(value):
+            return False
+        if op_string == '<':
+            return current < value
+        if op_string == '<=':
+            return current <= value
+        if op_string == '>':
+            return current > value
+        if op_string == '>=':
+            return current >= value
+        raise InvalidArgument(f"Unsupported operator: {op_string}")
+
+    def _run(self):
+        documents = self._client._collection_items(self._collection_path)
+        matched = [(doc_id, entry) for doc_id, entry in documents
+                   if all(self._matches(entry['data'], *condition) for condition in self._filters)]
+        # Like Firestore, documents without an order_by field are excluded, and ties fall back to the id.
+        for field_path, _ in self._orders:
+            matched = [item for item in matched if _get_path(item[1]['data'], _split_field_path(field_path)) is not _MISSING]
+        matched.sort(key=lambda item: item[0])
+        for field_path, direction in reversed(self._orders):
+            path = _split_field_path(field_path)
+            matched.sort(key=lambda item: _sort_key(_get_path(item[1]['data'], path)),
+                         reverse=direction == self.DESCENDING)
+        matched = matched[self._offset:]
+        if self._limit is not None:
+            matched = matched[:self._limit]
+        return matched
+
+    def stream(self, transaction=None, **kwargs):
+        self._client._record('firestore.query')
+        if self._client.record_queries:
+            self._client._log_query(self._collection_path, self._filters, self._orders)
+        with self._client._lock:
+            results = [self._client._make_snapshot(self._collection_path, doc_id, entry, self._projection)
+                       for doc_id, entry in self._run()]
+        self._client._record('firestore.documents_read', len(results), rpc=False)
+        return iter(results)
+
+    def get(self, transaction=None, **kwargs):
+        return list(self.stream(transaction=transaction))
+
+    def on_snapshot(self, callback):
+        """Starts a FakeWatch; callback(documents, changes, read_time) gets the initial result at once."""
+        return FakeWatch(self, callback)
+
+
+class FakeWatch:
+    """
+    Subset of google.cloud.firestore_v1.watch.Watch. Unlike the real listener, which calls back on
+    a background thread, the callback runs synchronously in the thread whose commit changed the
+    query result, which keeps tests deterministic.
+    """
+
+    def __init__(self, query, callback):
+        self._query = query
+        self._callback = callback
+        self._client = query._client
+        self._entries = {}  # document id -> stored entry of the last delivered version
+        self._delivered = False
+        self._client._record('firestore.listen')
+        with self._client._lock:
+            self._client._watches.append(self)
+        self._refresh()
+
+    def _refresh(self):
+        client = self._client
+        collection_path = self._query._collection_path
+        with client._lock:
+            results = [(doc_id, entry, client._make_snapshot(collection_path, doc_id, entry, self._query._projection))
+                       for doc_id, entry in self._query._run()]
+        new_index = {doc_id: index for index, (doc_id, _, _) in enumerate(results)}
+        old_order = list(self._entries)
+        changes = [DocumentChange(ChangeType.REMOVED,
+                                  FakeDocumentSnapshot(client.document(collection_path, doc_id), None),
+                                  old_order.index(doc_id), -1)
+                   for doc_id in old_order if doc_id not in new_index]
+        for doc_id, entry, snapshot in results:
+            if doc_id not in self._entries:
+                changes.append(DocumentChange(ChangeType.ADDED, snapshot, -1, new_index[doc_id]))
+            elif self._entries[doc_id] is not entry:  # Every write stores a new entry
+                changes.append(DocumentChange(ChangeType.MODIFIED, snapshot, old_order.index(doc_id),
+                                              new_index[doc_id]))
+        self._entries = {doc_id: entry for doc_id, entry, _ in results}
+        if changes or not self._delivered:
+            self._delivered = True
+            client._record('firestore.documents_read', len(changes), rpc=False)
+            self._callback([snapshot for _, _, snapshot in results], changes, _now())
+
+    def unsubscribe(self):
+        with self._client._lock:
+            if self in self._client._watches:
+                self._client._watches.remove(self)
+
+
+class FakeCollectionReference(FakeQuery):
+    """Subset of google.cloud.firestore_v1.CollectionReference."""
+
+    def __init__(self, client, path):
+        super().__init__(client, path)
+
+    @property
+    def id(self):
+        return self._collection_path.rsplit('/', 1)[-1]
+
+    def document(self, document_id=None):
+        return FakeDocumentReference(self._client, self._collection_path, document_id or uuid.uuid4().hex[:20])
+
+    def add(self, document_data, document_id=None):
+        reference = self.document(document_id)
+        write_result = reference.create(document_data)
+        return write_result.update_time, reference
+
+    def list_documents(self):
+        with self._client._lock:
+            return [self.document(doc_id) for doc_id, _ in self._client._collection_items(self._collection_path)]
+
+
+class FakeWriteBatch:
+    """Subset of google.cloud.firestore_v1.WriteBatch; commits atomically."""
+
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def _add(self, kind, reference, data, merge=False):
+        self._writes.append((kind, reference, data, merge))
+        return self
+
+    def create(self, reference, document_data):
+        return self._add('create', reference, document_data)
+
+    def set(self, reference, document_data, merge=False):
+        return self._add('set', reference, document_data, merge)
+
+    def update(self, reference, field_updates):
+        return self._add('update', reference, field_updates)
+
+    def delete(self, reference):
+        return self._add('delete', reference, None)
+
+    def __len__(self):
+        return len(self._writes)
+
+    def commit(self):
+        writes, self._writes = self._writes, []
+        if len(writes) > MAX_BATCH_WRITES:
+            raise InvalidArgument(f"maximum {MAX_BATCH_WRITES} writes allowed per request")
+        self._client._record('firestore.commit')
+        results = self._client._apply_writes(writes)
+        self._client._record('firestore.documents_written', len(writes), rpc=False)
+        return results
+
+
+class _FakeBulkWriteFailure:
+    """Mirrors google.cloud.firestore_v1.bulk_writer.BulkWriteFailure."""
+
+    def __init__(self, operation, code, message):
+        self.operation = operation
+        self.code = code
+        self.message = message
+
+    @property
+    def attempts(self):
+        return self.operation.attempts
+
+
+class _FakeBulkWriterOperation:
+    def __init__(self, kind, reference, data, merge):
+        self.kind = kind
+        self.reference = reference
+        self.data = data
+        self.merge = merge
+        self.attempts = 0
+
+
+class FakeBulkWriter:
+    """
+    Subset of google.cloud.firestore_v1.BulkWriter. Writes are sent on flush() in non-atomic
+    BatchWrite RPCs of up to 20 writes (firestore.batch_write); a failed write calls the
+    on_write_error callback, which returns True to retry it.
+    """
+
+    BATCH_SIZE = 20
+    _STATUS_CODES = {NotFound: 5, AlreadyExists: 6, InvalidArgument: 3}
+
+    def __init__(self, client):
+        self._client = client
+        self._pending = []
+        self._closed = False
+        self._on_write_result = None
+        self._on_write_error = lambda failure, writer: failure.attempts < 5
+
+    def on_write_result(self, callback):
+        self._on_write_result = callback
+
+    def on_write_error(self, callback):
+        self._on_write_error = callback
+
+    def _add(self, kind, reference, data=None, merge=False):
+        if self._closed:
+            raise Exception('BulkWriter is closed')
+        self._pending.append(_FakeBulkWriterOperation(kind, reference, data, merge))
+
+    def create(self, reference, document_data, attempts=0):
+        self._add('create', reference, document_data)
+
+    def set(self, reference, document_data, merge=False, attempts=0):
+        self._add('set', reference, document_data, merge)
+
+    def update(self, reference, field_updates, option=None, attempts=0):
+        self._add('update', reference, field_updates)
+
+    def delete(self, reference, option=None, attempts=0):
+        self._add('delete', reference)
+
+    def flush(self):
+        while self._pending:
+            operations, self._pending = self._pending, []
+            for start in range(0, len(operations), self.BATCH_SIZE):
+                self._client._record('firestore.batch_write')
+                for operation in operations[start:start + self.BATCH_SIZE]:
+                    operation.attempts += 1
+                    try:
+                        result = self._client._apply_writes(
+                            [(operation.kind, operation.reference, operation.data, operation.merge)])[0]
+                    except (NotFound, AlreadyExists, InvalidArgument) as e:
+                        failure = _FakeBulkWriteFailure(operation, self._STATUS_CODES[type(e)], str(e))
+                        if self._on_write_error(failure, self):
+                            self._pending.append(operation)
+                        continue
+                    self._client._record('firestore.documents_written', rpc=False)
+                    if self._on_write_result:
+                        self._on_write_result(operation.reference, result, self)
+
+    def close(self):
+        self.flush()
+        self._closed = True
+
+
+class FakeTransaction(FakeWriteBatch):
+    """
+    Transaction usable with firestore.transactional: writes are buffered and applied atomically
+    on commit. Reads are not isolated (there is no conflict detection).
+    """
+
+    def __init__(self, client, max_attempts=5, read_only=False):
+        super().__init__(client)
+        self._max_attempts = max_attempts
+        self._read_only = read_only
+        self._id = None
+
+    @property
+    def in_progress(self):
+        return self._id is not None
+
+    def _clean_up(self):
+        self._writes = []
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._client._record('firestore.begin_transaction')
+        self._id = uuid.uuid4().bytes
+
+    def _rollback(self):
+        if self._id is not None:
+            self._client._record('firestore.rollback')
+        self._clean_up()
+
+    def _commit(self):
+        results = self.commit() if self._writes else []
+        if not results:
+            self._client._record('firestore.commit')
+        self._clean_up()
+        return results
+
+    def get(self, ref_or_query, **kwargs):
+        if isinstance(ref_or_query, FakeDocumentReference):
+            return iter([ref_or_query.get()])
+        return ref_or_query.stream()
+
+
+class FakeFirestore(_RpcRecorder):
+    """
+    Thread-safe, in-memory subset of google.cloud.firestore.Client.
+
+    RPC counters: firestore.get, firestore.query, firestore.get_all, firestore.commit,
+    firestore.begin_transaction, firestore.rollback and firestore.listen (on_snapshot), plus
+    firestore.documents_read and firestore.documents_written document totals.
+
+    With record_queries=True every executed query is appended to ``executed_queries`` as
+    (collection id, ((field, operator), ...), ((field, direction), ...)), which is what
+    firestore_indexes needs to check that the query is served by an index.
+    """
+
+    def __init__(self, latency=0.0, record_queries=False):
+        super().__init__(latency)
+        self._collections = {}  # collection path -> {document id: {'data', 'create_time', 'update_time'}}
+        self.record_queries = record_queries
+        self.executed_queries = []
+        self._watches = []
+
+    # Client API
+
+    def collection(self, *collection_path):
+        return FakeCollectionReference(self, '/'.join(collection_path))
+
+    def document(self, *document_path):
+        path = '/'.join(document_path)
+        collection_path, document_id = path.rsplit('/', 1)
+        return FakeDocumentReference(self, collection_path, document_id)
+
+    def collections(self):
+        with self._lock:
+            return [FakeCollectionReference(self, path) for path in sorted(self._collections) if '/' not in path]
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def bulk_writer(self, **kwargs):
+        return FakeBulkWriter(self)
+
+    def transaction(self, max_attempts=5, read_only=False):
+        return FakeTransaction(self, max_attempts=max_attempts, read_only=read_only)
+
+    def get_all(self, references, field_paths=None, transaction=None, **kwargs):
+        references = list(references)
+        self._record('firestore.get_all')
+        with self._lock:
+            snapshots = [self._snapshot(reference, field_paths) for reference in references]
+        self._record('firestore.documents_read', len(snapshots), rpc=False)
+        return iter(snapshots)
+
+    # Test/benchmark helpers (not part of the real client)
+
+    def put_document(self, collection_path, document_id, data):
+        """Stores a document directly without counting an RPC."""
+        with self._lock:
+            now = _now()
+            self._collections.setdefault(collection_path, {})[document_id] = {
+                'data': _resolve(dict(data)), 'create_time': now, 'update_time': now
+            }
+        self._notify_watches()
+        return self.document(collection_path, document_id)
+
+    def document_count(self, collection_path):
+        with self._lock:
+            return len(self._collections.get(collection_path, {}))
+
+    # Internals
+
+    def _log_query(self, collection_path, filters, orders):
+        shape = (collection_path.rsplit('/', 1)[-1],
+                 tuple((field_path, op_string) for field_path, op_string, _ in filters),
+                 tuple(orders))
+        with self._lock:
+            self.executed_queries.append(shape)
+
+    def _collection_items(self, collection_path):
+        return list(self._collections.get(collection_path, {}).items())
+
+    def _make_snapshot(self, collection_path, document_id, entry, field_paths=None):
+        reference = FakeDocumentReference(self, collection_path, document_id)
+        if entry is None:
+            return FakeDocumentSnapshot(reference, None)
+        data = entry['data']
+        if field_paths is not None:
+            projected = {}
+            for field_path in field_paths:
+                value = _get_path(data, _split_field_path(field_path))
+                if value is not _MISSING:
+                    _set_path(projected, _split_field_path(field_path), copy.deepcopy(value))
+            data = projected
+        return FakeDocumentSnapshot(reference, copy.deepcopy(data), entry['create_time'], entry['update_time'])
+
+    def _snapshot(self, reference, field_paths=None):
+        with self._lock:
+            entry = self._collections.get(reference._collection_path, {}).get(reference.id)
+            return self._make_snapshot(reference._collection_path, reference.id, entry, field_paths)
+
+    def _apply_writes(self, writes):
+        with self._lock:
+            for kind, reference, _, _ in writes:
+                exists = reference.id in self._collections.get(reference._collection_path, {})
+                if kind == 'update' and not exists:
+                    raise NotFound(f"No document to update: {reference.path}")
+                if kind == 'create' and exists:
+                    raise AlreadyExists(f"Document already exists: {reference.path}")
+
+            now = _now()
+            results = []
+            for kind, reference, data, merge in writes:
+                documents = self._collections.setdefault(reference._collection_path, {})
+                entry = documents.get(reference.id)
+                if kind == 'delete':
+                    documents.pop(reference.id, None)
+                    results.append(FakeWriteResult(now))
+                    continue
+                if entry is None or (kind in ('set', 'create') and not merge):
+                    entry = {'data': {}, 'create_time': entry['create_time'] if entry else now}
+                new_data = copy.deepcopy(entry['data'])
+                if kind == 'update':
+                    for field_path, value in data.items():
+                        _set_path(new_data, _split_field_path(field_path), value)
+                elif isinstance(merge, (list, tuple)):
+                    # merge=[field paths]: only those fields are replaced, absent ones are removed.
+                    for field_path in merge:
+                        path = _split_field_path(field_path)
+                        value = _get_path(data, path)
+                        _set_path(new_data, path, transforms.DELETE_FIELD if value is _MISSING else value)
+                else:
+                    for path, value in _leaf_items(data):
+                        _set_path(new_data, path, value)
+                documents[reference.id] = {'data': new_data, 'create_time': entry['create_time'], 'update_time': now}
+                results.append(FakeWriteResult(now))
+        self._notify_watches()
+        return results
+
+    def _notify_watches(self):
+        with self._lock:
+            watches = list(self._watches)
+        for watch in watches:
+            watch._refresh()
+
+
+class FakeAsyncDocumentReference:
+    """Subset of google.cloud.firestore_v1.AsyncDocumentReference."""
+
+    def __init__(self, client, reference):
+        self._client = client
+        self._sync = reference
+
+    @property
+    def id(self):
+        return self._sync.id
+
+    @property
+    def path(self):
+        return self._sync.path
+
+    @property
+    def parent(self):
+        return FakeAsyncCollectionReference(self._client, self._sync.parent)
+
+    def collection(self, collection_id):
+        return FakeAsyncCollectionReference(self._client, self._sync.collection(collection_id))
+
+    async def get(self, field_paths=None, transaction=None, **kwargs):
+        return await self._client._call('firestore.get', self._sync.get, field_paths)
+
+    async def create(self, document_data):
+        return await self._client._call('firestore.commit', self._sync.create, document_data)
+
+    async def set(self, document_data, merge=False):
+        return await self._client._call('firestore.commit', self._sync.set, document_data, merge)
+
+    async def update(self, field_updates):
+        return await self._client._call('firestore.commit', self._sync.update, field_updates)
+
+    async def delete(self):
+        return await self._client._call('firestore.commit', self._sync.delete)
+
+
+class FakeAsyncQuery:
+    """Subset of google.cloud.firestore_v1.AsyncQuery; stream() is an async generator."""
+
+    def __init__(self, client, query):
+        self._client = client
+        self._sync = query
+
+    def where(self, *args, **kwargs):
+        return FakeAsyncQuery(self._client, self._sync.where(*args, **kwargs))
+
+    def order_by(self, *args, **kwargs):
+        return FakeAsyncQuery(self._client, self._sync.order_by(*args, **kwargs))
+
+    def limit(self, count):
+        return FakeAsyncQuery(self._client, self._sync.limit(count))
+
+    def offset(self, num_to_skip):
+        return FakeAsyncQuery(self._client, self._sync.offset(num_to_skip))
+
+    def select(self, field_paths):
+        return FakeAsyncQuery(self._client, self._sync.select(field_paths))
+
+    async def stream(self, transaction=None, **kwargs):
+        snapshots = await self._client._call('firestore.query', self._sync.get)
+        for snapshot in snapshots:
+            yield snapshot
+
+    async def get(self, transaction=None, **kwargs):
+        return [snapshot async for snapshot in self.stream()]
+
+
+class FakeAsyncCollectionReference(FakeAsyncQuery):
+    """Subset of google.cloud.firestore_v1.AsyncCollectionReference."""
+
+    @property
+    def id(self):
+        return self._sync.id
+
+    def document(self, document_id=None):
+        return FakeAsyncDocumentReference(self._client, self._sync.document(document_id))
+
+
+class FakeAsyncWriteBatch:
+    """Subset of google.cloud.firestore_v1.AsyncWriteBatch; only commit() is a coroutine."""
+
+    def __init__(self, client):
+        self._client = client
+        self._batch = FakeWriteBatch(client._db)
+
+    def create(self, reference, document_data):
+        self._batch.create(reference._sync, document_data)
+        return self
+
+    def set(self, reference, document_data, merge=False):
+        self._batch.set(reference._sync, document_data, merge=merge)
+        return self
+
+    def update(self, reference, field_updates):
+        self._batch.update(reference._sync, field_updates)
+        return self
+
+    def delete(self, reference):
+        self._batch.delete(reference._sync)
+        return self
+
+    def __len__(self):
+        return len(self._batch)
+
+    async def commit(self):
+        return await self._client._call('firestore.commit', self._batch.commit)
+
+
+class FakeAsyncFirestore:
+    """
+    google.cloud.firestore.AsyncClient view of a FakeFirestore: same documents, RPC counters and
+    latency setting, but the latency is awaited so concurrent requests overlap on one event loop.
+    """
+
+    def __init__(self, db):
+        self._db = db
+
+    @property
+    def rpc_counts(self):
+        return self._db.rpc_counts
+
+    def reset_rpc_counts(self):
+        self._db.reset_rpc_counts()
+
+    def collection(self, *collection_path):
+        return FakeAsyncCollectionReference(self, self._db.collection(*collection_path))
+
+    def document(self, *document_path):
+        return FakeAsyncDocumentReference(self, self._db.document(*document_path))
+
+    def batch(self):
+        return FakeAsyncWriteBatch(self)
+
+    async def get_all(self, references, field_paths=None, transaction=None, **kwargs):
+        references = [reference._sync for reference in references]
+        snapshots = await self._call('firestore.get_all', lambda: list(self._db.get_all(references, field_paths)))
+        for snapshot in snapshots:
+            yield snapshot
+
+    async def _call(self, operation, function, *args):
+        """Runs a synchronous FakeFirestore operation without its blocking sleep, then awaits the latency."""
+        token = _blocking_latency.set(False)
+        try:
+            result = function(*args)
+        finally:
+            _blocking_latency.reset(token)
+        delay = self._db._delay(operation)
+        if delay:
+            await asyncio.sleep(delay)
+        return result
+
+
+# --- SMTP ---
+
+class _FakeSMTPConnection:
+    """Subset of smtplib.SMTP that delivers into a FakeSMTPServer."""
+
+    def __init__(self, server, host='', port=0, *args, **kwargs):
+        self._server = server
+        self.host = host
+        self.port = port
+        server._record('smtp.connect')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.quit()
+
+    def ehlo(self, name=''):
+        return 250, b'fake-smtp'
+
+    def starttls(self, *args, **kwargs):
+        self._server._record('smtp.starttls')
+        return 220, b'ready'
+
+    def login(self, user, password):
+        self._server._record('smtp.login')
+        return 235, b'authenticated'
+
+    def sendmail(self, from_addr, to_addrs, msg, *args, **kwargs):
+        self._server._record('smtp.sendmail')
+        if isinstance(to_addrs, str):
+            to_addrs = [to_addrs]
+        with self._server._lock:
+            self._server.messages.append({'from': from_addr, 'to': list(to_addrs), 'message': msg})
+        return {}
+
+    def quit(self):
+        return 221, b'bye'
+
+
+class FakeSMTPServer(_RpcRecorder):
+    """
+    In-memory mail sink. Pass ``server.connect`` where code expects ``smtplib.SMTP``; every
+    delivered message is appended to ``messages``.
+
+    RPC counters: smtp.connect, smtp.starttls, smtp.login and smtp.sendmail.
+    """
+
+    def __init__(self, latency=0.0):
+        super().__init__(latency)
+        self.messages = []
+
+    def connect(self, host='', port=0, *args, **kwargs):
+        return _FakeSMTPConnection(self, host, port, *args, **kwargs)
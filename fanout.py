@@ -0,0 +1,65 @@
+"""
+Concurrent fan-out of independent blocking reads.
+
+Page handlers often need several Firestore reads that do not depend on each other (the logged-in
+user and the map items, the map items and the target post). gather() issues them at the same
+time, so the page waits for the slowest read instead of the sum of all of them:
+
+    results = fanout.gather({
+        'user': lambda: firestore_utils.get_user(uid, app_logger),
+        'items': lambda: firestore_utils.get_published_items_for_map(app_logger),
+    }, app_logger, defaults={'items': []})
+
+The calls run on a shared thread pool while the calling thread waits for them. Each call runs in
+a copy of the caller's context, so the Flask request context and flask.g (the identity map and
+the metrics counters) are available in the pool threads too.
+
+A call that raises, or that has not finished FANOUT_TIMEOUT_SECONDS (app config, default 5) after
+the fan-out started, is logged and gets its default (None unless given). A call that timed out
+keeps running in the background; Python threads cannot be cancelled.
+"""
+
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from flask import current_app, has_app_context
+
+DEFAULT_TIMEOUT_SECONDS = 5.0
+MAX_WORKERS = 16
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='fanout')
+
+
+def _timeout_seconds():
+    if has_app_context():
+        return float(current_app.config.get('FANOUT_TIMEOUT_SECONDS', DEFAULT_TIMEOUT_SECONDS))
+    return DEFAULT_TIMEOUT_SECONDS
+
+
+def gather(calls, app_logger, defaults=None, timeout=None):
+    """
+    Runs the callables in calls ({name: callable}) concurrently and returns {name: result}.
+    timeout is a deadline in seconds per call, measured from the start of the fan-out, either a
+    number or {name: seconds}; missing entries use FANOUT_TIMEOUT_SECONDS.
+    """
+    defaults = defaults or {}
+    if not calls:
+        return {}
+    default_timeout = _timeout_seconds()
+    started = time.monotonic()
+    futures = {name: _executor.submit(contextvars.copy_context().run, call) for name, call in calls.items()}
+
+    results = {}
+    for name, future in futures.items():
+        call_timeout = timeout.get(name, default_timeout) if isinstance(timeout, dict) else (timeout or default_timeout)
+        remaining = max(0.0, started + call_timeout - time.monotonic())
+        try:
+            results[name] = future.result(timeout=remaining)
+        except FutureTimeoutError:
+            app_logger.warning("Fan-out call '%s' did not finish within %ss; using its default.", name, call_timeout)
+            results[name] = defaults.get(name)
+        except Exception as e:
+            app_logger.error("Fan-out call '%s' failed: %s", name, e, exc_info=True)
+            results[name] = defaults.get(name)
+    return results
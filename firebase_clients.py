@@ -0,0 +1,83 @@
+"""
+Lazy access to the Firebase app and its Firestore and Storage clients.
+
+Nothing is initialized at import time: the Firebase app is created on the first call to
+get_firebase_app() (directly or via get_db()/get_bucket()), so importing the web app,
+running a CLI tool or collecting tests does not pay for credential discovery and
+client construction.
+"""
+
+import os
+import threading
+
+import firebase_admin
+from firebase_admin import credentials, firestore, firestore_async, storage
+
+_init_lock = threading.Lock()
+_client_overrides = {}
+
+
+def use_clients(db=None, bucket=None, async_db=None):
+    """
+    Makes get_db()/get_bucket()/get_async_db() return the given clients instead of the Firebase
+    ones, e.g. the fake_backends stand-ins for benchmarks and local tooling. Call without
+    arguments to restore.
+    """
+    _client_overrides.clear()
+    if db is not None:
+        _client_overrides['db'] = db
+    if bucket is not None:
+        _client_overrides['bucket'] = bucket
+    if async_db is not None:
+        _client_overrides['async_db'] = async_db
+
+
+def get_storage_bucket_name():
+    return os.environ.get('FIREBASE_STORAGE_BUCKET', 'your-project.appspot.com')
+
+
+def get_firebase_app():
+    """Returns the default Firebase app, initializing it on first use."""
+    if firebase_admin._apps:
+        return firebase_admin.get_app()
+    with _init_lock:
+        if firebase_admin._apps:
+            return firebase_admin.get_app()
+        if os.environ.get('TEST_ENV') == 'true':
+            # Use mock credentials for testing
+            from google.auth import credentials as google_auth_credentials
+
+            cred = google_auth_credentials.AnonymousCredentials()
+            firebase_app = firebase_admin.initialize_app(cred, {
+                'projectId': 'mock-project',  # Required for mock credentials
+                'storageBucket': get_storage_bucket_name()
+            })
+            print("INFO: Firebase initialized with MOCK credentials for TEST_ENV.")
+            return firebase_app
+        return firebase_admin.initialize_app(credentials.ApplicationDefault(), {
+            'storageBucket': get_storage_bucket_name()
+        })
+
+
+def get_db():
+    """Returns a Firestore client bound to the (lazily initialized) Firebase app."""
+    if 'db' in _client_overrides:
+        return _client_overrides['db']
+    return firestore.client(app=get_firebase_app())
+
+
+def get_async_db():
+    """
+    Returns a google.cloud.firestore.AsyncClient bound to the (lazily initialized) Firebase app,
+    for the coroutines in firestore_async. Use it from one event loop only.
+    """
+    if 'async_db' in _client_overrides:
+        return _client_overrides['async_db']
+    return firestore_async.client(app=get_firebase_app())
+
+
+def get_bucket():
+    """Returns the default Storage bucket of the (lazily initialized) Firebase app."""
+    if 'bucket' in _client_overrides:
+        return _client_overrides['bucket']
+    return storage.bucket(app=get_firebase_app())
@@ -0,0 +1,221 @@
+"""
+Coroutine versions of the read-heavy firestore_utils functions, on the Firestore AsyncClient.
+
+A Flask worker thread is blocked for the whole round trip of every Firestore read it makes.
+These coroutines await the round trip instead, so the single event loop of asgi_app can keep
+hundreds of reads in flight. They return the same values and log the same messages as their
+firestore_utils counterparts, and vote/report decisions come from the same helpers
+(firestore_utils._plan_vote/_plan_report), so the two paths cannot drift apart.
+
+The client comes from firebase_clients.get_async_db(). Reads go through the current identity
+map like the synchronous getters; asgi_app opens an identity_map.scope() per request.
+"""
+
+import asyncio
+import contextvars
+
+import firebase_clients
+import firestore_utils
+import identity_map
+from firebase_admin import firestore
+
+
+async def _get_document(doc_ref):
+    """Async counterpart of identity_map.get_document."""
+    request_map = identity_map.current()
+    collection = doc_ref.parent.id
+    if request_map is not None:
+        data = request_map.lookup(collection, doc_ref.id)
+        if data is not identity_map._MISSING:
+            return data
+    snapshot = await doc_ref.get()
+    data = snapshot.to_dict() if snapshot.exists else None
+    if request_map is not None:
+        request_map.remember(collection, doc_ref.id, data)
+    return data
+
+
+async def get_content_item(content_id, app_logger):
+    """
+    Fetches a single content item by its ID (at most once per request, see identity_map).
+    """
+    db = firebase_clients.get_async_db()
+    try:
+        item_data = await _get_document(db.collection('contentItems').document(content_id))
+        if item_data is not None:
+            item_data['itemId'] = content_id
+            app_logger.debug("Content item %s fetched successfully.", content_id)
+            return item_data
+        else:
+            app_logger.warning("Content item %s not found.", content_id)
+            return None
+    except Exception as e:
+        app_logger.error("Error fetching content item %s: %s", content_id, e, exc_info=True)
+        return None
+
+
+async def get_content_items_by_ids(content_ids, app_logger, fields=None):
+    """
+    Fetches several content items with concurrent get_all() calls, one per chunk; returns the
+    same list as firestore_utils.get_content_items_by_ids.
+    """
+    db = firebase_clients.get_async_db()
+    unique_ids = firestore_utils._unique_ids(content_ids)
+
+    async def read_chunk(chunk):
+        refs = [db.collection('contentItems').document(content_id) for content_id in chunk]
+        return [snapshot async for snapshot in db.get_all(refs, field_paths=fields)]
+
+    try:
+        items, to_fetch = identity_map.lookup_many('contentItems', unique_ids)
+        if fields:
+            items = {content_id: firestore_utils._project_fields(data, fields) if data is not None else None
+                     for content_id, data in items.items()}
+        chunks = list(firestore_utils._chunked(to_fetch, firestore_utils.BULK_WRITE_CHUNK_SIZE))
+        snapshots = {snapshot.id: snapshot for chunk_snapshots in await asyncio.gather(*map(read_chunk, chunks))
+                     for snapshot in chunk_snapshots if snapshot.exists}
+        for content_id in to_fetch:
+            snapshot = snapshots.get(content_id)
+            items[content_id] = snapshot.to_dict() if snapshot is not None else None
+            if not fields:
+                identity_map.remember('contentItems', content_id, items[content_id])
+    except Exception as e:
+        app_logger.error("Error fetching %s content items: %s", len(unique_ids), e, exc_info=True)
+        return None
+
+    app_logger.debug("Fetched %s content items, %s of them from Firestore.", len(content_ids), len(to_fetch))
+    return firestore_utils._items_in_order(content_ids, items)
+
+
+async def get_user(uid, app_logger):
+    """
+    Fetches a user document by UID (at most once per request, see identity_map).
+    """
+    db = firebase_clients.get_async_db()
+    try:
+        user_data = await _get_document(db.collection('users').document(uid))
+        if user_data is not None:
+            app_logger.debug("User data fetched successfully for UID: %s", uid)
+            return user_data
+        else:
+            app_logger.warning("User document not found for UID: %s", uid)
+            return None
+    except Exception as e:
+        app_logger.error("Error fetching user %s: %s", uid, e, exc_info=True)
+        return None
+
+
+async def get_user_post_index(user_id, app_logger, include_merges=True):
+    """
+    Returns {item_id: entry} for all of the user's posts, like firestore_utils.get_user_post_index.
+    A missing or incomplete index is rebuilt by the synchronous code in a worker thread; that
+    happens once per user.
+    """
+    db = firebase_clients.get_async_db()
+    index_doc = await db.collection(firestore_utils.POST_INDEX_COLLECTION).document(user_id).get()
+    index_data = index_doc.to_dict() if index_doc.exists else None
+    if not index_data or not index_data.get('complete'):
+        rebuild = contextvars.copy_context().run
+        entries = await asyncio.to_thread(rebuild, firestore_utils.rebuild_user_post_index, user_id, app_logger)
+    else:
+        entries = index_data.get('posts') or {}
+    merged_from = ((index_data or {}).get('mergedFrom') or []) if include_merges else []
+    if merged_from:
+        combined = {}
+        merged_entries = await asyncio.gather(*(get_user_post_index(old_user_id, app_logger, include_merges=False)
+                                                for old_user_id in merged_from))
+        for old_entries in merged_entries:
+            combined.update(old_entries)
+        combined.update(entries)
+        entries = combined
+    return entries
+
+
+async def get_published_items_for_map(app_logger, user_id=None):
+    """
+    Fetches published content items suitable for map display, optionally only the user's.
+    """
+    if user_id:
+        try:
+            entries = await get_user_post_index(user_id, app_logger)
+            items_for_map = firestore_utils._published_items_from_index(entries)
+            app_logger.info("Fetched %s published items for map display for user %s.", len(items_for_map), user_id)
+            return items_for_map
+        except Exception as e:
+            app_logger.error("Error fetching published items for map for user %s: %s", user_id, e, exc_info=True)
+            return []
+
+    db = firebase_clients.get_async_db()
+    try:
+        items_query = db.collection('contentItems').where(field_path='status', op_string='==', value='published') \
+            .order_by('voteCount', direction=firestore.Query.ASCENDING) \
+            .order_by('timestamp', direction=firestore.Query.DESCENDING)
+        items_for_map = []
+        async for item_doc in items_query.stream():
+            item_data = item_doc.to_dict()
+            item_data['itemId'] = item_doc.id
+            if 'latitude' in item_data and 'longitude' in item_data:
+                items_for_map.append(item_data)
+            else:
+                app_logger.debug("Item %s skipped for map, missing coordinates.", item_doc.id)
+
+        app_logger.info("Fetched %s published items for map display.", len(items_for_map))
+        return items_for_map
+    except Exception as e:
+        app_logger.error("Error fetching published items for map: %s", e, exc_info=True)
+        return []
+
+
+async def _commit_item_update(db, doc_ref, doc_data, content_id, update, index_entry):
+    batch = db.batch()
+    batch.update(doc_ref, update)
+    if index_entry:
+        firestore_utils._set_post_index_entries(batch, db, doc_data.get('userId'), {content_id: index_entry})
+    await batch.commit()
+    identity_map.forget('contentItems', content_id)
+
+
+async def record_vote(content_id, user_id, vote_value, app_logger):
+    """
+    Records a vote for a content item; returns the same dicts as firestore_utils.record_vote.
+    """
+    db = firebase_clients.get_async_db()
+    doc_ref = db.collection('contentItems').document(content_id)
+    try:
+        doc_data = await _get_document(doc_ref)
+        if doc_data is None:
+            app_logger.warning("Content not found for voting: %s", content_id)
+            return {'error': 'Content not found', 'status_code': 404}
+
+        result, update, index_entry = firestore_utils._plan_vote(content_id, doc_data, user_id, vote_value, app_logger)
+        if update is None:
+            return result
+        await _commit_item_update(db, doc_ref, doc_data, content_id, update, index_entry)
+        app_logger.info("Vote recorded for %s by user %s. New count: %s", content_id, user_id, result['newVoteCount'])
+        return result
+    except Exception as e:
+        app_logger.error("Error recording vote for content %s: %s", content_id, e, exc_info=True)
+        return {'error': str(e), 'status_code': 500}
+
+
+async def record_report(content_id, user_id, reason, app_logger):
+    """
+    Records a report for a content item; returns the same dicts as firestore_utils.record_report.
+    """
+    db = firebase_clients.get_async_db()
+    doc_ref = db.collection('contentItems').document(content_id)
+    try:
+        doc_data = await _get_document(doc_ref)
+        if doc_data is None:
+            app_logger.warning("Content not found for reporting: %s", content_id)
+            return {'error': 'Content not found', 'status_code': 404}
+
+        result, update, index_entry = firestore_utils._plan_report(content_id, doc_data, user_id, reason, app_logger)
+        if update is None:
+            return result
+        await _commit_item_update(db, doc_ref, doc_data, content_id, update, index_entry)
+        app_logger.info("Report submitted for %s by user %s.", content_id, user_id)
+        return result
+    except Exception as e:
+        app_logger.error("Error submitting report for content %s: %s", content_id, e, exc_info=True)
+        return {'error': str(e), 'status_code': 500}
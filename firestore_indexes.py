@@ -0,0 +1,289 @@
+"""
+Registry of the Firestore query shapes used by MailMap and the composite index manifest derived from it.
+
+Firestore serves equality-only queries and single-field orderings from its automatic single-field
+indexes, but any query that combines a filter or ordering on one field with an ordering or range
+filter on another needs a composite index; without it the query fails with FAILED_PRECONDITION.
+
+QUERY_SHAPES lists every query the application issues. `generate` writes firestore.indexes.json
+(the Firebase CLI format, deployed with `firebase deploy --only firestore:indexes`) from it, and
+`check` verifies that
+  * the manifest on disk contains every composite index the registry needs, and
+  * every query firestore_utils actually builds, captured by running its query functions against
+    the in-memory Firestore stand-in, matches a registered shape that an index serves.
+
+Usage:
+    python firestore_indexes.py generate [--output firestore.indexes.json]
+    python firestore_indexes.py check [--manifest firestore.indexes.json]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+
+ASCENDING = 'ASCENDING'
+DESCENDING = 'DESCENDING'
+CONTAINS = 'CONTAINS'
+
+EQUALITY_OPERATORS = frozenset({'==', 'in', 'array-contains', 'array-contains-any'})
+ARRAY_OPERATORS = frozenset({'array-contains', 'array-contains-any'})
+INEQUALITY_OPERATORS = frozenset({'<', '<=', '>', '>=', '!=', 'not-in'})
+
+DEFAULT_MANIFEST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'firestore.indexes.json')
+
+
+class QueryShape:
+    """
+    The index-relevant part of a query: the collection, its filters as (field, operator) pairs and
+    its order_by clauses as (field, direction) pairs. Filter values and limits do not matter.
+    """
+
+    def __init__(self, name, collection, filters=(), order_by=(), used_by=''):
+        self.name = name
+        self.collection = collection
+        self.filters = tuple(filters)
+        self.order_by = tuple(order_by)
+        self.used_by = used_by
+
+    def key(self):
+        return self.collection, frozenset(self.filters), self.order_by
+
+    def __repr__(self):
+        return f"QueryShape({self.name!r}, {self.collection!r}, filters={self.filters}, order_by={self.order_by})"
+
+
+QUERY_SHAPES = [
+    QueryShape('admin_by_email', 'admins', filters=[('email', '==')],
+               used_by='firestore_utils.get_admin_by_email, admin_setup'),
+    QueryShape('user_by_email', 'users', filters=[('email', '==')],
+               used_by='firestore_utils.get_user_by_email'),
+    QueryShape('content_by_owner', 'contentItems', filters=[('userId', '==')],
+               used_by='firestore_utils.rebuild_user_post_index'),
+    QueryShape('pending_ownership_migrations', 'ownershipMigrations', filters=[('status', '==')],
+               used_by='ownership_migration.process_pending_migrations'),
+    QueryShape('expired_upload_reservations', 'uploadReservations', filters=[('status', '=='), ('expiresAt', '<')],
+               order_by=[('expiresAt', ASCENDING)],
+               used_by='direct_uploads.release_expired_reservations'),
+    QueryShape('abandoned_upload_claims', 'uploadReservations', filters=[('status', '=='), ('claimedAt', '<')],
+               order_by=[('claimedAt', ASCENDING)],
+               used_by='direct_uploads.release_expired_reservations'),
+    QueryShape('reports_for_content', 'reports', filters=[('contentId', '==')],
+               used_by='firestore_utils.get_content_items'),
+    QueryShape('dashboard_all', 'contentItems', order_by=[('timestamp', DESCENDING)],
+               used_by='admin_services.get_dashboard_items (status=all)'),
+    QueryShape('dashboard_by_status', 'contentItems', filters=[('status', '==')],
+               order_by=[('timestamp', DESCENDING)],
+               used_by='admin_services.get_dashboard_items'),
+    QueryShape('dashboard_reported', 'contentItems', filters=[('reportedCount', '>')],
+               order_by=[('reportedCount', DESCENDING), ('timestamp', DESCENDING)],
+               used_by='admin_services.get_dashboard_items (view=reported)'),
+    QueryShape('map_published', 'contentItems', filters=[('status', '==')],
+               order_by=[('voteCount', ASCENDING), ('timestamp', DESCENDING)],
+               used_by='firestore_utils.get_published_items_for_map'),
+]
+
+
+class InvalidQueryShape(ValueError):
+    """The shape cannot be executed by Firestore whatever indexes exist."""
+
+
+def required_index(shape):
+    """
+    Returns the composite index fields the shape needs as a tuple of (field, order or CONTAINS),
+    or None when Firestore's automatic single-field indexes serve it.
+    """
+    equality = [(field, CONTAINS if op in ARRAY_OPERATORS else ASCENDING)
+                for field, op in shape.filters if op in EQUALITY_OPERATORS]
+    inequality_fields = {field for field, op in shape.filters if op in INEQUALITY_OPERATORS}
+    unknown = [op for _, op in shape.filters if op not in EQUALITY_OPERATORS | INEQUALITY_OPERATORS]
+    if unknown:
+        raise InvalidQueryShape(f"{shape.name}: unsupported operators {unknown}")
+    if len(inequality_fields) > 1:
+        raise InvalidQueryShape(f"{shape.name}: range filters on more than one field {sorted(inequality_fields)}")
+
+    ordering = list(shape.order_by)
+    if inequality_fields:
+        inequality_field = next(iter(inequality_fields))
+        if not ordering:
+            ordering = [(inequality_field, ASCENDING)]
+        elif ordering[0][0] != inequality_field:
+            raise InvalidQueryShape(
+                f"{shape.name}: the first order_by must be the range-filtered field '{inequality_field}'")
+
+    if not ordering:
+        return None  # Equality filters only: merged single-field indexes
+    fields = equality + [(field, direction) for field, direction in ordering
+                         if field not in {name for name, _ in equality}]
+    if len(fields) < 2:
+        return None
+    return tuple(fields)
+
+
+def _index_entry(collection, fields):
+    return {
+        'collectionGroup': collection,
+        'queryScope': 'COLLECTION',
+        'fields': [{'fieldPath': field, 'arrayConfig': CONTAINS} if order == CONTAINS
+                   else {'fieldPath': field, 'order': order} for field, order in fields],
+    }
+
+
+def build_manifest(shapes=None):
+    """Returns the firestore.indexes.json document for the registered shapes."""
+    seen, indexes = set(), []
+    for shape in shapes or QUERY_SHAPES:
+        fields = required_index(shape)
+        if fields is None or (shape.collection, fields) in seen:
+            continue
+        seen.add((shape.collection, fields))
+        indexes.append(_index_entry(shape.collection, fields))
+    indexes.sort(key=lambda entry: (entry['collectionGroup'], json.dumps(entry['fields'])))
+    return {'indexes': indexes, 'fieldOverrides': []}
+
+
+def load_manifest(path=DEFAULT_MANIFEST_PATH):
+    with open(path) as manifest_file:
+        return json.load(manifest_file)
+
+
+def _manifest_indexes(manifest):
+    for entry in manifest.get('indexes', []):
+        if entry.get('queryScope', 'COLLECTION') != 'COLLECTION':
+            continue
+        fields = tuple((field['fieldPath'], field.get('arrayConfig') or field.get('order', ASCENDING))
+                       for field in entry.get('fields', []))
+        yield entry['collectionGroup'], fields
+
+
+def find_serving_index(shape, manifest):
+    """
+    Returns the manifest index fields that serve the shape, () when no composite index is needed,
+    or None when the required index is missing. Equality fields may appear in any order in the
+    index; the ordering fields must follow them in order and direction.
+    """
+    required = required_index(shape)
+    if required is None:
+        return ()
+    equality_count = sum(1 for field, op in shape.filters if op in EQUALITY_OPERATORS)
+    for collection, fields in _manifest_indexes(manifest):
+        if collection != shape.collection or len(fields) != len(required):
+            continue
+        if (set(fields[:equality_count]) == set(required[:equality_count])
+                and fields[equality_count:] == required[equality_count:]):
+            return fields
+    return None
+
+
+def check_manifest(manifest, shapes=None):
+    """Returns problems with the registered shapes: invalid shapes and missing composite indexes."""
+    problems = []
+    for shape in shapes or QUERY_SHAPES:
+        try:
+            if find_serving_index(shape, manifest) is None:
+                fields = ', '.join(f'{field} {order}' for field, order in required_index(shape))
+                problems.append(f"{shape.name} ({shape.used_by}): missing index on {shape.collection} ({fields})")
+        except InvalidQueryShape as e:
+            problems.append(str(e))
+    return problems
+
+
+def match_registered_shape(collection, filters, order_by, shapes=None):
+    """Returns the registered shape with exactly these filters and orderings, or None."""
+    key = (collection, frozenset(filters), tuple(order_by))
+    for shape in shapes or QUERY_SHAPES:
+        if shape.key() == key:
+            return shape
+    return None
+
+
+def capture_firestore_utils_queries():
+    """
+    Runs the query functions of firestore_utils (plus the ownership migration and upload
+    reservation sweeps and the admin dashboard that parameterizes get_content_items) against a
+    recording in-memory Firestore and
+    returns the executed query shapes as (collection, ((field, operator), ...), ((field, direction), ...)) tuples.
+    """
+    import admin_services
+    import direct_uploads
+    import firebase_clients
+    import firestore_utils
+    import ownership_migration
+    from fake_backends import FakeBucket, FakeFirestore
+
+    logger = logging.getLogger('firestore_indexes.capture')
+    db = FakeFirestore(record_queries=True)
+    # One reported item so that get_content_items also issues its per-item reports query.
+    db.put_document('contentItems', 'probe-item', {
+        'status': 'for_moderation', 'reportedCount': 1, 'voteCount': 0, 'userId': 'probe-user',
+        'timestamp': 0, 'latitude': 0.0, 'longitude': 0.0,
+    })
+    db.put_document('reports', 'probe-report', {'contentId': 'probe-item', 'reason': 'probe'})
+
+    bucket = FakeBucket()
+    firebase_clients.use_clients(db=db, bucket=bucket)
+    try:
+        firestore_utils.get_admin_by_email('probe@example.com', logger)
+        firestore_utils.get_user_by_email('probe@example.com', logger)
+        firestore_utils.migrate_content_ownership('probe-user', 'probe-user-2', logger)
+        ownership_migration.process_pending_migrations(logger)
+        direct_uploads.release_expired_reservations(logger, bucket=bucket)
+        firestore_utils.get_published_items_for_map(logger)
+        firestore_utils.get_published_items_for_map(logger, user_id='probe-user')
+        for status in ('for_moderation', 'published', 'rejected', 'all'):
+            admin_services.get_dashboard_items(status, logger)
+        admin_services.get_dashboard_items(None, logger, view_type='reported')
+    finally:
+        firebase_clients.use_clients()
+    return sorted(set(db.executed_queries))
+
+
+def check_queries(manifest, executed_queries, shapes=None):
+    """Returns problems with executed queries: unregistered shapes and shapes without an index."""
+    problems = []
+    for collection, filters, order_by in executed_queries:
+        shape = match_registered_shape(collection, filters, order_by, shapes)
+        description = f"{collection} where {list(filters)} order by {list(order_by)}"
+        if shape is None:
+            problems.append(f"Unregistered query shape: {description}")
+            continue
+        try:
+            if find_serving_index(shape, manifest) is None:
+                problems.append(f"No index serves {shape.name}: {description}")
+        except InvalidQueryShape as e:
+            problems.append(str(e))
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate or check the Firestore composite index manifest.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    generate_parser = subparsers.add_parser('generate', help='Write the manifest from the query shape registry.')
+    generate_parser.add_argument('--output', default=DEFAULT_MANIFEST_PATH)
+    check_parser = subparsers.add_parser('check', help='Check the manifest and firestore_utils queries.')
+    check_parser.add_argument('--manifest', default=DEFAULT_MANIFEST_PATH)
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        with open(args.output, 'w') as manifest_file:
+            json.dump(build_manifest(), manifest_file, indent=2)
+            manifest_file.write('\n')
+        print(f"Wrote {len(build_manifest()['indexes'])} composite indexes to {args.output}")
+        return 0
+
+    manifest = load_manifest(args.manifest)
+    executed = capture_firestore_utils_queries()
+    problems = check_manifest(manifest) + check_queries(manifest, executed)
+    if problems:
+        print("Firestore index check failed:")
+        for problem in problems:
+            print(f"  - {problem}")
+        return 1
+    print(f"{len(QUERY_SHAPES)} registered query shapes and {len(executed)} executed queries are served by indexes.")
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(main())
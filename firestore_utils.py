@@ -1,21 +1,83 @@
-import firebase_admin # Added import for firebase_admin.get_app()
-from firebase_admin import firestore, storage
+import firebase_clients
+import identity_map
+import metrics
+import unit_of_work
+from firebase_admin import firestore
 from datetime import datetime, timedelta, timezone # <--- ДОБАВЛЕН ИМПОРТ
 from urllib.parse import urlparse, unquote
 import re # For parsing the image path
 
+BULK_WRITE_CHUNK_SIZE = 400  # Firestore batch limit is 500 operations
+MAX_BATCH_WRITES = 500
+MAX_BULK_CONTENT_IDS = 5000
+MAX_BATCH_GET_IDS = 300
+DELETION_TOMBSTONE_COLLECTION = 'contentDeletions'
+
+# userPostIndex/{userId} holds a compact copy of each of the user's posts under 'posts.<itemId>',
+# so the "my posts" map reads one document instead of querying contentItems. Text is truncated
+# to keep the document well below Firestore's 1 MiB limit.
+POST_INDEX_COLLECTION = 'userPostIndex'
+POST_INDEX_FIELDS = ('userId', 'latitude', 'longitude', 'imageUrl', 'text', 'status', 'voteCount', 'timestamp')
+POST_INDEX_TEXT_LENGTH = 500
+
 # Firestore client will be initialized dynamically within functions
 # db = firestore.client() # Removed global initialization
 
 def get_db_client():
     """Returns an initialized Firestore client using the current Firebase app."""
-    # Ensures that the client is created from the potentially mocked app instance.
-    app = firebase_admin.get_app()
-    return firestore.client(app=app)
+    # Ensures that the client is created from the potentially mocked app instance;
+    # the app itself is initialized on first use rather than at import time.
+    return firebase_clients.get_db()
+
+
+def _post_index_entry(item_id, data):
+    """Returns the post index fields present in data for item_id."""
+    entry = {'itemId': item_id}
+    for field in POST_INDEX_FIELDS:
+        if field in data:
+            entry[field] = data[field]
+    if isinstance(entry.get('text'), str):
+        entry['text'] = entry['text'][:POST_INDEX_TEXT_LENGTH]
+    return entry
+
+
+def _set_post_index_entries(writer, db, user_id, entries):
+    """
+    Merges entries ({item_id: fields to set, or firestore.DELETE_FIELD}) into the user's post
+    index through writer, a WriteBatch, Transaction or UnitOfWork. A merge is used so that the write also
+    works before the index document exists; such a document stays incomplete until it is
+    rebuilt on first read. Does nothing without a user id.
+    """
+    if not entries or not user_id:
+        return
+    writer.set(db.collection(POST_INDEX_COLLECTION).document(user_id),
+               {'userId': user_id, 'posts': entries, 'updatedAt': firestore.SERVER_TIMESTAMP}, merge=True)
+
+
+def _batches_with_index_writes(content_ids, owner_by_id, writes_per_item, max_items=BULK_WRITE_CHUNK_SIZE):
+    """
+    Splits content_ids into groups that fit in one WriteBatch together with one post index write
+    per distinct owner: at most max_items items and MAX_BATCH_WRITES writes.
+    """
+    group, owners = [], set()
+    for content_id in content_ids:
+        owner = owner_by_id.get(content_id)
+        new_owner = 1 if owner and owner not in owners else 0
+        if group and (len(group) >= max_items or
+                      (len(group) + 1) * writes_per_item + len(owners) + new_owner > MAX_BATCH_WRITES):
+            yield group
+            group, owners = [], set()
+        group.append(content_id)
+        if owner:
+            owners.add(owner)
+    if group:
+        yield group
+
 
 def save_content_item(data, app_logger):
     """
-    Saves a new content item to Firestore.
+    Saves a new content item to Firestore. Inside unit_of_work.begin() the writes join the
+    current unit of work and are committed with it; the returned ID is only saved once it is.
     """
     db = get_db_client()
     try:
@@ -26,12 +88,18 @@ def save_content_item(data, app_logger):
 
         doc_ref = db.collection('contentItems').document()
         data['itemId'] = doc_ref.id
-        doc_ref.set(data)
-        doc_ref.update({'shortUrl': doc_ref.id})
-        app_logger.info(f"Content item saved successfully with ID: {doc_ref.id}")
+        data['shortUrl'] = doc_ref.id
+        queued = unit_of_work.current() is not None
+        with unit_of_work.begin(db) as batch:
+            batch.set(doc_ref, data)
+            _set_post_index_entries(batch, db, data.get('userId'), {doc_ref.id: _post_index_entry(doc_ref.id, data)})
+        if queued:
+            app_logger.info("Content item %s queued in the current unit of work.", doc_ref.id)
+        else:
+            app_logger.info("Content item saved successfully with ID: %s", doc_ref.id)
         return doc_ref.id
     except Exception as e:
-        app_logger.error(f"Error saving content item to Firestore. Data: {str(data)[:200]}. Error: {e}", exc_info=True)
+        app_logger.error("Error saving content item of user %s to Firestore: %s", data.get('userId'), e, exc_info=True)
         return None
 
 
@@ -44,16 +112,16 @@ def get_admin_by_email(email, app_logger):
         admin_query_stream = db.collection('admins').where(field_path='email', op_string='==', value=email).limit(1).stream()
         admin_docs = list(admin_query_stream)
         if not admin_docs:
-            app_logger.info(f"No admin found with email: {email}")
+            app_logger.info("No admin found with email: %s", email)
             return None
 
         admin_doc = admin_docs[0]
         admin_data = admin_doc.to_dict()
         admin_data['id'] = admin_doc.id
-        app_logger.debug(f"Admin data retrieved for email {email}: {admin_doc.id}")
+        app_logger.debug("Admin data retrieved for email %s: %s", email, admin_doc.id)
         return admin_data
     except Exception as e:
-        app_logger.error(f"Error fetching admin by email '{email}': {e}", exc_info=True)
+        app_logger.error("Error fetching admin by email '%s': %s", email, e, exc_info=True)
         return None
 
 
@@ -70,13 +138,13 @@ def is_admin_uid(uid, app_logger):
         admin_ref = db.collection('admins').document(uid)
         admin_doc = admin_ref.get()
         if admin_doc.exists:
-            app_logger.info(f"is_admin_uid: UID {uid} confirmed as admin.")
+            app_logger.info("is_admin_uid: UID %s confirmed as admin.", uid)
             return True
         else:
-            app_logger.info(f"is_admin_uid: UID {uid} not found in admins collection.")
+            app_logger.info("is_admin_uid: UID %s not found in admins collection.", uid)
             return False
     except Exception as e:
-        app_logger.error(f"is_admin_uid: Error checking admin status for UID {uid}: {e}", exc_info=True)
+        app_logger.error("is_admin_uid: Error checking admin status for UID %s: %s", uid, e, exc_info=True)
         return False
 
 
@@ -113,14 +181,14 @@ def get_content_items(app_logger, status_filter=None, order_by_field='timestamp'
                     reports_ref = db.collection('reports').where(field_path='contentId', op_string='==', value=doc.id).stream()
                     item_data['reports'] = [report.to_dict() for report in reports_ref]
                 except Exception as report_e:
-                    app_logger.error(f"Error fetching reports for item {doc.id}: {report_e}", exc_info=True)
+                    app_logger.error("Error fetching reports for item %s: %s", doc.id, report_e, exc_info=True)
                     item_data['reports'] = []
             items.append(item_data)
         app_logger.info(
-            f"Fetched {len(items)} items with status_filter='{status_filter}', ordered by '{order_by_field}'.")
+            "Fetched %s items with status_filter='%s', ordered by '%s'.", len(items), status_filter, order_by_field)
         return items
     except Exception as e:
-        app_logger.error(f"Error fetching content items (status: {status_filter}, order: {order_by_field}): {e}",
+        app_logger.error("Error fetching content items (status: %s, order: %s): %s", status_filter, order_by_field, e,
                          exc_info=True)
         return []
 
@@ -137,35 +205,144 @@ def update_content_status(content_id, new_status, admin_id, app_logger):
             'moderated_by': admin_id,
             'moderated_at': firestore.SERVER_TIMESTAMP # Оставляем SERVER_TIMESTAMP, т.к. это прямое обновление
         }
-        content_ref.update(update_data)
-        app_logger.info(f"Content item {content_id} status updated to '{new_status}' by admin {admin_id}.")
+        content_data = identity_map.get_document(content_ref)
+        owner_id = content_data.get('userId') if content_data else None
+        batch = db.batch()
+        batch.update(content_ref, update_data)
+        _set_post_index_entries(batch, db, owner_id, {content_id: {'status': new_status}})
+        batch.commit()
+        identity_map.forget('contentItems', content_id)
+        app_logger.info("Content item %s status updated to '%s' by admin %s.", content_id, new_status, admin_id)
         return True
     except Exception as e:
-        app_logger.error(f"Error updating status for content {content_id} to '{new_status}': {e}", exc_info=True)
+        app_logger.error("Error updating status for content %s to '%s': %s", content_id, new_status, e, exc_info=True)
         return False
 
 
 def get_content_item(content_id, app_logger):
     """
-    Fetches a single content item by its ID.
+    Fetches a single content item by its ID (at most once per request, see identity_map).
     """
     db = get_db_client()
     try:
         doc_ref = db.collection('contentItems').document(content_id)
-        doc = doc_ref.get()
-        if doc.exists:
-            item_data = doc.to_dict()
-            item_data['itemId'] = doc.id
-            app_logger.debug(f"Content item {content_id} fetched successfully.")
+        item_data = identity_map.get_document(doc_ref)
+        if item_data is not None:
+            item_data['itemId'] = content_id
+            app_logger.debug("Content item %s fetched successfully.", content_id)
             return item_data
         else:
-            app_logger.warning(f"Content item {content_id} not found.")
+            app_logger.warning("Content item %s not found.", content_id)
             return None
     except Exception as e:
-        app_logger.error(f"Error fetching content item {content_id}: {e}", exc_info=True)
+        app_logger.error("Error fetching content item %s: %s", content_id, e, exc_info=True)
         return None
 
 
+def _project_fields(data, field_paths):
+    """Returns the given dotted field paths of data, like a Firestore field mask."""
+    projected = {}
+    for field_path in field_paths:
+        value, parts = data, field_path.split('.')
+        for part in parts:
+            if not isinstance(value, dict) or part not in value:
+                break
+            value = value[part]
+        else:
+            target = projected
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+            target[parts[-1]] = value
+    return projected
+
+
+def get_content_items_by_ids(content_ids, app_logger, fields=None):
+    """
+    Fetches several content items with chunked get_all() calls instead of one get per ID.
+    Returns a list in the order of content_ids holding each item (with 'itemId', as
+    get_content_item returns it) or None where the item does not exist. With fields (field
+    paths) only those fields are read. Documents already read in this request come from the
+    identity map, and full reads are added to it; masked reads are not, as they are partial.
+    Returns None if Firestore cannot be read.
+    """
+    db = get_db_client()
+    unique_ids = _unique_ids(content_ids)
+    try:
+        items, to_fetch = identity_map.lookup_many('contentItems', unique_ids)
+        if fields:
+            items = {content_id: _project_fields(data, fields) if data is not None else None
+                     for content_id, data in items.items()}
+        if to_fetch:
+            snapshots = _get_snapshots_by_id(db, 'contentItems', to_fetch, field_paths=fields)
+            for content_id in to_fetch:
+                snapshot = snapshots.get(content_id)
+                items[content_id] = snapshot.to_dict() if snapshot is not None else None
+                if not fields:
+                    identity_map.remember('contentItems', content_id, items[content_id])
+    except Exception as e:
+        app_logger.error("Error fetching %s content items: %s", len(unique_ids), e, exc_info=True)
+        return None
+
+    app_logger.debug("Fetched %s content items, %s of them from Firestore.", len(content_ids), len(to_fetch))
+    return _items_in_order(content_ids, items)
+
+
+def _items_in_order(content_ids, items):
+    """Lists items ({content_id: data or None}) in the order of content_ids, with 'itemId' set."""
+    results = []
+    for content_id in content_ids:
+        data = items.get(content_id)
+        if data is not None:
+            data = dict(data, itemId=content_id)
+        results.append(data)
+    return results
+
+
+def _plan_vote(content_id, doc_data, user_id, vote_value, app_logger):
+    """
+    Decides a vote on the item data doc_data. Returns (result, update, index_entry): the
+    result dict to return and, unless the vote is rejected or changes nothing (update is None),
+    the contentItems field update and post index entry to write before returning it.
+    Shared with firestore_async.record_vote.
+    """
+    if doc_data.get('status') == 'for_moderation':
+        app_logger.info("Attempt to vote on content under moderation: %s", content_id)
+        return {'error': 'Cannot vote for content under moderation', 'status_code': 403}, None, None
+
+    voters = doc_data.get('voters', {})
+    current_vote_count = doc_data.get('voteCount', 0)
+    new_vote_count = current_vote_count
+
+    if user_id in voters and voters[user_id] == vote_value:
+        app_logger.info("User %s already voted this way for %s.", user_id, content_id)
+        return {'message': 'You have already voted this way', 'newVoteCount': current_vote_count,
+                'status_code': 200}, None, None
+
+    if user_id in voters:
+        previous_vote_val = voters[user_id]
+        new_vote_count = current_vote_count - previous_vote_val + vote_value
+    else:
+        new_vote_count = current_vote_count + vote_value
+
+    voters_update_payload = {f'voters.{user_id}': vote_value}
+
+    update_payload_counts_voters = {
+        'voteCount': new_vote_count,
+    }
+    for key, value in voters_update_payload.items():
+        update_payload_counts_voters[key] = value
+
+    vote_history_entry = {
+        'userId': user_id,
+        'value': vote_value,
+        'timestamp': datetime.now(timezone.utc),  # <--- ИЗМЕНЕНО
+        'isAnonymous': True
+    }
+    update_payload_counts_voters['voteHistory'] = firestore.ArrayUnion([vote_history_entry])
+    result = {'message': 'Vote recorded', 'newVoteCount': new_vote_count, 'status_code': 200}
+    return result, update_payload_counts_voters, {'voteCount': new_vote_count}
+
+
 def record_vote(content_id, user_id, vote_value, app_logger, current_item_data=None):
     """
     Records a vote for a content item.
@@ -178,58 +355,72 @@ def record_vote(content_id, user_id, vote_value, app_logger, current_item_data=N
     try:
         if current_item_data:
             doc_data = current_item_data
-            app_logger.debug(f"Using provided item data for vote on {content_id}")
+            app_logger.debug("Using provided item data for vote on %s", content_id)
         else:
-            app_logger.debug(f"Fetching item data for vote on {content_id}")
-            doc_snapshot = doc_ref.get()
-            if not doc_snapshot.exists:
-                app_logger.warning(f"Content not found for voting: {content_id}")
+            app_logger.debug("Fetching item data for vote on %s", content_id)
+            doc_data = identity_map.get_document(doc_ref)
+            if doc_data is None:
+                app_logger.warning("Content not found for voting: %s", content_id)
                 return {'error': 'Content not found', 'status_code': 404}
-            doc_data = doc_snapshot.to_dict()
-
-        if doc_data.get('status') == 'for_moderation':
-            app_logger.info(f"Attempt to vote on content under moderation: {content_id}")
-            return {'error': 'Cannot vote for content under moderation', 'status_code': 403}
-
-        voters = doc_data.get('voters', {})
-        current_vote_count = doc_data.get('voteCount', 0)
-        new_vote_count = current_vote_count
 
-        if user_id in voters and voters[user_id] == vote_value:
-            app_logger.info(f"User {user_id} already voted this way for {content_id}.")
-            return {'message': 'You have already voted this way', 'newVoteCount': current_vote_count,
-                    'status_code': 200}
+        result, update, index_entry = _plan_vote(content_id, doc_data, user_id, vote_value, app_logger)
+        if update is None:
+            return result
+        batch = db.batch()
+        batch.update(doc_ref, update)
+        _set_post_index_entries(batch, db, doc_data.get('userId'), {content_id: index_entry})
+        batch.commit()
+        identity_map.forget('contentItems', content_id)
 
-        if user_id in voters:
-            previous_vote_val = voters[user_id]
-            new_vote_count = current_vote_count - previous_vote_val + vote_value
-        else:
-            new_vote_count = current_vote_count + vote_value
+        app_logger.info("Vote recorded for %s by user %s. New count: %s", content_id, user_id, result['newVoteCount'])
+        return result
+    except Exception as e:
+        app_logger.error("Error recording vote for content %s: %s", content_id, e, exc_info=True)
+        return {'error': str(e), 'status_code': 500}
 
-        voters_update_payload = {f'voters.{user_id}': vote_value}
 
-        update_payload_counts_voters = {
-            'voteCount': new_vote_count,
-        }
-        for key, value in voters_update_payload.items():
-            update_payload_counts_voters[key] = value
-        doc_ref.update(update_payload_counts_voters)
-
-        vote_history_entry = {
-            'userId': user_id,
-            'value': vote_value,
-            'timestamp': datetime.now(timezone.utc),  # <--- ИЗМЕНЕНО
-            'isAnonymous': True
-        }
-        doc_ref.update({
-            'voteHistory': firestore.ArrayUnion([vote_history_entry])
-        })
+def _plan_report(content_id, doc_data, user_id, reason, app_logger):
+    """
+    Decides a report on the item data doc_data; returns (result, update, index_entry) like
+    _plan_vote. index_entry is None unless the report sends the item to moderation.
+    Shared with firestore_async.record_report.
+    """
+    if doc_data.get('status') == 'for_moderation':
+        app_logger.info("Attempt to report content already under moderation: %s", content_id)
+        return {'error': 'This content is already under moderation', 'status_code': 403}, None, None
+
+    reporters = doc_data.get('reporters', [])
+    if user_id in reporters:
+        app_logger.info("User %s already reported content %s.", user_id, content_id)
+        return {'message': 'You have already reported this content', 'status_code': 200}, None, None
+
+    current_reports_count = doc_data.get('reportedCount', 0)
+    new_reports_count = current_reports_count + 1
+    report_entry = {
+        'reason': reason,
+        'timestamp': datetime.now(timezone.utc), # <--- ИЗМЕНЕНО
+        'userId': user_id,
+        'isAnonymous': True
+    }
+
+    update_payload = {
+        'reportedCount': new_reports_count,
+        'reports': firestore.ArrayUnion([report_entry]),
+        'reporters': firestore.ArrayUnion([user_id])
+    }
+
+    REPORT_THRESHOLD = 3
+    index_entry = None
+    if new_reports_count >= REPORT_THRESHOLD and doc_data.get('status') == 'published':
+        app_logger.info(
+            "Content %s reached %s reports, changing status to for_moderation.", content_id, new_reports_count
+        )
+        update_payload['status'] = 'for_moderation'
+        update_payload['moderation_note'] = f'Automatically sent for moderation ({new_reports_count} reports)'
+        update_payload['moderation_timestamp'] = datetime.now(timezone.utc) # <--- ИЗМЕНЕНО для консистентности
+        index_entry = {'status': update_payload['status']}
 
-        app_logger.info(f"Vote recorded for {content_id} by user {user_id}. New count: {new_vote_count}")
-        return {'message': 'Vote recorded', 'newVoteCount': new_vote_count, 'status_code': 200}
-    except Exception as e:
-        app_logger.error(f"Error recording vote for content {content_id}: {e}", exc_info=True)
-        return {'error': str(e), 'status_code': 500}
+    return {'message': 'Report submitted', 'status_code': 200}, update_payload, index_entry
 
 
 def record_report(content_id, user_id, reason, app_logger):
@@ -239,57 +430,32 @@ def record_report(content_id, user_id, reason, app_logger):
     db = get_db_client()
     try:
         doc_ref = db.collection('contentItems').document(content_id)
-        doc = doc_ref.get()
+        doc_data = identity_map.get_document(doc_ref)
 
-        if not doc.exists:
-            app_logger.warning(f"Content not found for reporting: {content_id}")
+        if doc_data is None:
+            app_logger.warning("Content not found for reporting: %s", content_id)
             return {'error': 'Content not found', 'status_code': 404}
 
-        doc_data = doc.to_dict()
-        if doc_data.get('status') == 'for_moderation':
-            app_logger.info(f"Attempt to report content already under moderation: {content_id}")
-            return {'error': 'This content is already under moderation', 'status_code': 403}
-
-        reporters = doc_data.get('reporters', [])
-        if user_id in reporters:
-            app_logger.info(f"User {user_id} already reported content {content_id}.")
-            return {'message': 'You have already reported this content', 'status_code': 200}
-
-        current_reports_count = doc_data.get('reportedCount', 0)
-        new_reports_count = current_reports_count + 1
-        report_entry = {
-            'reason': reason,
-            'timestamp': datetime.now(timezone.utc), # <--- ИЗМЕНЕНО
-            'userId': user_id,
-            'isAnonymous': True
-        }
-
-        update_payload = {
-            'reportedCount': new_reports_count,
-            'reports': firestore.ArrayUnion([report_entry]),
-            'reporters': firestore.ArrayUnion([user_id])
-        }
-
-        REPORT_THRESHOLD = 3
-        if new_reports_count >= REPORT_THRESHOLD and doc_data.get('status') == 'published':
-            app_logger.info(
-                f"Content {content_id} reached {new_reports_count} reports, changing status to for_moderation."
-            )
-            update_payload['status'] = 'for_moderation'
-            update_payload['moderation_note'] = f'Automatically sent for moderation ({new_reports_count} reports)'
-            update_payload['moderation_timestamp'] = datetime.now(timezone.utc) # <--- ИЗМЕНЕНО для консистентности
-
-        doc_ref.update(update_payload)
-        app_logger.info(f"Report submitted for {content_id} by user {user_id}.")
-        return {'message': 'Report submitted', 'status_code': 200}
+        result, update, index_entry = _plan_report(content_id, doc_data, user_id, reason, app_logger)
+        if update is None:
+            return result
+        batch = db.batch()
+        batch.update(doc_ref, update)
+        if index_entry:
+            _set_post_index_entries(batch, db, doc_data.get('userId'), {content_id: index_entry})
+        batch.commit()
+        identity_map.forget('contentItems', content_id)
+        app_logger.info("Report submitted for %s by user %s.", content_id, user_id)
+        return result
     except Exception as e:
-        app_logger.error(f"Error submitting report for content {content_id}: {e}", exc_info=True)
+        app_logger.error("Error submitting report for content %s: %s", content_id, e, exc_info=True)
         return {'error': str(e), 'status_code': 500}
 
 
 def create_web_content_item(data, app_logger):
     """
-    Creates a new content item from web/API submission.
+    Creates a new content item from web/API submission. Inside unit_of_work.begin() the writes
+    join the current unit of work and are committed with it; the returned ID is only saved once it is.
     """
     db = get_db_client()
     try:
@@ -301,29 +467,124 @@ def create_web_content_item(data, app_logger):
 
         doc_ref = db.collection('contentItems').document()
         data['itemId'] = doc_ref.id
-        doc_ref.set(data)
-        app_logger.info(f"Web content item created successfully with ID: {doc_ref.id}")
+        queued = unit_of_work.current() is not None
+        with unit_of_work.begin(db) as batch:
+            batch.set(doc_ref, data)
+            _set_post_index_entries(batch, db, data.get('userId'), {doc_ref.id: _post_index_entry(doc_ref.id, data)})
+        if queued:
+            app_logger.info("Web content item %s queued in the current unit of work.", doc_ref.id)
+        else:
+            app_logger.info("Web content item created successfully with ID: %s", doc_ref.id)
         return doc_ref.id
     except Exception as e:
-        app_logger.error(f"Error creating web content item. Data: {str(data)[:200]}. Error: {e}", exc_info=True)
+        app_logger.error("Error creating web content item of user %s: %s", data.get('userId'), e, exc_info=True)
         return None
 
 
+def rebuild_user_post_index(user_id, app_logger):
+    """
+    Rebuilds the user's post index from their contentItems (one query) and marks it complete.
+    The query and the write run in a transaction that also reads the index document. Every write
+    that changes one of the user's posts writes that document too, so a post created, voted on or
+    deleted meanwhile makes the transaction retry instead of going missing from the index.
+    Returns the index entries as {item_id: entry}.
+    """
+    db = get_db_client()
+    index_ref = db.collection(POST_INDEX_COLLECTION).document(user_id)
+    query = db.collection('contentItems').where(field_path='userId', op_string='==', value=user_id)
+
+    @firestore.transactional
+    def rebuild(transaction):
+        index_ref.get(transaction=transaction)
+        entries = {doc.id: _post_index_entry(doc.id, doc.to_dict()) for doc in query.stream(transaction=transaction)}
+        # Replaces the posts map so that stale entries disappear, keeping other fields (mergedFrom).
+        transaction.set(index_ref, {
+            'userId': user_id, 'posts': entries, 'complete': True, 'updatedAt': firestore.SERVER_TIMESTAMP
+        }, merge=['userId', 'posts', 'complete', 'updatedAt'])
+        return entries
+
+    entries = rebuild(db.transaction())
+    app_logger.info("Rebuilt post index for user %s with %d items.", user_id, len(entries))
+    return entries
+
+
+def get_user_post_index(user_id, app_logger, include_merges=True):
+    """
+    Returns {item_id: entry} for all of the user's posts, whatever their status, from the user's
+    post index document. Missing or incomplete indexes are rebuilt first.
+    While an account merge is in progress the index lists the old user IDs in 'mergedFrom'
+    (see ownership_migration); their not yet migrated posts are included unless include_merges
+    is False.
+    """
+    db = get_db_client()
+    index_doc = db.collection(POST_INDEX_COLLECTION).document(user_id).get()
+    index_data = index_doc.to_dict() if index_doc.exists else None
+    if not index_data or not index_data.get('complete'):
+        entries = rebuild_user_post_index(user_id, app_logger)
+    else:
+        entries = index_data.get('posts') or {}
+    merged_from = ((index_data or {}).get('mergedFrom') or []) if include_merges else []
+    if merged_from:
+        combined = {}
+        for old_user_id in merged_from:
+            combined.update(get_user_post_index(old_user_id, app_logger, include_merges=False))
+        combined.update(entries)
+        entries = combined
+    return entries
+
+
+def is_content_owner(author_id, user_id, app_logger):
+    """
+    Returns whether user_id may change content written by author_id: their own, or that of an
+    account merged into theirs whose posts are still being migrated (listed in 'mergedFrom' of
+    their post index, see ownership_migration).
+    """
+    if author_id == user_id:
+        return True
+    if not author_id or not user_id:
+        return False
+    try:
+        index_doc = get_db_client().collection(POST_INDEX_COLLECTION).document(user_id).get()
+    except Exception as e:
+        app_logger.error("Error reading the post index of user %s: %s", user_id, e, exc_info=True)
+        return False
+    merged_from = (index_doc.to_dict() or {}).get('mergedFrom') if index_doc.exists else None
+    return isinstance(merged_from, list) and author_id in merged_from
+
+
+def _published_items_from_index(entries):
+    """Published entries with coordinates, ordered like the map query: voteCount asc, timestamp desc."""
+    items = [dict(entry, itemId=item_id) for item_id, entry in entries.items()
+             if isinstance(entry, dict) and entry.get('status') == 'published'
+             and 'latitude' in entry and 'longitude' in entry]
+    items.sort(key=lambda item: item['itemId'])
+    timestamped = [item for item in items if isinstance(item.get('timestamp'), datetime)]
+    untimestamped = [item for item in items if not isinstance(item.get('timestamp'), datetime)]
+    timestamped.sort(key=lambda item: item['timestamp'], reverse=True)
+    items = timestamped + untimestamped
+    items.sort(key=lambda item: item.get('voteCount') or 0)
+    return items
+
+
 def get_published_items_for_map(app_logger, user_id=None):
     """
     Fetches published content items suitable for map display.
-    If user_id is provided, only returns items created by that user.
+    If user_id is provided, only returns items created by that user; they come from the
+    user's post index document instead of a query over contentItems.
     """
+    if user_id:
+        try:
+            items_for_map = _published_items_from_index(get_user_post_index(user_id, app_logger))
+            app_logger.info("Fetched %s published items for map display for user %s.", len(items_for_map), user_id)
+            return items_for_map
+        except Exception as e:
+            app_logger.error("Error fetching published items for map for user %s: %s", user_id, e, exc_info=True)
+            return []
+
     db = get_db_client()
     try:
-        # Начинаем с базового запроса
         items_query = db.collection('contentItems').where(field_path='status', op_string='==', value='published')
 
-        # Добавляем фильтр по userId, если он указан
-        if user_id:
-            items_query = items_query.where(field_path='userId', op_string='==', value=user_id)
-            app_logger.debug(f"Filtering map items for user ID: {user_id}")
-
         # Добавляем сортировку
         items_query = items_query.order_by('voteCount', direction=firestore.Query.ASCENDING) \
                              .order_by('timestamp', direction=firestore.Query.DESCENDING)
@@ -336,13 +597,12 @@ def get_published_items_for_map(app_logger, user_id=None):
             if 'latitude' in item_data and 'longitude' in item_data:
                 items_for_map.append(item_data)
             else:
-                app_logger.debug(f"Item {item_doc.id} skipped for map, missing coordinates.")
+                app_logger.debug("Item %s skipped for map, missing coordinates.", item_doc.id)
 
-        filter_message = f" for user {user_id}" if user_id else ""
-        app_logger.info(f"Fetched {len(items_for_map)} published items for map display{filter_message}.")
+        app_logger.info("Fetched %s published items for map display.", len(items_for_map))
         return items_for_map
     except Exception as e:
-        app_logger.error(f"Error fetching published items for map: {e}", exc_info=True)
+        app_logger.error("Error fetching published items for map: %s", e, exc_info=True)
         return []
 
 
@@ -370,30 +630,30 @@ def create_user(uid, email, display_name, provider, app_logger):
             'subscription_id': None
         }
         user_ref.set(user_data)
-        app_logger.info(f"User created successfully with UID: {uid}")
+        identity_map.forget('users', uid)
+        app_logger.info("User created successfully with UID: %s", uid)
         return user_data
     except Exception as e:
-        app_logger.error(f"Error creating user {uid}: {e}", exc_info=True)
+        app_logger.error("Error creating user %s: %s", uid, e, exc_info=True)
         return None
 
 
 def get_user(uid, app_logger):
     """
-    Fetches a user document by UID from Firestore.
+    Fetches a user document by UID from Firestore (at most once per request, see identity_map).
     """
     db_client = get_db_client() # Renamed to avoid conflict with global 'db' in app.py if imported there
     try:
         user_ref = db_client.collection('users').document(uid)
-        doc = user_ref.get()
-        if doc.exists:
-            user_data = doc.to_dict()
-            app_logger.debug(f"User data fetched successfully for UID: {uid}")
+        user_data = identity_map.get_document(user_ref)
+        if user_data is not None:
+            app_logger.debug("User data fetched successfully for UID: %s", uid)
             return user_data
         else:
-            app_logger.warning(f"User document not found for UID: {uid}")
+            app_logger.warning("User document not found for UID: %s", uid)
             return None
     except Exception as e:
-        app_logger.error(f"Error fetching user {uid}: {e}", exc_info=True)
+        app_logger.error("Error fetching user %s: %s", uid, e, exc_info=True)
         return None
 
 
@@ -411,134 +671,125 @@ def get_user_by_email(email, app_logger):
         if user_list:
             user_doc = user_list[0]
             user_data = user_doc.to_dict()
-            app_logger.debug(f"User data fetched successfully for email: {email}")
+            # A following get_user(uid) for the same user is served from the identity map
+            identity_map.remember('users', user_doc.id, user_data)
+            app_logger.debug("User data fetched successfully for email: %s", email)
             return user_data
         else:
-            app_logger.warning(f"User document not found for email: {email}")
+            app_logger.warning("User document not found for email: %s", email)
             return None
     except Exception as e:
-        app_logger.error(f"Error fetching user by email {email}: {e}", exc_info=True)
+        app_logger.error("Error fetching user by email %s: %s", email, e, exc_info=True)
         return None
 
 def migrate_content_ownership(old_user_id, new_user_id, app_logger):
     """
-    Updates the userId in contentItems from old_user_id to new_user_id.
+    Updates the userId in contentItems from old_user_id to new_user_id and moves the items
+    between the two users' post indexes, synchronously. Sign-in flows start the same job in
+    the background with ownership_migration.start_migration instead.
     """
     if old_user_id == new_user_id:
-        app_logger.info(f"Old UID and New UID are the same ({old_user_id}). No content migration needed.")
+        app_logger.info("Old UID and New UID are the same (%s). No content migration needed.", old_user_id)
         return True
-    db = get_db_client()
-    try:
-        content_items_ref = db.collection('contentItems')
-        query = content_items_ref.where(field_path='userId', op_string='==', value=old_user_id)
-        docs_to_update = query.stream()
-
-        updated_count = 0
-        batch = db.batch()
-        for doc in docs_to_update:
-            app_logger.info(f"Migrating content item {doc.id} from user {old_user_id} to {new_user_id}")
-            batch.update(doc.reference, {'userId': new_user_id})
-            updated_count += 1
-            if updated_count % 400 == 0:  # Firestore batch limit is 500 operations
-                batch.commit()
-                batch = db.batch()
-
-        if updated_count % 400 != 0:  # Commit any remaining operations
-            batch.commit()
+    import ownership_migration  # Imported here because ownership_migration imports this module
 
-        app_logger.info(f"Successfully migrated {updated_count} content items from {old_user_id} to {new_user_id}.")
-        return True
+    try:
+        if not ownership_migration.start_migration(old_user_id, new_user_id, app_logger, background=False):
+            return False
+        result = ownership_migration.run_migration(old_user_id, app_logger)
+        return result['status'] == 'done'
     except Exception as e:
-        app_logger.error(f"Error migrating content ownership from {old_user_id} to {new_user_id}: {e}", exc_info=True)
+        app_logger.error("Error migrating content ownership from %s to %s: %s",
+                         old_user_id, new_user_id, e, exc_info=True)
         return False
 
 
+def parse_storage_image_path(image_url):
+    """
+    Returns the object path inside the bucket for a Firebase Storage or GCS public URL,
+    or None if the URL does not point to our storage.
+    """
+    if not image_url:
+        return None
+    parsed_url = urlparse(image_url)
+    if 'firebasestorage.googleapis.com' in parsed_url.netloc:
+        # https://firebasestorage.googleapis.com/v0/b/<bucket>/o/<encoded path>?alt=media
+        match = re.search(r'/o/([^?]+)', parsed_url.path)
+        return unquote(match.group(1)) if match else None
+    if parsed_url.netloc == 'storage.googleapis.com':
+        # https://storage.googleapis.com/<bucket>/<path> (blob.public_url)
+        parts = parsed_url.path.lstrip('/').split('/', 1)
+        return unquote(parts[1]) if len(parts) == 2 and parts[1] else None
+    return None
+
+
+def _build_deletion_tombstone(content_id, content_data):
+    """
+    Builds the tombstone written next to a content delete. It records the cleanup
+    still owed for the item: the Storage blob and the author's photo counter.
+    """
+    image_url = content_data.get('imageUrl')
+    image_path = parse_storage_image_path(image_url)
+    return {
+        'contentId': content_id,
+        'userId': content_data.get('userId'),
+        'imageUrl': image_url,
+        'imagePath': image_path,
+        'storageDeleted': image_path is None,
+        'quotaReleased': not image_url,
+        'attempts': 0,
+        'lastError': None,
+        'createdAt': firestore.SERVER_TIMESTAMP
+    }
+
+
 def delete_content_item(content_id, user_id, app_logger, is_admin_delete=False):
     """
-    Deletes a content item from Firestore and its associated image from Firebase Storage.
-    Decrements the user's photo upload count if an image was deleted.
+    Deletes a content item from Firestore. If the item had an image, a tombstone is
+    written in the same batch and the Storage delete and photo counter decrement are
+    left to deletion_worker, so the request does not wait for them.
     """
     db = get_db_client()
     try:
         content_ref = db.collection('contentItems').document(content_id)
-        content_doc = content_ref.get()
+        content_data = identity_map.get_document(content_ref)
 
-        if not content_doc.exists:
-            app_logger.warning(f"Content item {content_id} not found for deletion.")
+        if content_data is None:
+            app_logger.warning("Content item %s not found for deletion.", content_id)
             return {'status': 'error', 'message': 'Content not found', 'code': 404}
 
-        content_data = content_doc.to_dict()
         author_id = content_data.get('userId')
-        image_url = content_data.get('imageUrl')
 
         # Важно: Проверка авторизации должна оставаться здесь,
         # чтобы только владелец мог удалить свой контент.
-        if not is_admin_delete and author_id != user_id:
-            app_logger.warning(f"User {user_id} not authorized to delete content {content_id} owned by {author_id}.")
+        if not is_admin_delete and not is_content_owner(author_id, user_id, app_logger):
+            app_logger.warning("User %s not authorized to delete content %s owned by %s.",
+                               user_id, content_id, author_id)
             return {'status': 'error', 'message': 'User not authorized to delete this content', 'code': 403}
 
-        # Сначала удаляем документ из Firestore
-        content_ref.delete()
-        app_logger.info(f"Content item {content_id} deleted successfully from Firestore.")
+        batch = db.batch()
+        batch.delete(content_ref)
+        _set_post_index_entries(batch, db, author_id, {content_id: firestore.DELETE_FIELD})
+        if not content_data.get('imageUrl'):
+            batch.commit()
+            identity_map.forget('contentItems', content_id)
+            app_logger.info("Content item %s (no image) deleted successfully from Firestore.", content_id)
+            return {'status': 'success', 'message': 'Content deleted successfully', 'code': 200}
 
-        image_deleted_from_storage = False # Флаг для отслеживания удаления из Storage
+        # Удаление документа и запись tombstone атомарны: очистка не потеряется при сбое.
+        batch.set(db.collection(DELETION_TOMBSTONE_COLLECTION).document(content_id),
+                  _build_deletion_tombstone(content_id, content_data))
+        batch.commit()
+        identity_map.forget('contentItems', content_id)
+        app_logger.info("Content item %s deleted from Firestore; image cleanup scheduled.", content_id)
 
-        if image_url:
-            if 'firebasestorage.googleapis.com' in image_url:
-                try:
-                    parsed_url = urlparse(image_url)
-                    match = re.search(r'/o/([^?]+)', parsed_url.path)
-                    if match:
-                        image_path = unquote(match.group(1))
-                        bucket = storage.bucket()
-                        blob = bucket.blob(image_path)
-
-                        if blob.exists():
-                            blob.delete()
-                            app_logger.info(f"Image {image_path} deleted successfully from Firebase Storage for content {content_id}.")
-                            image_deleted_from_storage = True # Устанавливаем флаг
-                        else:
-                            app_logger.warning(f"Image {image_path} not found in Firebase Storage for content {content_id}.")
-                    else:
-                        app_logger.warning(f"Could not parse image path from URL: {image_url} for content {content_id}")
-                except Exception as e:
-                    app_logger.error(f"Error deleting image {image_url} from Firebase Storage for content {content_id}: {e}", exc_info=True)
-                    # Даже если удаление из Storage не удалось, продолжаем, т.к. запись из Firestore удалена.
-                    # Можно добавить более сложную логику обработки ошибок здесь.
-            else:
-                app_logger.info(f"Image URL {image_url} is not a Firebase Storage URL, skipping deletion for content {content_id}.")
-
-        # Уменьшаем счетчик фото, если было изображение и оно было связано с этим контентом
-        # (независимо от того, успешно ли оно удалилось из Storage, т.к. запись контента удалена)
-        # ИЛИ если image_deleted_from_storage is True (если хотите уменьшать только при успешном удалении из Storage)
-        if image_url:
-            try:
-                user_ref = db.collection('users').document(author_id) # Используем author_id
-                user_doc = user_ref.get()
-                if user_doc.exists:
-                    # Уменьшаем счетчик, но не позволяем ему стать отрицательным,
-                    # хотя Firestore.Increment(-1) сам по себе не предотвратит < 0,
-                    # если значение уже 0. Лучше проверить.
-                    current_count = user_doc.to_dict().get('photo_upload_count_current_month', 0)
-                    if current_count > 0:
-                        user_ref.update({
-                            'photo_upload_count_current_month': firestore.Increment(-1)
-                        })
-                        app_logger.info(f"Decremented photo upload count for user {author_id} for deleted content {content_id} (had image).")
-                    else:
-                        app_logger.info(f"Photo upload count for user {author_id} is already 0 or not set, not decrementing (had image).")
-                else:
-                    app_logger.warning(f"User {author_id} not found, cannot decrement photo count for deleted content {content_id} (had image).")
-            except Exception as e:
-                app_logger.error(f"Error decrementing photo count for user {author_id} after deleting content {content_id} (had image): {e}", exc_info=True)
-                # Ошибка здесь не должна прерывать общий успех удаления контента.
-        else:
-            app_logger.info(f"Content item {content_id} did not have an imageUrl. Skipping photo count decrement for user {author_id}.")
+        import deletion_worker  # Imported here because deletion_worker imports this module
+        deletion_worker.schedule_deletion(content_id, app_logger)
 
         return {'status': 'success', 'message': 'Content deleted successfully', 'code': 200}
 
     except Exception as e:
-        app_logger.error(f"An unexpected error occurred while deleting content {content_id}: {e}", exc_info=True)
+        app_logger.error("An unexpected error occurred while deleting content %s: %s", content_id, e, exc_info=True)
         return {'status': 'error', 'message': 'An unexpected error occurred', 'code': 500}
 
 
@@ -555,12 +806,259 @@ def update_web_content_item(content_id, data, app_logger):
     data_to_update = data.copy() # Avoid modifying the original dict passed to the function
     data_to_update['timestamp_updated'] = firestore.SERVER_TIMESTAMP
 
-    app_logger.info(f"Attempting to update content item {content_id} with data fields: {list(data_to_update.keys())}")
+    app_logger.info("Attempting to update content item %s with data fields: %s",
+                    content_id, list(data_to_update.keys()))
 
     try:
-        doc_ref.update(data_to_update)
-        app_logger.info(f"Content item {content_id} updated successfully in Firestore.")
+        index_fields = {field: value for field, value in data.items() if field in POST_INDEX_FIELDS and field != 'userId'}
+        owner_id = None
+        if index_fields:
+            content_data = identity_map.get_document(doc_ref)
+            owner_id = content_data.get('userId') if content_data else None
+        batch = db.batch()
+        batch.update(doc_ref, data_to_update)
+        if owner_id:
+            _set_post_index_entries(batch, db, owner_id, {content_id: _post_index_entry(content_id, index_fields)})
+        batch.commit()
+        identity_map.forget('contentItems', content_id)
+        app_logger.info("Content item %s updated successfully in Firestore.", content_id)
         return True
     except Exception as e:
-        app_logger.error(f"Error updating content item {content_id} in Firestore: {e}", exc_info=True)
-        return False
\ No newline at end of file
+        app_logger.error("Error updating content item %s in Firestore: %s", content_id, e, exc_info=True)
+        return False
+
+def _chunked(sequence, size):
+    """Yields consecutive slices of at most `size` elements."""
+    for start in range(0, len(sequence), size):
+        yield sequence[start:start + size]
+
+
+def _unique_ids(content_ids):
+    """Drops empty, non-string and duplicate IDs while keeping the caller's order."""
+    seen = set()
+    unique = []
+    for content_id in content_ids or []:
+        if isinstance(content_id, str) and content_id and content_id not in seen:
+            seen.add(content_id)
+            unique.append(content_id)
+    return unique
+
+
+def _get_snapshots_by_id(db, collection_name, doc_ids, field_paths=None):
+    """
+    Fetches many documents with chunked get_all() calls, optionally only the given field paths.
+    Returns a dict {doc_id: snapshot} containing only existing documents.
+    """
+    snapshots = {}
+    refs = [db.collection(collection_name).document(doc_id) for doc_id in doc_ids]
+    for refs_chunk in _chunked(refs, BULK_WRITE_CHUNK_SIZE):
+        for snapshot in db.get_all(refs_chunk, field_paths=field_paths):
+            if snapshot.exists:
+                snapshots[snapshot.id] = snapshot
+    return snapshots
+
+
+def _bulk_result(results, action, app_logger):
+    """Builds the summary returned by the bulk moderation functions."""
+    succeeded = sum(1 for result in results if result['status'] == 'success')
+    failed = len(results) - succeeded
+    if failed == 0:
+        status = 'success'
+    elif succeeded == 0:
+        status = 'error'
+    else:
+        status = 'partial_success'
+    app_logger.info("Bulk %s: %s succeeded, %s failed out of %s items.", action, succeeded, failed, len(results))
+    return {'status': status, 'succeeded': succeeded, 'failed': failed, 'results': results}
+
+
+def bulk_update_content_status(content_ids, new_status, admin_id, app_logger):
+    """
+    Updates the status of many content items using chunked WriteBatch commits.
+    Returns a summary dict with per-item results in the order of content_ids.
+    """
+    content_ids = _unique_ids(content_ids)
+    db = get_db_client()
+    try:
+        snapshots = _get_snapshots_by_id(db, 'contentItems', content_ids)
+    except Exception as e:
+        app_logger.error("Bulk status update to '%s': error fetching items: %s", new_status, e, exc_info=True)
+        results = [{'contentId': cid, 'status': 'error', 'message': 'Failed to fetch content', 'code': 500}
+                   for cid in content_ids]
+        return _bulk_result(results, f"status update to '{new_status}'", app_logger)
+
+    results_by_id = {}
+    existing_ids = []
+    for content_id in content_ids:
+        if content_id in snapshots:
+            existing_ids.append(content_id)
+        else:
+            results_by_id[content_id] = {'contentId': content_id, 'status': 'error',
+                                         'message': 'Content not found', 'code': 404}
+
+    update_data = {
+        'status': new_status,
+        'moderated_by': admin_id,
+        'moderated_at': firestore.SERVER_TIMESTAMP
+    }
+    owner_by_id = {content_id: snapshots[content_id].to_dict().get('userId') for content_id in existing_ids}
+    for ids_chunk in _batches_with_index_writes(existing_ids, owner_by_id, writes_per_item=1):
+        batch = db.batch()
+        index_entries = {}
+        for content_id in ids_chunk:
+            batch.update(snapshots[content_id].reference, update_data)
+            index_entries.setdefault(owner_by_id[content_id], {})[content_id] = {'status': new_status}
+        for owner_id, entries in index_entries.items():
+            _set_post_index_entries(batch, db, owner_id, entries)
+        try:
+            batch.commit()
+            identity_map.forget('contentItems', *ids_chunk)
+            chunk_result = {'status': 'success', 'message': f"Status updated to '{new_status}'", 'code': 200}
+        except Exception as e:
+            app_logger.error("Bulk status update to '%s': batch commit failed for %s items: %s",
+                             new_status, len(ids_chunk), e, exc_info=True)
+            chunk_result = {'status': 'error', 'message': 'Failed to update status', 'code': 500}
+        for content_id in ids_chunk:
+            results_by_id[content_id] = dict(chunk_result, contentId=content_id)
+
+    results = [results_by_id[content_id] for content_id in content_ids]
+    return _bulk_result(results, f"status update to '{new_status}' by admin {admin_id}", app_logger)
+
+
+def _release_photo_quotas(db, tombstone_ids_by_author, tombstones, app_logger):
+    """
+    Decrements photo_upload_count_current_month once per author by the number of
+    deleted photos (never below zero) and marks the matching tombstones as released
+    in the same batch. Tombstones left unreleased after an error are handled
+    one by one by deletion_worker.
+    """
+    author_ids = [author_id for author_id in tombstone_ids_by_author if author_id]
+    try:
+        user_snapshots = _get_snapshots_by_id(db, 'users', author_ids) if author_ids else {}
+    except Exception as e:
+        app_logger.error("Bulk delete: error fetching authors for photo count decrement: %s", e, exc_info=True)
+        return
+
+    remaining_counts = {author_id: snapshot.to_dict().get('photo_upload_count_current_month', 0)
+                        for author_id, snapshot in user_snapshots.items()}
+    batch = db.batch()
+    batch_ops = 0
+    batch_tombstone_ids = []
+
+    def commit_batch():
+        try:
+            batch.commit()
+            identity_map.forget('users', *author_ids)
+            for tombstone_id in batch_tombstone_ids:
+                tombstones[tombstone_id]['quotaReleased'] = True
+        except Exception as e:
+            app_logger.error("Bulk delete: photo count batch commit failed: %s", e, exc_info=True)
+
+    # Each group fits in one batch together with its user update, so counter and
+    # tombstone flags always change atomically.
+    for author_id, tombstone_ids in tombstone_ids_by_author.items():
+        for ids_group in _chunked(tombstone_ids, BULK_WRITE_CHUNK_SIZE - 1):
+            if batch_ops + len(ids_group) + 1 > BULK_WRITE_CHUNK_SIZE:
+                commit_batch()
+                batch, batch_ops, batch_tombstone_ids = db.batch(), 0, []
+            user_snapshot = user_snapshots.get(author_id)
+            if user_snapshot:
+                decrement = min(len(ids_group), remaining_counts[author_id])
+                if decrement > 0:
+                    batch.update(user_snapshot.reference, {
+                        'photo_upload_count_current_month': firestore.Increment(-decrement)
+                    })
+                    remaining_counts[author_id] -= decrement
+                    batch_ops += 1
+            elif author_id:
+                app_logger.warning("User %s not found, cannot decrement photo count after bulk delete.", author_id)
+            for tombstone_id in ids_group:
+                batch.update(db.collection(DELETION_TOMBSTONE_COLLECTION).document(tombstone_id),
+                             {'quotaReleased': True})
+            batch_ops += len(ids_group)
+            batch_tombstone_ids.extend(ids_group)
+    if batch_ops:
+        commit_batch()
+    app_logger.info("Bulk delete: released photo quota for %s authors.", len(author_ids))
+
+
+def bulk_delete_content_items(content_ids, app_logger):
+    """
+    Deletes many content items (admin action). Items and their tombstones are written
+    in chunked WriteBatch commits, photo counters are decremented once per author and
+    Storage blobs are deleted in parallel by deletion_worker.
+    Returns a summary dict with per-item results in the order of content_ids.
+    """
+    import deletion_worker  # Imported here because deletion_worker imports this module
+
+    content_ids = _unique_ids(content_ids)
+    db = get_db_client()
+    try:
+        snapshots = _get_snapshots_by_id(db, 'contentItems', content_ids)
+    except Exception as e:
+        app_logger.error("Bulk delete: error fetching items: %s", e, exc_info=True)
+        results = [{'contentId': cid, 'status': 'error', 'message': 'Failed to fetch content', 'code': 500}
+                   for cid in content_ids]
+        return _bulk_result(results, 'delete', app_logger)
+
+    results_by_id = {}
+    existing_ids = []
+    for content_id in content_ids:
+        if content_id in snapshots:
+            existing_ids.append(content_id)
+        else:
+            results_by_id[content_id] = {'contentId': content_id, 'status': 'error',
+                                         'message': 'Content not found', 'code': 404}
+
+    tombstones = {}
+    for content_id in existing_ids:
+        content_data = snapshots[content_id].to_dict()
+        if content_data.get('imageUrl'):
+            tombstones[content_id] = _build_deletion_tombstone(content_id, content_data)
+
+    deleted_ids = []
+    owner_by_id = {content_id: snapshots[content_id].to_dict().get('userId') for content_id in existing_ids}
+    # Up to two writes per item (delete and tombstone) plus one index write per author.
+    for ids_chunk in _batches_with_index_writes(existing_ids, owner_by_id, writes_per_item=2,
+                                                max_items=BULK_WRITE_CHUNK_SIZE // 2):
+        batch = db.batch()
+        index_entries = {}
+        for content_id in ids_chunk:
+            batch.delete(snapshots[content_id].reference)
+            if content_id in tombstones:
+                batch.set(db.collection(DELETION_TOMBSTONE_COLLECTION).document(content_id), tombstones[content_id])
+            index_entries.setdefault(owner_by_id[content_id], {})[content_id] = firestore.DELETE_FIELD
+        for owner_id, entries in index_entries.items():
+            _set_post_index_entries(batch, db, owner_id, entries)
+        try:
+            batch.commit()
+            identity_map.forget('contentItems', *ids_chunk)
+            deleted_ids.extend(ids_chunk)
+        except Exception as e:
+            app_logger.error("Bulk delete: batch commit failed for %s items: %s", len(ids_chunk), e, exc_info=True)
+            for content_id in ids_chunk:
+                results_by_id[content_id] = {'contentId': content_id, 'status': 'error',
+                                             'message': 'Failed to delete content', 'code': 500}
+
+    committed_tombstones = {content_id: tombstones[content_id] for content_id in deleted_ids
+                            if content_id in tombstones}
+    tombstone_ids_by_author = {}
+    for content_id, tombstone in committed_tombstones.items():
+        tombstone_ids_by_author.setdefault(tombstone['userId'], []).append(content_id)
+    if tombstone_ids_by_author:
+        _release_photo_quotas(db, tombstone_ids_by_author, committed_tombstones, app_logger)
+
+    outcomes = deletion_worker.process_tombstones(committed_tombstones, app_logger)
+
+    for content_id in deleted_ids:
+        outcome = outcomes.get(content_id, {})
+        results_by_id[content_id] = {'contentId': content_id, 'status': 'success',
+                                     'message': 'Content deleted successfully', 'code': 200,
+                                     'imageDeleted': outcome.get('imageDeleted', False)}
+
+    results = [results_by_id[content_id] for content_id in content_ids]
+    return _bulk_result(results, 'delete', app_logger)
+
+
+# Time every public Firestore helper as a 'firestore' dependency call (see metrics.py).
+metrics.instrument_module_functions(globals(), 'firestore', exclude=('get_db_client', 'parse_storage_image_path'))
@@ -0,0 +1,162 @@
+"""
+Request-scoped identity map for Firestore documents.
+
+Several flows read the same document more than once while handling one request: reporting a
+post reads it in api_services and again in firestore_utils.record_report, an admin delete reads
+it in admin_services and again in delete_content_item, and the email webhook reads the sender by
+email and then by UID. The firestore_utils getters consult the current IdentityMap first, so each
+document (including a missing one) is fetched at most once per request. Writes made through
+firestore_utils drop the affected entries, so a read after a write goes to Firestore again.
+
+Inside a Flask request the map lives on flask.g (installed by init_app, IDENTITY_MAP_ENABLED,
+default true). Elsewhere (workers, scripts, tests) code opts in with `with identity_map.scope():`.
+Without a current map every read goes to Firestore, as before.
+
+Reads served from the map are counted in mailmap_firestore_documents_read_saved_total (see
+metrics.py) and logged at debug level at the end of each request.
+"""
+
+import contextlib
+import contextvars
+import copy
+import threading
+
+from flask import current_app, g, has_request_context
+
+import metrics
+
+_MISSING = object()
+_scoped_map = contextvars.ContextVar('identity_map', default=None)
+
+
+class IdentityMap:
+    """
+    Caches document data by (collection, document id) and counts the reads it saved. Safe to
+    share between the threads of a fan-out (see fanout.py).
+    """
+
+    def __init__(self):
+        self._documents = {}
+        self._lock = threading.Lock()
+        self.reads = 0
+        self.reads_saved = 0
+
+    def lookup(self, collection, doc_id):
+        """Returns a copy of the cached data (None for a missing document), or _MISSING."""
+        with self._lock:
+            data = self._documents.get((collection, doc_id), _MISSING)
+            if data is _MISSING:
+                return _MISSING
+            self.reads_saved += 1
+        if metrics.is_enabled():
+            metrics.DOCUMENTS_READ_SAVED.inc(1, collection)
+        return copy.deepcopy(data)
+
+    def remember(self, collection, doc_id, data):
+        """Stores data (None if the document does not exist) as read from Firestore."""
+        data = copy.deepcopy(data)
+        with self._lock:
+            self.reads += 1
+            self._documents[(collection, doc_id)] = data
+
+    def forget(self, collection, doc_id):
+        with self._lock:
+            self._documents.pop((collection, doc_id), None)
+
+    def __contains__(self, key):
+        return key in self._documents
+
+    def __len__(self):
+        return len(self._documents)
+
+
+def current():
+    """Returns the identity map of the current request or scope, or None."""
+    if has_request_context():
+        request_map = g.get('identity_map')
+        if request_map is not None:
+            return request_map
+    return _scoped_map.get()
+
+
+@contextlib.contextmanager
+def scope():
+    """Makes a fresh IdentityMap current for the block, outside of (or nested in) a request."""
+    identity_map = IdentityMap()
+    token = _scoped_map.set(identity_map)
+    try:
+        yield identity_map
+    finally:
+        _scoped_map.reset(token)
+
+
+def get_document(doc_ref):
+    """
+    Returns the data of the document at doc_ref (None if it does not exist), read from the
+    current identity map when possible. Do not use inside transactions: they must read from
+    Firestore.
+    """
+    identity_map = current()
+    collection = doc_ref.parent.id
+    if identity_map is not None:
+        data = identity_map.lookup(collection, doc_ref.id)
+        if data is not _MISSING:
+            return data
+    snapshot = doc_ref.get()
+    data = snapshot.to_dict() if snapshot.exists else None
+    if identity_map is not None:
+        identity_map.remember(collection, doc_ref.id, data)
+    return data
+
+
+def lookup_many(collection, doc_ids):
+    """
+    Splits doc_ids into ({doc_id: data or None} served from the current identity map, [ids it
+    does not hold]) for batched reads.
+    """
+    identity_map = current()
+    if identity_map is None:
+        return {}, list(doc_ids)
+    found, missing = {}, []
+    for doc_id in doc_ids:
+        data = identity_map.lookup(collection, doc_id)
+        if data is _MISSING:
+            missing.append(doc_id)
+        else:
+            found[doc_id] = data
+    return found, missing
+
+
+def remember(collection, doc_id, data):
+    """Records a document read by other means (e.g. a query) in the current identity map."""
+    identity_map = current()
+    if identity_map is not None:
+        identity_map.remember(collection, doc_id, data)
+
+
+def forget(collection, *doc_ids):
+    """Drops documents that were just written from the current identity map."""
+    identity_map = current()
+    if identity_map is not None:
+        for doc_id in doc_ids:
+            identity_map.forget(collection, doc_id)
+
+
+def _start_request():
+    g.identity_map = IdentityMap()
+
+
+def _finish_request(response):
+    identity_map = g.get('identity_map')
+    if identity_map is not None and identity_map.reads_saved:
+        current_app.logger.debug("Identity map: %d document reads, %d served from the map.",
+                                 identity_map.reads, identity_map.reads_saved)
+    return response
+
+
+def init_app(app):
+    """Gives every request its own identity map unless IDENTITY_MAP_ENABLED is false."""
+    if not app.config.get('IDENTITY_MAP_ENABLED', True):
+        return
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
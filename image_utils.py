@@ -3,11 +3,12 @@
 import io
 import math
 # import traceback # No longer needed if using logger.exception or exc_info=True
-from PIL import Image
-import exifread
+# Pillow and exifread are imported inside the functions that use them (see __getattr__ below)
 import logging
 import uuid
 import os
+
+import metrics
 # from firebase_admin import storage # bucket is passed as a parameter
 
 # Configure module logger
@@ -23,6 +24,20 @@ logger = logging.getLogger(__name__) # Using this logger, assuming it's configur
 #     logger.addHandler(ch)
 
 
+def __getattr__(name):
+    """
+    Lazily exposes ``image_utils.Image`` and ``image_utils.exifread`` (PEP 562) so importing this
+    module does not pull in Pillow and exifread until an image is actually processed.
+    """
+    if name == 'Image':
+        from PIL import Image
+        return Image
+    if name == 'exifread':
+        import exifread
+        return exifread
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 # --- Helper functions for conversion ---
 
 def _robust_float_conversion(value_component):
@@ -105,6 +120,7 @@ def _extract_gps_with_pillow_modern(image_data):
     """Extract GPS coordinates using Pillow (modern approach)."""
     logger.debug("Attempting GPS extraction with Pillow (getexif/get_ifd).")
     try:
+        from PIL import Image
         image = Image.open(io.BytesIO(image_data))
         exif_dict = image.getexif()
 
@@ -159,6 +175,7 @@ def _extract_gps_with_exifread(image_data):
     """Extract GPS coordinates using exifread."""
     logger.debug("Attempting GPS extraction with exifread.")
     try:
+        import exifread
         img_file_obj = io.BytesIO(image_data)
         tags = exifread.process_file(img_file_obj, details=False, strict=False)
 
@@ -217,6 +234,7 @@ def _extract_gps_with_exifread(image_data):
         return None, None
 
 
+@metrics.timed('exif', 'extract_gps_coordinates')
 def extract_gps_coordinates(image_data):
     """
     Main public function to extract GPS coordinates from image byte data.
@@ -241,6 +259,40 @@ def extract_gps_coordinates(image_data):
     return None, None
 
 
+def validate_client_coordinates(latitude, longitude):
+    """
+    Validates a GPS position read from EXIF by the browser (photo-worker.js).
+    Returns (latitude, longitude) as floats, or (None, None) if either is missing, not a finite
+    number or out of range.
+    """
+    try:
+        lat, lon = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        return None, None
+    if not (math.isfinite(lat) and math.isfinite(lon)) or abs(lat) > 90 or abs(lon) > 180:
+        logger.warning(f"Rejected client EXIF coordinates: lat={latitude!r}, lon={longitude!r}")
+        return None, None
+    return lat, lon
+
+
+IMAGE_CONTENT_TYPES = {'jpg': 'image/jpeg', 'jpeg': 'image/jpeg', 'png': 'image/png', 'gif': 'image/gif'}
+IMAGE_MAGIC_NUMBERS = {
+    'image/jpeg': (b'\xff\xd8\xff',),
+    'image/png': (b'\x89PNG\r\n\x1a\n',),
+    'image/gif': (b'GIF87a', b'GIF89a'),
+}
+IMAGE_SNIFF_BYTES = 8  # Enough for the longest magic number
+
+
+def sniff_image_type(head):
+    """Returns the content type the first bytes of a file belong to, or None if it is not a supported image."""
+    for content_type, magic_numbers in IMAGE_MAGIC_NUMBERS.items():
+        if head.startswith(magic_numbers):
+            return content_type
+    return None
+
+
+@metrics.timed('gcs', 'upload_image')
 def upload_image_to_gcs(image_data, filename, app_logger, bucket, content_type=None):
     """
     Uploads image data to Google Cloud Storage.
@@ -348,6 +400,37 @@ def process_uploaded_image(image_bytes, original_filename, app_logger, bucket, a
         return None, None, None
 
 
+def delete_images_from_gcs(image_urls, app_logger, bucket):
+    """
+    Deletes uploaded images whose posts were not saved, e.g. because the unit of work they were
+    written in failed to commit.
+    Args:
+        image_urls (iterable): Public URLs returned by upload_image_to_gcs.
+        app_logger (logging.Logger): Logger instance.
+        bucket (google.cloud.storage.bucket.Bucket): GCS bucket object.
+    Returns:
+        int: The number of images that could not be deleted. A missing image counts as deleted.
+    """
+    from google.api_core.exceptions import NotFound
+    import firestore_utils
+
+    current_logger = app_logger if app_logger else logger
+    failed = 0
+    for image_url in image_urls:
+        image_path = firestore_utils.parse_storage_image_path(image_url)
+        if not image_path:
+            continue
+        try:
+            bucket.blob(image_path).delete()
+            current_logger.info("Deleted orphaned image %s.", image_path)
+        except NotFound:
+            pass
+        except Exception as e:
+            failed += 1
+            current_logger.error("Could not delete orphaned image %s: %s", image_path, e, exc_info=True)
+    return failed
+
+
 if __name__ == '__main__':
     # This block is for local testing of image_utils.py
     # It needs its own logger configuration if not run as part of the Flask app.
@@ -398,6 +481,7 @@ if __name__ == '__main__':
     # Creating a minimal valid JPEG for testing structure, not content extraction
     minimal_jpeg_io = io.BytesIO()
     try:
+        from PIL import Image
         Image.new('RGB', (10, 10), color='blue').save(minimal_jpeg_io, format='JPEG')
         minimal_jpeg_bytes = minimal_jpeg_io.getvalue()
     except Exception as e:
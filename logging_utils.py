@@ -0,0 +1,205 @@
+"""
+Non-blocking structured logging.
+
+Log calls on request threads only enqueue records through a QueueHandler; a QueueListener thread
+formats them as one JSON object per line for the rotating log file (and as plain text for stderr),
+so request latency never includes file writes or rotations. Each record carries the id of the request that
+produced it (taken from the X-Request-ID header or generated), and high-volume INFO records can be
+sampled per request with LOG_INFO_SAMPLE_RATE.
+
+Log with %-style arguments (``logger.info("Loaded %d items", n)``): the message is only built for
+records that pass the level check and sampling.
+"""
+
+import atexit
+import json
+import logging
+import queue
+import random
+import threading
+import uuid
+import zlib
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+DEFAULT_LOG_FILE = 'app.log'
+DEFAULT_MAX_BYTES = 10000000
+DEFAULT_BACKUP_COUNT = 5
+
+# Attributes every LogRecord has; anything else on a record came from `extra=` and is emitted as a field.
+_STANDARD_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {
+    'message', 'asctime', 'request_id'
+}
+
+_setup_lock = threading.Lock()
+_queue_handler = None
+_listener = None
+
+
+def get_request_id():
+    """Returns the id of the current request, or None outside a request context."""
+    if has_request_context():
+        return g.get('request_id')
+    return None
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps each record with the current request id ('-' outside requests)."""
+
+    def filter(self, record):
+        if not hasattr(record, 'request_id'):
+            record.request_id = get_request_id() or '-'
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps only a fraction of INFO (and lower) records; WARNING and above always pass.
+
+    The decision is derived from the request id, so a sampled request keeps all of its info logs
+    and a dropped one loses all of them. Records logged with ``extra={'sample': False}`` are never
+    dropped.
+    """
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = max(0.0, min(1.0, float(rate)))
+
+    def filter(self, record):
+        if self.rate >= 1.0 or record.levelno > logging.INFO or getattr(record, 'sample', True) is False:
+            return True
+        request_id = getattr(record, 'request_id', '-')
+        if request_id and request_id != '-':
+            return (zlib.crc32(request_id.encode('utf-8')) / 0xFFFFFFFF) < self.rate
+        return random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as a single-line JSON object."""
+
+    def format(self, record):
+        payload = {
+            'timestamp': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', '-'),
+            'module': record.module,
+            'line': record.lineno,
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload['exception'] = record.exc_text
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_RECORD_ATTRS and key != 'sample' and not key.startswith('_'):
+                payload[key] = value
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+class StructuredQueueHandler(QueueHandler):
+    """
+    QueueHandler that keeps records structured: the message is rendered once on the calling thread
+    (its arguments may be mutated afterwards), extra fields are kept, and the traceback is stored
+    in exc_text for the JSON formatter instead of being appended to the message.
+    """
+
+    def prepare(self, record):
+        message = record.getMessage()
+        exc_text = record.exc_text
+        if record.exc_info and not exc_text:
+            exc_text = logging.Formatter().formatException(record.exc_info)
+        prepared = logging.makeLogRecord(record.__dict__)
+        prepared.msg = message
+        prepared.args = None
+        prepared.exc_info = None
+        prepared.exc_text = exc_text
+        prepared.stack_info = None
+        return prepared
+
+
+def _assign_request_id():
+    incoming = request.headers.get(REQUEST_ID_HEADER, '')
+    # Accept a caller-supplied id (e.g. from a load balancer) only if it is short and printable.
+    if incoming and len(incoming) <= 128 and incoming.isprintable():
+        g.request_id = incoming
+    else:
+        g.request_id = uuid.uuid4().hex
+
+
+def _echo_request_id(response):
+    request_id = g.get('request_id')
+    if request_id:
+        response.headers[REQUEST_ID_HEADER] = request_id
+    return response
+
+
+def _build_queue_handler(config):
+    global _queue_handler, _listener
+    with _setup_lock:
+        if _queue_handler is None:
+            file_handler = RotatingFileHandler(
+                config.get('LOG_FILE', DEFAULT_LOG_FILE),
+                maxBytes=config.get('LOG_MAX_BYTES', DEFAULT_MAX_BYTES),
+                backupCount=config.get('LOG_BACKUP_COUNT', DEFAULT_BACKUP_COUNT),
+                delay=True
+            )
+            file_handler.setFormatter(JsonFormatter())
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(logging.Formatter('[%(asctime)s] %(levelname)s in %(module)s: %(message)s'))
+            _listener = QueueListener(queue.SimpleQueue(), file_handler, console_handler,
+                                      respect_handler_level=True)
+            _queue_handler = StructuredQueueHandler(_listener.queue)
+            _queue_handler.addFilter(RequestIdFilter())
+            _listener.start()
+            atexit.register(stop_logging)
+        return _queue_handler
+
+
+def stop_logging():
+    """Flushes queued records and stops the listener thread."""
+    global _queue_handler, _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+        _listener = None
+        _queue_handler = None
+
+
+def configure_logging(app):
+    """
+    Routes app.logger and module loggers through the shared queue handler and installs request-id
+    hooks on app. Safe to call for several apps in one process; the listener thread is shared.
+
+    Config keys: LOG_LEVEL (default INFO), LOG_FILE, LOG_MAX_BYTES, LOG_BACKUP_COUNT and
+    LOG_INFO_SAMPLE_RATE (0.0-1.0, default 1.0).
+    """
+    handler = _build_queue_handler(app.config)
+    level = logging.getLevelName(str(app.config.get('LOG_LEVEL', 'INFO')).upper())
+    if not isinstance(level, int):
+        level = logging.INFO
+
+    sample_rate = app.config.get('LOG_INFO_SAMPLE_RATE', 1.0)
+    for existing in [f for f in handler.filters if isinstance(f, SamplingFilter)]:
+        handler.removeFilter(existing)
+    handler.addFilter(SamplingFilter(sample_rate))
+
+    app.logger.setLevel(level)
+    # Flask's default stderr handler would write synchronously on the request thread.
+    app.logger.removeHandler(default_handler)
+    if handler not in app.logger.handlers:
+        app.logger.addHandler(handler)
+    # Module loggers (image_utils, email_utils, ...) reach the handler through the root logger;
+    # app.logger stops there so its records are not written twice.
+    app.logger.propagate = False
+    root_logger = logging.getLogger()
+    if handler not in root_logger.handlers:
+        root_logger.addHandler(handler)
+
+    app.before_request(_assign_request_id)
+    app.after_request(_echo_request_id)
+    return handler
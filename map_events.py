@@ -0,0 +1,316 @@
+"""
+Real-time map updates over Server-Sent Events.
+
+One Firestore listener per process (on_snapshot on the published contentItems) feeds a
+MapEventHub, which turns every listener callback into one compact diff message and fans it out
+to all connected map tabs. Thousands of open tabs cost one listener, and the message is encoded
+once, not once per tab. Each diff is a list of changes:
+
+    {"type": "add", "item": {...map item fields...}}
+    {"type": "update", "itemId": "...", "changes": {"voteCount": 3}}
+    {"type": "remove", "itemId": "..."}
+
+Only the map fields (firestore_utils.POST_INDEX_FIELDS) are compared, so writes that do not
+change the map (voter lists, notification flags) are not sent. A post that leaves the published
+set (moderation, deletion) is removed.
+
+Every subscriber has a bounded queue (MAP_EVENTS_QUEUE_SIZE). The listener thread never waits for
+a client: when a slow client's queue is full its backlog is dropped and replaced by a "resync"
+event, after which map.js reloads the map. The last messages are kept, so a client that
+reconnects with Last-Event-ID gets what it missed, or a resync when it is too far behind.
+
+The listener starts with the first subscriber and stops when the last one leaves. The endpoint is
+GET /api/map/events, served by the Flask app (one thread per open stream) and by asgi_app (one
+event loop for all streams, the intended deployment).
+
+Configuration (app.config / environment):
+    MAP_EVENTS_ENABLED              'true' to serve /api/map/events (default false)
+    MAP_EVENTS_QUEUE_SIZE           messages kept per subscriber and for replay (default 100)
+    MAP_EVENTS_MAX_SUBSCRIBERS      open streams per process (default 5000)
+    MAP_EVENTS_HEARTBEAT_SECONDS    keep-alive comment interval (default 15)
+"""
+
+import asyncio
+import collections
+import functools
+import logging
+import os
+import threading
+import uuid
+
+from flask import Response, current_app, request, stream_with_context
+
+import firestore_utils
+import map_snapshot
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 100
+DEFAULT_MAX_SUBSCRIBERS = 5000
+DEFAULT_HEARTBEAT_SECONDS = 15.0
+RETRY_MILLISECONDS = 5000
+
+OPENING_MESSAGE = b'retry: %d\n\n' % RETRY_MILLISECONDS
+RESYNC_MESSAGE = b'event: resync\ndata: {}\n\n'
+HEARTBEAT_MESSAGE = b': keepalive\n\n'
+
+# Installed by init_app, or created from the environment by get_hub() (asgi_app).
+_hub = None
+
+
+def _map_item(item_id, data):
+    return firestore_utils._post_index_entry(item_id, data)
+
+
+def _diff_item(old, new):
+    """Fields of new that differ from old (None for removed fields)."""
+    changes = {field: value for field, value in new.items() if old.get(field) != value}
+    changes.update({field: None for field in old if field not in new})
+    return changes
+
+
+class Subscription:
+    """
+    One open stream. The hub pushes encoded messages from the listener thread; the stream takes
+    them with get() from a WSGI thread or, when created with the event loop it runs on, with the
+    coroutine next().
+    """
+
+    def __init__(self, hub, max_pending, loop=None):
+        self._hub = hub
+        self._max_pending = max_pending
+        self._pending = collections.deque()
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._loop = loop
+        self._async_ready = asyncio.Event() if loop is not None else None
+        self.overflows = 0
+
+    def push(self, message):
+        with self._lock:
+            if len(self._pending) >= self._max_pending:
+                self._pending.clear()
+                self._pending.append(RESYNC_MESSAGE)
+                self.overflows += 1
+            else:
+                self._pending.append(message)
+        if self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._async_ready.set)
+            except RuntimeError:  # The loop is closed; the stream is gone
+                pass
+        else:
+            self._ready.set()
+
+    def _drain(self):
+        with self._lock:
+            messages = list(self._pending)
+            self._pending.clear()
+        return messages
+
+    def get(self, timeout):
+        """Waits up to timeout seconds; returns the pending messages ([] on timeout)."""
+        if not self._ready.wait(timeout):
+            return []
+        self._ready.clear()
+        return self._drain()
+
+    async def next(self, timeout):
+        """Coroutine version of get()."""
+        try:
+            await asyncio.wait_for(self._async_ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self._async_ready.clear()
+        return self._drain()
+
+    def close(self):
+        self._hub.unsubscribe(self)
+
+
+class MapEventHub:
+    """Owns the per-process listener and the subscribers it fans out to."""
+
+    def __init__(self, queue_size=DEFAULT_QUEUE_SIZE, max_subscribers=DEFAULT_MAX_SUBSCRIBERS,
+                 heartbeat_seconds=DEFAULT_HEARTBEAT_SECONDS):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.heartbeat_seconds = heartbeat_seconds
+        self._subscribers = set()
+        self._items = None  # {item_id: map item} as last seen by the listener
+        self._recent = collections.deque(maxlen=queue_size)  # (sequence number, message) for Last-Event-ID
+        self._epoch = None  # Event IDs are '<epoch>-<sequence number>', new with every listener
+        self._next_sequence = 1
+        self._watch = None
+        self._lock = threading.RLock()
+
+    def subscribe(self, last_event_id=None, loop=None):
+        """
+        Returns a new Subscription, or None when MAP_EVENTS_MAX_SUBSCRIBERS streams are open.
+        With last_event_id the missed messages are queued first, or a resync if they are gone.
+        Pass the running event loop to consume it with Subscription.next().
+        """
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            subscription = Subscription(self, self.queue_size, loop)
+            if last_event_id is not None:
+                for message in self._missed_since(last_event_id):
+                    subscription.push(message)
+            self._subscribers.add(subscription)
+            if self._watch is None:
+                self._start_listener()
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+            if self._subscribers or self._watch is None:
+                return
+            watch = self._detach_listener()
+        # unsubscribe() waits for the listener thread, which may be waiting for the lock in _on_snapshot
+        self._stop_listener(watch)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def _missed_since(self, last_event_id):
+        """
+        Messages after last_event_id, or a resync when they are no longer kept or the ID comes
+        from another listener (a restart, or another worker process).
+        """
+        epoch, _, sequence = str(last_event_id).partition('-')
+        if epoch != self._epoch or not sequence.isdigit():
+            return [RESYNC_MESSAGE]
+        sequence = int(sequence)
+        if sequence >= self._next_sequence - 1:
+            return []
+        oldest = self._recent[0][0] if self._recent else self._next_sequence
+        if oldest > sequence + 1:
+            return [RESYNC_MESSAGE]
+        return [message for message_sequence, message in self._recent if message_sequence > sequence]
+
+    def _start_listener(self):
+        db = firestore_utils.get_db_client()
+        query = db.collection('contentItems').where(field_path='status', op_string='==', value='published')
+        self._items = None
+        self._epoch = uuid.uuid4().hex[:8]
+        self._next_sequence = 1
+        self._recent.clear()
+        self._watch = query.on_snapshot(functools.partial(self._on_snapshot, self._epoch))
+        logger.info("Map event listener started.")
+
+    def _detach_listener(self):
+        """Forgets the listener (call with the lock held) and returns its watch for _stop_listener."""
+        watch, self._watch = self._watch, None
+        self._items = None
+        self._epoch = None  # Changes made while nobody listens are unknown: reconnects resync
+        return watch
+
+    def _stop_listener(self, watch):
+        try:
+            watch.unsubscribe()
+        except Exception as e:
+            logger.warning(f"Error stopping the map event listener: {e}")
+        logger.info("Map event listener stopped; no subscribers left.")
+
+    def _on_snapshot(self, epoch, documents, changes, read_time):
+        """
+        Listener callback (Firestore's thread) of the listener started with epoch. Must not raise:
+        that would close the listener.
+        """
+        try:
+            with self._lock:
+                if epoch != self._epoch:
+                    return  # A late callback of a listener that has been detached
+                if self._items is None:
+                    # The initial snapshot: the clients loaded this state with the page.
+                    self._items = {document.id: _map_item(document.id, document.to_dict()) for document in documents}
+                    return
+                diff = self._diff(changes)
+                if diff:
+                    self._broadcast(diff)
+        except Exception as e:
+            logger.error(f"Error handling map listener changes: {e}", exc_info=True)
+            with self._lock:
+                self._items = None
+                for subscription in self._subscribers:
+                    subscription.push(RESYNC_MESSAGE)
+
+    def _diff(self, changes):
+        diff = []
+        for change in changes:
+            item_id = change.document.id
+            if change.type.name == 'REMOVED':
+                if self._items.pop(item_id, None) is not None:
+                    diff.append({'type': 'remove', 'itemId': item_id})
+                continue
+            item = _map_item(item_id, change.document.to_dict())
+            previous = self._items.get(item_id)
+            self._items[item_id] = item
+            if previous is None:
+                diff.append({'type': 'add', 'item': item})
+            else:
+                item_changes = _diff_item(previous, item)
+                if item_changes:
+                    diff.append({'type': 'update', 'itemId': item_id, 'changes': item_changes})
+        return diff
+
+    def _broadcast(self, diff):
+        sequence = self._next_sequence
+        self._next_sequence += 1
+        message = b'id: %s-%d\nevent: changes\ndata: %s\n\n' % (self._epoch.encode(), sequence,
+                                                                 map_snapshot._dumps(diff))
+        self._recent.append((sequence, message))
+        for subscription in self._subscribers:
+            subscription.push(message)
+
+
+def stream_messages(hub, subscription):
+    """Yields the SSE stream of a subscription from a WSGI thread until the client disconnects."""
+    try:
+        yield OPENING_MESSAGE
+        while True:
+            messages = subscription.get(hub.heartbeat_seconds)
+            yield b''.join(messages) if messages else HEARTBEAT_MESSAGE
+    finally:
+        subscription.close()
+
+
+def _hub_from_config(config):
+    return MapEventHub(int(config.get('MAP_EVENTS_QUEUE_SIZE', DEFAULT_QUEUE_SIZE)),
+                       int(config.get('MAP_EVENTS_MAX_SUBSCRIBERS', DEFAULT_MAX_SUBSCRIBERS)),
+                       float(config.get('MAP_EVENTS_HEARTBEAT_SECONDS', DEFAULT_HEARTBEAT_SECONDS)))
+
+
+def get_hub():
+    """
+    Returns the hub of this process, or None when map events are off. Outside the Flask app
+    (asgi_app) the hub is created from the MAP_EVENTS_* environment variables on first use.
+    """
+    global _hub
+    if _hub is None and os.environ.get('MAP_EVENTS_ENABLED', 'false').lower() == 'true':
+        _hub = _hub_from_config(os.environ)
+    return _hub
+
+
+def events_response():
+    """The Flask view of GET /api/map/events."""
+    hub = get_hub()
+    if hub is None:
+        return {'status': 'error', 'message': 'Map events are disabled'}, 404
+    subscription = hub.subscribe(request.headers.get('Last-Event-ID'))
+    if subscription is None:
+        current_app.logger.warning("Map events: subscriber limit reached.")
+        return {'status': 'error', 'message': 'Too many open map streams'}, 503
+    response = Response(stream_with_context(stream_messages(hub, subscription)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Keep nginx from buffering the stream
+    return response
+
+
+def init_app(app):
+    """Installs the hub when MAP_EVENTS_ENABLED is set; the listener starts with the first subscriber."""
+    global _hub
+    _hub = _hub_from_config(app.config) if app.config.get('MAP_EVENTS_ENABLED') else None
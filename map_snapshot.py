@@ -0,0 +1,544 @@
+"""
+Precomputed snapshot of the public map.
+
+For visitors without a user filter the map is the same for everyone, so instead of querying
+Firestore and inlining the items into every page, the published map items are written to a
+versioned JSON file (map-<hash>.json) together with gzip and, when the optional `brotli`
+package is installed, brotli variants. The home page only passes the snapshot URL to map.js,
+which fetches the file; since the name changes with the content it can be cached forever by
+browsers and CDNs.
+
+Each version also exists in a columnar encoding (map-<hash>.columns.json, see encode_columns)
+that avoids repeating key names and coordinate digits for every marker; the local route serves
+it to clients that ask for COLUMNS_MIMETYPE in their Accept header.
+
+Snapshots are stored either in a local directory (served by the /map-snapshots/ route, or
+directly by a front-end web server) or in the Storage bucket under map-snapshots/.
+
+Exactly one process builds snapshots: the one with MAP_SNAPSHOT_BUILDER set, or a separate
+`python map_snapshot.py --watch`. Its MapSnapshotBuilder runs a Firestore listener on the
+published contentItems, so it sees every committed change, whichever process (web worker,
+asgi_app, cron job) or tool wrote it. Changes are collected for MAP_SNAPSHOT_DEBOUNCE_SECONDS and
+then applied to the previous snapshot by reading only those documents; every
+MAP_SNAPSHOT_FULL_REBUILD_SECONDS the snapshot is rebuilt from scratch in case the listener
+missed something. The builder records the URL of each new version in the Firestore document
+mapSnapshots/current, which every other process reads at most every MAP_SNAPSHOT_POLL_SECONDS.
+Until a version is recorded pages fall back to querying the map. With the local store the
+builder must run on the host whose directory is served; several hosts need the bucket store.
+
+Configuration (app.config / environment):
+    MAP_SNAPSHOT_ENABLED              'true' to serve the public map from snapshots (default false)
+    MAP_SNAPSHOT_BUILDER              'true' in the one process that builds snapshots (default false)
+    MAP_SNAPSHOT_STORAGE              'local' (default) or 'bucket'
+    MAP_SNAPSHOT_DIR                  local directory, default static/snapshots
+    MAP_SNAPSHOT_DEBOUNCE_SECONDS     delay before changes are applied (default 2)
+    MAP_SNAPSHOT_FULL_REBUILD_SECONDS age after which the snapshot is rebuilt from scratch (default 3600)
+    MAP_SNAPSHOT_POLL_SECONDS         how long other processes cache the current URL (default 5)
+    MAP_SNAPSHOT_KEEP                 number of versions kept (default 5)
+
+A snapshot can also be built once from the command line (e.g. on deploy), or kept up to date by
+a long-running builder process:
+
+    python map_snapshot.py [--storage local|bucket] [--dir DIR] [--watch]
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+
+from flask import abort, request
+
+import compression
+import firestore_utils
+from firebase_clients import get_bucket
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FIELDS = firestore_utils.POST_INDEX_FIELDS
+BUCKET_PREFIX = 'map-snapshots/'
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+SNAPSHOT_NAME_PATTERN = re.compile(r'map-[0-9a-f]{16}\.json')
+COLUMNS_MIMETYPE = 'application/vnd.mailmap.map-columns+json'
+COLUMNS_FORMAT_VERSION = 1
+COORDINATE_SCALE = 100000  # Coordinates are quantized to 1e-5 degrees (about 1 m)
+DEFAULT_DEBOUNCE_SECONDS = 2.0
+DEFAULT_FULL_REBUILD_SECONDS = 3600.0
+DEFAULT_POLL_SECONDS = 5.0
+DEFAULT_KEEP_VERSIONS = 5
+POINTER_COLLECTION = 'mapSnapshots'
+POINTER_DOCUMENT = 'current'
+
+# Installed by init_app when snapshots are enabled; _builder only in the builder process.
+_store = None
+_pointer = None
+_builder = None
+
+
+def _pointer_ref():
+    return firestore_utils.get_db_client().collection(POINTER_COLLECTION).document(POINTER_DOCUMENT)
+
+
+def _snapshot_item(item_id, data):
+    item = {field: data[field] for field in SNAPSHOT_FIELDS if field in data}
+    item['itemId'] = item_id
+    return item
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _dumps(value):
+    return json.dumps(value, default=_json_default, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def _quantize(value):
+    return round(value * COORDINATE_SCALE) if isinstance(value, (int, float)) else None
+
+
+def _delta_encode(values):
+    """Differences to the previous non-null value; nulls stay null."""
+    encoded, previous = [], 0
+    for value in values:
+        if value is None:
+            encoded.append(None)
+        else:
+            encoded.append(value - previous)
+            previous = value
+    return encoded
+
+
+def _delta_decode(values):
+    decoded, previous = [], 0
+    for value in values:
+        if value is None:
+            decoded.append(None)
+        else:
+            previous += value
+            decoded.append(previous)
+    return decoded
+
+
+def _dictionary_encode(values):
+    """Returns (distinct non-null values, index per value or null)."""
+    dictionary, positions, indexes = [], {}, []
+    for value in values:
+        if value is None:
+            indexes.append(None)
+            continue
+        if value not in positions:
+            positions[value] = len(dictionary)
+            dictionary.append(value)
+        indexes.append(positions[value])
+    return dictionary, indexes
+
+
+def _epoch_millis(value):
+    return round(value.timestamp() * 1000) if isinstance(value, datetime) else None
+
+
+def encode_columns(items):
+    """
+    Returns the columnar form of snapshot items: one array per field instead of one object per
+    item. Coordinates are quantized and, like timestamps (epoch milliseconds), delta-encoded;
+    user IDs, statuses and image URL prefixes (everything up to the last '/') are stored once in
+    a dictionary and referenced by index. decode_columns and decodeMapColumns in map.js invert it.
+    """
+    users, user_indexes = _dictionary_encode([item.get('userId') for item in items])
+    statuses, status_indexes = _dictionary_encode([item.get('status') for item in items])
+    image_urls = [item.get('imageUrl') or None for item in items]
+    image_prefixes, image_prefix_indexes = _dictionary_encode(
+        [url.rsplit('/', 1)[0] + '/' if url else None for url in image_urls])
+    return {
+        'format': 'columns',
+        'version': COLUMNS_FORMAT_VERSION,
+        'count': len(items),
+        'coordinateScale': COORDINATE_SCALE,
+        'itemId': [item['itemId'] for item in items],
+        'latitude': _delta_encode([_quantize(item.get('latitude')) for item in items]),
+        'longitude': _delta_encode([_quantize(item.get('longitude')) for item in items]),
+        'voteCount': [item.get('voteCount') for item in items],
+        'timestamp': _delta_encode([_epoch_millis(item.get('timestamp')) for item in items]),
+        'text': [item.get('text') for item in items],
+        'users': users,
+        'user': user_indexes,
+        'statuses': statuses,
+        'status': status_indexes,
+        'imagePrefixes': image_prefixes,
+        'imagePrefix': image_prefix_indexes,
+        'imageName': [url.rsplit('/', 1)[1] if url else None for url in image_urls],
+    }
+
+
+def decode_columns(columns):
+    """Returns the snapshot items of a columnar payload; timestamps come back as epoch milliseconds."""
+    scale = columns['coordinateScale']
+    latitudes = _delta_decode(columns['latitude'])
+    longitudes = _delta_decode(columns['longitude'])
+    timestamps = _delta_decode(columns['timestamp'])
+    items = []
+    for index, item_id in enumerate(columns['itemId']):
+        user, status, prefix = columns['user'][index], columns['status'][index], columns['imagePrefix'][index]
+        items.append({
+            'itemId': item_id,
+            'latitude': latitudes[index] / scale if latitudes[index] is not None else None,
+            'longitude': longitudes[index] / scale if longitudes[index] is not None else None,
+            'voteCount': columns['voteCount'][index],
+            'timestamp': timestamps[index],
+            'text': columns['text'][index],
+            'userId': columns['users'][user] if user is not None else None,
+            'status': columns['statuses'][status] if status is not None else None,
+            'imageUrl': columns['imagePrefixes'][prefix] + columns['imageName'][index] if prefix is not None else None,
+        })
+    return items
+
+
+def _compressed_variants(payload):
+    """Returns {encoding: bytes} with encoding 'identity', 'gzip' and, if available, 'br'."""
+    variants = {'identity': payload, 'gzip': gzip.compress(payload, compresslevel=9, mtime=0)}
+    if compression.brotli is not None:
+        variants['br'] = compression.brotli.compress(payload, quality=11)
+    return variants
+
+
+def encode_snapshot(items):
+    """
+    Returns (version, {format: {encoding: bytes}}) for the items, where format is 'json' (one
+    object per item) or 'columns' and encoding is 'identity', 'gzip' or 'br'.
+    """
+    payload = _dumps(items)
+    version = hashlib.sha256(payload).hexdigest()[:16]
+    return version, {'json': _compressed_variants(payload),
+                     'columns': _compressed_variants(_dumps(encode_columns(items)))}
+
+
+ENCODING_SUFFIXES = {'identity': '', 'gzip': '.gz', 'br': '.br'}
+FORMAT_EXTENSIONS = {'json': '.json', 'columns': '.columns.json'}
+
+
+def snapshot_filename(version, encoding='identity', snapshot_format='json'):
+    return f'map-{version}{FORMAT_EXTENSIONS[snapshot_format]}{ENCODING_SUFFIXES[encoding]}'
+
+
+class LocalSnapshotStore:
+    """Writes snapshot files to a directory and keeps the newest `keep` versions."""
+
+    def __init__(self, directory, url_prefix='/map-snapshots/', keep=DEFAULT_KEEP_VERSIONS):
+        self.directory = directory
+        self.url_prefix = url_prefix
+        self.keep = keep
+
+    def write(self, version, encoded):
+        os.makedirs(self.directory, exist_ok=True)
+        for snapshot_format, variants in encoded.items():
+            for encoding, data in variants.items():
+                path = os.path.join(self.directory, snapshot_filename(version, encoding, snapshot_format))
+                temporary_path = f'{path}.tmp'
+                with open(temporary_path, 'wb') as snapshot_file:
+                    snapshot_file.write(data)
+                os.replace(temporary_path, path)  # Readers never see a partial file
+        self._prune(version)
+        return self.url_prefix + snapshot_filename(version)
+
+    def _prune(self, current_version):
+        snapshots = [name for name in os.listdir(self.directory) if SNAPSHOT_NAME_PATTERN.fullmatch(name)]
+        snapshots.sort(key=lambda name: os.path.getmtime(os.path.join(self.directory, name)), reverse=True)
+        stale_versions = {name[len('map-'):-len('.json')] for name in snapshots[self.keep:]} - {current_version}
+        for version in stale_versions:
+            for snapshot_format in FORMAT_EXTENSIONS:
+                for encoding in ENCODING_SUFFIXES:
+                    try:
+                        os.remove(os.path.join(self.directory, snapshot_filename(version, encoding, snapshot_format)))
+                    except FileNotFoundError:
+                        pass
+
+
+class BucketSnapshotStore:
+    """
+    Uploads the gzip variant to the Storage bucket with Content-Encoding: gzip; Cloud Storage
+    decompresses it for clients that do not accept gzip. Only the JSON format is uploaded, as
+    Cloud Storage cannot negotiate on the Accept header.
+    """
+
+    def __init__(self, keep=DEFAULT_KEEP_VERSIONS):
+        self.keep = keep
+        self._versions = []
+
+    def write(self, version, encoded):
+        blob = get_bucket().blob(BUCKET_PREFIX + snapshot_filename(version))
+        blob.cache_control = CACHE_CONTROL
+        blob.content_encoding = 'gzip'
+        blob.upload_from_string(encoded['json']['gzip'], content_type='application/json')
+        blob.make_public()
+        if version in self._versions:
+            self._versions.remove(version)
+        self._versions.append(version)
+        for stale_version in self._versions[:-self.keep]:
+            try:
+                get_bucket().blob(BUCKET_PREFIX + snapshot_filename(stale_version)).delete()
+            except Exception as e:
+                logger.warning("Could not delete map snapshot %s: %s", stale_version, e)
+        self._versions = self._versions[-self.keep:]
+        return blob.public_url
+
+
+class SnapshotPointer:
+    """Reads the URL of the current snapshot from mapSnapshots/current, at most every poll_seconds."""
+
+    def __init__(self, poll_seconds=DEFAULT_POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self._url = None
+        self._read_at = None
+        self._lock = threading.Lock()
+
+    def url(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._read_at is not None and now - self._read_at < self.poll_seconds:
+                return self._url
+            self._read_at = now  # Concurrent requests keep using the cached URL meanwhile
+        try:
+            snapshot = _pointer_ref().get()
+            url = (snapshot.to_dict() or {}).get('url') if snapshot.exists else None
+        except Exception as e:
+            logger.warning("Could not read the current map snapshot: %s", e)
+            return self._url
+        with self._lock:
+            self._url = url
+        return url
+
+
+class MapSnapshotBuilder:
+    """
+    Holds the current snapshot and applies changes to it. A full build reads all published
+    items; later ones re-read only the changed documents, until the snapshot is older than
+    full_rebuild_seconds. A failed build keeps its changes pending and is retried after another
+    debounce period. start_listener feeds it the changes committed by any process.
+    """
+
+    def __init__(self, store, app_logger, debounce_seconds=DEFAULT_DEBOUNCE_SECONDS,
+                 full_rebuild_seconds=DEFAULT_FULL_REBUILD_SECONDS):
+        self.store = store
+        self.app_logger = app_logger
+        self.debounce_seconds = debounce_seconds
+        self.full_rebuild_seconds = full_rebuild_seconds
+        self.version = None
+        self.url = None
+        self._entries = None  # {item_id: snapshot item} of the current snapshot
+        self._loaded_at = None  # time.monotonic() of the last full build
+        self._full_rebuild = False
+        self._dirty = set()
+        self._timer = None
+        self._watch = None
+        self._listener_started = False
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    def start_listener(self):
+        """Listens to the published contentItems; its first result triggers a full build."""
+        db = firestore_utils.get_db_client()
+        query = db.collection('contentItems').where(field_path='status', op_string='==', value='published')
+        self._listener_started = False
+        self._watch = query.on_snapshot(self._on_snapshot)
+
+    def stop(self):
+        with self._lock:
+            watch, self._watch = self._watch, None
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if watch is not None:
+            watch.unsubscribe()
+
+    def _on_snapshot(self, documents, changes, read_time):
+        """Listener callback (Firestore's thread). Must not raise: that would close the listener."""
+        try:
+            if not self._listener_started:
+                # The initial result lists every published item, and changes made before it are unknown
+                self._listener_started = True
+                self.request_full_rebuild()
+            else:
+                # Posts that left the published set arrive as REMOVED; re-reading them drops them.
+                self.mark_changed([change.document.id for change in changes])
+        except Exception as e:
+            self.app_logger.error("Error handling map snapshot listener changes: %s", e, exc_info=True)
+
+    def request_full_rebuild(self):
+        with self._lock:
+            self._full_rebuild = True
+        self.mark_changed(())
+
+    def mark_changed(self, item_ids):
+        with self._lock:
+            self._dirty.update(item_ids)
+            if self._timer is None:
+                self._timer = threading.Timer(self.debounce_seconds, self._run_scheduled)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def ensure_built(self):
+        """Schedules a build if there is no snapshot yet or it is due for a full rebuild."""
+        if self.url is None or self._is_stale():
+            self.mark_changed(())
+
+    def _is_stale(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.full_rebuild_seconds
+
+    def _run_scheduled(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.build()
+        except Exception as e:
+            self.app_logger.error("Error building map snapshot: %s", e, exc_info=True)
+            self.mark_changed(())
+
+    def build(self):
+        """
+        Applies the pending changes (or builds from scratch), writes a new version if needed and
+        records it in mapSnapshots/current.
+        """
+        with self._build_lock:
+            with self._lock:
+                dirty, self._dirty = self._dirty, set()
+                full, self._full_rebuild = self._full_rebuild or self._entries is None or self._is_stale(), False
+            try:
+                if full:
+                    loaded_at = time.monotonic()
+                    entries = self._load_all()
+                else:
+                    entries = self._apply_changes(dirty)
+
+                items = firestore_utils._published_items_from_index(entries)
+                version, encoded = encode_snapshot(items)
+                if version != self.version:
+                    url = self.store.write(version, encoded)
+                    _pointer_ref().set({'version': version, 'url': url, 'itemCount': len(items),
+                                        'updatedAt': firestore_utils.firestore.SERVER_TIMESTAMP})
+                    self.url, self.version = url, version
+                    self.app_logger.info("Wrote map snapshot %s with %s items (%s bytes, %s gzipped, "
+                                         "%s gzipped columns).", version, len(items),
+                                         len(encoded['json']['identity']), len(encoded['json']['gzip']),
+                                         len(encoded['columns']['gzip']))
+            except Exception:
+                with self._lock:
+                    self._dirty |= dirty
+                    self._full_rebuild = self._full_rebuild or full
+                raise
+            if full:
+                self._loaded_at = loaded_at
+            self._entries = {item['itemId']: item for item in items}
+            return self.url
+
+    def _load_all(self):
+        items = firestore_utils.get_published_items_for_map(self.app_logger)
+        return {item['itemId']: _snapshot_item(item['itemId'], item) for item in items}
+
+    def _apply_changes(self, item_ids):
+        entries = dict(self._entries)
+        if not item_ids:
+            return entries
+        db = firestore_utils.get_db_client()
+        content_items_ref = db.collection('contentItems')
+        for snapshot in db.get_all([content_items_ref.document(item_id) for item_id in sorted(item_ids)]):
+            if snapshot.exists:
+                entries[snapshot.id] = _snapshot_item(snapshot.id, snapshot.to_dict())
+            else:
+                entries.pop(snapshot.id, None)
+        return entries
+
+
+def init_app(app):
+    """
+    Enables snapshots for app when MAP_SNAPSHOT_ENABLED is set. With MAP_SNAPSHOT_BUILDER this
+    process also builds them and starts the listener, which schedules the first build.
+    """
+    global _store, _pointer, _builder
+    if _builder is not None:
+        _builder.stop()
+    _store = _pointer = _builder = None
+    if not app.config.get('MAP_SNAPSHOT_ENABLED'):
+        return
+    keep = int(app.config.get('MAP_SNAPSHOT_KEEP', DEFAULT_KEEP_VERSIONS))
+    if app.config.get('MAP_SNAPSHOT_STORAGE', 'local') == 'bucket':
+        _store = BucketSnapshotStore(keep=keep)
+    else:
+        _store = LocalSnapshotStore(app.config.get('MAP_SNAPSHOT_DIR') or os.path.join(app.static_folder, 'snapshots'),
+                                    keep=keep)
+    _pointer = SnapshotPointer(float(app.config.get('MAP_SNAPSHOT_POLL_SECONDS', DEFAULT_POLL_SECONDS)))
+    if app.config.get('MAP_SNAPSHOT_BUILDER'):
+        _builder = MapSnapshotBuilder(
+            _store, app.logger,
+            float(app.config.get('MAP_SNAPSHOT_DEBOUNCE_SECONDS', DEFAULT_DEBOUNCE_SECONDS)),
+            float(app.config.get('MAP_SNAPSHOT_FULL_REBUILD_SECONDS', DEFAULT_FULL_REBUILD_SECONDS)))
+        _builder.start_listener()
+
+
+def current_snapshot_url():
+    """Returns the URL of the current snapshot, or None (disabled or not built yet)."""
+    if _builder is not None:
+        _builder.ensure_built()
+        return _builder.url
+    if _pointer is None:
+        return None
+    return _pointer.url()
+
+
+def snapshot_directory():
+    """Directory of the local store, or None when snapshots are off or kept in the bucket."""
+    return _store.directory if isinstance(_store, LocalSnapshotStore) else None
+
+
+def snapshot_response(name):
+    """
+    Serves a snapshot file of the local store: the columnar format when the client prefers
+    COLUMNS_MIMETYPE, and the precompressed variant it accepts. Production deployments can serve
+    the directory from the web server or CDN instead.
+    """
+    directory = snapshot_directory()
+    if directory is None or not SNAPSHOT_NAME_PATTERN.fullmatch(name):
+        abort(404)
+    mimetype = request.accept_mimetypes.best_match(['application/json', COLUMNS_MIMETYPE], 'application/json')
+    if mimetype == COLUMNS_MIMETYPE:
+        name = snapshot_filename(name[len('map-'):-len('.json')], snapshot_format='columns')
+    response = compression.send_precompressed(os.path.join(directory, name), mimetype, CACHE_CONTROL)
+    if response is None:
+        abort(404)
+    response.vary.add('Accept')
+    return response
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+
+    parser = argparse.ArgumentParser(description='Build the public map snapshot.')
+    parser.add_argument('--storage', choices=['local', 'bucket'], default='local')
+    parser.add_argument('--dir', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'snapshots'))
+    parser.add_argument('--watch', action='store_true', help='Keep the snapshot up to date until interrupted.')
+    args = parser.parse_args()
+
+    snapshot_store = BucketSnapshotStore() if args.storage == 'bucket' else LocalSnapshotStore(args.dir)
+    snapshot_builder = MapSnapshotBuilder(
+        snapshot_store, logger,
+        float(os.environ.get('MAP_SNAPSHOT_DEBOUNCE_SECONDS', DEFAULT_DEBOUNCE_SECONDS)),
+        float(os.environ.get('MAP_SNAPSHOT_FULL_REBUILD_SECONDS', DEFAULT_FULL_REBUILD_SECONDS)))
+    if not args.watch:
+        print(snapshot_builder.build())
+        sys.exit(0)
+    snapshot_builder.start_listener()
+    try:
+        while True:
+            time.sleep(snapshot_builder.full_rebuild_seconds)
+            snapshot_builder.ensure_built()
+    except KeyboardInterrupt:
+        snapshot_builder.stop()
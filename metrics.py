@@ -0,0 +1,334 @@
+"""
+In-process metrics with a Prometheus text endpoint.
+
+Collected per process (each gunicorn worker exposes its own numbers):
+  * mailmap_http_request_duration_seconds{method,route,status}
+  * mailmap_dependency_call_duration_seconds{dependency,operation} - firestore_utils functions,
+    GCS uploads, EXIF parsing, SMTP sends and template rendering
+  * mailmap_firestore_documents_{read,written}_total and the per-request histograms
+    mailmap_firestore_documents_{read,written}_per_request{route}
+  * mailmap_firestore_documents_read_saved_total{collection} - reads served from the request
+    identity map instead of Firestore (see identity_map.py)
+
+Document counts come from thin wrappers around the Firestore SDK's read and commit methods, so
+they cover every code path (queries, get_all, batches, transactions) without each caller having
+to report them.
+"""
+
+import functools
+import hmac
+import threading
+import time
+from bisect import bisect_left
+
+from flask import current_app, g, has_request_context, request, Response, abort
+
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DOCUMENT_COUNT_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+_enabled = True
+# The per-request document counts on flask.g are also updated from fanout threads.
+_request_counts_lock = threading.Lock()
+
+
+def _escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(label_names, label_values, extra=()):
+    pairs = [f'{name}="{_escape_label_value(value)}"' for name, value in zip(label_names, label_values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter keyed by label values."""
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            lines.append(f'{self.name}{_format_labels(self.label_names, label_values)} {_format_number(value)}')
+        return lines
+
+
+class Histogram:
+    """Fixed-bucket histogram keyed by label values."""
+
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, *label_values):
+        series = self._series.get(label_values)
+        return sum(series[:-1]) if series else 0
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        for label_values, series in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), series[:-1]):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, label_values, extra=(('le', _format_number(float(bound))),))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.label_names, label_values)
+            lines.append(f'{self.name}_sum{labels} {_format_number(series[-1])}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+REQUEST_DURATION = Histogram('mailmap_http_request_duration_seconds', 'HTTP request latency by route.',
+                             ('method', 'route', 'status'))
+DEPENDENCY_DURATION = Histogram('mailmap_dependency_call_duration_seconds',
+                                'Latency of calls to Firestore, Storage, EXIF parsing, SMTP and templates.',
+                                ('dependency', 'operation'))
+DEPENDENCY_ERRORS = Counter('mailmap_dependency_call_errors_total', 'Dependency calls that raised.',
+                            ('dependency', 'operation'))
+DOCUMENTS_READ = Counter('mailmap_firestore_documents_read_total', 'Firestore documents read.')
+DOCUMENTS_WRITTEN = Counter('mailmap_firestore_documents_written_total', 'Firestore documents written.')
+DOCUMENTS_READ_SAVED = Counter('mailmap_firestore_documents_read_saved_total',
+                               'Document reads served from the request identity map.', ('collection',))
+DOCUMENTS_READ_PER_REQUEST = Histogram('mailmap_firestore_documents_read_per_request',
+                                       'Firestore documents read per HTTP request.', ('route',),
+                                       buckets=DOCUMENT_COUNT_BUCKETS)
+DOCUMENTS_WRITTEN_PER_REQUEST = Histogram('mailmap_firestore_documents_written_per_request',
+                                          'Firestore documents written per HTTP request.', ('route',),
+                                          buckets=DOCUMENT_COUNT_BUCKETS)
+
+REGISTRY = [REQUEST_DURATION, DEPENDENCY_DURATION, DEPENDENCY_ERRORS, DOCUMENTS_READ, DOCUMENTS_WRITTEN,
+            DOCUMENTS_READ_SAVED, DOCUMENTS_READ_PER_REQUEST, DOCUMENTS_WRITTEN_PER_REQUEST]
+
+
+def set_enabled(enabled):
+    global _enabled
+    _enabled = bool(enabled)
+
+
+def is_enabled():
+    return _enabled
+
+
+def render_metrics():
+    """Returns all metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# --- Dependency timing ---
+
+def timed(dependency, operation=None):
+    """Decorator recording the wrapped function's latency as a dependency call."""
+    def decorator(func):
+        op_name = operation or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                DEPENDENCY_ERRORS.inc(1, dependency, op_name)
+                raise
+            finally:
+                DEPENDENCY_DURATION.observe(time.perf_counter() - started, dependency, op_name)
+        wrapper._metrics_timed = True
+        return wrapper
+    return decorator
+
+
+def instrument_module_functions(namespace, dependency, exclude=()):
+    """
+    Wraps every public function defined in a module (pass its globals()) with timed(). Call it at
+    the bottom of the module so that `from module import func` picks up the wrapped version.
+    """
+    module_name = namespace.get('__name__')
+    for name, value in list(namespace.items()):
+        if (name.startswith('_') or name in exclude or not callable(value) or not hasattr(value, '__code__')
+                or getattr(value, '__module__', None) != module_name or getattr(value, '_metrics_timed', False)):
+            continue
+        namespace[name] = timed(dependency, name)(value)
+
+
+# --- Firestore document counters ---
+
+def _add_document_counts(read=0, written=0):
+    if not _enabled:
+        return
+    if read:
+        DOCUMENTS_READ.inc(read)
+    if written:
+        DOCUMENTS_WRITTEN.inc(written)
+    if has_request_context():
+        with _request_counts_lock:
+            g.metrics_docs_read = g.get('metrics_docs_read', 0) + read
+            g.metrics_docs_written = g.get('metrics_docs_written', 0) + written
+
+
+def _counting_stream(results):
+    for snapshot in results:
+        _add_document_counts(read=1)
+        yield snapshot
+
+
+_firestore_counters_installed = False
+
+
+def install_firestore_counters():
+    """Wraps the Firestore SDK's read and commit entry points to count documents. Idempotent."""
+    global _firestore_counters_installed
+    if _firestore_counters_installed:
+        return
+    from google.cloud.firestore_v1.batch import WriteBatch
+    from google.cloud.firestore_v1.client import Client
+    from google.cloud.firestore_v1.document import DocumentReference
+    from google.cloud.firestore_v1.query import Query
+    from google.cloud.firestore_v1.transaction import Transaction
+
+    original_get = DocumentReference.get
+    original_stream = Query.stream
+    original_get_all = Client.get_all
+    original_batch_commit = WriteBatch.commit
+    original_transaction_commit = Transaction._commit
+
+    @functools.wraps(original_get)
+    def get(self, *args, **kwargs):
+        snapshot = original_get(self, *args, **kwargs)
+        _add_document_counts(read=1)
+        return snapshot
+
+    @functools.wraps(original_stream)
+    def stream(self, *args, **kwargs):
+        return _counting_stream(original_stream(self, *args, **kwargs))
+
+    @functools.wraps(original_get_all)
+    def get_all(self, *args, **kwargs):
+        return _counting_stream(original_get_all(self, *args, **kwargs))
+
+    @functools.wraps(original_batch_commit)
+    def batch_commit(self, *args, **kwargs):
+        results = original_batch_commit(self, *args, **kwargs)
+        _add_document_counts(written=len(results))
+        return results
+
+    @functools.wraps(original_transaction_commit)
+    def transaction_commit(self, *args, **kwargs):
+        results = original_transaction_commit(self, *args, **kwargs)
+        _add_document_counts(written=len(results or ()))
+        return results
+
+    DocumentReference.get = get
+    Query.stream = stream
+    Client.get_all = get_all
+    WriteBatch.commit = batch_commit
+    Transaction._commit = transaction_commit
+    _firestore_counters_installed = True
+
+
+# --- Flask integration ---
+
+def _route_label():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def _start_request_timer():
+    g.metrics_started = time.perf_counter()
+
+
+def _remember_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+def _record_request(exc):
+    """Runs on teardown, so requests that ended in an unhandled exception are counted as 500s."""
+    started = g.pop('metrics_started', None)
+    if started is not None and _enabled:
+        route = _route_label()
+        status = g.get('metrics_status', 500)
+        REQUEST_DURATION.observe(time.perf_counter() - started, request.method, route, str(status))
+        with _request_counts_lock:
+            docs_read, docs_written = g.get('metrics_docs_read', 0), g.get('metrics_docs_written', 0)
+        DOCUMENTS_READ_PER_REQUEST.observe(docs_read, route)
+        DOCUMENTS_WRITTEN_PER_REQUEST.observe(docs_written, route)
+
+
+def _template_started(sender, template, context, **extra):
+    if has_request_context():
+        g.setdefault('metrics_template_starts', []).append(time.perf_counter())
+
+
+def _template_finished(sender, template, context, **extra):
+    starts = g.get('metrics_template_starts') if has_request_context() else None
+    if starts and _enabled:
+        DEPENDENCY_DURATION.observe(time.perf_counter() - starts.pop(), 'template', template.name or 'string')
+
+
+def metrics_endpoint():
+    token = current_app.config.get('METRICS_TOKEN')
+    if not token:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        abort(403)
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+def init_app(app):
+    """
+    Enables metrics for app according to METRICS_ENABLED (default True) and exposes them at
+    /metrics, which requires 'Authorization: Bearer <METRICS_TOKEN>'. Without METRICS_TOKEN the
+    endpoint answers 404; the metrics are still collected.
+    """
+    from flask import before_render_template, template_rendered
+
+    set_enabled(app.config.get('METRICS_ENABLED', True))
+    if not _enabled:
+        return
+    install_firestore_counters()
+    app.before_request(_start_request_timer)
+    app.after_request(_remember_status)
+    app.teardown_request(_record_request)
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_finished, app)
+    app.add_url_rule('/metrics', 'metrics', metrics_endpoint)
@@ -0,0 +1,227 @@
+"""
+Background migration of content ownership for account merges.
+
+When a user signs in with a provider whose UID differs from the account found by email, their
+posts have to move from the old UID to the new one. start_migration records a job in the
+'ownershipMigrations' collection (one document per old UID) and adds the old UID to the new
+user's post index under 'mergedFrom', so reads of the new user's posts include the old ones
+(firestore_utils.get_user_post_index) while the job runs. Sign-in returns right away.
+
+run_migration moves the posts in chunks: content documents are updated with a BulkWriter, then
+one batch moves the chunk's post index entries and advances the job's cursor and count. Every
+step is idempotent (setting userId again is harmless, and items deleted meanwhile are skipped),
+so an interrupted job simply resumes from the old user's remaining index entries. Jobs that fail
+are retried in-process with backoff; anything left over is picked up by running this module as a
+script (e.g. from cron):
+
+    python ownership_migration.py [limit]
+"""
+
+import logging
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import firestore_utils
+from firestore_utils import firestore, POST_INDEX_COLLECTION
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_COLLECTION = 'ownershipMigrations'
+MIGRATION_CHUNK_SIZE = firestore_utils.BULK_WRITE_CHUNK_SIZE  # Leaves room for the index and job writes
+MAX_WRITE_ATTEMPTS = 5
+MAX_INLINE_ATTEMPTS = 5
+RETRY_BASE_DELAY_SECONDS = 2
+GRPC_NOT_FOUND = 5
+
+STATUS_PENDING = 'pending'
+STATUS_DONE = 'done'
+
+# Shared pool for migrations started from sign-in requests.
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='ownership-migration')
+
+
+def _job_ref(db, old_user_id):
+    return db.collection(MIGRATION_COLLECTION).document(old_user_id)
+
+
+def start_migration(old_user_id, new_user_id, app_logger, background=True):
+    """
+    Records a migration job from old_user_id to new_user_id and, unless background is False,
+    schedules it. Restarting a pending job for the same pair keeps its progress.
+    Returns the job data, or None if the job could not be recorded.
+    """
+    if not old_user_id or not new_user_id or old_user_id == new_user_id:
+        return None
+    db = firestore_utils.get_db_client()
+    job_ref = _job_ref(db, old_user_id)
+    try:
+        job_snapshot = job_ref.get()
+        job = job_snapshot.to_dict() if job_snapshot.exists else None
+        batch = db.batch()
+        if not job or job.get('status') != STATUS_PENDING or job.get('newUserId') != new_user_id:
+            job = {
+                'oldUserId': old_user_id,
+                'newUserId': new_user_id,
+                'status': STATUS_PENDING,
+                'cursor': None,
+                'migratedCount': 0,
+                'attempts': 0,
+                'lastError': None,
+                'createdAt': firestore.SERVER_TIMESTAMP,
+                'updatedAt': firestore.SERVER_TIMESTAMP,
+            }
+            batch.set(job_ref, job)
+        batch.set(db.collection(POST_INDEX_COLLECTION).document(new_user_id), {
+            'userId': new_user_id,
+            'mergedFrom': firestore.ArrayUnion([old_user_id]),
+            'updatedAt': firestore.SERVER_TIMESTAMP,
+        }, merge=True)
+        batch.commit()
+    except Exception as e:
+        app_logger.error(f"Error starting content migration from {old_user_id} to {new_user_id}: {e}", exc_info=True)
+        return None
+
+    app_logger.info(f"Content migration from {old_user_id} to {new_user_id} recorded.")
+    if background:
+        schedule_migration(old_user_id, app_logger)
+    return job
+
+
+def _migrate_chunk(db, job_ref, old_user_id, new_user_id, entries, ids_chunk, app_logger):
+    """
+    Moves one chunk of items. Returns the IDs whose update failed after retries; those stay in
+    the old user's index for the next run.
+    """
+    gone, failed = set(), {}
+
+    def on_write_error(failure, writer):
+        item_id = failure.operation.reference.id
+        if failure.code == GRPC_NOT_FOUND:
+            gone.add(item_id)  # Deleted since it was indexed: nothing to migrate
+            return False
+        if failure.attempts < MAX_WRITE_ATTEMPTS:
+            return True
+        failed[item_id] = failure.message
+        return False
+
+    writer = db.bulk_writer()
+    writer.on_write_error(on_write_error)
+    content_items_ref = db.collection('contentItems')
+    for item_id in ids_chunk:
+        writer.update(content_items_ref.document(item_id), {'userId': new_user_id})
+    writer.close()
+
+    done_ids = [item_id for item_id in ids_chunk if item_id not in failed]
+    moved_ids = [item_id for item_id in done_ids if item_id not in gone]
+    if done_ids:
+        batch = db.batch()
+        firestore_utils._set_post_index_entries(batch, db, old_user_id,
+                                                {item_id: firestore.DELETE_FIELD for item_id in done_ids})
+        firestore_utils._set_post_index_entries(batch, db, new_user_id, {
+            item_id: dict(entries[item_id], userId=new_user_id) for item_id in moved_ids
+        })
+        batch.update(job_ref, {
+            'cursor': done_ids[-1],
+            'migratedCount': firestore.Increment(len(moved_ids)),
+            'updatedAt': firestore.SERVER_TIMESTAMP,
+        })
+        batch.commit()
+    app_logger.info(f"Migrated {len(moved_ids)} content items from {old_user_id} to {new_user_id} "
+                    f"({len(gone)} already deleted, {len(failed)} failed).")
+    if failed:
+        app_logger.error(f"Content migration from {old_user_id}: updates failed for {sorted(failed)}: "
+                         f"{next(iter(failed.values()))}")
+    return failed
+
+
+def run_migration(old_user_id, app_logger):
+    """
+    Runs or resumes the migration job of old_user_id until it completes or a write fails.
+    Returns a dictionary with 'status' ('done', 'pending' or 'missing') and 'migrated'.
+    """
+    db = firestore_utils.get_db_client()
+    job_ref = _job_ref(db, old_user_id)
+    migrated = 0
+    try:
+        job_snapshot = job_ref.get()
+        if not job_snapshot.exists:
+            return {'status': 'missing', 'migrated': 0}
+        job = job_snapshot.to_dict()
+        if job.get('status') == STATUS_DONE:
+            return {'status': STATUS_DONE, 'migrated': 0}
+        new_user_id = job['newUserId']
+
+        # Items are processed in ID order; the old user's index only lists items not yet moved.
+        entries = firestore_utils.get_user_post_index(old_user_id, app_logger, include_merges=False)
+        pending_ids = sorted(entries)
+        for start in range(0, len(pending_ids), MIGRATION_CHUNK_SIZE):
+            ids_chunk = pending_ids[start:start + MIGRATION_CHUNK_SIZE]
+            failed = _migrate_chunk(db, job_ref, old_user_id, new_user_id, entries, ids_chunk, app_logger)
+            migrated += len(ids_chunk) - len(failed)
+            if failed:
+                job_ref.update({'attempts': firestore.Increment(1), 'updatedAt': firestore.SERVER_TIMESTAMP,
+                                'lastError': f"{len(failed)} updates failed"})
+                return {'status': STATUS_PENDING, 'migrated': migrated}
+
+        batch = db.batch()
+        batch.update(job_ref, {'status': STATUS_DONE, 'lastError': None,
+                               'completedAt': firestore.SERVER_TIMESTAMP, 'updatedAt': firestore.SERVER_TIMESTAMP})
+        batch.set(db.collection(POST_INDEX_COLLECTION).document(new_user_id), {
+            'mergedFrom': firestore.ArrayRemove([old_user_id]), 'updatedAt': firestore.SERVER_TIMESTAMP,
+        }, merge=True)
+        batch.delete(db.collection(POST_INDEX_COLLECTION).document(old_user_id))
+        batch.commit()
+        app_logger.info(f"Content migration from {old_user_id} to {new_user_id} completed.")
+        return {'status': STATUS_DONE, 'migrated': migrated}
+    except Exception as e:
+        app_logger.error(f"Error running content migration for {old_user_id}: {e}", exc_info=True)
+        try:
+            job_ref.update({'attempts': firestore.Increment(1), 'lastError': str(e),
+                            'updatedAt': firestore.SERVER_TIMESTAMP})
+        except Exception:
+            pass
+        return {'status': STATUS_PENDING, 'migrated': migrated}
+
+
+def schedule_migration(old_user_id, app_logger, attempt=1):
+    """
+    Runs a migration job in the background. Retries with exponential backoff up to
+    MAX_INLINE_ATTEMPTS; after that the job waits for process_pending_migrations.
+    """
+    def run():
+        result = run_migration(old_user_id, app_logger)
+        if result['status'] != STATUS_PENDING:
+            return
+        if attempt >= MAX_INLINE_ATTEMPTS:
+            app_logger.warning(f"Content migration for {old_user_id} still pending after {attempt} attempts; "
+                               f"leaving it for the next sweep.")
+            return
+        timer = threading.Timer(RETRY_BASE_DELAY_SECONDS * 2 ** (attempt - 1),
+                                schedule_migration, args=(old_user_id, app_logger, attempt + 1))
+        timer.daemon = True
+        timer.start()
+
+    return _executor.submit(run)
+
+
+def process_pending_migrations(app_logger, limit=100):
+    """
+    Resumes leftover migration jobs (crashes, exhausted retries) one after another.
+    Returns a dictionary with counts per result status.
+    """
+    db = firestore_utils.get_db_client()
+    job_docs = db.collection(MIGRATION_COLLECTION).where(
+        field_path='status', op_string='==', value=STATUS_PENDING).limit(limit).stream()
+    counts = {STATUS_DONE: 0, STATUS_PENDING: 0, 'missing': 0}
+    for job_doc in job_docs:
+        counts[run_migration(job_doc.id, app_logger)['status']] += 1
+    app_logger.info(f"Migration sweep processed {sum(counts.values())} jobs: {counts}")
+    return counts
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+
+    sweep_limit = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    process_pending_migrations(logger, limit=sweep_limit)
@@ -0,0 +1,196 @@
+"""
+Opt-in sampling profiler for production requests.
+
+When enabled, a fraction of requests (PROFILING_SAMPLE_RATE) is profiled by a background thread
+that samples the request thread's stack every PROFILING_INTERVAL_MS. Requests slower than
+PROFILING_SLOW_THRESHOLD_MS are written as collapsed-stack files (one "frame;frame;frame count"
+line per stack, the input format of flamegraph.pl and speedscope) plus a JSON sidecar with the
+request details. The directory keeps at most PROFILING_MAX_FILES profiles; the oldest are removed.
+
+Logged-in admins can force a profile for a single request with the `X-Profile: 1` header; forced
+profiles are always written, whatever their duration.
+
+Sampling only reads frames from another thread, so the profiled request itself runs at full speed
+apart from GIL hand-offs at the sampling interval.
+"""
+
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+from flask import g, request, session
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_SUFFIX = '.folded'
+METADATA_SUFFIX = '.json'
+
+DEFAULT_SAMPLE_RATE = 0.01
+DEFAULT_INTERVAL_MS = 5
+DEFAULT_SLOW_THRESHOLD_MS = 500
+DEFAULT_MAX_FILES = 50
+DEFAULT_PROFILE_DIR = 'profiles'
+
+_prune_lock = threading.Lock()
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Samples one thread's Python stack from a background thread and aggregates collapsed stacks."""
+
+    def __init__(self, thread_id, interval_seconds):
+        self.thread_id = thread_id
+        self.interval_seconds = interval_seconds
+        self.stacks = Counter()
+        self.sample_count = 0
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval_seconds):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None or self.thread_id == own_id:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(labels))] += 1
+            self.sample_count += 1
+
+    def collapsed(self):
+        """Returns the samples in collapsed-stack format, heaviest stacks first."""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+def _config(app_config, key, default):
+    value = app_config.get(key)
+    return default if value is None else value
+
+
+def _should_profile(app_config):
+    if request.headers.get(PROFILE_HEADER) == '1' and 'admin_id' in session:
+        return True, True
+    if not _config(app_config, 'PROFILING_ENABLED', False):
+        return False, False
+    return random.random() < float(_config(app_config, 'PROFILING_SAMPLE_RATE', DEFAULT_SAMPLE_RATE)), False
+
+
+def _safe_name(text):
+    return re.sub(r'[^A-Za-z0-9_-]+', '_', text).strip('_')[:60] or 'root'
+
+
+def save_profile(profile_dir, sampler, details, max_files):
+    """Writes a collapsed-stack profile plus its metadata and prunes the directory to max_files."""
+    os.makedirs(profile_dir, exist_ok=True)
+    created = datetime.now(timezone.utc)
+    name = (f"{created.strftime('%Y%m%dT%H%M%S%f')}_{int(details['duration_ms'])}ms_"
+            f"{_safe_name(details['path'])}_{uuid.uuid4().hex[:8]}")
+    with open(os.path.join(profile_dir, name + PROFILE_SUFFIX), 'w') as profile_file:
+        profile_file.write(sampler.collapsed())
+    metadata = dict(details, name=name, samples=sampler.sample_count, created=created.isoformat())
+    with open(os.path.join(profile_dir, name + METADATA_SUFFIX), 'w') as metadata_file:
+        json.dump(metadata, metadata_file)
+    prune_profiles(profile_dir, max_files)
+    return name
+
+
+def prune_profiles(profile_dir, max_files):
+    """Removes the oldest profiles so that at most max_files remain."""
+    with _prune_lock:
+        names = sorted(entry[:-len(METADATA_SUFFIX)] for entry in os.listdir(profile_dir)
+                       if entry.endswith(METADATA_SUFFIX))
+        for name in names[:max(0, len(names) - max_files)]:
+            for suffix in (PROFILE_SUFFIX, METADATA_SUFFIX):
+                try:
+                    os.remove(os.path.join(profile_dir, name + suffix))
+                except FileNotFoundError:
+                    pass
+
+
+def list_profiles(profile_dir, limit=50):
+    """Returns metadata of the stored profiles, slowest first."""
+    if not os.path.isdir(profile_dir):
+        return []
+    profiles = []
+    for entry in os.listdir(profile_dir):
+        if not entry.endswith(METADATA_SUFFIX):
+            continue
+        try:
+            with open(os.path.join(profile_dir, entry)) as metadata_file:
+                profiles.append(json.load(metadata_file))
+        except (OSError, ValueError):
+            continue
+    profiles.sort(key=lambda item: item.get('duration_ms', 0), reverse=True)
+    return profiles[:limit]
+
+
+def profile_path(profile_dir, name):
+    """Returns the path of a stored profile, or None if the name is invalid or missing."""
+    if not re.fullmatch(r'[A-Za-z0-9_-]+', name or ''):
+        return None
+    path = os.path.join(profile_dir, name + PROFILE_SUFFIX)
+    return path if os.path.isfile(path) else None
+
+
+def get_profile_dir(app):
+    return _config(app.config, 'PROFILING_DIR', os.path.join(app.root_path, DEFAULT_PROFILE_DIR))
+
+
+def init_app(app):
+    """Installs the profiling hooks on app. Profiling stays off unless enabled or forced by an admin."""
+
+    @app.before_request
+    def _start_profiler():
+        selected, forced = _should_profile(app.config)
+        if not selected:
+            return
+        interval_ms = float(_config(app.config, 'PROFILING_INTERVAL_MS', DEFAULT_INTERVAL_MS))
+        sampler = StackSampler(threading.get_ident(), interval_ms / 1000.0)
+        g.profiler = (sampler, time.perf_counter(), forced)
+        sampler.start()
+
+    @app.teardown_request
+    def _stop_profiler(exc=None):
+        state = g.pop('profiler', None)
+        if state is None:
+            return
+        sampler, started, forced = state
+        sampler.stop()
+        duration_ms = (time.perf_counter() - started) * 1000
+        threshold_ms = float(_config(app.config, 'PROFILING_SLOW_THRESHOLD_MS', DEFAULT_SLOW_THRESHOLD_MS))
+        if not forced and duration_ms < threshold_ms:
+            return
+        details = {
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'duration_ms': round(duration_ms, 1),
+            'forced': forced,
+            'request_id': g.get('request_id'),
+        }
+        try:
+            name = save_profile(get_profile_dir(app), sampler, details,
+                                int(_config(app.config, 'PROFILING_MAX_FILES', DEFAULT_MAX_FILES)))
+            app.logger.info("Saved request profile %s (%.1f ms, %d samples)", name, duration_ms,
+                            sampler.sample_count)
+        except OSError as e:
+            app.logger.error("Failed to save request profile for %s: %s", request.path, e)
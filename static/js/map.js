@@ -373,6 +373,14 @@ async function showAddPhotoModal(latLng) {
         newSubmitButton.addEventListener('click', handlePhotoSubmit); // Wire to ADD handler
     }
 
+    hidePhotoLocationOption();
+    if (fileInput) {
+        fileInput.addEventListener('change', onAddPhotoFileSelected); // Removed by hideAddPhotoModal
+    }
+    if (currentDroppedFile) {
+        startPhotoPreparation(currentDroppedFile);
+    }
+
     if (currentDroppedFile) {
         if (droppedFileInfo) {
             droppedFileInfo.textContent = 'Using dropped file: ' + currentDroppedFile.name;
@@ -414,8 +422,11 @@ function hideAddPhotoModal() {
         }
 
         // Clear fields within the modal
+        hidePhotoLocationOption();
+        photoPreparation = null;
         const fileInput = modalElement.querySelector('#photo-file-input');
         if (fileInput) {
+            fileInput.removeEventListener('change', onAddPhotoFileSelected);
             fileInput.value = ''; // Clear selected file
             fileInput.style.display = 'block'; // Ensure it's visible for next time (if it's an add modal)
         }
@@ -467,6 +478,8 @@ function updateMarkerInfoWindowContent(contentId, newText, newImageUrl) {
     const marker = markers[contentId];
     if (!marker) {
         console.error('Marker not found for contentId:', contentId);
+    } else {
+        syncMarker(marker, mapItems[itemIndex]);
     }
 
     if (infoWindow && infoWindow.getMap() && marker && infoWindow.anchor === marker) {
@@ -497,41 +510,37 @@ function handlePhotoSubmit() {
 
     if (typeof showLoading === 'function') showLoading(true);
 
-    const formData = new FormData();
-    formData.append('image', file);
-    formData.append('text', description);
-    formData.append('latitude', currentPhotoAddLatLng.lat());
-    formData.append('longitude', currentPhotoAddLatLng.lng());
-    formData.append('userId', (typeof currentUser !== 'undefined' && currentUser) ? currentUser.uid : 'anonymous');
+    const pressedLatLng = currentPhotoAddLatLng;
+    // Read now: the option is only checked if it was shown before the form was submitted
+    const useExifCheckbox = document.getElementById('photo-use-exif-location');
+    const useExifLocation = Boolean(useExifCheckbox && useExifCheckbox.checked);
+    const userId = (typeof currentUser !== 'undefined' && currentUser) ? currentUser.uid : 'anonymous';
+    let latitude = pressedLatLng.lat();
+    let longitude = pressedLatLng.lng();
 
     currentDroppedFile = null; // Clear the global reference to the dropped file
 
-    fetch('/api/content/create', {
-        method: 'POST',
-        body: formData
-    })
-    .then(response => {
-        if (typeof showLoading === 'function') showLoading(false);
-        if (response.ok) {
-            return response.json();
-        } else {
-            response.text().then(text => {
-                alert('Error adding photo: ' + (text || response.statusText));
-            }).catch(() => {
-                alert('Error adding photo: ' + response.statusText);
-            });
-            throw new Error('Server responded with an error: ' + response.statusText);
+    startPhotoPreparation(file)
+    .then(prepared => {
+        const exif = prepared.latitude !== null ? { latitude: prepared.latitude, longitude: prepared.longitude } : null;
+        if (exif && useExifLocation) {
+            latitude = exif.latitude;
+            longitude = exif.longitude;
         }
+        return uploadPhotoDirect(prepared.file, description, latitude, longitude, userId, exif)
+            .then(newItemData => newItemData ||
+                  uploadPhotoThroughServer(prepared.file, description, latitude, longitude, userId, exif));
     })
     .then(newItemData => {
+        if (typeof showLoading === 'function') showLoading(false);
         if (newItemData && newItemData.content) {
             addItemToMap(newItemData.content);
         } else if (newItemData && newItemData.contentId) {
             console.warn("Photo added, but full item data not returned. addItemToMap might not work as expected.", newItemData);
             const tempItem = {
                 itemId: newItemData.contentId,
-                latitude: currentPhotoAddLatLng.lat(),
-                longitude: currentPhotoAddLatLng.lng(),
+                latitude: latitude,
+                longitude: longitude,
                 text: description,
                 imageUrl: URL.createObjectURL(file),
                 status: 'for_moderation',
@@ -545,8 +554,211 @@ function handlePhotoSubmit() {
     .catch(error => {
         console.error('Error during photo submission:', error);
         if (typeof showLoading === 'function') showLoading(false);
-        alert('Network error or server issue: ' + error.message);
+        alert('Error adding photo: ' + error.message);
+    });
+}
+
+// Direct upload (direct_uploads.py): reserve a signed URL, PUT the file straight to Storage, then
+// let the server check the object and create the post. Resolves to null when the server cannot
+// sign upload URLs, so that the caller falls back to the multipart upload.
+async function uploadPhotoDirect(file, text, latitude, longitude, userId, exif) {
+    const reserveResponse = await fetch('/api/uploads', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ filename: file.name, size: file.size, userId: userId })
+    });
+    if (reserveResponse.status === 404 || reserveResponse.status === 500) return null;
+    const reservation = await readUploadResponse(reserveResponse);
+
+    const storageResponse = await fetch(reservation.uploadUrl, {
+        method: 'PUT',
+        headers: reservation.uploadHeaders,
+        body: file
+    });
+    if (!storageResponse.ok) {
+        throw new Error(`Storage rejected the upload (${storageResponse.status})`);
+    }
+
+    const finalizeResponse = await fetch(`/api/uploads/${encodeURIComponent(reservation.uploadId)}/finalize`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+            text: text, latitude: latitude, longitude: longitude, userId: userId,
+            exifLatitude: exif ? exif.latitude : null, exifLongitude: exif ? exif.longitude : null
+        })
+    });
+    return readUploadResponse(finalizeResponse);
+}
+
+function uploadPhotoThroughServer(file, text, latitude, longitude, userId, exif) {
+    const formData = new FormData();
+    formData.append('image', file);
+    formData.append('text', text);
+    formData.append('latitude', latitude);
+    formData.append('longitude', longitude);
+    formData.append('userId', userId);
+    if (exif) {
+        formData.append('exifLatitude', exif.latitude);
+        formData.append('exifLongitude', exif.longitude);
+    }
+    return fetch('/api/content/create', {
+        method: 'POST',
+        body: formData
+    }).then(readUploadResponse);
+}
+
+// --- Photo preparation ---
+// photo-worker.js reads the photo's EXIF GPS position and downscales it to
+// photoUploadOptions.maxDimension as soon as it is picked, so that it is usually done by the time
+// the form is submitted. photoPreparation is { file, promise } for the photo picked last.
+
+let photoPreparation = null;
+
+function startPhotoPreparation(file) {
+    if (photoPreparation && photoPreparation.file === file) return photoPreparation.promise;
+    const promise = preparePhoto(file);
+    photoPreparation = { file, promise };
+    promise.then(prepared => {
+        if (photoPreparation && photoPreparation.file === file && prepared.latitude !== null) {
+            showPhotoLocationOption(prepared.latitude, prepared.longitude);
+        }
     });
+    return promise;
+}
+
+// Resolves to { file, latitude, longitude }; the original file without GPS when workers are not
+// available or the worker fails.
+function preparePhoto(file) {
+    const unchanged = { file: file, latitude: null, longitude: null };
+    if (typeof photoUploadOptions === 'undefined' || typeof Worker === 'undefined') {
+        return Promise.resolve(unchanged);
+    }
+    return new Promise(resolve => {
+        let worker;
+        try {
+            worker = new Worker(photoUploadOptions.workerUrl);
+        } catch (error) {
+            console.warn('Photo worker unavailable:', error);
+            resolve(unchanged);
+            return;
+        }
+        const finish = result => {
+            worker.terminate();
+            resolve(result);
+        };
+        worker.onmessage = event => finish(event.data);
+        worker.onerror = event => {
+            console.warn('Photo worker failed, uploading the original:', event.message);
+            finish(unchanged);
+        };
+        worker.postMessage({
+            file: file,
+            maxDimension: photoUploadOptions.maxDimension,
+            quality: photoUploadOptions.quality
+        });
+    });
+}
+
+function onAddPhotoFileSelected(event) {
+    hidePhotoLocationOption();
+    const file = event.target.files[0];
+    if (file) startPhotoPreparation(file);
+}
+
+// Offers to place the post where the photo was taken instead of where the map was pressed.
+function showPhotoLocationOption(latitude, longitude) {
+    if (!addPhotoModal) return;
+    let option = addPhotoModal.querySelector('#photo-location-option');
+    if (!option) {
+        option = document.createElement('label');
+        option.id = 'photo-location-option';
+        option.style.display = 'block';
+        option.style.margin = '10px 0';
+        option.style.fontSize = '13px';
+        const checkbox = document.createElement('input');
+        checkbox.type = 'checkbox';
+        checkbox.id = 'photo-use-exif-location';
+        checkbox.style.marginRight = '6px';
+        option.appendChild(checkbox);
+        option.appendChild(document.createElement('span'));
+        const descriptionInput = addPhotoModal.querySelector('#photo-description-input');
+        descriptionInput.parentNode.insertBefore(option, descriptionInput);
+    }
+    option.querySelector('span').textContent =
+        `Place at the photo's location (${latitude.toFixed(5)}, ${longitude.toFixed(5)})`;
+    option.querySelector('input').checked = true;
+    option.style.display = 'block';
+}
+
+function hidePhotoLocationOption() {
+    const option = addPhotoModal ? addPhotoModal.querySelector('#photo-location-option') : null;
+    if (option) {
+        option.style.display = 'none';
+        option.querySelector('input').checked = false;
+    }
+}
+
+// Resolves to the JSON body of a successful response; rejects with the server's message otherwise.
+async function readUploadResponse(response) {
+    const payload = await response.json().catch(() => null);
+    if (!response.ok) {
+        throw new Error((payload && payload.message) || response.statusText);
+    }
+    return payload;
+}
+
+const MAP_COLUMNS_MIMETYPE = 'application/vnd.mailmap.map-columns+json';
+
+// Rebuilds map items from the columnar snapshot encoding (map_snapshot.encode_columns):
+// coordinates and timestamps are delta-encoded, users, statuses and image URL prefixes are
+// dictionary-encoded. Timestamps stay epoch milliseconds, which formatTimestamp accepts.
+function decodeMapColumns(columns) {
+    const count = columns.count;
+    const scale = columns.coordinateScale;
+    const items = new Array(count);
+    let latitude = 0, longitude = 0, timestamp = 0;
+    for (let i = 0; i < count; i++) {
+        const lat = columns.latitude[i], lng = columns.longitude[i], ts = columns.timestamp[i];
+        if (lat !== null) latitude += lat;
+        if (lng !== null) longitude += lng;
+        if (ts !== null) timestamp += ts;
+        const user = columns.user[i], status = columns.status[i], prefix = columns.imagePrefix[i];
+        items[i] = {
+            itemId: columns.itemId[i],
+            latitude: lat !== null ? latitude / scale : null,
+            longitude: lng !== null ? longitude / scale : null,
+            voteCount: columns.voteCount[i],
+            timestamp: ts !== null ? timestamp : null,
+            text: columns.text[i],
+            userId: user !== null ? columns.users[user] : null,
+            status: status !== null ? columns.statuses[status] : null,
+            imageUrl: prefix !== null ? columns.imagePrefixes[prefix] + columns.imageName[i] : null
+        };
+    }
+    return items;
+}
+
+// Loads the public map from a precomputed snapshot file (see map_snapshot.py). The file name
+// changes with its content, so browsers and CDNs can cache it. The compact columnar encoding is
+// requested when the server can negotiate it; otherwise the plain array of items arrives.
+function loadMapSnapshot(url, targetItemId) {
+    return fetch(url, {
+        mode: 'cors',
+        credentials: 'omit',
+        headers: { 'Accept': `${MAP_COLUMNS_MIMETYPE}, application/json;q=0.9` }
+    })
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`Snapshot request failed with status ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(payload => Array.isArray(payload) ? payload : decodeMapColumns(payload))
+        .then(items => setMapItemsAndPopulate(items, targetItemId))
+        .catch(error => {
+            console.error('Error loading map snapshot:', error);
+            setMapItemsAndPopulate([], targetItemId);
+        });
 }
 
 function setMapItemsAndPopulate(items, targetItemId) {
@@ -563,78 +775,131 @@ function populateMapWithMarkers() {
         console.warn("Map or mapItems not ready for populating markers.");
         return;
     }
-    clearAllMarkers();
-    let mapCenter = { lat: 0, lng: 0 };
-    let initialZoom = 3;
-
-    if (mapItems && mapItems.length > 0) {
-        if (mapItems.length === 1) {
-            mapCenter = { lat: mapItems[0].latitude, lng: mapItems[0].longitude };
-            initialZoom = 10;
-        } else {
-            const bounds = new google.maps.LatLngBounds();
-            mapItems.forEach(item => {
-                if (typeof item.latitude === 'number' && typeof item.longitude === 'number') {
-                    bounds.extend({ lat: item.latitude, lng: item.longitude });
-                }
-            });
-            if (!bounds.isEmpty()) {
-                const center = bounds.getCenter();
-                mapCenter = { lat: center.lat(), lng: center.lng() };
-            } else {
-                console.warn("No valid coordinates in mapItems to determine bounds.");
-            }
-        }
-        map.setCenter(mapCenter);
-        map.setZoom(initialZoom);
-        if (mapItems.length > 1) {
-            const bounds = new google.maps.LatLngBounds();
-            let validItemsExist = false;
-            mapItems.forEach(item => {
-                if (typeof item.latitude === 'number' && typeof item.longitude === 'number') {
-                    bounds.extend({ lat: item.latitude, lng: item.longitude });
-                    validItemsExist = true;
-                }
-            });
-            if (validItemsExist) {
-                map.fitBounds(bounds);
+    if (mapItems.length > 0) {
+        const bounds = new google.maps.LatLngBounds();
+        let validItemCount = 0;
+        mapItems.forEach(item => {
+            if (hasMapPosition(item)) {
+                bounds.extend({ lat: item.latitude, lng: item.longitude });
+                validItemCount++;
             }
+        });
+        if (validItemCount === 1) {
+            map.setCenter(bounds.getCenter());
+            map.setZoom(10);
+        } else if (validItemCount > 1) {
+            map.fitBounds(bounds);
+        } else {
+            console.warn("No valid coordinates in mapItems to determine bounds.");
+            map.setCenter({ lat: 0, lng: 0 });
+            map.setZoom(3);
         }
     }
-    addMarkersToMapInternal();
+    reconcileMarkers(mapItems);
     if (currentTargetItemId) {
         focusOnTargetItem(currentTargetItemId);
     }
 }
 
 function clearAllMarkers() {
-    for (const markerId in markers) {
-        if (markers.hasOwnProperty(markerId)) {
-            markers[markerId].map = null;
-        }
-    }
-    markers = {};
+    reconcileMarkers([]);
 }
 
-function addMarkersToMapInternal() {
-    if (!mapItems) return;
-    mapItems.forEach(item => {
-        if (typeof item.latitude === 'number' && typeof item.longitude === 'number' && item.itemId) {
-            const marker = createMarker(item);
-            markers[item.itemId] = marker;
-        } else {
+// --- Marker reconciliation ---
+// markers holds one AdvancedMarkerView per shown itemId. reconcileMarkers() diffs a new item list
+// against it: markers of kept items are updated in place (and their content only rebuilt when its
+// look changed), new items take a marker from markerPool, and markers of items that are gone are
+// hidden and returned to the pool instead of being dropped with their DOM subtree.
+
+const MARKER_POOL_LIMIT = 500;
+let markerPool = [];
+
+function hasMapPosition(item) {
+    return typeof item.latitude === 'number' && typeof item.longitude === 'number';
+}
+
+function reconcileMarkers(items) {
+    const nextMarkers = {};
+    items.forEach(item => {
+        if (!hasMapPosition(item) || !item.itemId) {
             console.warn("Skipping item due to invalid coordinates or missing itemId:", item);
+            return;
         }
+        const marker = markers[item.itemId] || nextMarkers[item.itemId] || acquireMarker();
+        syncMarker(marker, item);
+        nextMarkers[item.itemId] = marker;
     });
+    for (const markerId in markers) {
+        if (markers.hasOwnProperty(markerId) && !nextMarkers[markerId]) {
+            releaseMarker(markers[markerId]);
+        }
+    }
+    markers = nextMarkers;
 }
 
-function createMarker(item) {
-    const markerPosition = { lat: item.latitude, lng: item.longitude };
-    const isUnderModeration = item.status === 'for_moderation';
+function acquireMarker() {
+    const pooled = markerPool.pop();
+    if (pooled) return pooled;
 
     const markerElement = document.createElement('div');
-    markerElement.style.cursor = 'pointer';
     markerElement.className = 'custom-marker';
+    markerElement.style.cursor = 'pointer';
+    const marker = new google.maps.marker.AdvancedMarkerView({ content: markerElement });
+    // One listener for the marker's lifetime; it reads the item the marker currently shows.
+    marker.addListener("click", () => {
+        const item = marker.mailmapItem;
+        if (!item) return;
+        infoWindow.setContent(createInfoWindowContent(item));
+        infoWindow.open({ anchor: marker, map });
+        if (window.history && window.history.pushState) {
+            const newUrl = `/post/${item.itemId}`;
+            window.history.pushState({ itemId: item.itemId }, '', newUrl);
+        }
+    });
+    return marker;
+}
+
+function releaseMarker(marker) {
+    if (infoWindow && infoWindow.anchor === marker) {
+        infoWindow.close();
+    }
+    marker.map = null;
+    marker.mailmapItem = null;
+    if (markerPool.length < MARKER_POOL_LIMIT) {
+        markerPool.push(marker);
+    }
+}
+
+function syncMarker(marker, item) {
+    const positionKey = `${item.latitude},${item.longitude}`;
+    if (marker.mailmapPositionKey !== positionKey) {
+        marker.position = { lat: item.latitude, lng: item.longitude };
+        marker.mailmapPositionKey = positionKey;
+    }
+    if (marker.title !== item.text) {
+        marker.title = item.text;
+    }
+    const contentKey = markerContentKey(item);
+    if (marker.mailmapContentKey !== contentKey) {
+        renderMarkerContent(marker.content, item);
+        marker.mailmapContentKey = contentKey;
+    }
+    marker.mailmapItem = item;
+    if (marker.map !== map) {
+        marker.map = map;
+    }
+}
+
+// Everything renderMarkerContent() depends on; a marker whose key is unchanged is left alone.
+function markerContentKey(item) {
+    const preview = item.imageUrl || (item.text?.substring(0, 10) || 'Post');
+    return `${item.status === 'for_moderation' ? 'm' : 'p'}:${item.imageUrl ? 'img' : 'txt'}:${preview}`;
+}
+
+function renderMarkerContent(markerElement, item) {
+    const isUnderModeration = item.status === 'for_moderation';
+    markerElement.replaceChildren();
+    markerElement.style.position = isUnderModeration ? 'relative' : '';
 
     if (isUnderModeration) {
         const moderationIndicator = document.createElement('div');
@@ -645,7 +910,6 @@ function createMarker(item) {
             fontWeight: 'bold', border: '2px solid white'
         });
         moderationIndicator.textContent = '!';
-        markerElement.style.position = 'relative';
         markerElement.appendChild(moderationIndicator);
     }
 
@@ -670,25 +934,6 @@ function createMarker(item) {
         });
         markerElement.appendChild(textElement);
     }
-
-    const marker = new google.maps.marker.AdvancedMarkerView({
-        map: map,
-        position: markerPosition,
-        content: markerElement,
-        title: item.text
-    });
-
-    const infoWindowContent = createInfoWindowContent(item);
-
-    marker.addListener("click", () => {
-        infoWindow.setContent(infoWindowContent);
-        infoWindow.open({ anchor: marker, map });
-        if (window.history && window.history.pushState) {
-            const newUrl = `/post/${item.itemId}`;
-            window.history.pushState({ itemId: item.itemId }, '', newUrl);
-        }
-    });
-    return marker;
 }
 
 function focusOnTargetItem(itemId) {
@@ -898,8 +1143,9 @@ function addItemToMap(item) {
         mapItems = [];
     }
     mapItems.push(item);
-    if (typeof item.latitude === 'number' && typeof item.longitude === 'number' && item.itemId) {
-        const marker = createMarker(item);
+    if (hasMapPosition(item) && item.itemId) {
+        const marker = markers[item.itemId] || acquireMarker();
+        syncMarker(marker, item);
         markers[item.itemId] = marker;
     } else {
         console.warn("New item has invalid coordinates or missing itemId, not adding to map:", item);
@@ -915,11 +1161,51 @@ function updateItemVoteCount(itemId, newVoteCount) {
     }
 }
 
+// Live updates (map_events.py): the server pushes 'changes' events with lists of add/update/remove
+// diffs, and a 'resync' event when this tab fell behind and has to reload the items.
+function subscribeToMapEvents(url) {
+    if (!url || typeof EventSource === 'undefined') return null;
+    const source = new EventSource(url);
+    source.addEventListener('changes', event => applyMapChanges(JSON.parse(event.data)));
+    source.addEventListener('resync', () => reloadMapItems());
+    return source;
+}
+
+function applyMapChanges(changes) {
+    if (!map) return;
+    changes.forEach(change => {
+        if (change.type === 'add') {
+            if (!markers[change.item.itemId]) addItemToMap(change.item);
+        } else if (change.type === 'remove') {
+            if (markers[change.itemId]) removeMarkerFromMap(change.itemId);
+        } else if (change.type === 'update') {
+            const fields = Object.keys(change.changes);
+            if (fields.length === 1 && fields[0] === 'voteCount') {
+                updateItemVoteCount(change.itemId, change.changes.voteCount);
+                return;
+            }
+            const current = mapItems.find(item => item.itemId === change.itemId);
+            if (!current) return;
+            Object.assign(current, change.changes);
+            if (markers[change.itemId]) syncMarker(markers[change.itemId], current);
+        }
+    });
+}
+
+function reloadMapItems() {
+    fetch('/api/map/items')
+        .then(response => response.ok ? response.json() : Promise.reject(new Error(`status ${response.status}`)))
+        .then(payload => {
+            mapItems = payload.items || [];
+            reconcileMarkers(mapItems);
+        })
+        .catch(error => console.error('Error reloading map items:', error));
+}
+
 function removeMarkerFromMap(contentId) {
     const marker = markers[contentId];
     if (marker) {
-        marker.map = null; // Remove from Google Map (AdvancedMarkerView)
-        // For google.maps.Marker, it would be marker.setMap(null);
+        releaseMarker(marker); // Hides it and keeps it for reuse
         delete markers[contentId]; // Remove from our tracking object
         console.log(`Marker ${contentId} removed from map.`);
     } else {
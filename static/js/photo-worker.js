@@ -0,0 +1,136 @@
+// Photo preprocessing before upload, off the main thread (started by preparePhoto in map.js).
+// Reads the EXIF GPS position of a JPEG, then downscales the photo to maxDimension with
+// OffscreenCanvas and re-encodes it as JPEG. The original EXIF block is copied into the new file
+// with Orientation reset to 1, because the pixels are already drawn upright.
+//
+// Message in:  { file, maxDimension, quality }
+// Message out: { file, latitude, longitude } - file is the original when it is small enough, is
+//              a GIF, or cannot be decoded here; latitude/longitude are null without GPS data.
+
+const EXIF_READ_BYTES = 128 * 1024;
+
+self.onmessage = async event => {
+    const { file, maxDimension, quality } = event.data;
+    let exif = null;
+    let gps = { latitude: null, longitude: null };
+    try {
+        const head = new DataView(await file.slice(0, EXIF_READ_BYTES).arrayBuffer());
+        exif = findExifSegment(head);
+        if (exif) gps = readGpsPosition(head, exif.tiffStart) || gps;
+    } catch (error) {
+        console.warn('photo-worker: could not read EXIF data:', error);
+        exif = null;
+    }
+
+    let output = file;
+    try {
+        output = await downscale(file, maxDimension, quality, exif ? uprightExifSegment(exif) : null);
+    } catch (error) {
+        console.warn('photo-worker: could not downscale, uploading the original:', error);
+    }
+    self.postMessage({ file: output, latitude: gps.latitude, longitude: gps.longitude });
+};
+
+// Returns the APP1 "Exif" segment of a JPEG as { view, start, length, tiffStart }, or null.
+function findExifSegment(view) {
+    if (view.byteLength < 4 || view.getUint16(0) !== 0xFFD8) return null;
+    let offset = 2;
+    while (offset + 4 <= view.byteLength) {
+        const marker = view.getUint16(offset);
+        if ((marker & 0xFF00) !== 0xFF00 || marker === 0xFFDA) return null; // Start of scan: no EXIF
+        const length = view.getUint16(offset + 2) + 2;
+        if (marker === 0xFFE1 && offset + 10 <= view.byteLength &&
+                view.getUint32(offset + 4) === 0x45786966 && view.getUint16(offset + 8) === 0) { // "Exif\0\0"
+            return offset + length <= view.byteLength
+                ? { view, start: offset, length, tiffStart: offset + 10 } : null;
+        }
+        offset += length;
+    }
+    return null;
+}
+
+// Returns [{ tag, type, count, entry }] of the IFD at tiffStart + ifdOffset.
+function readIfd(view, tiffStart, ifdOffset, littleEndian) {
+    const ifdStart = tiffStart + ifdOffset;
+    const count = view.getUint16(ifdStart, littleEndian);
+    const entries = [];
+    for (let index = 0; index < count; index++) {
+        const entry = ifdStart + 2 + index * 12;
+        entries.push({
+            tag: view.getUint16(entry, littleEndian),
+            type: view.getUint16(entry + 2, littleEndian),
+            count: view.getUint32(entry + 4, littleEndian),
+            entry
+        });
+    }
+    return entries;
+}
+
+function readGpsPosition(view, tiffStart) {
+    const littleEndian = view.getUint16(tiffStart) === 0x4949; // "II"
+    const ifd0 = readIfd(view, tiffStart, view.getUint32(tiffStart + 4, littleEndian), littleEndian);
+    const gpsPointer = ifd0.find(entry => entry.tag === 0x8825);
+    if (!gpsPointer) return null;
+    const gpsEntries = readIfd(view, tiffStart, view.getUint32(gpsPointer.entry + 8, littleEndian), littleEndian);
+    const byTag = tag => gpsEntries.find(entry => entry.tag === tag);
+
+    const coordinate = (refTag, valueTag, positiveRef, limit) => {
+        const ref = byTag(refTag);
+        const value = byTag(valueTag);
+        if (!ref || !value || value.count !== 3) return null;
+        const valueStart = tiffStart + view.getUint32(value.entry + 8, littleEndian);
+        const parts = [0, 1, 2].map(index => {
+            const numerator = view.getUint32(valueStart + index * 8, littleEndian);
+            const denominator = view.getUint32(valueStart + index * 8 + 4, littleEndian);
+            return denominator ? numerator / denominator : NaN;
+        });
+        const degrees = parts[0] + parts[1] / 60 + parts[2] / 3600;
+        const sign = String.fromCharCode(view.getUint8(ref.entry + 8)) === positiveRef ? 1 : -1;
+        return Number.isFinite(degrees) && degrees <= limit ? sign * degrees : null;
+    };
+
+    const latitude = coordinate(1, 2, 'N', 90);
+    const longitude = coordinate(3, 4, 'E', 180);
+    return latitude === null || longitude === null ? null : { latitude, longitude };
+}
+
+// A copy of the EXIF segment with the Orientation tag (0x0112) set to 1 (upright).
+function uprightExifSegment(exif) {
+    const { view, start, length, tiffStart } = exif;
+    const segment = new Uint8Array(view.buffer.slice(view.byteOffset + start, view.byteOffset + start + length));
+    const littleEndian = view.getUint16(tiffStart) === 0x4949;
+    const ifd0 = readIfd(view, tiffStart, view.getUint32(tiffStart + 4, littleEndian), littleEndian);
+    const orientation = ifd0.find(entry => entry.tag === 0x0112);
+    if (orientation) {
+        new DataView(segment.buffer).setUint16(orientation.entry - start + 8, 1, littleEndian);
+    }
+    return segment;
+}
+
+async function downscale(file, maxDimension, quality, exifSegment) {
+    if (file.type === 'image/gif' || typeof OffscreenCanvas === 'undefined' || typeof createImageBitmap === 'undefined') {
+        return file; // GIFs may be animated; old browsers upload the original
+    }
+    const bitmap = await createImageBitmap(file, { imageOrientation: 'from-image' });
+    const scale = Math.min(1, maxDimension / Math.max(bitmap.width, bitmap.height));
+    if (scale === 1) {
+        bitmap.close();
+        return file;
+    }
+    const width = Math.round(bitmap.width * scale);
+    const height = Math.round(bitmap.height * scale);
+    const canvas = new OffscreenCanvas(width, height);
+    const context = canvas.getContext('2d');
+    context.fillStyle = '#fff'; // JPEG has no transparency
+    context.fillRect(0, 0, width, height);
+    context.drawImage(bitmap, 0, 0, width, height);
+    bitmap.close();
+
+    let blob = await canvas.convertToBlob({ type: 'image/jpeg', quality });
+    if (exifSegment) {
+        blob = new Blob([blob.slice(0, 2), exifSegment, blob.slice(2)], { type: 'image/jpeg' }); // After SOI
+    }
+    if (blob.size >= file.size) return file;
+    const name = file.name.replace(/\.[^.]*$/, '') + '.jpg';
+    return new File([blob], name, { type: 'image/jpeg', lastModified: file.lastModified });
+}
@@ -0,0 +1,201 @@
+"""
+Garbage collector for Storage blobs that no content item references.
+
+Failed uploads, partial webhook runs and interrupted deletions can leave objects in the
+bucket that no contentItems.imageUrl points to. The collector first streams every
+imageUrl into a compact in-memory index, then lists the bucket page by page and deletes
+unreferenced blobs older than a grace period in parallel. The grace period also protects
+uploads that finish while the collector is running.
+
+Usage example:
+    python storage_gc.py --prefix user123/ --grace-hours 48 --dry-run
+"""
+
+import argparse
+import hashlib
+import logging
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from google.api_core.exceptions import NotFound
+
+import firestore_utils
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GRACE_PERIOD = timedelta(hours=24)
+DEFAULT_PAGE_SIZE = 1000
+DEFAULT_DELETE_WORKERS = 16
+# Above this many references a Bloom filter is used instead of the exact digest set.
+BLOOM_FILTER_THRESHOLD = 2_000_000
+# Objects under these prefixes are not content images; their owners prune them (map_snapshot).
+RESERVED_PREFIXES = ('map-snapshots/',)
+
+
+class CompactReferenceSet:
+    """
+    Exact membership set that stores 8-byte BLAKE2 digests instead of full paths.
+    A digest collision can only make the collector keep a blob, never delete one.
+    """
+
+    def __init__(self):
+        self._digests = set()
+
+    @staticmethod
+    def _digest(path):
+        return hashlib.blake2b(path.encode('utf-8'), digest_size=8).digest()
+
+    def add(self, path):
+        self._digests.add(self._digest(path))
+
+    def __contains__(self, path):
+        return self._digest(path) in self._digests
+
+    def __len__(self):
+        return len(self._digests)
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter for very large buckets. False positives only keep orphans
+    around until a later run; false negatives cannot happen.
+    """
+
+    def __init__(self, expected_items, false_positive_rate=0.001):
+        expected_items = max(1, expected_items)
+        self.num_bits = max(8, int(-expected_items * math.log(false_positive_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / expected_items * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self._count = 0
+
+    def _positions(self, path):
+        digest = hashlib.blake2b(path.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, path):
+        for position in self._positions(path):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self._count += 1
+
+    def __contains__(self, path):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(path))
+
+    def __len__(self):
+        return self._count
+
+
+def build_reference_index(db, app_logger, expected_items=None):
+    """
+    Streams imageUrl of every content item (and the image paths of pending deletion
+    tombstones) into a reference index. Only the imageUrl field is fetched.
+    """
+    if expected_items and expected_items > BLOOM_FILTER_THRESHOLD:
+        index = BloomFilter(expected_items)
+        app_logger.info(f"Using a Bloom filter ({index.num_bits} bits, {index.num_hashes} hashes) for references.")
+    else:
+        index = CompactReferenceSet()
+
+    for doc in db.collection('contentItems').select(['imageUrl']).stream():
+        image_path = firestore_utils.parse_storage_image_path(doc.to_dict().get('imageUrl'))
+        if image_path:
+            index.add(image_path)
+    # Blobs owned by a tombstone are deleted by deletion_worker; leave them to it.
+    for doc in db.collection(firestore_utils.DELETION_TOMBSTONE_COLLECTION).select(['imagePath']).stream():
+        image_path = doc.to_dict().get('imagePath')
+        if image_path:
+            index.add(image_path)
+
+    app_logger.info(f"Reference index built with {len(index)} image paths.")
+    return index
+
+
+def _delete_blob(blob, app_logger):
+    try:
+        blob.delete()
+        return True
+    except NotFound:
+        return True
+    except Exception as e:
+        app_logger.error(f"Error deleting orphaned blob {blob.name}: {e}", exc_info=True)
+        return False
+
+
+def collect_orphaned_blobs(db, bucket, app_logger, prefix=None, grace_period=DEFAULT_GRACE_PERIOD,
+                           dry_run=False, page_size=DEFAULT_PAGE_SIZE, workers=DEFAULT_DELETE_WORKERS,
+                           expected_items=None, now=None):
+    """
+    Deletes blobs under `prefix` that are not referenced by any content item and are
+    older than `grace_period`. With dry_run=True nothing is deleted.
+    Returns a dictionary of counters and throughput figures.
+    """
+    started = time.monotonic()
+    cutoff = (now or datetime.now(timezone.utc)) - grace_period
+    # The index is built before listing so that any blob created afterwards is
+    # younger than the cutoff and therefore protected.
+    references = build_reference_index(db, app_logger, expected_items=expected_items)
+    index_seconds = time.monotonic() - started
+
+    stats = {'scanned': 0, 'referenced': 0, 'too_recent': 0, 'orphaned': 0,
+             'deleted': 0, 'failed': 0, 'orphaned_bytes': 0, 'dry_run': dry_run}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for page in bucket.list_blobs(prefix=prefix, page_size=page_size).pages:
+            orphans = []
+            for blob in page:
+                stats['scanned'] += 1
+                if blob.name in references or blob.name.startswith(RESERVED_PREFIXES):
+                    stats['referenced'] += 1
+                elif blob.time_created and blob.time_created > cutoff:
+                    stats['too_recent'] += 1
+                else:
+                    orphans.append(blob)
+                    stats['orphaned'] += 1
+                    stats['orphaned_bytes'] += blob.size or 0
+
+            if dry_run:
+                for blob in orphans:
+                    app_logger.info(f"[dry-run] Would delete orphaned blob {blob.name} ({blob.size} bytes).")
+            elif orphans:
+                for deleted in executor.map(lambda b: _delete_blob(b, app_logger), orphans):
+                    stats['deleted' if deleted else 'failed'] += 1
+
+            elapsed = time.monotonic() - started
+            app_logger.info(f"Storage GC progress: scanned {stats['scanned']} blobs "
+                            f"({stats['scanned'] / elapsed:.0f}/s), orphaned {stats['orphaned']}, "
+                            f"deleted {stats['deleted']}.")
+
+    elapsed = time.monotonic() - started
+    stats['index_seconds'] = round(index_seconds, 3)
+    stats['elapsed_seconds'] = round(elapsed, 3)
+    stats['blobs_per_second'] = round(stats['scanned'] / elapsed, 1) if elapsed else None
+    stats['deletes_per_second'] = round(stats['deleted'] / (elapsed - index_seconds), 1) \
+        if stats['deleted'] and elapsed > index_seconds else 0
+    app_logger.info(f"Storage GC finished: {stats}")
+    return stats
+
+
+if __name__ == '__main__':
+    import firebase_clients
+
+    parser = argparse.ArgumentParser(description='Delete Storage blobs that no content item references.')
+    parser.add_argument('--prefix', default=None, help='Only scan blobs whose name starts with this prefix.')
+    parser.add_argument('--grace-hours', type=float, default=DEFAULT_GRACE_PERIOD.total_seconds() / 3600,
+                        help='Keep unreferenced blobs younger than this many hours.')
+    parser.add_argument('--dry-run', action='store_true', help='Report orphans without deleting them.')
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE)
+    parser.add_argument('--workers', type=int, default=DEFAULT_DELETE_WORKERS)
+    parser.add_argument('--expected-items', type=int, default=None,
+                        help=f'Approximate number of content items; above {BLOOM_FILTER_THRESHOLD} '
+                             f'a Bloom filter is used to bound memory.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+
+    collect_orphaned_blobs(
+        firestore_utils.get_db_client(), firebase_clients.get_bucket(), logger,
+        prefix=args.prefix, grace_period=timedelta(hours=args.grace_hours), dry_run=args.dry_run,
+        page_size=args.page_size, workers=args.workers, expected_items=args.expected_items
+    )
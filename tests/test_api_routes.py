@@ -229,6 +229,22 @@ class TestApiRoutes(unittest.TestCase):
         self.assertEqual(json_response['message'], 'An internal server error occurred')
         self.mock_get_content_item_util.assert_called_once_with(item_id_exception, mock.ANY)
 
+    @mock.patch('api_services.firestore_utils.get_content_items_by_ids')
+    def test_content_batch_endpoint(self, mock_get_items):
+        mock_get_items.return_value = [{'itemId': 'b', 'text': 'B'}, None]
+        response = self.client.get('/api/content/batch?ids=b,missing&fields=text')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {'status': 'success', 'items': [{'itemId': 'b', 'text': 'B'}, None],
+                                               'notFound': ['missing']})
+        mock_get_items.assert_called_once_with(['b', 'missing'], mock.ANY, fields=['text'])
+        self.mock_get_content_item_util.assert_not_called()
+
+        response = self.client.post('/api/content/batch', json={'ids': 'not-a-list'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/content/batch', json={'ids': ['x'] * 301})
+        self.assertEqual(response.status_code, 400)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -114,6 +114,29 @@ class TestApiServices(unittest.TestCase):
         # Assert that counter was not incremented
         self.mock_user_doc_ref.update.assert_not_called()
 
+    def test_create_new_content_uses_trusted_client_exif_coordinates(self):
+        self.mock_create_web_content_item.return_value = "test_content_id_789"
+        form_data = {'text': 'Test content', 'exifLatitude': '55.755', 'exifLongitude': '37.6175'}
+
+        untrusted = api_services.create_new_content_from_api(
+            form_data, {}, self.user_id, self.mock_app_logger,
+            self.mock_bucket_client, self.allowed_extensions, self.max_image_size
+        )
+        trusted = api_services.create_new_content_from_api(
+            form_data, {}, self.user_id, self.mock_app_logger,
+            self.mock_bucket_client, self.allowed_extensions, self.max_image_size, trust_client_exif=True
+        )
+        out_of_range = api_services.create_new_content_from_api(
+            dict(form_data, exifLatitude='95'), {}, self.user_id, self.mock_app_logger,
+            self.mock_bucket_client, self.allowed_extensions, self.max_image_size, trust_client_exif=True
+        )
+
+        self.assertEqual(untrusted['http_code'], 400)
+        self.assertEqual(trusted['http_code'], 201)
+        created_content_data = self.mock_create_web_content_item.call_args[0][0]
+        self.assertEqual((created_content_data['latitude'], created_content_data['longitude']), (55.755, 37.6175))
+        self.assertEqual(out_of_range['http_code'], 400)
+
 
 class TestUpdateContentItem(unittest.TestCase):
     def setUp(self):
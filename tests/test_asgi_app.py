@@ -0,0 +1,130 @@
+import asyncio
+import json
+import time
+import unittest
+from unittest import mock
+import os
+import sys
+
+# Add the parent directory to the Python path to allow module imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asgi_app
+import firebase_clients
+import firestore_async
+import firestore_utils
+import map_events
+from fake_backends import FakeAsyncFirestore, FakeBucket, FakeFirestore
+
+
+async def call(method, path, body=None, query=b'', headers=()):
+    """Sends one request to asgi_app.app and returns (status, decoded JSON body)."""
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query, 'headers': list(headers)}
+    messages = [{'type': 'http.request', 'body': json.dumps(body).encode() if body is not None else b''}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    await asgi_app.app(scope, receive, send)
+    return sent[0]['status'], json.loads(sent[1]['body'])
+
+
+class TestAsgiApp(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_logger = mock.MagicMock()
+        self.db = FakeFirestore()
+        firebase_clients.use_clients(db=self.db, bucket=FakeBucket(), async_db=FakeAsyncFirestore(self.db))
+        self.addCleanup(firebase_clients.use_clients)
+        self.item_id = firestore_utils.create_web_content_item(
+            {'userId': 'author', 'latitude': 1.0, 'longitude': 2.0, 'text': 'post', 'status': 'published'},
+            self.mock_logger)
+        self.db.reset_rpc_counts()
+
+    def test_get_content_matches_flask_route(self):
+        status, payload = asyncio.run(call('GET', f'/api/content/{self.item_id}'))
+        self.assertEqual((status, payload['status'], payload['content']['itemId']), (200, 'success', self.item_id))
+        self.assertEqual(self.db.rpc_counts['firestore.get'], 1)
+
+        self.assertEqual(asyncio.run(call('GET', '/api/content/missing')),
+                         (404, {'status': 'error', 'message': 'Content not found'}))
+        self.assertEqual(asyncio.run(call('DELETE', f'/api/content/{self.item_id}'))[0], 405)
+        self.assertEqual(asyncio.run(call('GET', '/admin/dashboard'))[0], 404)
+
+    def test_content_batch(self):
+        status, payload = asyncio.run(call('GET', '/api/content/batch', query=f'ids=missing,{self.item_id}&fields=text'.encode()))
+        self.assertEqual((status, payload), (200, {'status': 'success', 'notFound': ['missing'],
+                                                   'items': [None, {'itemId': self.item_id, 'text': 'post'}]}))
+        self.assertEqual(self.db.rpc_counts['firestore.get_all'], 1)
+        self.assertEqual(asyncio.run(call('POST', '/api/content/batch', {'ids': []}))[0], 400)
+
+    def test_vote_and_report(self):
+        vote = {'vote': 1, 'userId': 'voter'}
+        self.assertEqual(asyncio.run(call('POST', f'/api/content/{self.item_id}/vote', vote)),
+                         (200, {'status': 'success', 'message': 'Vote recorded', 'newVoteCount': 1}))
+        self.assertEqual(asyncio.run(call('POST', f'/api/content/{self.item_id}/vote', vote))[1]['status'], 'info')
+        self.assertEqual(asyncio.run(call('POST', f'/api/content/{self.item_id}/vote', {'vote': 5}))[0], 400)
+        self.assertEqual(firestore_utils.get_user_post_index('author', self.mock_logger)[self.item_id]['voteCount'], 1)
+
+        for reporter in ('r1', 'r2', 'r3'):
+            status, payload = asyncio.run(call('POST', f'/api/content/{self.item_id}/report', {'reason': 'spam'},
+                                               headers=[(b'x-user-id', reporter.encode())]))
+            self.assertEqual((status, payload['status']), (200, 'success'))
+        self.assertEqual(firestore_utils.get_content_item(self.item_id, self.mock_logger)['status'], 'for_moderation')
+        status, payload = asyncio.run(call('POST', f'/api/content/{self.item_id}/report', {'reason': 'spam', 'userId': 'r4'}))
+        self.assertEqual((status, payload['message']), (403, 'This content is already under moderation'))
+
+    def test_map_items(self):
+        status, payload = asyncio.run(call('GET', '/api/map/items'))
+        self.assertEqual([item['itemId'] for item in payload['items']], [self.item_id])
+        status, payload = asyncio.run(call('GET', '/api/map/items', query=b'userId=author'))
+        self.assertEqual([item['itemId'] for item in payload['items']], [self.item_id])
+        self.assertEqual(asyncio.run(call('GET', '/api/map/items', query=b'userId=nobody'))[1]['items'], [])
+
+    def test_map_events_stream(self):
+        self.addCleanup(setattr, map_events, '_hub', None)
+        map_events._hub = map_events.MapEventHub(heartbeat_seconds=0.05)
+        sent = []
+
+        async def stream():
+            disconnect = asyncio.Event()
+
+            async def receive():
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                sent.append(message)
+                if message.get('body') == map_events.OPENING_MESSAGE:
+                    await firestore_async.record_vote(self.item_id, 'voter', 1, self.mock_logger)
+                elif b'event: changes' in message.get('body', b''):
+                    disconnect.set()
+
+            await asyncio.wait_for(asgi_app.app({'type': 'http', 'method': 'GET', 'path': '/api/map/events',
+                                                 'query_string': b'', 'headers': []}, receive, send), 5)
+
+        asyncio.run(stream())
+        self.assertIn((b'content-type', b'text/event-stream'), sent[0]['headers'])
+        self.assertIn(b'"voteCount":1', sent[-1]['body'])
+        self.assertEqual((map_events._hub.subscriber_count(), self.db._watches), (0, []))
+
+    def test_reads_overlap_on_one_event_loop(self):
+        self.db.latency = 0.05
+
+        async def read_many():
+            return await asyncio.gather(*(firestore_async.get_content_item(self.item_id, self.mock_logger)
+                                          for _ in range(20)))
+
+        started = time.monotonic()
+        items = asyncio.run(read_many())
+        self.assertLess(time.monotonic() - started, 0.5)  # 20 sequential reads would take 1 s
+        self.assertTrue(all(item['itemId'] == self.item_id for item in items))
+        self.assertEqual(self.db.rpc_counts['firestore.get'], 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
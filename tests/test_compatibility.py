@@ -174,7 +174,7 @@ class TestConfigurationCompatibility:
 class TestDatabaseCompatibility:
     """Тесты совместимости с базой данных"""
     
-    @patch('app.firestore.client')
+    @patch('app.get_db')
     def test_existing_content_structure_preserved(self, mock_client):
         """Тест что структура существующего контента сохранена"""
         # Проверяем что новые поля не ломают старую структуру
@@ -198,7 +198,7 @@ class TestDatabaseCompatibility:
         for field in required_fields:
             assert field in old_content_structure
     
-    @patch('app.firestore.client')
+    @patch('app.get_db')
     def test_new_content_structure_works(self, mock_client):
         """Тест что новая структура контента работает"""
         # Проверяем новые поля
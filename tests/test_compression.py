@@ -0,0 +1,105 @@
+import unittest
+import gzip
+import json
+import os
+import sys
+import tempfile
+import zlib
+
+# Add the parent directory to the Python path to allow module imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask, Response, jsonify, render_template_string
+
+import assets
+import compression
+
+
+class TestCompression(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config.update(COMPRESSION_MIN_SIZE=100)
+        compression.init_app(self.app)
+
+        @self.app.route('/large')
+        def large():
+            return jsonify(items=[{'itemId': str(index), 'text': 'post'} for index in range(50)])
+
+        @self.app.route('/small')
+        def small():
+            return jsonify(ok=True)
+
+        @self.app.route('/stream')
+        def stream():
+            return Response((f'data: {index}\n\n' for index in range(3)), mimetype='text/event-stream')
+
+        self.client = self.app.test_client()
+
+    def test_large_response_is_gzipped_and_small_is_not(self):
+        response = self.client.get('/large', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(len(json.loads(gzip.decompress(response.data))['items']), 50)
+
+        self.assertNotIn('Content-Encoding', self.client.get('/small', headers={'Accept-Encoding': 'gzip'}).headers)
+        self.assertNotIn('Content-Encoding', self.client.get('/large').headers)
+
+    def test_streamed_chunks_are_flushed(self):
+        response = self.client.get('/stream', headers={'Accept-Encoding': 'gzip'}, buffered=False)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        chunks = list(response.response)
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        # The first chunk decodes on its own: it was sync-flushed
+        self.assertEqual(decompressor.decompress(chunks[0]), b'data: 0\n\n')
+        self.assertEqual(gzip.decompress(b''.join(chunks)), b'data: 0\n\ndata: 1\n\ndata: 2\n\n')
+
+
+class TestAssets(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.static_dir = self.tmp_dir.name
+        os.makedirs(os.path.join(self.static_dir, 'js'))
+        with open(os.path.join(self.static_dir, 'js', 'map.js'), 'w') as source_file:
+            source_file.write('console.log("map");\n' * 50)
+
+    def _app(self):
+        app = Flask(__name__, static_folder=self.static_dir, static_url_path='/static')
+        app.add_url_rule('/assets/<path:filename>', 'asset_file', assets.asset_response)
+        assets.init_app(app)
+        return app
+
+    def test_build_fingerprints_and_serves_precompressed(self):
+        manifest = assets.build_assets(self.static_dir)
+        hashed_path = manifest['js/map.js']
+        self.assertRegex(hashed_path, r'^js/map\.[0-9a-f]{10}\.js$')
+        app = self._app()
+
+        with app.test_request_context():
+            url = render_template_string("{{ asset_url('js/map.js') }}|{{ asset_url('css/none.css') }}")
+        self.assertEqual(url, f'/assets/{hashed_path}|/static/css/none.css')
+
+        client = app.test_client()
+        response = client.get(f'/assets/{hashed_path}', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertTrue(gzip.decompress(response.data).startswith(b'console.log'))
+        self.assertEqual(client.get('/assets/manifest.json').status_code, 404)
+        self.assertEqual(client.get('/assets/../js/map.js').status_code, 404)
+
+    def test_clean_removes_previous_builds(self):
+        first = assets.build_assets(self.static_dir)['js/map.js']
+        with open(os.path.join(self.static_dir, 'js', 'map.js'), 'a') as source_file:
+            source_file.write('// changed\n')
+        second = assets.build_assets(self.static_dir, clean=True)['js/map.js']
+
+        self.assertNotEqual(first, second)
+        dist_dir = os.path.join(self.static_dir, assets.DIST_DIRNAME)
+        self.assertFalse(os.path.exists(os.path.join(dist_dir, first)))
+        self.assertTrue(os.path.exists(os.path.join(dist_dir, second + '.gz')))
+
+
+if __name__ == '__main__':
+    unittest.main()
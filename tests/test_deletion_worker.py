@@ -0,0 +1,81 @@
+import unittest
+from unittest import mock
+import sys
+import os
+
+# Add the parent directory to the Python path to allow module imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import deletion_worker
+
+
+class TestDeletionWorker(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_logger = mock.MagicMock()
+        self.patch_get_db_client = mock.patch('firestore_utils.get_db_client')
+        self.mock_db = mock.MagicMock()
+        self.patch_get_db_client.start().return_value = self.mock_db
+        self.addCleanup(self.patch_get_db_client.stop)
+
+        self.patch_storage_bucket = mock.patch('firebase_clients.get_bucket')
+        self.mock_bucket = self.patch_storage_bucket.start().return_value
+        self.addCleanup(self.patch_storage_bucket.stop)
+
+        self.patch_release_quota = mock.patch('deletion_worker._release_photo_quota')
+        self.mock_release_quota = self.patch_release_quota.start()
+        self.addCleanup(self.patch_release_quota.stop)
+
+        self.tombstone_ref = self.mock_db.collection.return_value.document.return_value
+        self.tombstone = {
+            'contentId': 'c1', 'userId': 'u1', 'imagePath': 'u1/c1.jpg',
+            'storageDeleted': False, 'quotaReleased': False
+        }
+
+    def test_completed_tombstone_is_deleted(self):
+        result = deletion_worker.process_tombstone('c1', self.mock_logger, dict(self.tombstone))
+
+        self.assertEqual(result, {'status': 'done', 'imageDeleted': True})
+        self.mock_bucket.blob.assert_called_once_with('u1/c1.jpg')
+        self.mock_bucket.blob.return_value.exists.assert_not_called()
+        self.mock_release_quota.assert_called_once_with(self.mock_db, self.tombstone_ref, 'u1')
+        self.tombstone_ref.delete.assert_called_once()
+
+    def test_missing_blob_counts_as_deleted(self):
+        self.mock_bucket.blob.return_value.delete.side_effect = deletion_worker.NotFound('gone')
+
+        result = deletion_worker.process_tombstone('c1', self.mock_logger, dict(self.tombstone))
+
+        self.assertEqual(result['status'], 'done')
+        self.tombstone_ref.delete.assert_called_once()
+
+    def test_failed_quota_release_keeps_tombstone_pending(self):
+        self.mock_release_quota.side_effect = Exception('contention')
+
+        result = deletion_worker.process_tombstone('c1', self.mock_logger, dict(self.tombstone))
+
+        self.assertEqual(result['status'], 'pending')
+        self.tombstone_ref.delete.assert_not_called()
+        update = self.tombstone_ref.update.call_args[0][0]
+        self.assertTrue(update['storageDeleted'])  # Not retried on the next attempt
+        self.assertEqual(update['lastError'], 'contention')
+
+    def test_already_released_quota_is_not_touched_again(self):
+        tombstone = dict(self.tombstone, quotaReleased=True, storageDeleted=True)
+
+        result = deletion_worker.process_tombstone('c1', self.mock_logger, tombstone)
+
+        self.assertEqual(result['status'], 'done')
+        self.mock_release_quota.assert_not_called()
+        self.mock_bucket.blob.assert_not_called()
+
+    def test_missing_tombstone(self):
+        self.tombstone_ref.get.return_value.exists = False
+
+        result = deletion_worker.process_tombstone('c1', self.mock_logger)
+
+        self.assertEqual(result['status'], 'missing')
+
+
+if __name__ == '__main__':
+    unittest.main()
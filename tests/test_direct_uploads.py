@@ -0,0 +1,186 @@
+import io
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+import os
+import sys
+
+# Add the parent directory to the Python path to allow module imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from PIL import Image
+
+import direct_uploads
+import firebase_clients
+import firestore_utils
+import unit_of_work
+from fake_backends import FakeBucket, FakeFirestore
+
+MAX_SIZE = 64 * 1024
+
+
+def jpeg_with_gps():
+    exif = Image.Exif()
+    exif.get_ifd(0x8825).update({1: 'N', 2: (55.0, 45.0, 18.0), 3: 'E', 4: (37.0, 37.0, 3.0)})
+    image_file = io.BytesIO()
+    Image.new('RGB', (8, 8)).save(image_file, format='JPEG', exif=exif)
+    return image_file.getvalue()
+
+
+class TestDirectUploads(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_logger = mock.MagicMock()
+        self.db = FakeFirestore()
+        self.bucket = FakeBucket()
+        firebase_clients.use_clients(db=self.db, bucket=self.bucket)
+        self.addCleanup(firebase_clients.use_clients)
+        self.db.put_document('users', 'u1', {'photo_upload_count_current_month': 0})
+        self.photo = jpeg_with_gps()
+
+    def photo_count(self):
+        return self.db.collection('users').document('u1').get().to_dict()['photo_upload_count_current_month']
+
+    def reserve(self, filename='photo.jpg', size=None, limit=5):
+        return direct_uploads.reserve_upload('u1', filename, size or len(self.photo), self.mock_logger, self.bucket,
+                                             {'jpg', 'jpeg', 'png', 'gif'}, MAX_SIZE, limit)
+
+    def upload(self, reservation, data=None, content_type=None):
+        headers = dict(reservation['uploadHeaders'])
+        if content_type:
+            headers['Content-Type'] = content_type
+        return self.bucket.put_signed_url(reservation['uploadUrl'], self.photo if data is None else data, headers)
+
+    def finalize(self, reservation, form_data=None, user_id='u1'):
+        return direct_uploads.finalize_upload(reservation['uploadId'], user_id, form_data or {},
+                                              self.mock_logger, self.bucket)
+
+    def test_reserve_upload_finalize(self):
+        reservation = self.reserve()
+        self.assertEqual((reservation['status'], reservation['http_code']), ('success', 201))
+        self.assertTrue(reservation['objectName'].startswith('u1/'))
+        self.assertEqual(self.photo_count(), 1)  # Reserved before the upload
+
+        self.assertEqual(self.finalize(reservation)['http_code'], 409)  # Not uploaded yet
+        self.assertEqual(self.upload(reservation), 200)
+        self.bucket.reset_rpc_counts()
+        result = self.finalize(reservation, {'text': 'hello'})
+
+        self.assertEqual((result['status'], result['http_code']), ('success', 201))
+        item = firestore_utils.get_content_item(result['contentId'], self.mock_logger)
+        self.assertEqual((item['latitude'], item['longitude'], item['text']), (55.755, 37.6175, 'hello'))
+        self.assertTrue(item['imageUrl'].endswith(reservation['objectName']))
+        self.assertEqual(self.bucket.rpc_counts.get('storage.download'), 1)  # One ranged read
+        self.assertEqual(self.photo_count(), 1)
+        self.assertEqual(self.finalize(reservation)['http_code'], 404)  # The reservation is used up
+
+    def test_client_coordinates_win_over_exif(self):
+        reservation = self.reserve()
+        self.upload(reservation)
+        result = self.finalize(reservation, {'latitude': '1.5', 'longitude': 2})
+        item = firestore_utils.get_content_item(result['contentId'], self.mock_logger)
+        self.assertEqual((item['latitude'], item['longitude']), (1.5, 2.0))
+
+    def test_trusted_client_exif_coordinates(self):
+        reservation = self.reserve()
+        self.upload(reservation)
+        with mock.patch('image_utils.extract_gps_coordinates') as mock_extract:
+            result = direct_uploads.finalize_upload(reservation['uploadId'], 'u1',
+                                                    {'exifLatitude': 10.5, 'exifLongitude': -20.25},
+                                                    self.mock_logger, self.bucket, trust_client_exif=True)
+        mock_extract.assert_not_called()
+        item = firestore_utils.get_content_item(result['contentId'], self.mock_logger)
+        self.assertEqual((item['latitude'], item['longitude']), (10.5, -20.25))
+
+    def test_reservation_checks(self):
+        self.assertEqual(self.reserve(filename='notes.txt')['http_code'], 400)
+        self.assertEqual(self.reserve(size=MAX_SIZE + 1)['http_code'], 400)
+        self.assertEqual(self.reserve(limit=1)['http_code'], 201)
+        self.assertEqual(self.reserve(limit=1)['http_code'], 403)
+        self.assertEqual(self.photo_count(), 1)
+
+    def test_storage_enforces_the_signed_headers(self):
+        reservation = self.reserve()
+        self.assertEqual(self.upload(reservation, content_type='image/png'), 403)
+        self.assertEqual(self.upload(reservation, data=b'x' * (MAX_SIZE + 1)), 400)
+        self.assertEqual(self.bucket.object_names(), [])
+        self.assertEqual(self.upload(reservation), 200)
+        self.assertEqual(self.upload(reservation, data=b'<html>not a photo</html>'), 412)  # Created only once
+        self.assertEqual(self.bucket.get_blob(reservation['objectName']).size, len(self.photo))
+
+    def test_invalid_object_is_deleted_and_quota_returned(self):
+        reservation = self.reserve()
+        self.upload(reservation, data=b'<html>not a photo</html>')
+
+        result = self.finalize(reservation)
+
+        self.assertEqual(result['http_code'], 400)
+        self.assertEqual((self.bucket.object_names(), self.photo_count()), ([], 0))
+        self.assertEqual(self.finalize(reservation)['http_code'], 404)
+
+    def test_finalize_by_another_user(self):
+        reservation = self.reserve()
+        self.upload(reservation)
+        self.assertEqual(self.finalize(reservation, user_id='u2')['http_code'], 403)
+        self.assertEqual(self.finalize(reservation)['http_code'], 201)
+
+    def test_expired_reservations_are_released(self):
+        reservation = self.reserve()
+        self.upload(reservation)
+        self.reserve()
+        self.db.collection(direct_uploads.UPLOAD_RESERVATION_COLLECTION).document(reservation['uploadId']).update(
+            {'expiresAt': datetime.now(timezone.utc) - timedelta(minutes=1)})
+
+        self.assertEqual(self.finalize(reservation)['http_code'], 410)
+        self.assertEqual(direct_uploads.release_expired_reservations(self.mock_logger, bucket=self.bucket), 1)
+        self.assertEqual((self.bucket.object_names(), self.photo_count()), ([], 1))
+
+    def test_sweep_leaves_a_reservation_being_finalized(self):
+        reservation = self.reserve()
+        self.upload(reservation)
+        reservation_ref = self.db.collection(direct_uploads.UPLOAD_RESERVATION_COLLECTION).document(
+            reservation['uploadId'])
+        direct_uploads._claim_reservation(self.db, reservation_ref, 'u1')
+        reservation_ref.update({'expiresAt': datetime.now(timezone.utc) - timedelta(minutes=1)})
+
+        self.assertEqual(direct_uploads.release_expired_reservations(self.mock_logger, bucket=self.bucket), 0)
+        self.assertEqual((self.bucket.object_names(), self.photo_count()), ([reservation['objectName']], 1))
+
+    def test_abandoned_claim_is_released(self):
+        reservation = self.reserve()
+        self.upload(reservation)
+        reservation_ref = self.db.collection(direct_uploads.UPLOAD_RESERVATION_COLLECTION).document(
+            reservation['uploadId'])
+        with mock.patch('direct_uploads.datetime') as mock_datetime:
+            # Claimed by a finalize call whose process died before it finished
+            mock_datetime.now.return_value = datetime.now(timezone.utc) - direct_uploads.FINALIZE_CLAIM_TIMEOUT * 2
+            claimed, _ = direct_uploads._claim_reservation(self.db, reservation_ref, 'u1')
+        for _ in range(3):  # Rows the sweep leaves alone do not take its places
+            self.reserve()
+
+        self.assertEqual(direct_uploads.release_expired_reservations(self.mock_logger, limit=1, bucket=self.bucket), 1)
+        self.assertEqual((self.bucket.object_names(), self.photo_count()), ([], 3))
+
+        # A late commit of the dead call finds its claim gone
+        with unit_of_work.collect(self.db) as writes:
+            writes.set(self.db.collection('contentItems').document('late'), {'status': 'published'})
+        self.assertFalse(direct_uploads._commit_finalized(self.db, reservation_ref, claimed, writes))
+        self.assertFalse(self.db.collection('contentItems').document('late').get().exists)
+
+    def test_routes(self):
+        import app as app_module
+
+        client = app_module.create_app({'TESTING': True, 'MAX_IMAGE_SIZE': MAX_SIZE}).test_client()
+        response = client.post('/api/uploads', json={'filename': 'photo.jpg', 'size': len(self.photo)},
+                               headers={'X-User-ID': 'u1'})
+        self.assertEqual(response.status_code, 201)
+        reservation = response.get_json()
+        self.assertEqual(reservation['uploadHeaders']['x-goog-content-length-range'], f'0,{MAX_SIZE}')
+        self.upload(reservation)
+
+        response = client.post(f"/api/uploads/{reservation['uploadId']}/finalize", json={'userId': 'u1'})
+        self.assertEqual((response.status_code, response.get_json()['status']), (201, 'success'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import unittest
+import os
+import sys
+
+# Add the parent directory to the Python path to allow module imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from firebase_admin import firestore
+from google.api_core.exceptions import InvalidArgument, NotFound
+
+from fake_backends import FakeFirestore, MAX_BATCH_WRITES
+
+
+class TestFakeFirestore(unittest.TestCase):
+
+    def setUp(self):
+        self.db = FakeFirestore()
+        for index, status in enumerate(['published', 'published', 'for_moderation', 'published']):
+            self.db.put_document('contentItems', f'item-{index}', {
+                'status': status, 'voteCount': index, 'tags': ['a'],
+            })
+
+    def test_query_filters_orders_and_limits(self):
+        query = (self.db.collection('contentItems').where('status', '==', 'published')
+                 .order_by('voteCount', direction=firestore.Query.DESCENDING).limit(2))
+        self.assertEqual([doc.id for doc in query.stream()], ['item-3', 'item-1'])
+        self.assertEqual(self.db.rpc_counts['firestore.query'], 1)
+        self.assertEqual(self.db.rpc_counts['firestore.documents_read'], 2)
+
+    def test_update_applies_transforms(self):
+        ref = self.db.collection('contentItems').document('item-0')
+        ref.update({
+            'voteCount': firestore.Increment(5),
+            'tags': firestore.ArrayUnion(['b']),
+            'status': firestore.DELETE_FIELD,
+            'updatedAt': firestore.SERVER_TIMESTAMP,
+        })
+        data = ref.get().to_dict()
+        self.assertEqual(data['voteCount'], 5)
+        self.assertEqual(data['tags'], ['a', 'b'])
+        self.assertNotIn('status', data)
+        self.assertIsNotNone(data['updatedAt'].tzinfo)
+
+    def test_batch_is_atomic_and_limited(self):
+        batch = self.db.batch()
+        batch.set(self.db.collection('contentItems').document('new'), {'status': 'published'})
+        batch.update(self.db.collection('contentItems').document('missing'), {'status': 'x'})
+        with self.assertRaises(NotFound):
+            batch.commit()
+        self.assertFalse(self.db.collection('contentItems').document('new').get().exists)
+
+        batch = self.db.batch()
+        for index in range(MAX_BATCH_WRITES + 1):
+            batch.set(self.db.collection('other').document(str(index)), {})
+        with self.assertRaises(InvalidArgument):
+            batch.commit()
+
+    def test_transactional_function_commits(self):
+        ref = self.db.collection('contentItems').document('item-1')
+
+        @firestore.transactional
+        def bump(transaction):
+            snapshot = ref.get(transaction=transaction)
+            transaction.update(ref, {'voteCount': snapshot.get('voteCount') + 10})
+
+        bump(self.db.transaction())
+        self.assertEqual(ref.get().get('voteCount'), 11)
+        self.assertEqual(self.db.rpc_counts['firestore.commit'], 1)
+
+    def test_get_all_returns_missing_documents(self):
+        refs = [self.db.collection('contentItems').document(name) for name in ('item-0', 'nope')]
+        snapshots = {snapshot.id: snapshot.exists for snapshot in self.db.get_all(refs)}
+        self.assertEqual(snapshots, {'item-0': True, 'nope': False})
+        self.assertEqual(self.db.rpc_counts['firestore.get_all'], 1)
+
+
+class TestFlowBenchmark(unittest.TestCase):
+
+    def test_flows_run_without_errors(self):
+        from benchmarks import run_flows
+
+        results = run_flows.run_benchmark(items=40, users=5, iterations=2, flows=['home', 'vote', 'report'])
+        self.assertEqual(set(results), {'home', 'vote', 'report'})
+        for result in results.values():
+            self.assertEqual(result['errors'], 0)
+            self.assertGreater(result['rpcs_per_op'], 0)
+        self.assertEqual(run_flows.check_budget(results, run_flows.budget_from_results(results)), [])
+
+
+class TestWebhookLoad(unittest.TestCase):
+
+    def test_generated_jpeg_carries_gps_exif(self):
+        from benchmarks import webhook_load
+        import image_utils
+
+        jpeg = webhook_load.make_gps_jpeg(30 * 1024, 48.8566, -2.3522)
+        self.assertGreater(len(jpeg), 20 * 1024)
+        lat, lng = image_utils.extract_gps_coordinates(jpeg)
+        self.assertAlmostEqual(lat, 48.8566, places=3)
+        self.assertAlmostEqual(lng, -2.3522, places=3)
+
+    def test_load_run_reports_outcomes(self):
+        from benchmarks import webhook_load
+
+        result = webhook_load.run_load(requests=6, rps=0, concurrency=2, attachments=2, attachment_kb=8,
+                                       gps_ratio=1.0, senders=3, image_pool_size=2)
+        self.assertEqual(result['succeeded'], 6)
+        self.assertEqual(result['content_items_created'], 12)
+        self.assertEqual(result['emails_sent'], 12)
+        self.assertEqual(result['errors'], {})
+        self.assertGreater(result['latency_ms']['p99'], 0)
+
+
+class TestMapEncodingBenchmark(unittest.TestCase):
+
+    def test_columns_are_smaller_than_tojson(self):
+        from benchmarks import map_encoding
+
+        results = map_encoding.compare_encodings(500, repeat=1)
+        self.assertEqual(set(results), {'tojson', 'json', 'columns'})
+        self.assertLess(results['columns']['gzip_bytes'], results['json']['gzip_bytes'])
+        self.assertLess(results['json']['raw_bytes'], results['tojson']['raw_bytes'])
+
+
+if __name__ == '__main__':
+    unittest.main()
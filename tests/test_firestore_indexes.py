@@ -0,0 +1,49 @@
+import unittest
+import os
+import sys
+
+# Add the parent directory to the Python path to allow module imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import firestore_indexes
+from firestore_indexes import ASCENDING, DESCENDING, QueryShape
+
+
+class TestFirestoreIndexes(unittest.TestCase):
+
+    def test_manifest_on_disk_matches_registry(self):
+        manifest = firestore_indexes.load_manifest()
+        self.assertEqual(manifest, firestore_indexes.build_manifest())
+        self.assertEqual(firestore_indexes.check_manifest(manifest), [])
+
+    def test_firestore_utils_queries_are_registered_and_indexed(self):
+        executed = firestore_indexes.capture_firestore_utils_queries()
+        self.assertTrue(executed)
+        self.assertEqual(firestore_indexes.check_queries(firestore_indexes.load_manifest(), executed), [])
+
+    def test_required_index_rules(self):
+        equality_only = QueryShape('eq', 'c', filters=[('a', '=='), ('b', '==')])
+        self.assertIsNone(firestore_indexes.required_index(equality_only))
+        ordered = QueryShape('ordered', 'c', filters=[('b', '=='), ('a', '==')],
+                             order_by=[('x', DESCENDING)])
+        self.assertEqual(firestore_indexes.required_index(ordered),
+                         (('b', ASCENDING), ('a', ASCENDING), ('x', DESCENDING)))
+        # Equality fields may appear in any order in the serving index.
+        manifest = {'indexes': [{'collectionGroup': 'c', 'queryScope': 'COLLECTION', 'fields': [
+            {'fieldPath': 'a', 'order': ASCENDING}, {'fieldPath': 'b', 'order': ASCENDING},
+            {'fieldPath': 'x', 'order': DESCENDING}]}]}
+        self.assertIsNotNone(firestore_indexes.find_serving_index(ordered, manifest))
+        bad_range = QueryShape('bad', 'c', filters=[('a', '>')], order_by=[('x', ASCENDING)])
+        with self.assertRaises(firestore_indexes.InvalidQueryShape):
+            firestore_indexes.required_index(bad_range)
+
+    def test_missing_index_and_unregistered_query_are_reported(self):
+        manifest = {'indexes': [], 'fieldOverrides': []}
+        problems = firestore_indexes.check_manifest(manifest)
+        self.assertTrue(any('map_published' in problem for problem in problems))
+        unregistered = [('contentItems', (('status', '=='),), (('createdAt', DESCENDING),))]
+        self.assertEqual(len(firestore_indexes.check_queries(manifest, unregistered)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -15,6 +15,7 @@ import firebase_admin # Still needed for firestore.SERVER_TIMESTAMP etc.
 # from google.auth import credentials as google_auth_credentials # No longer needed here
 
 import firestore_utils
+from google.api_core.exceptions import NotFound
 
 class TestFirestoreUtils(unittest.TestCase):
 
@@ -56,5 +57,193 @@ class TestFirestoreUtils(unittest.TestCase):
         self.assertEqual(called_user_data['current_period_end'], expected_period_end)
         self.assertEqual(called_user_data['subscription_plan'], 'free')
 
+
+def _mock_snapshot(doc_id, data):
+    snapshot = mock.MagicMock()
+    snapshot.id = doc_id
+    snapshot.exists = True
+    snapshot.to_dict.return_value = data
+    snapshot.reference = mock.MagicMock(name=f"ref_{doc_id}")
+    return snapshot
+
+
+class TestBulkModeration(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_logger = mock.MagicMock()
+        self.patch_get_db_client = mock.patch('firestore_utils.get_db_client')
+        self.mock_db = mock.MagicMock()
+        self.patch_get_db_client.start().return_value = self.mock_db
+        self.addCleanup(self.patch_get_db_client.stop)
+
+        self.patch_storage_bucket = mock.patch('firebase_clients.get_bucket')
+        self.mock_bucket = self.patch_storage_bucket.start().return_value
+        self.addCleanup(self.patch_storage_bucket.stop)
+
+    def test_parse_storage_image_path_supports_both_url_styles(self):
+        self.assertEqual(
+            firestore_utils.parse_storage_image_path(
+                'https://firebasestorage.googleapis.com/v0/b/bucket/o/user%2Fa.jpg?alt=media'),
+            'user/a.jpg')
+        self.assertEqual(
+            firestore_utils.parse_storage_image_path('https://storage.googleapis.com/bucket/user/b.png'),
+            'user/b.png')
+        self.assertIsNone(firestore_utils.parse_storage_image_path('https://example.com/c.jpg'))
+
+    def test_bulk_update_status_reports_missing_items_and_chunks_writes(self):
+        ids = [f"item{i}" for i in range(firestore_utils.BULK_WRITE_CHUNK_SIZE + 5)]
+        snapshots = [_mock_snapshot(cid, {'status': 'for_moderation'}) for cid in ids]
+        self.mock_db.get_all.side_effect = lambda refs, **kwargs: [s for s in snapshots if s.id in {r.id for r in refs}]
+        self.mock_db.collection.return_value.document.side_effect = lambda doc_id: mock.MagicMock(id=doc_id)
+
+        result = firestore_utils.bulk_update_content_status(ids + ['missing', 'item0'], 'published',
+                                                            'admin1', self.mock_logger)
+
+        self.assertEqual(result['status'], 'partial_success')
+        self.assertEqual(result['succeeded'], len(ids))
+        self.assertEqual(result['failed'], 1)
+        self.assertEqual(len(result['results']), len(ids) + 1)  # Duplicate 'item0' is dropped
+        self.assertEqual(result['results'][-1], {'contentId': 'missing', 'status': 'error',
+                                                 'message': 'Content not found', 'code': 404})
+        self.assertEqual(self.mock_db.batch.return_value.commit.call_count, 2)
+
+    def test_bulk_delete_aggregates_photo_counts_per_author(self):
+        items = {
+            'a': {'userId': 'u1', 'imageUrl': 'https://storage.googleapis.com/bucket/u1/a.jpg'},
+            'b': {'userId': 'u1', 'imageUrl': 'https://storage.googleapis.com/bucket/u1/b.jpg'},
+            'c': {'userId': 'u2', 'imageUrl': None},
+        }
+        content_snapshots = {cid: _mock_snapshot(cid, data) for cid, data in items.items()}
+        user_snapshot = _mock_snapshot('u1', {'photo_upload_count_current_month': 1})
+
+        def get_all(refs, **kwargs):
+            return [content_snapshots.get(r.id) or user_snapshot for r in refs
+                    if r.id in content_snapshots or r.id == 'u1']
+        self.mock_db.get_all.side_effect = get_all
+        self.mock_db.collection.return_value.document.side_effect = lambda doc_id: mock.MagicMock(id=doc_id)
+
+        result = firestore_utils.bulk_delete_content_items(['a', 'b', 'c'], self.mock_logger)
+
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual([r['imageDeleted'] for r in result['results']], [True, True, False])
+        self.assertEqual(self.mock_bucket.blob.call_count, 2)
+        # Two photos deleted for u1 but the counter is only 1, so it must not go negative.
+        self.mock_db.batch.return_value.update.assert_any_call(
+            user_snapshot.reference,
+            {'photo_upload_count_current_month': firestore_utils.firestore.Increment(-1)}
+        )
+
+    @mock.patch('deletion_worker.schedule_deletion')
+    def test_delete_content_item_writes_tombstone_and_schedules_cleanup(self, mock_schedule):
+        content_doc = _mock_snapshot('a', {'userId': 'u1',
+                                           'imageUrl': 'https://storage.googleapis.com/bucket/u1/a.jpg'})
+        self.mock_db.collection.return_value.document.return_value.get.return_value = content_doc
+
+        result = firestore_utils.delete_content_item('a', 'u1', self.mock_logger)
+
+        self.assertEqual(result['code'], 200)
+        batch = self.mock_db.batch.return_value
+        batch.delete.assert_called_once()
+        tombstone = batch.set.call_args[0][1]
+        self.assertEqual(tombstone['imagePath'], 'u1/a.jpg')
+        self.assertFalse(tombstone['quotaReleased'])
+        batch.commit.assert_called_once()
+        mock_schedule.assert_called_once_with('a', self.mock_logger)
+        self.mock_bucket.blob.assert_not_called()  # Storage cleanup is left to the worker
+
+    def test_delete_content_item_rejects_other_users(self):
+        content_doc = _mock_snapshot('a', {'userId': 'owner', 'imageUrl': None})
+        self.mock_db.collection.return_value.document.return_value.get.return_value = content_doc
+
+        result = firestore_utils.delete_content_item('a', 'intruder', self.mock_logger)
+
+        self.assertEqual(result['code'], 403)
+        self.mock_db.batch.assert_not_called()
+
+    def test_bulk_delete_treats_missing_blob_as_deleted(self):
+        snapshot = _mock_snapshot('a', {'userId': None,
+                                        'imageUrl': 'https://storage.googleapis.com/bucket/x/a.jpg'})
+        self.mock_db.get_all.side_effect = lambda refs, **kwargs: [snapshot] if any(r.id == 'a' for r in refs) else []
+        self.mock_db.collection.return_value.document.side_effect = lambda doc_id: mock.MagicMock(id=doc_id)
+        self.mock_bucket.blob.return_value.delete.side_effect = NotFound('gone')
+
+        result = firestore_utils.bulk_delete_content_items(['a'], self.mock_logger)
+
+        self.assertTrue(result['results'][0]['imageDeleted'])
+
+    def test_bulk_moderation_rejects_ids_that_are_not_strings(self):
+        import admin_services
+
+        for content_ids in (['a', {'id': 'b'}], [['a']], ['a', '']):
+            result = admin_services.bulk_moderate_content('approve', content_ids, 'admin', self.mock_logger)
+            self.assertEqual(result['code'], 400, content_ids)
+        self.mock_db.get_all.assert_not_called()
+
+
+
+class TestUserPostIndex(unittest.TestCase):
+
+    def setUp(self):
+        import firebase_clients
+        from fake_backends import FakeBucket, FakeFirestore
+
+        self.mock_logger = mock.MagicMock()
+        self.db = FakeFirestore()
+        firebase_clients.use_clients(db=self.db, bucket=FakeBucket())
+        self.addCleanup(firebase_clients.use_clients)
+        self.patch_schedule = mock.patch('deletion_worker.schedule_deletion')
+        self.patch_schedule.start()
+        self.addCleanup(self.patch_schedule.stop)
+
+    def _create(self, user_id, **fields):
+        data = dict({'userId': user_id, 'latitude': 1.0, 'longitude': 2.0, 'text': 'post'}, **fields)
+        return firestore_utils.create_web_content_item(data, self.mock_logger)
+
+    def test_filtered_map_reads_one_index_document(self):
+        first = self._create('u1')
+        second = self._create('u1')
+        self._create('u2')
+        firestore_utils.record_vote(first, 'voter', 1, self.mock_logger)
+        firestore_utils.get_published_items_for_map(self.mock_logger, user_id='u1')  # Builds the index
+        self.db.reset_rpc_counts()
+
+        items = firestore_utils.get_published_items_for_map(self.mock_logger, user_id='u1')
+
+        self.assertEqual([item['itemId'] for item in items], [second, first])  # voteCount ascending
+        self.assertEqual(items[1]['voteCount'], 1)
+        self.assertEqual(self.db.rpc_counts, {'firestore.get': 1, 'firestore.documents_read': 1})
+
+    def test_index_follows_status_changes_deletes_and_migration(self):
+        kept = self._create('old')
+        rejected = self._create('old')
+        deleted = self._create('old')
+        firestore_utils.get_user_post_index('old', self.mock_logger)
+
+        firestore_utils.update_content_status(rejected, 'rejected', 'admin', self.mock_logger)
+        firestore_utils.delete_content_item(deleted, 'old', self.mock_logger)
+        self.assertEqual(firestore_utils.get_user_post_index('old', self.mock_logger)[rejected]['status'], 'rejected')
+        self.assertNotIn(deleted, firestore_utils.get_user_post_index('old', self.mock_logger))
+
+        self.assertTrue(firestore_utils.migrate_content_ownership('old', 'new', self.mock_logger))
+
+        self.assertEqual(firestore_utils.get_user_post_index('old', self.mock_logger), {})
+        self.assertEqual(set(firestore_utils.get_user_post_index('new', self.mock_logger)), {kept, rejected})
+        self.assertEqual(firestore_utils.get_content_item(kept, self.mock_logger)['userId'], 'new')
+        self.assertEqual([item['itemId'] for item in
+                          firestore_utils.get_published_items_for_map(self.mock_logger, user_id='new')], [kept])
+
+    def test_rebuild_runs_in_a_transaction_on_the_index_document(self):
+        first = self._create('u1')
+        self.db.collection(firestore_utils.POST_INDEX_COLLECTION).document('u1').delete()
+        self.db.reset_rpc_counts()
+
+        entries = firestore_utils.rebuild_user_post_index('u1', self.mock_logger)
+
+        self.assertEqual(set(entries), {first})
+        self.assertEqual(self.db.rpc_counts['firestore.begin_transaction'], 1)
+        index = self.db.collection(firestore_utils.POST_INDEX_COLLECTION).document('u1').get().to_dict()
+        self.assertEqual((set(index['posts']), index['complete']), ({first}, True))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+from unittest import mock
+import os
+import sys
+
+# Add the parent directory to the Python path to allow module imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask, g
+
+import admin_services
+import api_services
+import firebase_clients
+import firestore_utils
+import identity_map
+from fake_backends import FakeBucket, FakeFirestore
+
+
+class TestIdentityMap(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_logger = mock.MagicMock()
+        self.db = FakeFirestore()
+        firebase_clients.use_clients(db=self.db, bucket=FakeBucket())
+        self.addCleanup(firebase_clients.use_clients)
+        patcher = mock.patch('deletion_worker.schedule_deletion')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.item_id = firestore_utils.create_web_content_item(
+            {'userId': 'author', 'latitude': 1.0, 'longitude': 2.0, 'text': 'post', 'status': 'published'},
+            self.mock_logger)
+        self.db.reset_rpc_counts()
+
+    def test_report_reads_item_once(self):
+        with identity_map.scope() as request_map:
+            result = api_services.process_content_report(self.item_id, 'reporter', 'spam', self.mock_logger)
+
+        self.assertEqual(result['http_code'], 200)
+        self.assertEqual(self.db.rpc_counts['firestore.get'], 1)
+        self.assertEqual((request_map.reads, request_map.reads_saved), (1, 1))
+        # The write dropped the cached copy
+        self.assertNotIn(('contentItems', self.item_id), request_map)
+
+    def test_admin_delete_reads_item_once(self):
+        with identity_map.scope() as request_map:
+            result = admin_services.delete_content_admin(self.item_id, 'admin', self.mock_logger)
+
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual(self.db.rpc_counts['firestore.get'], 1)
+        self.assertEqual(request_map.reads_saved, 1)
+        self.assertIsNone(firestore_utils.get_content_item(self.item_id, self.mock_logger))
+
+    def test_user_by_email_then_uid_and_copies(self):
+        firestore_utils.create_user('uid-1', 'a@example.com', 'A', 'email', self.mock_logger)
+        self.db.reset_rpc_counts()
+        with identity_map.scope():
+            by_email = firestore_utils.get_user_by_email('a@example.com', self.mock_logger)
+            by_email['displayName'] = 'changed by caller'
+            by_uid = firestore_utils.get_user('uid-1', self.mock_logger)
+
+        self.assertEqual(by_uid['displayName'], 'A')
+        self.assertEqual(self.db.rpc_counts, {'firestore.query': 1, 'firestore.documents_read': 1})
+
+    def test_batch_get_keeps_order_and_shares_the_map(self):
+        other_id = firestore_utils.create_web_content_item(
+            {'userId': 'author', 'latitude': 3.0, 'longitude': 4.0, 'text': 'other', 'status': 'published'},
+            self.mock_logger)
+        self.db.reset_rpc_counts()
+        with identity_map.scope() as request_map:
+            firestore_utils.get_content_item(self.item_id, self.mock_logger)
+            items = firestore_utils.get_content_items_by_ids(
+                [other_id, 'missing', self.item_id, other_id], self.mock_logger)
+            again = firestore_utils.get_content_item(other_id, self.mock_logger)
+
+        self.assertEqual([item and item['itemId'] for item in items], [other_id, None, self.item_id, other_id])
+        self.assertEqual(again['text'], 'other')
+        self.assertEqual(self.db.rpc_counts['firestore.get'], 1)
+        self.assertEqual(self.db.rpc_counts['firestore.get_all'], 1)
+        self.assertEqual(request_map.reads_saved, 2)
+
+    def test_batch_get_field_mask(self):
+        with identity_map.scope() as request_map:
+            firestore_utils.get_content_item(self.item_id, self.mock_logger)
+            cached, = firestore_utils.get_content_items_by_ids([self.item_id], self.mock_logger,
+                                                               fields=['latitude', 'longitude'])
+            fetched = firestore_utils.get_content_items_by_ids(['missing', self.item_id], self.mock_logger,
+                                                               fields=['text'])
+        self.assertEqual(cached, {'itemId': self.item_id, 'latitude': 1.0, 'longitude': 2.0})
+        self.assertEqual(fetched, [None, {'itemId': self.item_id, 'text': 'post'}])
+        self.assertEqual(self.db.rpc_counts['firestore.get_all'], 1)  # Only for 'missing'
+        self.assertNotIn(('contentItems', 'missing'), request_map)
+
+    def test_without_scope_every_read_goes_to_firestore(self):
+        firestore_utils.get_content_item(self.item_id, self.mock_logger)
+        firestore_utils.get_content_item(self.item_id, self.mock_logger)
+        self.assertEqual(self.db.rpc_counts['firestore.get'], 2)
+
+    def test_flask_request_gets_its_own_map(self):
+        app = Flask(__name__)
+        identity_map.init_app(app)
+
+        @app.route('/item')
+        def item():
+            firestore_utils.get_content_item(self.item_id, self.mock_logger)
+            firestore_utils.get_content_item('missing', self.mock_logger)
+            firestore_utils.get_content_item('missing', self.mock_logger)
+            return {'saved': g.identity_map.reads_saved}
+
+        client = app.test_client()
+        self.assertEqual(client.get('/item').get_json(), {'saved': 1})
+        self.assertEqual(client.get('/item').get_json(), {'saved': 1})
+        self.assertEqual(self.db.rpc_counts['firestore.get'], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
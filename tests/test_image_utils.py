@@ -6,7 +6,8 @@ from PIL import Image
 from image_utils import (
     process_uploaded_image,
     upload_image_to_gcs,
-    extract_gps_coordinates
+    extract_gps_coordinates,
+    validate_client_coordinates
 )
 
 
@@ -333,4 +334,17 @@ class TestExtractGPSCoordinates:
                 lat, lng = extract_gps_coordinates(image_data)
                 
                 assert lat is None
-                assert lng is None 
\ No newline at end of file
+                assert lng is None 
+
+
+class TestValidateClientCoordinates:
+    """Тесты для функции validate_client_coordinates"""
+
+    def test_valid_coordinates(self):
+        assert validate_client_coordinates('55.755', -37.6175) == (55.755, -37.6175)
+
+    @pytest.mark.parametrize('latitude, longitude', [
+        (None, 10), ('abc', 10), (91, 10), (10, -180.5), ('nan', 10), (10, 'inf'),
+    ])
+    def test_invalid_coordinates(self, latitude, longitude):
+        assert validate_client_coordinates(latitude, longitude) == (None, None)
@@ -0,0 +1,103 @@
+import unittest
+import json
+import logging
+import queue
+import sys
+import os
+from logging.handlers import QueueListener
+
+# Add the parent directory to the Python path to allow module imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask, g
+
+from logging_utils import (
+    JsonFormatter, SamplingFilter, RequestIdFilter, StructuredQueueHandler, configure_logging, REQUEST_ID_HEADER
+)
+
+
+def _record(level=logging.INFO, msg='hello %s', args=('world',), **extra):
+    record = logging.LogRecord('test', level, __file__, 10, msg, args, None)
+    for key, value in extra.items():
+        setattr(record, key, value)
+    return record
+
+
+class _ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+
+class TestLoggingUtils(unittest.TestCase):
+
+    def test_json_formatter_includes_request_id_and_extra_fields(self):
+        line = JsonFormatter().format(_record(request_id='abc', content_id='c1'))
+        payload = json.loads(line)
+        self.assertEqual(payload['message'], 'hello world')
+        self.assertEqual(payload['request_id'], 'abc')
+        self.assertEqual(payload['content_id'], 'c1')
+        self.assertEqual(payload['level'], 'INFO')
+
+    def test_sampling_is_consistent_per_request_and_spares_warnings(self):
+        sampler = SamplingFilter(0.5)
+        decisions = {rid: sampler.filter(_record(request_id=rid)) for rid in (f'req-{i}' for i in range(200))}
+        self.assertTrue(0 < sum(decisions.values()) < 200)
+        for rid, kept in list(decisions.items())[:20]:
+            self.assertEqual(sampler.filter(_record(request_id=rid)), kept)
+        self.assertTrue(SamplingFilter(0.0).filter(_record(level=logging.WARNING, request_id='x')))
+        self.assertTrue(SamplingFilter(0.0).filter(_record(request_id='x', sample=False)))
+        self.assertFalse(SamplingFilter(0.0).filter(_record(request_id='x')))
+
+    def test_queue_handler_renders_message_and_exception_off_thread(self):
+        log_queue = queue.SimpleQueue()
+        target = _ListHandler()
+        target.setFormatter(JsonFormatter())
+        listener = QueueListener(log_queue, target)
+        handler = StructuredQueueHandler(log_queue)
+        handler.addFilter(RequestIdFilter())
+        logger = logging.getLogger('test_logging_utils.queue')
+        logger.propagate = False
+        logger.addHandler(handler)
+        listener.start()
+        try:
+            items = ['a']
+            logger.info('items: %s', items, extra={'user_id': 'u1'})
+            items.append('b')  # mutation after the call must not change the logged message
+            try:
+                raise ValueError('boom')
+            except ValueError:
+                logger.error('failed', exc_info=True)
+        finally:
+            listener.stop()
+            logger.removeHandler(handler)
+
+        first, second = (json.loads(line) for line in target.lines)
+        self.assertEqual(first['message'], "items: ['a']")
+        self.assertEqual(first['user_id'], 'u1')
+        self.assertEqual(first['request_id'], '-')
+        self.assertIn('ValueError: boom', second['exception'])
+
+    def test_configure_logging_assigns_and_echoes_request_ids(self):
+        app = Flask(__name__)
+        configure_logging(app)
+
+        @app.route('/ping')
+        def ping():
+            return g.request_id
+
+        client = app.test_client()
+        response = client.get('/ping', headers={REQUEST_ID_HEADER: 'incoming-id'})
+        self.assertEqual(response.headers[REQUEST_ID_HEADER], 'incoming-id')
+        self.assertEqual(response.get_data(as_text=True), 'incoming-id')
+
+        generated = client.get('/ping').headers[REQUEST_ID_HEADER]
+        self.assertEqual(len(generated), 32)
+        self.assertFalse(app.logger.propagate)
+
+
+if __name__ == '__main__':
+    unittest.main()
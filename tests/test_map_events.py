@@ -0,0 +1,124 @@
+import json
+import unittest
+from unittest import mock
+import os
+import sys
+import threading
+from types import SimpleNamespace
+
+# Add the parent directory to the Python path to allow module imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import firebase_clients
+import firestore_utils
+import map_events
+from fake_backends import FakeBucket, FakeFirestore
+
+
+def decode(messages):
+    """Returns [(event name, data)] of encoded SSE messages."""
+    events = []
+    for message in messages:
+        fields = dict(line.split(': ', 1) for line in message.decode().strip().split('\n'))
+        events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+class TestMapEventHub(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_logger = mock.MagicMock()
+        self.db = FakeFirestore()
+        firebase_clients.use_clients(db=self.db, bucket=FakeBucket())
+        self.addCleanup(firebase_clients.use_clients)
+        self.item_id = firestore_utils.create_web_content_item(
+            {'userId': 'author', 'latitude': 1.0, 'longitude': 2.0, 'text': 'post', 'status': 'published'},
+            self.mock_logger)
+        self.hub = map_events.MapEventHub(queue_size=3)
+
+    def test_changes_are_diffed(self):
+        subscription = self.hub.subscribe()
+        self.assertEqual(subscription.get(0), [])  # The initial snapshot is not sent
+
+        firestore_utils.record_vote(self.item_id, 'voter', 1, self.mock_logger)
+        new_id = firestore_utils.create_web_content_item(
+            {'userId': 'other', 'latitude': 3.0, 'longitude': 4.0, 'text': 'new', 'status': 'published'},
+            self.mock_logger)
+        self.db.collection('contentItems').document(self.item_id).update({'status': 'for_moderation'})
+
+        events = decode(subscription.get(0))
+        self.assertEqual(events[0], ('changes', [{'type': 'update', 'itemId': self.item_id, 'changes': {'voteCount': 1}}]))
+        self.assertEqual(events[1][1][0]['type'], 'add')
+        self.assertEqual(events[1][1][0]['item']['itemId'], new_id)
+        self.assertEqual(events[-1], ('changes', [{'type': 'remove', 'itemId': self.item_id}]))
+
+    def test_writes_outside_the_map_fields_are_not_sent(self):
+        subscription = self.hub.subscribe()
+        self.db.collection('contentItems').document(self.item_id).update({'notificationSent': True})
+        self.assertEqual(subscription.get(0), [])
+
+    def test_slow_subscriber_gets_resync(self):
+        slow = self.hub.subscribe()
+        for count in range(1, 5):
+            self.db.collection('contentItems').document(self.item_id).update({'voteCount': count})
+        self.assertEqual(slow.get(0), [map_events.RESYNC_MESSAGE])
+        self.assertEqual(slow.overflows, 1)
+
+    def test_last_event_id_replay(self):
+        subscription = self.hub.subscribe()
+        self.db.collection('contentItems').document(self.item_id).update({'voteCount': 1})
+        first_id = subscription.get(0)[0].decode().split('\n')[0][len('id: '):]
+        self.db.collection('contentItems').document(self.item_id).update({'voteCount': 2})
+
+        missed = self.hub.subscribe(first_id).get(0)
+        self.assertEqual(decode(missed), [('changes', [{'type': 'update', 'itemId': self.item_id,
+                                                         'changes': {'voteCount': 2}}])])
+        self.assertEqual(self.hub.subscribe('elsewhere-1').get(0), [map_events.RESYNC_MESSAGE])
+
+    def test_listener_runs_while_subscribed(self):
+        first, second = self.hub.subscribe(), self.hub.subscribe()
+        self.assertEqual(self.db.rpc_counts['firestore.listen'], 1)
+        first.close()
+        self.assertEqual(len(self.db._watches), 1)
+        second.close()
+        self.assertEqual((self.hub.subscriber_count(), self.db._watches), (0, []))
+
+    def test_listener_is_stopped_outside_the_lock(self):
+        subscription = self.hub.subscribe()
+        watch = self.hub._watch
+        listener_threads = []
+
+        def unsubscribe():
+            # Like Firestore's listener thread delivering a callback while unsubscribe() waits for it
+            thread = threading.Thread(target=self.hub.subscriber_count)
+            thread.start()
+            thread.join(timeout=1)
+            listener_threads.append(thread)
+
+        with mock.patch.object(watch, 'unsubscribe', side_effect=unsubscribe):
+            subscription.close()
+
+        self.assertFalse(listener_threads[0].is_alive())
+        later = self.hub.subscribe()
+        self.db.collection('contentItems').document(self.item_id).update({'voteCount': 1})
+        removed = SimpleNamespace(type=SimpleNamespace(name='REMOVED'), document=SimpleNamespace(id=self.item_id))
+        watch._callback([], [removed], None)  # A late callback of the stopped listener is ignored
+        self.assertEqual(decode(later.get(0)), [('changes', [{'type': 'update', 'itemId': self.item_id,
+                                                              'changes': {'voteCount': 1}}])])
+
+    def test_subscriber_limit(self):
+        hub = map_events.MapEventHub(max_subscribers=1)
+        self.assertIsNotNone(hub.subscribe())
+        self.assertIsNone(hub.subscribe())
+
+    def test_flask_routes(self):
+        import app as app_module
+
+        client = app_module.create_app({'TESTING': True, 'MAP_EVENTS_ENABLED': False}).test_client()
+        self.assertEqual(client.get('/api/map/events').status_code, 404)
+        payload = client.get('/api/map/items').get_json()
+        self.assertEqual([item['itemId'] for item in payload['items']], [self.item_id])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+import unittest
+from unittest import mock
+import gzip
+import json
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+# Add the parent directory to the Python path to allow module imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+
+import firebase_clients
+import firestore_utils
+import map_snapshot
+from fake_backends import FakeBucket, FakeFirestore
+
+
+class TestMapSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.mock_logger = mock.MagicMock()
+        self.db = FakeFirestore()
+        firebase_clients.use_clients(db=self.db, bucket=FakeBucket())
+        self.addCleanup(firebase_clients.use_clients)
+        patcher = mock.patch('deletion_worker.schedule_deletion')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.app = Flask(__name__)
+        self.app.config.update(MAP_SNAPSHOT_ENABLED=True, MAP_SNAPSHOT_BUILDER=True, MAP_SNAPSHOT_DIR=self.tmp_dir.name,
+                               MAP_SNAPSHOT_DEBOUNCE_SECONDS=3600)
+        self.app.add_url_rule('/map-snapshots/<name>', view_func=map_snapshot.snapshot_response)
+        # The listener's callbacks are delivered by hand through _on_snapshot
+        with mock.patch.object(map_snapshot.MapSnapshotBuilder, 'start_listener'):
+            map_snapshot.init_app(self.app)
+        self.builder = map_snapshot._builder
+        self.builder._on_snapshot([], [], None)
+        self.addCleanup(self._disable)
+
+    def _disable(self):
+        self.builder.stop()
+        map_snapshot._store = map_snapshot._pointer = map_snapshot._builder = None
+
+    def _changed(self, *item_ids):
+        self.builder._on_snapshot([], [SimpleNamespace(type=SimpleNamespace(name='MODIFIED'),
+                                                       document=SimpleNamespace(id=item_id)) for item_id in item_ids],
+                                  None)
+
+    def _create(self, text, status='published'):
+        item_id = firestore_utils.create_web_content_item(
+            {'userId': 'u1', 'latitude': 1.0, 'longitude': 2.0, 'text': text}, self.mock_logger)
+        firestore_utils.update_content_status(item_id, status, 'admin', self.mock_logger)
+        return item_id
+
+    def _read_snapshot(self, url):
+        with open(os.path.join(self.tmp_dir.name, url.rsplit('/', 1)[-1]), 'rb') as snapshot_file:
+            return json.loads(snapshot_file.read())
+
+    def test_changes_are_applied_from_changed_documents_only(self):
+        first = self._create('first')
+        self._create('hidden', status='rejected')
+        self.assertIsNone(map_snapshot.current_snapshot_url())
+        first_url = self.builder.build()
+        self.assertEqual([item['itemId'] for item in self._read_snapshot(first_url)], [first])
+
+        second = self._create('second')
+        firestore_utils.record_vote(first, 'voter', 1, self.mock_logger)
+        self._changed(second, first)
+        self.db.reset_rpc_counts()
+        second_url = self.builder.build()
+
+        # The changed documents, then the current version for the other processes
+        self.assertEqual(self.db.rpc_counts, {'firestore.get_all': 1, 'firestore.documents_read': 2,
+                                              'firestore.commit': 1, 'firestore.documents_written': 1})
+        self.assertNotEqual(second_url, first_url)
+        items = self._read_snapshot(second_url)
+        self.assertEqual([item['itemId'] for item in items], [second, first])  # voteCount ascending
+        self.assertLessEqual(set(items[0]), set(firestore_utils.POST_INDEX_FIELDS) | {'itemId'})
+        self.assertEqual(map_snapshot.current_snapshot_url(), second_url)
+
+        firestore_utils.delete_content_item(second, 'u1', self.mock_logger)
+        self._changed(second)
+        self.assertEqual([item['itemId'] for item in self._read_snapshot(self.builder.build())], [first])
+
+    def test_other_processes_read_the_current_version(self):
+        self._create('first')
+        url = self.builder.build()
+        self.builder.stop()
+        map_snapshot._builder = None  # Like a web worker without MAP_SNAPSHOT_BUILDER
+
+        self.assertEqual(map_snapshot.current_snapshot_url(), url)
+        self.db.reset_rpc_counts()
+        self.assertEqual(map_snapshot.current_snapshot_url(), url)
+        self.assertEqual(self.db.rpc_counts, {})  # Cached for MAP_SNAPSHOT_POLL_SECONDS
+        pointer = self.db.collection(map_snapshot.POINTER_COLLECTION).document(map_snapshot.POINTER_DOCUMENT)
+        self.assertEqual(pointer.get().to_dict()['version'], self.builder.version)
+
+    def test_stale_snapshot_is_rebuilt_from_scratch(self):
+        first = self._create('first')
+        self.builder.build()
+        second = self._create('second')  # A change the listener did not deliver
+        self.builder.full_rebuild_seconds = 0
+        self.builder.ensure_built()
+        self.assertIsNotNone(self.builder._timer)
+        items = self._read_snapshot(self.builder.build())
+        self.assertEqual({item['itemId'] for item in items}, {first, second})
+
+    def test_unchanged_content_keeps_version(self):
+        self._create('first')
+        url = self.builder.build()
+        self.builder.mark_changed(['unknown-id'])
+        self.assertEqual(self.builder.build(), url)
+
+    def test_route_serves_precompressed_variant(self):
+        item_id = self._create('first')
+        name = self.builder.build().rsplit('/', 1)[1]
+        client = self.app.test_client()
+
+        response = client.get(f'/map-snapshots/{name}', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertEqual(json.loads(gzip.decompress(response.data))[0]['itemId'], item_id)
+
+        response = client.get(f'/map-snapshots/{name}', headers={'Accept-Encoding': 'identity'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(json.loads(response.data)[0]['itemId'], item_id)
+        self.assertEqual(client.get('/map-snapshots/..%2Fapp.py').status_code, 404)
+
+    def test_columns_round_trip_and_negotiation(self):
+        first = self._create('first')
+        self._create('second')
+        firestore_utils.update_web_content_item(first, {'imageUrl': 'https://storage.googleapis.com/b/u1/a.jpg'},
+                                                self.mock_logger)
+        name = self.builder.build().rsplit('/', 1)[1]
+        rows = self._read_snapshot(name)
+
+        client = self.app.test_client()
+        response = client.get(f'/map-snapshots/{name}', headers={
+            'Accept': f'{map_snapshot.COLUMNS_MIMETYPE}, application/json;q=0.9', 'Accept-Encoding': 'identity'})
+        self.assertEqual(response.mimetype, map_snapshot.COLUMNS_MIMETYPE)
+        self.assertIn('Accept', response.headers['Vary'])
+        decoded = map_snapshot.decode_columns(json.loads(response.data))
+
+        self.assertEqual(len(decoded), 2)
+        for row, item in zip(rows, decoded):
+            self.assertEqual(item['itemId'], row['itemId'])
+            self.assertAlmostEqual(item['latitude'], row['latitude'], places=5)
+            self.assertEqual(item['imageUrl'], row.get('imageUrl'))
+            self.assertEqual((item['userId'], item['status'], item['text']), (row['userId'], row['status'], row['text']))
+        self.assertEqual(client.get(f'/map-snapshots/{name}', headers={'Accept': '*/*'}).mimetype, 'application/json')
+
+
+if __name__ == '__main__':
+    unittest.main()
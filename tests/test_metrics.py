@@ -0,0 +1,98 @@
+import unittest
+import sys
+import os
+
+# Add the parent directory to the Python path to allow module imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+
+import metrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        metrics.set_enabled(True)
+
+    def test_histogram_renders_cumulative_buckets(self):
+        histogram = metrics.Histogram('test_latency_seconds', 'Test.', ('route',), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            histogram.observe(value, '/a"b')
+        text = '\n'.join(histogram.render())
+        self.assertIn('test_latency_seconds_bucket{route="/a\\"b",le="0.1"} 1', text)
+        self.assertIn('test_latency_seconds_bucket{route="/a\\"b",le="1"} 2', text)
+        self.assertIn('test_latency_seconds_bucket{route="/a\\"b",le="+Inf"} 3', text)
+        self.assertIn('test_latency_seconds_count{route="/a\\"b"} 3', text)
+
+    def test_timed_records_latency_and_errors(self):
+        @metrics.timed('testdep', 'failing_op')
+        def failing():
+            raise RuntimeError('boom')
+
+        before = metrics.DEPENDENCY_DURATION.count('testdep', 'failing_op')
+        with self.assertRaises(RuntimeError):
+            failing()
+        self.assertEqual(metrics.DEPENDENCY_DURATION.count('testdep', 'failing_op'), before + 1)
+        self.assertEqual(metrics.DEPENDENCY_ERRORS.value('testdep', 'failing_op'), 1)
+
+        metrics.set_enabled(False)
+        with self.assertRaises(RuntimeError):
+            failing()
+        self.assertEqual(metrics.DEPENDENCY_DURATION.count('testdep', 'failing_op'), before + 1)
+
+    def test_instrument_module_functions_wraps_public_functions_only(self):
+        def public():
+            return 1
+
+        def _private():
+            return 2
+
+        public.__module__ = _private.__module__ = 'fake_module'
+        namespace = {'__name__': 'fake_module', 'public': public, '_private': _private, 'Flask': Flask}
+        metrics.instrument_module_functions(namespace, 'fake')
+        self.assertIsNot(namespace['public'], public)
+        self.assertEqual(namespace['public'](), 1)
+        self.assertIs(namespace['_private'], _private)
+        self.assertIs(namespace['Flask'], Flask)
+        self.assertEqual(metrics.DEPENDENCY_DURATION.count('fake', 'public'), 1)
+
+    def test_request_metrics_and_document_counts(self):
+        app = Flask(__name__)
+        app.config['METRICS_TOKEN'] = 'secret'
+        metrics.init_app(app)
+
+        @app.route('/items/<item_id>')
+        def item(item_id):
+            metrics._add_document_counts(read=3, written=1)
+            return item_id
+
+        client = app.test_client()
+        reads_before = metrics.DOCUMENTS_READ.value()
+        client.get('/items/42')
+        self.assertEqual(metrics.DOCUMENTS_READ.value(), reads_before + 3)
+        self.assertEqual(metrics.REQUEST_DURATION.count('GET', '/items/<item_id>', '200'), 1)
+        self.assertEqual(metrics.DOCUMENTS_READ_PER_REQUEST.count('/items/<item_id>'), 1)
+
+        self.assertEqual(client.get('/metrics').status_code, 403)
+        response = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('mailmap_firestore_documents_read_per_request_bucket{route="/items/<item_id>",le="5"} 1',
+                      response.get_data(as_text=True))
+
+    def test_unhandled_errors_are_recorded_and_metrics_need_a_token(self):
+        app = Flask(__name__)
+        metrics.init_app(app)
+
+        @app.route('/broken')
+        def broken():
+            raise RuntimeError('boom')
+
+        client = app.test_client()
+        self.assertEqual(client.get('/broken').status_code, 500)
+        self.assertEqual(metrics.REQUEST_DURATION.count('GET', '/broken', '500'), 1)
+        self.assertEqual(client.get('/metrics').status_code, 404)  # No METRICS_TOKEN configured
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+from unittest import mock
+import os
+import sys
+
+# Add the parent directory to the Python path to allow module imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from google.api_core.exceptions import InvalidArgument
+
+import firebase_clients
+import firestore_utils
+import ownership_migration
+from fake_backends import FakeBucket, FakeFirestore, FakeWriteBatch
+
+
+class TestOwnershipMigration(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_logger = mock.MagicMock()
+        self.db = FakeFirestore()
+        firebase_clients.use_clients(db=self.db, bucket=FakeBucket())
+        self.addCleanup(firebase_clients.use_clients)
+        patcher = mock.patch.object(ownership_migration, 'MIGRATION_CHUNK_SIZE', 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.item_ids = [self._create('old') for _ in range(5)]
+        firestore_utils.get_user_post_index('old', self.mock_logger)
+
+    def _create(self, user_id):
+        return firestore_utils.create_web_content_item(
+            {'userId': user_id, 'latitude': 1.0, 'longitude': 2.0, 'text': 'post'}, self.mock_logger)
+
+    def _job(self):
+        return self.db.collection(ownership_migration.MIGRATION_COLLECTION).document('old').get().to_dict()
+
+    def test_start_records_job_and_reads_union_old_and_new(self):
+        own = self._create('new')
+        with mock.patch.object(ownership_migration, 'schedule_migration') as schedule:
+            job = ownership_migration.start_migration('old', 'new', self.mock_logger)
+
+        schedule.assert_called_once_with('old', self.mock_logger)
+        self.assertEqual(job['status'], 'pending')
+        self.assertEqual(firestore_utils.get_content_item(self.item_ids[0], self.mock_logger)['userId'], 'old')
+        self.assertEqual(set(firestore_utils.get_user_post_index('new', self.mock_logger)),
+                         set(self.item_ids) | {own})
+        self.assertEqual(len(firestore_utils.get_published_items_for_map(self.mock_logger, user_id='new')), 6)
+
+    def test_merged_user_owns_old_posts_while_the_job_is_pending(self):
+        import api_services
+
+        ownership_migration.start_migration('old', 'new', self.mock_logger, background=False)
+
+        result = api_services.update_content_item(self.item_ids[0], 'new', {'text': 'edited'}, self.mock_logger,
+                                                  'bucket', {'jpg'}, 1024)
+        self.assertEqual(result['http_code'], 200)
+        self.assertEqual(firestore_utils.delete_content_item(self.item_ids[1], 'other', self.mock_logger)['code'], 403)
+        self.assertEqual(firestore_utils.delete_content_item(self.item_ids[1], 'new', self.mock_logger)['code'], 200)
+        self.assertNotIn(self.item_ids[1], firestore_utils.get_user_post_index('new', self.mock_logger))
+
+    def test_interrupted_migration_resumes_from_remaining_items(self):
+        ownership_migration.start_migration('old', 'new', self.mock_logger, background=False)
+        real_commit = FakeWriteBatch.commit
+        commits = []
+
+        def failing_second_commit(batch):
+            commits.append(batch)
+            if len(commits) == 2:
+                raise InvalidArgument('interrupted')
+            return real_commit(batch)
+
+        with mock.patch.object(FakeWriteBatch, 'commit', failing_second_commit):
+            result = ownership_migration.run_migration('old', self.mock_logger)
+
+        self.assertEqual(result['status'], 'pending')
+        job = self._job()
+        self.assertEqual((job['cursor'], job['migratedCount'], job['attempts']), (sorted(self.item_ids)[1], 2, 1))
+        self.assertEqual(set(firestore_utils.get_user_post_index('new', self.mock_logger)), set(self.item_ids))
+
+        firestore_utils.delete_content_item(sorted(self.item_ids)[-1], 'old', self.mock_logger)
+        result = ownership_migration.run_migration('old', self.mock_logger)
+
+        self.assertEqual(result, {'status': 'done', 'migrated': 2})
+        self.assertEqual(self._job()['migratedCount'], 4)
+        self.assertEqual(set(firestore_utils.get_user_post_index('new', self.mock_logger)),
+                         set(sorted(self.item_ids)[:-1]))
+        index = self.db.collection(firestore_utils.POST_INDEX_COLLECTION).document('new').get().to_dict()
+        self.assertEqual(index['mergedFrom'], [])
+        self.assertEqual(ownership_migration.run_migration('old', self.mock_logger), {'status': 'done', 'migrated': 0})
+
+    def test_pending_sweep_completes_jobs(self):
+        ownership_migration.start_migration('old', 'new', self.mock_logger, background=False)
+
+        counts = ownership_migration.process_pending_migrations(self.mock_logger)
+
+        self.assertEqual(counts, {'done': 1, 'pending': 0, 'missing': 0})
+        for item_id in self.item_ids:
+            self.assertEqual(firestore_utils.get_content_item(item_id, self.mock_logger)['userId'], 'new')
+        self.assertEqual(firestore_utils.get_user_post_index('old', self.mock_logger), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# Add the parent directory to the Python path to allow module imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+
+import profiling
+
+
+def _busy_wait(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.profile_dir = self.tmp_dir.name
+
+    def test_stack_sampler_collects_collapsed_stacks(self):
+        sampler = profiling.StackSampler(threading.get_ident(), 0.001)
+        sampler.start()
+        _busy_wait(0.1)
+        sampler.stop()
+        self.assertGreater(sampler.sample_count, 0)
+        first_line = sampler.collapsed().splitlines()[0]
+        stack, count = first_line.rsplit(' ', 1)
+        self.assertIn('_busy_wait (test_profiling.py:', stack)
+        self.assertGreater(int(count), 0)
+
+    def test_save_prunes_oldest_and_lists_slowest_first(self):
+        sampler = profiling.StackSampler(threading.get_ident(), 0.001)
+        sampler.stacks['a;b'] = 3
+        names = []
+        for duration in (100, 900, 300):
+            names.append(profiling.save_profile(self.profile_dir, sampler,
+                                                {'method': 'GET', 'path': '/', 'duration_ms': duration}, max_files=2))
+            time.sleep(0.01)  # names start with a microsecond timestamp
+
+        profiles = profiling.list_profiles(self.profile_dir)
+        self.assertEqual([p['duration_ms'] for p in profiles], [900, 300])
+        self.assertIsNone(profiling.profile_path(self.profile_dir, names[0]))
+        with open(profiling.profile_path(self.profile_dir, names[1])) as profile_file:
+            self.assertEqual(profile_file.read(), 'a;b 3\n')
+        self.assertIsNone(profiling.profile_path(self.profile_dir, '../etc/passwd'))
+
+    def test_admin_header_forces_profile(self):
+        app = Flask(__name__)
+        app.secret_key = 'test'
+        app.config.update(PROFILING_DIR=self.profile_dir, PROFILING_INTERVAL_MS=1)
+        profiling.init_app(app)
+
+        @app.route('/slow')
+        def slow():
+            _busy_wait(0.05)
+            return 'done'
+
+        client = app.test_client()
+        client.get('/slow', headers={profiling.PROFILE_HEADER: '1'})
+        self.assertEqual(profiling.list_profiles(self.profile_dir), [])  # not an admin
+
+        with client.session_transaction() as sess:
+            sess['admin_id'] = 'admin-1'
+        client.get('/slow', headers={profiling.PROFILE_HEADER: '1'})
+        profiles = profiling.list_profiles(self.profile_dir)
+        self.assertEqual(len(profiles), 1)
+        self.assertTrue(profiles[0]['forced'])
+        self.assertEqual(profiles[0]['path'], '/slow')
+
+    def test_sampled_requests_below_threshold_are_discarded(self):
+        app = Flask(__name__)
+        app.config.update(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=1.0, PROFILING_SLOW_THRESHOLD_MS=10000,
+                          PROFILING_DIR=self.profile_dir)
+        profiling.init_app(app)
+
+        @app.route('/fast')
+        def fast():
+            return 'ok'
+
+        app.test_client().get('/fast')
+        self.assertEqual(profiling.list_profiles(self.profile_dir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+import subprocess
+import sys
+import os
+
+# Add the parent directory to the Python path to allow module imports
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.startup_importtime import parse_importtime, check_budget
+
+
+class TestStartupImportPath(unittest.TestCase):
+
+    def _run_in_fresh_interpreter(self, code):
+        env = dict(os.environ, TEST_ENV='true')
+        completed = subprocess.run([sys.executable, '-c', code], cwd=REPO_ROOT, env=env,
+                                   capture_output=True, text=True)
+        self.assertEqual(completed.returncode, 0, completed.stderr)
+        return completed.stdout.strip().splitlines()[-1]
+
+    def test_import_app_defers_heavy_modules_and_firebase(self):
+        output = self._run_in_fresh_interpreter(
+            "import sys, app, firebase_admin\n"
+            "loaded = [m for m in ('PIL', 'exifread', 'smtplib') if m in sys.modules]\n"
+            "print(loaded, len(firebase_admin._apps))"
+        )
+        self.assertEqual(output, "[] 0")
+
+    def test_create_app_keeps_endpoint_names(self):
+        output = self._run_in_fresh_interpreter(
+            "import app\n"
+            "second = app.create_app({'TESTING': True})\n"
+            "print(sorted(r.endpoint for r in app.app.url_map.iter_rules()) == "
+            "sorted(r.endpoint for r in second.url_map.iter_rules()), 'home' in second.view_functions)"
+        )
+        self.assertEqual(output, "True True")
+
+    def test_image_utils_exposes_lazy_modules(self):
+        output = self._run_in_fresh_interpreter(
+            "import sys, image_utils\n"
+            "before = 'exifread' in sys.modules\n"
+            "print(before, image_utils.exifread.__name__, image_utils.Image.__name__)"
+        )
+        self.assertEqual(output, "False exifread PIL.Image")
+
+    def test_budget_check_reports_violations(self):
+        rows = parse_importtime(
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |   smtplib\n"
+            "import time:      5000 |     950000 | app\n"
+        )
+        self.assertEqual(rows[-1], ('app', 5000, 950000))
+        result = {'cumulative_ms': 950.0, 'modules': {name for name, _, _ in rows}}
+        violations = check_budget(result, {'max_cumulative_ms': 900, 'forbidden_modules': ['smtplib', 'PIL']})
+        self.assertEqual(len(violations), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
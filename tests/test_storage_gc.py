@@ -0,0 +1,92 @@
+import unittest
+from unittest import mock
+from datetime import datetime, timedelta, timezone
+import sys
+import os
+
+# Add the parent directory to the Python path to allow module imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import storage_gc
+from fake_backends import FakeBucket
+
+
+def _mock_db(image_urls, tombstone_paths=()):
+    """Returns a db mock whose select().stream() yields the given field values."""
+    def stream_for(collection_name):
+        if collection_name == 'contentItems':
+            values = [{'imageUrl': url} for url in image_urls]
+        else:
+            values = [{'imagePath': path} for path in tombstone_paths]
+        docs = []
+        for value in values:
+            doc = mock.MagicMock()
+            doc.to_dict.return_value = value
+            docs.append(doc)
+        collection = mock.MagicMock()
+        collection.select.return_value.stream.return_value = docs
+        return collection
+
+    db = mock.MagicMock()
+    db.collection.side_effect = stream_for
+    return db
+
+
+class TestStorageGC(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_logger = mock.MagicMock()
+        self.now = datetime(2025, 1, 10, tzinfo=timezone.utc)
+        self.old = self.now - timedelta(days=3)
+        self.bucket = FakeBucket('bucket')
+        self.bucket.put_object('u1/kept.jpg', b'x' * 10, time_created=self.old)
+        self.bucket.put_object('u1/orphan.jpg', b'x' * 20, time_created=self.old)
+        self.bucket.put_object('u1/fresh.jpg', b'x' * 30, time_created=self.now - timedelta(hours=1))
+        self.bucket.put_object('u2/tombstoned.jpg', b'x', time_created=self.old)
+        self.bucket.put_object('u2/orphan.png', b'x' * 40, time_created=self.old)
+        self.db = _mock_db(
+            ['https://storage.googleapis.com/bucket/u1/kept.jpg', None],
+            tombstone_paths=['u2/tombstoned.jpg']
+        )
+
+    def test_deletes_only_old_unreferenced_blobs(self):
+        stats = storage_gc.collect_orphaned_blobs(self.db, self.bucket, self.mock_logger,
+                                                  page_size=2, now=self.now)
+
+        self.assertEqual(self.bucket.object_names(), ['u1/fresh.jpg', 'u1/kept.jpg', 'u2/tombstoned.jpg'])
+        self.assertEqual(stats['scanned'], 5)
+        self.assertEqual(stats['referenced'], 2)
+        self.assertEqual(stats['too_recent'], 1)
+        self.assertEqual(stats['deleted'], 2)
+        self.assertEqual(stats['orphaned_bytes'], 60)
+        self.assertEqual(self.bucket.rpc_counts['storage.list'], 3)  # Listed in pages of 2
+
+    def test_dry_run_deletes_nothing(self):
+        stats = storage_gc.collect_orphaned_blobs(self.db, self.bucket, self.mock_logger,
+                                                  dry_run=True, now=self.now)
+
+        self.assertEqual(stats['orphaned'], 2)
+        self.assertEqual(stats['deleted'], 0)
+        self.assertEqual(len(self.bucket.object_names()), 5)
+
+    def test_prefix_limits_the_scan(self):
+        stats = storage_gc.collect_orphaned_blobs(self.db, self.bucket, self.mock_logger,
+                                                  prefix='u2/', now=self.now)
+
+        self.assertEqual(stats['scanned'], 2)
+        self.assertIn('u1/orphan.jpg', self.bucket.object_names())
+        self.assertNotIn('u2/orphan.png', self.bucket.object_names())
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = storage_gc.BloomFilter(expected_items=1000)
+        paths = [f"user/{i}.jpg" for i in range(1000)]
+        for path in paths:
+            bloom.add(path)
+
+        self.assertTrue(all(path in bloom for path in paths))
+        false_positives = sum(f"other/{i}.jpg" in bloom for i in range(10000))
+        self.assertLess(false_positives, 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+from unittest import mock
+import os
+import sys
+
+# Add the parent directory to the Python path to allow module imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import firebase_clients
+import firestore_utils
+import unit_of_work
+import webhook_handlers
+from fake_backends import FakeBucket, FakeFirestore
+from firestore_utils import firestore
+
+
+class TestUnitOfWork(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_logger = mock.MagicMock()
+        self.db = FakeFirestore()
+        firebase_clients.use_clients(db=self.db, bucket=FakeBucket())
+        self.addCleanup(firebase_clients.use_clients)
+
+    def _data(self, collection, doc_id):
+        return self.db.collection(collection).document(doc_id).get().to_dict()
+
+    def test_writes_to_same_document_are_merged(self):
+        user_ref = self.db.collection('users').document('u1')
+        user_ref.set({'photo_upload_count_current_month': 2})
+        self.db.reset_rpc_counts()
+
+        with unit_of_work.begin(self.db) as writes:
+            writes.update(user_ref, {'photo_upload_count_current_month': firestore.Increment(1)})
+            writes.update(user_ref, {'photo_upload_count_current_month': firestore.Increment(1), 'plan': 'free'})
+            new_ref = self.db.collection('items').document('i1')
+            writes.set(new_ref, {'voters': {'a': 1}, 'voteCount': 1})
+            writes.update(new_ref, {'voters.b': 1, 'voteCount': firestore.Increment(1)})
+            writes.set(self.db.collection('index').document('u1'), {'posts': {'i1': {'text': 'x'}}}, merge=True)
+            writes.set(self.db.collection('index').document('u1'), {'posts': {'i2': {'text': 'y'}}}, merge=True)
+            self.assertEqual((len(writes), writes.writes_merged), (3, 3))
+            self.assertEqual(self.db.rpc_counts, {})  # Nothing is written before the block exits
+
+        self.assertEqual(self.db.rpc_counts, {'firestore.commit': 1, 'firestore.documents_written': 3})
+        self.assertEqual(self._data('users', 'u1'), {'photo_upload_count_current_month': 4, 'plan': 'free'})
+        self.assertEqual(self._data('items', 'i1'), {'voters': {'a': 1, 'b': 1}, 'voteCount': 2})
+        self.assertEqual(set(self._data('index', 'u1')['posts']), {'i1', 'i2'})
+
+    def test_unmergeable_writes_stay_in_order_and_errors_discard(self):
+        ref = self.db.collection('items').document('i1')
+        ref.set({'tags': ['a'], 'count': 1})
+
+        with unit_of_work.begin(self.db) as writes:
+            writes.update(ref, {'tags': firestore.ArrayUnion(['b'])})
+            writes.update(ref, {'tags': firestore.ArrayUnion(['c'])})
+            writes.update(ref, {'count': 5})
+            self.assertEqual(len(writes), 2)
+        self.assertEqual(self._data('items', 'i1'), {'tags': ['a', 'b', 'c'], 'count': 5})
+
+        with self.assertRaises(RuntimeError):
+            with unit_of_work.begin(self.db) as writes:
+                writes.delete(ref)
+                raise RuntimeError('abort')
+        self.assertIsNotNone(self._data('items', 'i1'))
+
+    def test_webhook_commits_email_posts_in_one_batch(self):
+        firestore_utils.create_user('u1', 'sender@example.com', 'Sender', 'email', self.mock_logger)
+        self.db.reset_rpc_counts()
+        attachments = [{'Name': f'photo{index}.jpg', 'ContentType': 'image/jpeg', 'Content': 'AAAA'}
+                       for index in range(2)]
+        payload = {'FromFull': {'Email': 'sender@example.com'}, 'Subject': 'Hi', 'TextBody': 'text',
+                   'Attachments': attachments}
+
+        with mock.patch('webhook_handlers.image_utils.process_uploaded_image',
+                        return_value=('https://storage.googleapis.com/b/u1/a.jpg', 1.0, 2.0)), \
+                mock.patch('webhook_handlers.email_utils.send_pending_notification', return_value=True) as send, \
+                mock.patch('webhook_handlers.utils.verify_inbound_token', return_value=True):
+            result = webhook_handlers.handle_postmark_webhook_request(
+                payload, 'token', self.mock_logger, self.db, FakeBucket(), None, 'token',
+                ['.jpg'], 1024, {'PHOTO_UPLOAD_LIMIT': 10})
+
+        self.assertEqual(len(result['contentIds']), 2)
+        self.assertEqual(send.call_count, 2)
+        # Two posts, one merged post index write, one merged counter increment, two notifications
+        self.assertEqual(self.db.rpc_counts['firestore.commit'], 1)
+        self.assertEqual(self.db.rpc_counts['firestore.documents_written'], 6)
+        self.assertEqual(self._data('users', 'u1')['photo_upload_count_current_month'], 2)
+        self.assertEqual(set(firestore_utils.get_user_post_index('u1', self.mock_logger)), set(result['contentIds']))
+
+    def test_failed_commit_deletes_uploaded_images(self):
+        bucket = FakeBucket()
+        blob = bucket.blob('u1/a.jpg')
+        blob.upload_from_string(b'jpeg', content_type='image/jpeg')
+        payload = {'FromFull': {'Email': 'sender@example.com'}, 'Subject': 'Hi', 'TextBody': 'text',
+                   'Attachments': [{'Name': 'a.jpg', 'ContentType': 'image/jpeg', 'Content': 'AAAA'}]}
+
+        with mock.patch('webhook_handlers.image_utils.process_uploaded_image',
+                        return_value=(blob.public_url, 1.0, 2.0)), \
+                mock.patch('webhook_handlers.email_utils.send_pending_notification') as send, \
+                mock.patch('webhook_handlers.utils.verify_inbound_token', return_value=True), \
+                mock.patch.object(unit_of_work.UnitOfWork, 'flush', side_effect=RuntimeError('unavailable')):
+            result = webhook_handlers.handle_postmark_webhook_request(
+                payload, 'token', self.mock_logger, self.db, bucket, None, 'token',
+                ['.jpg'], 1024, {'PHOTO_UPLOAD_LIMIT': 10})
+
+        self.assertEqual((result['status'], result['http_status_code']), ('error', 500))
+        self.assertFalse(blob.exists())
+        send.assert_not_called()
+        self.assertEqual(self.db.collection('contentItems').get(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import io
+import unittest
+from unittest import mock
+import os
+import sys
+
+# Add the parent directory to the Python path to allow module imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from werkzeug.http import parse_options_header
+from werkzeug.test import EnvironBuilder
+
+import firebase_clients
+import firestore_utils
+import upload_stream
+from fake_backends import FakeBucket, FakeFirestore
+from upload_stream import UploadRejected
+
+MAX_SIZE = 256 * 1024
+EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif'}
+JPEG = b'\xff\xd8\xff\xe0' + b'\x00' * 1000
+
+
+class CountingStream(io.BytesIO):
+    """A request body that records how much of it was read."""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+def multipart(fields):
+    """Returns (boundary, body) of a multipart/form-data request with fields."""
+    environ = EnvironBuilder(method='POST', data=fields).get_environ()
+    return parse_options_header(environ['CONTENT_TYPE'])[1]['boundary'], environ['wsgi.input'].read()
+
+
+class TestParsePhotoForm(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_logger = mock.MagicMock()
+
+    def parse(self, body, boundary, content_length=None):
+        stream = CountingStream(body)
+        try:
+            return upload_stream.parse_photo_form(stream, boundary, content_length, self.mock_logger,
+                                                  EXTENSIONS, MAX_SIZE)
+        finally:
+            self.bytes_read = stream.bytes_read
+
+    def test_fields_and_image(self):
+        boundary, body = multipart({'text': 'привет', 'latitude': '1.5',
+                                    'image': (io.BytesIO(JPEG), 'photo.JPG', 'image/jpeg')})
+        form, files = self.parse(body, boundary, len(body))
+
+        self.assertEqual((form['text'], form['latitude']), ('привет', '1.5'))
+        image = files['image']
+        self.assertEqual((image.filename, image.content_type, image.read()), ('photo.JPG', 'image/jpeg', JPEG))
+        image.close()
+
+    def test_empty_file_field(self):
+        boundary, body = multipart({'text': 'no photo', 'image': (io.BytesIO(b''), '')})
+        form, files = self.parse(body, boundary)
+        self.assertEqual((form['text'], files['image'].filename), ('no photo', ''))
+
+    def test_content_length_over_limit_is_not_read(self):
+        boundary, body = multipart({'image': (io.BytesIO(JPEG), 'photo.jpg')})
+        with self.assertRaises(UploadRejected) as raised:
+            self.parse(body, boundary, MAX_SIZE + upload_stream.MAX_FIELD_BYTES + 1)
+        self.assertEqual((raised.exception.http_code, self.bytes_read), (413, 0))
+
+    def test_oversized_image_stops_reading(self):
+        data = JPEG + b'\x00' * (4 * MAX_SIZE)
+        boundary, body = multipart({'image': (io.BytesIO(data), 'photo.jpg')})
+        with self.assertRaises(UploadRejected) as raised:
+            self.parse(body, boundary)  # Chunked: no Content-Length
+        self.assertEqual(raised.exception.http_code, 413)
+        self.assertLessEqual(self.bytes_read, MAX_SIZE + 2 * upload_stream.CHUNK_BYTES)
+
+    def test_extension_checked_with_the_first_chunk(self):
+        boundary, body = multipart({'image': (io.BytesIO(b'\x00' * MAX_SIZE), 'notes.txt')})
+        with self.assertRaises(UploadRejected) as raised:
+            self.parse(body, boundary)
+        self.assertEqual((raised.exception.http_code, self.bytes_read), (400, upload_stream.CHUNK_BYTES))
+
+    def test_content_must_match_the_extension(self):
+        png = b'\x89PNG\r\n\x1a\n' + b'\x00' * 100
+        for data, filename, content_type in [(png, 'photo.jpg', None), (b'<html>', 'photo.png', None),
+                                             (JPEG, 'photo.jpg', 'text/html')]:
+            boundary, body = multipart({'image': (io.BytesIO(data), filename, content_type)})
+            with self.assertRaises(UploadRejected) as raised:
+                self.parse(body, boundary)
+            self.assertEqual(raised.exception.http_code, 400, filename)
+
+    def test_other_file_fields_and_truncated_bodies(self):
+        boundary, body = multipart({'attachment': (io.BytesIO(JPEG), 'photo.jpg')})
+        self.assertRaises(UploadRejected, self.parse, body, boundary)
+        boundary, body = multipart({'image': (io.BytesIO(JPEG), 'photo.jpg')})
+        self.assertRaises(UploadRejected, self.parse, body[:-100], boundary)
+        self.assertRaises(UploadRejected, self.parse, body, None)
+
+
+class TestCreateContentRoute(unittest.TestCase):
+
+    def setUp(self):
+        self.db = FakeFirestore()
+        self.bucket = FakeBucket()
+        firebase_clients.use_clients(db=self.db, bucket=self.bucket)
+        self.addCleanup(firebase_clients.use_clients)
+        self.db.put_document('users', 'u1', {'photo_upload_count_current_month': 0})
+        import app as app_module
+        self.client = app_module.create_app({'TESTING': True, 'MAX_IMAGE_SIZE': MAX_SIZE,
+                                             'PHOTO_UPLOAD_LIMIT': 5}).test_client()
+
+    def post(self, data):
+        return self.client.post('/api/content/create', data=data, content_type='multipart/form-data',
+                                headers={'X-User-ID': 'u1'})
+
+    def test_photo_post(self):
+        with mock.patch('image_utils.upload_image_to_gcs', return_value='https://example/photo.jpg') as upload:
+            response = self.post({'text': 'hi', 'latitude': '1', 'longitude': '2',
+                                  'image': (io.BytesIO(JPEG), 'photo.jpg')})
+        self.assertEqual(response.status_code, 201, response.get_json())
+        self.assertEqual(upload.call_args[0][0], JPEG)
+        item = firestore_utils.get_content_item(response.get_json()['contentId'], mock.MagicMock())
+        self.assertEqual(item['imageUrl'], 'https://example/photo.jpg')
+
+    def test_rejected_uploads(self):
+        oversized = self.post({'latitude': '1', 'longitude': '2',
+                               'image': (io.BytesIO(JPEG + b'\x00' * MAX_SIZE), 'photo.jpg')})
+        self.assertEqual((oversized.status_code, oversized.get_json()['status']), (413, 'error'))
+        mislabeled = self.post({'latitude': '1', 'longitude': '2',
+                                'image': (io.BytesIO(b'<script>'), 'photo.gif')})
+        self.assertEqual(mislabeled.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
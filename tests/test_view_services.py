@@ -11,10 +11,18 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 # from firebase_admin import credentials # No longer needed here
 # from google.auth import credentials as google_auth_credentials # No longer needed here
 
+import threading
+import time
+
+from flask import Flask, g
+
+import fanout
 import view_services
 # firestore_utils will be mocked, so direct import isn't strictly needed in the test file itself
 # but it's good to be aware of what's being mocked.
 
+UPLOAD_COUNT_LOG = "User %s: Uploaded %s photos this month (Limit: %s). Remaining: %s."
+
 class TestViewServices(unittest.TestCase):
 
     def setUp(self):
@@ -47,7 +55,7 @@ class TestViewServices(unittest.TestCase):
 
         self.assertEqual(context['remaining_photos'], 20)
         self.mock_get_user.assert_called_once_with(user_id, self.mock_logger)
-        self.mock_logger.info.assert_called_with(f"User {user_id}: Uploaded 5 photos this month (Limit: 25). Remaining: 20.")
+        self.mock_logger.info.assert_called_with(UPLOAD_COUNT_LOG, user_id, 5, 25, 20)
 
     def test_get_home_page_data_user_logged_in_limit_reached(self):
         user_id = "test_user_id_2"
@@ -63,7 +71,7 @@ class TestViewServices(unittest.TestCase):
 
         self.assertEqual(context['remaining_photos'], 0)
         self.mock_get_user.assert_called_once_with(user_id, self.mock_logger)
-        self.mock_logger.info.assert_called_with(f"User {user_id}: Uploaded {test_limit} photos this month (Limit: {test_limit}). Remaining: 0.")
+        self.mock_logger.info.assert_called_with(UPLOAD_COUNT_LOG, user_id, test_limit, test_limit, 0)
 
 
     def test_get_home_page_data_user_logged_in_over_limit(self):
@@ -80,7 +88,7 @@ class TestViewServices(unittest.TestCase):
 
         self.assertEqual(context['remaining_photos'], 0) # Should not be negative
         self.mock_get_user.assert_called_once_with(user_id, self.mock_logger)
-        self.mock_logger.info.assert_called_with(f"User {user_id}: Uploaded {test_limit+5} photos this month (Limit: {test_limit}). Remaining: 0.")
+        self.mock_logger.info.assert_called_with(UPLOAD_COUNT_LOG, user_id, test_limit + 5, test_limit, 0)
 
     def test_get_home_page_data_user_not_logged_in(self):
         test_limit = 15 # This limit won't be used but needs to be passed
@@ -108,7 +116,7 @@ class TestViewServices(unittest.TestCase):
 
         self.assertIsNone(context['remaining_photos'])
         self.mock_get_user.assert_called_once_with(user_id, self.mock_logger)
-        self.mock_logger.warning.assert_called_with(f"Logged-in user ID {user_id} provided, but user data not found.")
+        self.mock_logger.warning.assert_called_with("Logged-in user ID %s provided, but user data not found.", user_id)
 
     def test_get_home_page_data_user_logged_in_photo_count_missing(self):
         user_id = "test_user_id_no_count"
@@ -126,7 +134,52 @@ class TestViewServices(unittest.TestCase):
         # Expecting default of 0 for count, so test_limit remaining
         self.assertEqual(context['remaining_photos'], test_limit)
         self.mock_get_user.assert_called_once_with(user_id, self.mock_logger)
-        self.mock_logger.info.assert_called_with(f"User {user_id}: Uploaded 0 photos this month (Limit: {test_limit}). Remaining: {test_limit}.")
+        self.mock_logger.info.assert_called_with(UPLOAD_COUNT_LOG, user_id, 0, test_limit, test_limit)
+
+
+class TestFanOut(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_logger = mock.MagicMock()
+
+    def test_page_reads_run_concurrently(self):
+        def slow(result):
+            def read(*args):
+                time.sleep(0.2)
+                return result
+            return read
+
+        with mock.patch('firestore_utils.get_published_items_for_map', side_effect=slow([{'itemId': 'a'}])), \
+                mock.patch('firestore_utils.get_content_item', side_effect=slow({'itemId': 'a'})):
+            started = time.monotonic()
+            context = view_services.get_post_page_data('a', self.mock_logger, 'key')
+            elapsed = time.monotonic() - started
+
+        self.assertEqual(context['items'], [{'itemId': 'a'}])
+        self.assertEqual(context['target_item_data'], {'itemId': 'a'})
+        self.assertLess(elapsed, 0.35)
+
+    def test_failed_and_late_calls_get_defaults(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def fail():
+            raise RuntimeError('unavailable')
+
+        results = fanout.gather({'late': release.wait, 'failed': fail, 'ok': lambda: 1}, self.mock_logger,
+                                defaults={'late': 'default'}, timeout={'late': 0.05})
+
+        self.assertEqual(results, {'late': 'default', 'failed': None, 'ok': 1})
+        self.mock_logger.warning.assert_called_once()
+        self.mock_logger.error.assert_called_once()
+
+    def test_calls_share_the_request_context(self):
+        app = Flask(__name__)
+        with app.test_request_context('/'):
+            g.marker = 'request'
+            results = fanout.gather({'a': lambda: g.marker, 'b': lambda: g.marker}, self.mock_logger)
+        self.assertEqual(results, {'a': 'request', 'b': 'request'})
+
 
 if __name__ == '__main__':
     unittest.main()
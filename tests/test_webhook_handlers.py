@@ -1,5 +1,5 @@
 import unittest
-from unittest.mock import patch, MagicMock, call
+from unittest.mock import ANY, patch, MagicMock, call
 from webhook_handlers import handle_postmark_webhook_request
 
 # Basic App Context Mock (if needed by email_utils.send_pending_notification)
@@ -48,7 +48,7 @@ class TestWebhookHandlers(unittest.TestCase):
         self.assertEqual(response['http_status_code'], 401)
         mock_verify_token.assert_called_once_with("invalid_query_token", self.mock_inbound_url_token_config)
         self.mock_app_logger.warning.assert_called_once_with(
-            f"Invalid token in Postmark webhook URL. Provided token: invalid_query_token"
+            "Invalid token in Postmark webhook URL."
         )
 
     @patch('webhook_handlers.utils.verify_inbound_token', return_value=True) # Token is valid for this test
@@ -120,7 +120,8 @@ class TestWebhookHandlers(unittest.TestCase):
         mock_create_user.assert_called_once()
 
         self.mock_app_logger.warning.assert_any_call(
-            f"Failed to create user for {user_email} in Firestore. Content will be saved without a specific userId."
+            "Failed to create user for %s in Firestore. Content will be saved without a specific userId.",
+            user_email
         )
 
         mock_process_image.assert_called_once()
@@ -131,7 +132,7 @@ class TestWebhookHandlers(unittest.TestCase):
         self.assertEqual(content_data_arg['imageUrl'], 'http://example.com/image.jpg')
 
         # Ensure no attempt to increment photo count for a non-existent user
-        self.mock_db_client.collection('users').document().update.assert_not_called()
+        self.mock_db_client.batch.return_value.update.assert_not_called()
         mock_create_email_record.assert_called_once() # Email notification should still be attempted
         mock_send_notification.assert_called_once()
 
@@ -287,12 +288,11 @@ class TestWebhookHandlers(unittest.TestCase):
             self.assertEqual(response['message'], 'No valid images found in attachments')
             mock_save_content.assert_not_called()
             # Assert specific log for skipping due to no GPS
-            expected_log_msg = (
-                f"Could not determine coordinates for post from image 'image1.jpg' "
-                f"(email: {request_data['FromFull']['Email']}, subject: '{request_data['Subject']}'). "
-                f"Skipping this image."
+            self.mock_app_logger.warning.assert_any_call(
+                "Could not determine coordinates for post from image '%s' (email: %s, subject: '%s'). "
+                "Skipping this image.",
+                'image1.jpg', request_data['FromFull']['Email'], request_data['Subject']
             )
-            self.mock_app_logger.warning.assert_any_call(expected_log_msg)
 
     # --- Tests for Photo Upload Limit and Count Increment (Original Set) ---
 
@@ -328,7 +328,9 @@ class TestWebhookHandlers(unittest.TestCase):
             self.mock_allowed_image_extensions_config, self.mock_max_image_size_config, self.mock_app_config)
         self.assertEqual(response['status'], 'success')
         mock_save_content.assert_called_once()
-        mock_user_doc_ref.update.assert_called_once_with({'photo_upload_count_current_month': mock_increment_instance})
+        self.mock_db_client.batch.return_value.update.assert_called_once_with(
+            mock_user_doc_ref, {'photo_upload_count_current_month': mock_increment_instance})
+        self.mock_db_client.batch.return_value.commit.assert_called_once()
         mock_increment.assert_called_once_with(1)
 
     @patch('webhook_handlers.utils.verify_inbound_token', return_value=True)
@@ -368,11 +370,12 @@ class TestWebhookHandlers(unittest.TestCase):
 
         mock_save_content.assert_not_called()
         mock_process_image.assert_not_called() # Corrected: Not called if limit is already met
-        mock_user_doc_ref.update.assert_not_called()
+        self.mock_db_client.batch.return_value.update.assert_not_called()
 
         # Check logger warning for the skipped image
         self.mock_app_logger.warning.assert_any_call(
-            f"User {user_uid} has reached photo upload limit ({initial_photo_count}/{self.mock_app_config['PHOTO_UPLOAD_LIMIT']}). Skipping image 'image1.jpg'."
+            "User %s has reached photo upload limit (%s/%s). Skipping image '%s'.",
+            user_uid, initial_photo_count, self.mock_app_config['PHOTO_UPLOAD_LIMIT'], 'image1.jpg'
         )
 
     @patch('webhook_handlers.utils.verify_inbound_token', return_value=True)
@@ -414,7 +417,9 @@ class TestWebhookHandlers(unittest.TestCase):
         mock_create_user.assert_called_once()
         mock_save_content.assert_called_once()
         # Check that the update call was made on the correct document reference for increment
-        self.mock_db_client.collection('users').document(new_user_uid).update.assert_called_once_with({'photo_upload_count_current_month': mock_increment_instance})
+        self.mock_db_client.batch.return_value.update.assert_called_once_with(
+            self.mock_db_client.collection('users').document(new_user_uid),
+            {'photo_upload_count_current_month': mock_increment_instance})
         mock_increment.assert_called_once_with(1)
 
     @patch('webhook_handlers.utils.verify_inbound_token', return_value=True)
@@ -442,7 +447,7 @@ class TestWebhookHandlers(unittest.TestCase):
         self.assertEqual(response['status'], 'error')
         mock_process_image.assert_not_called() # Added for clarity
         mock_save_content.assert_not_called() # Should also be here, as no processing means no saving
-        mock_user_doc_ref.update.assert_not_called()
+        self.mock_db_client.batch.return_value.update.assert_not_called()
 
     @patch('webhook_handlers.utils.verify_inbound_token', return_value=True)
     @patch('webhook_handlers.firestore_utils.get_user_by_email')
@@ -467,7 +472,7 @@ class TestWebhookHandlers(unittest.TestCase):
             self.mock_bucket, self.mock_app_context, self.mock_inbound_url_token_config,
             self.mock_allowed_image_extensions_config, self.mock_max_image_size_config, self.mock_app_config)
         self.assertEqual(response['status'], 'error')
-        mock_user_doc_ref.update.assert_not_called()
+        self.mock_db_client.batch.return_value.update.assert_not_called()
 
     # --- New Specific Edge Case Tests ---
 
@@ -523,12 +528,12 @@ class TestWebhookHandlers(unittest.TestCase):
         # (assuming image_bytes and other args are consistent with how process_uploaded_image is called)
         # This part might need more detailed argument checking if necessary, but call_count is primary here.
 
-        mock_user_doc_ref.update.assert_called_once() # Incremented only for the first image
+        self.mock_db_client.batch.return_value.update.assert_called_once() # Incremented only for the first image
         mock_increment.assert_called_once_with(1)
 
         # Check logger warning for the skipped image
         self.mock_app_logger.warning.assert_any_call(
-            f"User {user_uid} has reached photo upload limit ({limit}/{limit}). Skipping image 'imageB.jpg'."
+            "User %s has reached photo upload limit (%s/%s). Skipping image '%s'.", user_uid, limit, limit, 'imageB.jpg'
         )
 
     @patch('webhook_handlers.utils.verify_inbound_token', return_value=True)
@@ -569,14 +574,14 @@ class TestWebhookHandlers(unittest.TestCase):
 
         mock_save_content.assert_not_called()
         mock_process_image.assert_not_called() # Corrected: Not called if limit is already met for both
-        mock_user_doc_ref.update.assert_not_called()
+        self.mock_db_client.batch.return_value.update.assert_not_called()
 
         # Check logger warnings for skipped images
         self.mock_app_logger.warning.assert_any_call(
-            f"User {user_uid} has reached photo upload limit ({limit}/{limit}). Skipping image 'image1.jpg'."
+            "User %s has reached photo upload limit (%s/%s). Skipping image '%s'.", user_uid, limit, limit, 'image1.jpg'
         )
         self.mock_app_logger.warning.assert_any_call(
-            f"User {user_uid} has reached photo upload limit ({limit}/{limit}). Skipping image 'image2.jpg'."
+            "User %s has reached photo upload limit (%s/%s). Skipping image '%s'.", user_uid, limit, limit, 'image2.jpg'
         )
 
     @patch('webhook_handlers.utils.verify_inbound_token', return_value=True)
@@ -643,8 +648,8 @@ class TestWebhookHandlers(unittest.TestCase):
 
         # Check that new user's photo count was incremented
         # The mock_user_doc_ref_for_update is set up via the db_collection_side_effect
-        mock_user_doc_ref_for_update.update.assert_called_once_with(
-            {'photo_upload_count_current_month': mock_increment.return_value}
+        self.mock_db_client.batch.return_value.update.assert_called_once_with(
+            ANY, {'photo_upload_count_current_month': mock_increment.return_value}
         )
         mock_increment.assert_called_once_with(1)
 
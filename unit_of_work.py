@@ -0,0 +1,240 @@
+"""
+Write-coalescing unit of work for Firestore.
+
+An operation such as publishing a post from an email writes several documents: the content
+item, the author's post index entry, the author's photo counter and the notification record.
+Committed one by one that is one RPC per write. Inside
+
+    with unit_of_work.begin(db):
+        ...
+
+firestore_utils.save_content_item, create_web_content_item, email_utils'
+create_email_notification_record and the callers' own uow.set/update/delete calls add their
+writes to the current UnitOfWork, and the outermost block commits all of them in one WriteBatch
+when it exits. Nothing is written if the block raises. A nested begin() joins the unit that is
+already current, so a helper that wraps its writes in begin() still commits right away when it
+is called on its own.
+
+Writes to the same document are merged when the result is the same as applying them in order:
+  * a set without merge or a delete replaces the earlier writes,
+  * update after update combines the fields (two Increments of a field add up),
+  * update after set folds the fields into the set data,
+  * set(merge=True) after set merges the data (e.g. post index entries of several posts).
+Other combinations stay separate writes in the same batch, which Firestore applies in order.
+
+More than MAX_BATCH_WRITES writes are committed in several batches, which are not atomic
+together. Writes are not visible to reads until the unit is flushed. A caller that must commit
+them together with reads uses collect() instead of begin() and adds the collected writes to its
+transaction with write_to().
+"""
+
+import contextlib
+import contextvars
+import copy
+
+from google.cloud.firestore_v1 import transforms
+
+MAX_BATCH_WRITES = 500
+
+_current_unit = contextvars.ContextVar('unit_of_work', default=None)
+_CANNOT_MERGE = object()
+_FIELD_TRANSFORMS = (transforms.Increment, transforms.Maximum, transforms.Minimum,
+                     transforms.ArrayUnion, transforms.ArrayRemove)
+
+
+def _merge_value(current, value, missing):
+    """Returns the value of a field after `value` is written over `current`, or _CANNOT_MERGE."""
+    if missing or not isinstance(value, _FIELD_TRANSFORMS):
+        return value
+    if isinstance(value, transforms.Increment):
+        if isinstance(current, transforms.Increment):
+            return transforms.Increment(current.value + value.value)
+        if isinstance(current, (int, float)) and not isinstance(current, bool):
+            return current + value.value
+    return _CANNOT_MERGE
+
+
+def _merge_set_data(target, changes, drop_deleted):
+    """
+    Merges the data of a set(merge=True) into target, the data of an earlier set, in place.
+    drop_deleted removes fields set to DELETE_FIELD (plain set data cannot hold it). Returns
+    False, leaving target partially changed, if a change cannot be expressed in one write.
+    """
+    for key, value in changes.items():
+        current = target.get(key)
+        if isinstance(value, dict) and isinstance(current, dict):
+            if not _merge_set_data(current, value, drop_deleted):
+                return False
+            continue
+        if value is transforms.DELETE_FIELD and drop_deleted:
+            target.pop(key, None)
+            continue
+        merged = _merge_value(current, value, key not in target)
+        if merged is _CANNOT_MERGE:
+            return False
+        target[key] = copy.deepcopy(merged)
+    return True
+
+
+def _fold_update_into_set_data(target, field_updates):
+    """Applies update() field paths to the data of an earlier plain set, in place; False if it cannot."""
+    for path, value in field_updates.items():
+        node = target
+        *parents, leaf = path.split('.')
+        for part in parents:
+            if not isinstance(node.get(part), dict):
+                node[part] = {}
+            node = node[part]
+        if value is transforms.DELETE_FIELD:
+            node.pop(leaf, None)
+            continue
+        merged = _merge_value(node.get(leaf), value, leaf not in node)
+        if merged is _CANNOT_MERGE:
+            return False
+        node[leaf] = merged
+    return True
+
+
+def _merge_update_fields(fields, changes):
+    """Combines two update() field maps; returns None if their paths overlap in a way that cannot be merged."""
+    merged = dict(fields)
+    for path, value in changes.items():
+        if any(other.startswith(path + '.') or path.startswith(other + '.') for other in fields):
+            return None
+        value = _merge_value(fields.get(path), value, path not in fields)
+        if value is _CANNOT_MERGE:
+            return None
+        merged[path] = value
+    return merged
+
+
+class _Write:
+    __slots__ = ('kind', 'reference', 'data', 'merge')
+
+    def __init__(self, kind, reference, data=None, merge=False):
+        self.kind = kind
+        self.reference = reference
+        self.data = data
+        self.merge = merge
+
+    def combined_with(self, later):
+        """Returns one write equivalent to self followed by later, or None."""
+        if later.kind == 'delete' or (later.kind == 'set' and not later.merge):
+            return later
+        if self.kind == 'update' and later.kind == 'update':
+            fields = _merge_update_fields(self.data, later.data)
+            return _Write('update', self.reference, fields) if fields is not None else None
+        if self.kind != 'set' or not isinstance(self.merge, bool):
+            return None
+        data = copy.deepcopy(self.data)
+        if later.kind == 'update' and not self.merge:
+            merged = _fold_update_into_set_data(data, later.data)
+        elif later.kind == 'set' and later.merge is True:
+            merged = _merge_set_data(data, later.data, drop_deleted=not self.merge)
+        else:
+            return None
+        return _Write('set', self.reference, data, self.merge) if merged else None
+
+
+class UnitOfWork:
+    """Collects set/update/delete writes (the WriteBatch interface) and commits them on flush()."""
+
+    def __init__(self, db):
+        self.db = db
+        self._writes = []
+        self._last_write_by_path = {}
+        self.writes_merged = 0
+        self.batches_committed = 0
+
+    def _add(self, write):
+        path = write.reference.path
+        index = self._last_write_by_path.get(path)
+        if index is not None:
+            combined = self._writes[index].combined_with(write)
+            if combined is not None:
+                self._writes[index] = combined
+                self.writes_merged += 1
+                return self
+        self._last_write_by_path[path] = len(self._writes)
+        self._writes.append(write)
+        return self
+
+    def set(self, reference, document_data, merge=False):
+        return self._add(_Write('set', reference, copy.deepcopy(document_data), merge))
+
+    def update(self, reference, field_updates):
+        return self._add(_Write('update', reference, dict(field_updates)))
+
+    def delete(self, reference):
+        return self._add(_Write('delete', reference))
+
+    def __len__(self):
+        return len(self._writes)
+
+    def write_to(self, writer):
+        """
+        Adds the pending writes to writer, a Transaction or WriteBatch the caller commits. They stay
+        pending, so a retried transaction function can add them again.
+        """
+        if len(self._writes) > MAX_BATCH_WRITES:
+            raise ValueError(f"{len(self._writes)} writes do not fit in one commit")
+        _add_writes(writer, self._writes)
+
+    def flush(self):
+        """Commits the pending writes in as few WriteBatches as possible; returns the commit results."""
+        writes, self._writes, self._last_write_by_path = self._writes, [], {}
+        results = []
+        for start in range(0, len(writes), MAX_BATCH_WRITES):
+            batch = self.db.batch()
+            _add_writes(batch, writes[start:start + MAX_BATCH_WRITES])
+            results.append(batch.commit())
+            self.batches_committed += 1
+        return results
+
+
+def _add_writes(writer, writes):
+    for write in writes:
+        if write.kind == 'set':
+            writer.set(write.reference, write.data, merge=write.merge)
+        elif write.kind == 'update':
+            writer.update(write.reference, write.data)
+        else:
+            writer.delete(write.reference)
+
+
+def current():
+    """Returns the unit of work writes are currently collected in, or None."""
+    return _current_unit.get()
+
+
+@contextlib.contextmanager
+def begin(db):
+    """
+    Yields the current UnitOfWork, or a new one for db that is committed when the block exits
+    without an exception.
+    """
+    outer = _current_unit.get()
+    if outer is not None:
+        yield outer
+        return
+    unit = UnitOfWork(db)
+    token = _current_unit.set(unit)
+    try:
+        yield unit
+    finally:
+        _current_unit.reset(token)
+    unit.flush()
+
+
+@contextlib.contextmanager
+def collect(db):
+    """
+    Yields a new UnitOfWork that collects the writes made in the block but is never flushed; the
+    caller commits them, e.g. inside a transaction with write_to().
+    """
+    unit = UnitOfWork(db)
+    token = _current_unit.set(unit)
+    try:
+        yield unit
+    finally:
+        _current_unit.reset(token)
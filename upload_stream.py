@@ -0,0 +1,161 @@
+"""
+Streaming multipart parsing for photo uploads (POST /api/content/create).
+
+request.form and request.files parse the whole body before the view runs, so an oversized or
+mislabeled upload is only rejected once every byte of it has arrived. parse_photo_form reads the
+body in CHUNK_BYTES pieces through Werkzeug's sans-IO MultipartDecoder and checks as it goes:
+
+- a Content-Length above max_image_size + MAX_FIELD_BYTES is refused before anything is read;
+- the file name extension of the image part is checked as soon as the part's headers arrive,
+  and its first bytes are matched against the magic numbers of that extension's type;
+- the image is written to a SpooledTemporaryFile (in memory up to SPOOL_MEMORY_BYTES, on disk
+  after that), and parsing stops as soon as it grows past max_image_size, the text fields past
+  MAX_FIELD_BYTES or the body past their sum (chunked requests have no Content-Length).
+
+A rejected upload raises UploadRejected carrying the HTTP status to answer with. The rest of the
+body is never read; the WSGI server closes the connection after the response.
+"""
+
+import io
+import os
+import tempfile
+
+from werkzeug.datastructures import FileStorage, ImmutableMultiDict, MultiDict
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+from werkzeug.utils import secure_filename
+
+import image_utils
+
+CHUNK_BYTES = 64 * 1024
+SPOOL_MEMORY_BYTES = 512 * 1024
+# All text parts together: the post text, coordinates and user ID.
+MAX_FIELD_BYTES = 64 * 1024
+MAX_PARTS = 20
+
+
+class UploadRejected(Exception):
+    """An upload refused while it was being received; http_code is 400 or 413."""
+
+    def __init__(self, message, http_code):
+        super().__init__(message)
+        self.message = message
+        self.http_code = http_code
+
+
+def _too_large(max_image_size):
+    return UploadRejected(f'Image size exceeds limit of {max_image_size // (1024 * 1024)}MB.', 413)
+
+
+class _FilePart:
+    def __init__(self, event, content_type):
+        self.name = event.name
+        self.filename = event.filename
+        self.headers = event.headers
+        self.expected_type = content_type
+        self.head = b''
+        self.size = 0
+        self.stream = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES) if event.filename else io.BytesIO()
+
+    def write(self, data, more_data, max_image_size):
+        self.size += len(data)
+        if self.size > max_image_size:
+            raise _too_large(max_image_size)
+        if self.filename and len(self.head) < image_utils.IMAGE_SNIFF_BYTES:
+            self.head += data[:image_utils.IMAGE_SNIFF_BYTES - len(self.head)]
+            if (len(self.head) == image_utils.IMAGE_SNIFF_BYTES or not more_data) and \
+                    image_utils.sniff_image_type(self.head) != self.expected_type:
+                raise UploadRejected('The file content does not match its image type.', 400)
+        self.stream.write(data)
+
+    def file_storage(self):
+        self.stream.seek(0)
+        return FileStorage(stream=self.stream, filename=self.filename, name=self.name,
+                           content_type=self.expected_type, headers=self.headers)
+
+
+def _start_file_part(event, file_field, allowed_extensions, app_logger):
+    if event.name != file_field:
+        raise UploadRejected(f'Unexpected file field {event.name!r}.', 400)
+    if not event.filename:  # No file chosen in the form
+        return _FilePart(event, None)
+    file_extension = os.path.splitext(secure_filename(event.filename))[1].lower().lstrip('.')
+    if file_extension not in allowed_extensions or file_extension not in image_utils.IMAGE_CONTENT_TYPES:
+        app_logger.warning("Streaming upload: Unsupported image type %r.", event.filename)
+        raise UploadRejected('Unsupported image type.', 400)
+    content_type = image_utils.IMAGE_CONTENT_TYPES[file_extension]
+    declared_type = event.headers.get('Content-Type', 'application/octet-stream').split(';')[0].strip().lower()
+    if declared_type not in (content_type, 'application/octet-stream'):
+        app_logger.warning("Streaming upload: %r declared as %s.", event.filename, declared_type)
+        raise UploadRejected('Unsupported image type.', 400)
+    return _FilePart(event, content_type)
+
+
+def parse_photo_form(stream, boundary, content_length, app_logger, allowed_extensions, max_image_size,
+                     file_field='image'):
+    """
+    Parses a multipart/form-data body with one image part (file_field) from a file-like stream.
+    Returns (form, files) like request.form and request.files; the image is a FileStorage over a
+    SpooledTemporaryFile that the caller closes. Raises UploadRejected.
+    """
+    if not boundary:
+        raise UploadRejected('Expected a multipart/form-data body.', 400)
+    max_body = max_image_size + MAX_FIELD_BYTES
+    if content_length is not None and content_length > max_body:
+        app_logger.warning("Streaming upload: Content-Length %s over the limit of %s.", content_length, max_body)
+        raise _too_large(max_image_size)
+
+    # The decoder buffer only ever holds one chunk plus an unfinished boundary or header block.
+    decoder = MultipartDecoder(boundary.encode('latin-1'), max_form_memory_size=CHUNK_BYTES + MAX_FIELD_BYTES,
+                               max_parts=MAX_PARTS)
+    form, files = MultiDict(), MultiDict()
+    part = field_name = None
+    field_data = bytearray()
+    received = field_bytes = 0
+    event = None
+    try:
+        while not isinstance(event, Epilogue):
+            chunk = stream.read(CHUNK_BYTES)
+            received += len(chunk)
+            if received > max_body:
+                raise _too_large(max_image_size)
+            decoder.receive_data(chunk or None)
+            event = decoder.next_event()
+            while not isinstance(event, (Epilogue, NeedData)):
+                if isinstance(event, Field):
+                    part, field_name = None, event.name
+                    field_data.clear()
+                elif isinstance(event, File):
+                    part = _start_file_part(event, file_field, allowed_extensions, app_logger)
+                elif isinstance(event, Data) and part is not None:
+                    part.write(event.data, event.more_data, max_image_size)
+                    if not event.more_data:
+                        files.add(part.name, part.file_storage())
+                elif isinstance(event, Data):
+                    field_bytes += len(event.data)
+                    if field_bytes > MAX_FIELD_BYTES:
+                        raise UploadRejected('Form fields are too large.', 413)
+                    field_data.extend(event.data)
+                    if not event.more_data:
+                        form.add(field_name, field_data.decode('utf-8', 'replace'))
+                event = decoder.next_event()
+            if not chunk and not isinstance(event, Epilogue):
+                raise UploadRejected('The upload ended before it was complete.', 400)
+    except RequestEntityTooLarge:
+        _close(files, part)
+        raise UploadRejected('Form part headers are too large.', 413)
+    except ValueError as e:
+        _close(files, part)
+        app_logger.warning("Streaming upload: Malformed multipart body: %s", e)
+        raise UploadRejected('Malformed multipart body.', 400)
+    except UploadRejected:
+        _close(files, part)
+        raise
+    return ImmutableMultiDict(form), ImmutableMultiDict(files)
+
+
+def _close(files, part):
+    for file_storage in files.values():
+        file_storage.close()
+    if part is not None:
+        part.stream.close()
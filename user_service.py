@@ -6,6 +6,7 @@ from flask import current_app # Added for app_context
 
 # Assuming firestore_utils.py is in the same directory or accessible in PYTHONPATH
 import firestore_utils
+import ownership_migration
 # Assuming email_utils.py is in the same directory or accessible in PYTHONPATH
 from email_utils import send_verification_email # Added for email verification
 
@@ -306,10 +307,10 @@ class UserService:
                     self.logger.error(f"Failed to create new user record for {google_uid} during merge: {e_create}", exc_info=True)
                     return {'status': 'error', 'message': 'Failed to create user during account merge.'}
 
-                # Migrate content
-                migrated = firestore_utils.migrate_content_ownership(old_user_uid, google_uid, self.logger)
+                # Migrate content in the background; reads include the old UID's posts until it completes.
+                migrated = ownership_migration.start_migration(old_user_uid, google_uid, self.logger)
                 if not migrated:
-                    # This is a critical issue. The new user record was created, but content migration failed.
+                    # This is a critical issue. The new user record was created, but content migration could not be started.
                     # Potentially rollback new user creation or flag for manual intervention.
                     self.logger.error(f"Content migration failed from {old_user_uid} to {google_uid}. Manual check needed.")
                     # Returning error, but state is inconsistent.
@@ -485,7 +486,8 @@ class UserService:
                         self.logger.error(f"Failed to create new user record for {apple_uid} during merge: {e_create}", exc_info=True)
                         return {'status': 'error', 'message': 'Failed to create user record during account merge.', 'status_code': 500}
 
-                    migrated = firestore_utils.migrate_content_ownership(old_user_uid, apple_uid, self.logger)
+                    # Runs in the background; reads include the old UID's posts until it completes.
+                    migrated = ownership_migration.start_migration(old_user_uid, apple_uid, self.logger)
                     if not migrated:
                         self.logger.error(f"Content migration failed from {old_user_uid} to {apple_uid}. Manual check needed.")
                         # Rollback new user creation is complex; for now, flag critical error.
@@ -1,4 +1,6 @@
+import fanout
 import firestore_utils # Direct import
+import map_snapshot
 from datetime import datetime # Needed for format_datetime_filter
 from google.cloud import firestore
 
@@ -6,48 +8,68 @@ def get_home_page_data(app_logger, maps_api_key, user_id_for_filtering=None, log
     """
     Gets the data required for the home page.
     With optional filtering by user ID for map items, and checks for logged-in user's photo limits.
+    The user and the map items are read concurrently.
     """
     remaining_photos = None # Default for anonymous users or if user data not found
 
+    reads = {}
     if logged_in_user_id:
-        app_logger.debug(f"Fetching user data for {logged_in_user_id} to check photo limits.")
-        user_data = firestore_utils.get_user(logged_in_user_id, app_logger)
+        app_logger.debug("Fetching user data for %s to check photo limits.", logged_in_user_id)
+        reads['user'] = lambda: firestore_utils.get_user(logged_in_user_id, app_logger)
+
+    snapshot_url = None
+    if user_id_for_filtering:
+        app_logger.debug("Fetching map items for home page filtered by user ID: %s", user_id_for_filtering)
+        reads['items'] = lambda: firestore_utils.get_published_items_for_map(app_logger, user_id_for_filtering)
+    else:
+        # The unfiltered map is the same for everyone: map.js loads it from the snapshot file when one exists.
+        snapshot_url = map_snapshot.current_snapshot_url()
+        if snapshot_url:
+            app_logger.debug("Home page map served from snapshot %s", snapshot_url)
+        else:
+            app_logger.debug("Fetching map items for home page without filtering")
+            reads['items'] = lambda: firestore_utils.get_published_items_for_map(app_logger)
+
+    results = fanout.gather(reads, app_logger, defaults={'items': []})
+
+    if logged_in_user_id:
+        user_data = results['user']
         if user_data:
             photo_upload_count_current_month = user_data.get('photo_upload_count_current_month', 0)
             # PHOTO_UPLOAD_LIMIT = 25 # Standard limit # Removed
             calculated_remaining = photo_upload_limit - photo_upload_count_current_month
             remaining_photos = max(0, calculated_remaining)
-            app_logger.info(f"User {logged_in_user_id}: Uploaded {photo_upload_count_current_month} photos this month (Limit: {photo_upload_limit}). Remaining: {remaining_photos}.")
+            app_logger.info("User %s: Uploaded %s photos this month (Limit: %s). Remaining: %s.",
+                            logged_in_user_id, photo_upload_count_current_month, photo_upload_limit, remaining_photos)
         else:
-            app_logger.warning(f"Logged-in user ID {logged_in_user_id} provided, but user data not found.")
+            app_logger.warning("Logged-in user ID %s provided, but user data not found.", logged_in_user_id)
             # remaining_photos stays None
 
-    if user_id_for_filtering:
-        app_logger.debug(f"Fetching map items for home page filtered by user ID: {user_id_for_filtering}")
-        items_for_map = firestore_utils.get_published_items_for_map(app_logger, user_id_for_filtering)
-    else:
-        app_logger.debug("Fetching map items for home page without filtering")
-        items_for_map = firestore_utils.get_published_items_for_map(app_logger)
-
-    return {'items': items_for_map, 'maps_api_key': maps_api_key, 'remaining_photos': remaining_photos}
+    if snapshot_url:
+        return {'items': [], 'map_snapshot_url': snapshot_url, 'maps_api_key': maps_api_key,
+                'remaining_photos': remaining_photos}
+    return {'items': results['items'], 'maps_api_key': maps_api_key, 'remaining_photos': remaining_photos}
 
 def get_post_page_data(item_id, app_logger, maps_api_key, user_id_for_filtering=None):
     """
     Gets the data required for a single post page.
-    With optional filtering by user ID.
+    With optional filtering by user ID. The map items and the target item are read concurrently.
     """
     if user_id_for_filtering:
-        app_logger.debug(f"Fetching data for post page, item_id: {item_id}, filtered by user ID: {user_id_for_filtering}")
-        items_for_map = firestore_utils.get_published_items_for_map(app_logger, user_id_for_filtering)
+        app_logger.debug("Fetching data for post page, item_id: %s, filtered by user ID: %s", item_id, user_id_for_filtering)
     else:
-        app_logger.debug(f"Fetching data for post page, item_id: {item_id}, without filtering")
-        items_for_map = firestore_utils.get_published_items_for_map(app_logger)
+        app_logger.debug("Fetching data for post page, item_id: %s, without filtering", item_id)
 
-    target_item_data = firestore_utils.get_content_item(item_id, app_logger)
+    results = fanout.gather({
+        'items': lambda: firestore_utils.get_published_items_for_map(app_logger, user_id_for_filtering),
+        'target': lambda: firestore_utils.get_content_item(item_id, app_logger),
+    }, app_logger, defaults={'items': []})
+    items_for_map = results['items']
+    target_item_data = results['target']
 
     # Log if target item is not found, but still return data for map display
     if not target_item_data:
-        app_logger.warning(f"Target item {item_id} not found for post_view service.")
+        app_logger.warning("Target item %s not found for post_view service.", item_id)
 
     return {
         'items': items_for_map,
@@ -3,6 +3,7 @@ import utils  # Direct import
 import image_utils  # Direct import
 import firestore_utils  # Direct import
 import email_utils  # Direct import
+import unit_of_work
 
 
 # datetime import was removed as it's not used
@@ -33,11 +34,11 @@ def handle_postmark_webhook_request(
     Checks for user existence by email, creates if not found, and associates content.
     Returns a dictionary with 'status' and other relevant data (message, contentId).
     """
-    app_logger.info(f"handle_postmark_webhook_request called. Verifying token: {query_token}")
+    app_logger.info("handle_postmark_webhook_request called. Verifying token.")
 
     if not utils.verify_inbound_token(query_token, inbound_url_token_config):
         app_logger.warning(
-            f"Invalid token in Postmark webhook URL. Provided token: {query_token}")
+            "Invalid token in Postmark webhook URL.")
         return {'status': 'error', 'message': 'Invalid token', 'http_status_code': 401}
 
     try:
@@ -49,7 +50,8 @@ def handle_postmark_webhook_request(
         attachments = request_json_data.get('Attachments', [])
 
         app_logger.info(
-            f"Processing email via webhook from {from_email} with subject: '{subject}'. Attachments: {len(attachments)}")
+            "Processing email via webhook from %s with subject: '%s'. Attachments: %s",
+            from_email, subject, len(attachments))
 
         if not from_email:
             app_logger.warning("Email received via webhook without a 'From' email address. Cannot process.")
@@ -61,15 +63,15 @@ def handle_postmark_webhook_request(
 
         if user_data_from_email_check:
             user_id_for_content = user_data_from_email_check.get('uid')
-            app_logger.info(f"Existing user found for {from_email}: UID {user_id_for_content}")
+            app_logger.info("Existing user found for %s: UID %s", from_email, user_id_for_content)
             user_data = firestore_utils.get_user(user_id_for_content, app_logger)
             if not user_data:
-                app_logger.error(f"Could not retrieve full user data for UID {user_id_for_content} after email check.")
+                app_logger.error("Could not retrieve full user data for UID %s after email check.", user_id_for_content)
             else:
-                app_logger.info(f"Full user data fetched for UID {user_id_for_content}")
+                app_logger.info("Full user data fetched for UID %s", user_id_for_content)
         else:
             user_data = None
-            app_logger.info(f"No user found for {from_email}. Attempting to create one.")
+            app_logger.info("No user found for %s. Attempting to create one.", from_email)
             display_name = from_email.split('@')[0] if '@' in from_email else from_email
 
             try:
@@ -86,12 +88,14 @@ def handle_postmark_webhook_request(
                 if created_user_info:
                     user_id_for_content = new_user_uid
                     user_data = created_user_info
-                    app_logger.info(f"Successfully created new user for {from_email} with UID: {user_id_for_content}")
+                    app_logger.info("Successfully created new user for %s with UID: %s",
+                                    from_email, user_id_for_content)
                 else:
                     app_logger.warning(
-                        f"Failed to create user for {from_email} in Firestore. Content will be saved without a specific userId.")
+                        "Failed to create user for %s in Firestore. Content will be saved without a specific userId.",
+                        from_email)
             except Exception as e_user_create:
-                app_logger.error(f"Exception during user creation for {from_email}: {e_user_create}", exc_info=True)
+                app_logger.error("Exception during user creation for %s: %s", from_email, e_user_create, exc_info=True)
                 app_logger.warning(f"Content will be saved without a specific userId due to user creation error.")
 
         # Получаем настройки лимита
@@ -103,165 +107,198 @@ def handle_postmark_webhook_request(
             current_photo_count = user_data.get('photo_upload_count_current_month', 0)
 
         app_logger.info(
-            f"User {user_id_for_content or 'N/A'}: Current photo count: {current_photo_count}, Limit: {photo_limit}")
+            "User %s: Current photo count: %s, Limit: %s",
+            user_id_for_content or 'N/A', current_photo_count, photo_limit)
 
         processed_content_ids = []
         skipped_due_to_limit = 0
 
-        if attachments:
-            app_logger.info(f"Processing {len(attachments)} attachments for email from {from_email}.")
-
-            # Считаем количество изображений в attachments
-            image_attachments = [att for att in attachments if att.get('ContentType', '').startswith('image/')]
-            app_logger.info(f"Found {len(image_attachments)} image attachments to process.")
-
-            for i, attachment in enumerate(attachments):
-                # Reset per-image variables
-                current_image_url = None
-                current_exif_lat = None
-                current_exif_lng = None
-
-                content_type = attachment.get('ContentType', '')
-                original_filename = attachment.get('Name', '')
-                content_base64 = attachment.get('Content', '')
-
-                app_logger.debug(
-                    f"Attachment {i + 1}: Name='{original_filename}', ContentType='{content_type}', HasContent={bool(content_base64)}")
-
-                if not content_type.startswith('image/'):
-                    app_logger.debug(f"Attachment '{original_filename}' is not an image. Skipping.")
-                    continue
-                if not original_filename:
-                    app_logger.debug(f"Attachment {i + 1} has no filename. Skipping.")
-                    continue
-
-                # ПРОВЕРКА ЛИМИТА ДЛЯ КАЖДОГО ИЗОБРАЖЕНИЯ
-                if user_id_for_content and photo_limit > 0:
-                    if current_photo_count >= photo_limit:
-                        app_logger.warning(
-                            f"User {user_id_for_content} has reached photo upload limit ({current_photo_count}/{photo_limit}). "
-                            f"Skipping image '{original_filename}'."
-                        )
-                        skipped_due_to_limit += 1
-                        continue  # Пропускаем это изображение, но продолжаем обработку других
-
-                try:
-                    app_logger.debug(f"Decoding Base64 for attachment '{original_filename}'.")
-                    image_bytes = base64.b64decode(content_base64)
-                    app_logger.debug(f"Decoded '{original_filename}'. Length: {len(image_bytes)} bytes.")
-
-                    current_image_url, current_exif_lat, current_exif_lng = image_utils.process_uploaded_image(
-                        image_bytes=image_bytes,
-                        original_filename=original_filename,
-                        app_logger=app_logger,
-                        bucket=bucket,
-                        allowed_extensions=allowed_image_extensions_config,
-                        max_size=max_image_size_config
-                    )
-
-                    if current_image_url:
-                        app_logger.info(
-                            f"Successfully processed image attachment '{original_filename}'. URL: {current_image_url}"
-                        )
-
-                        # Определяем координаты для этого изображения
-                        image_specific_latitude = None
-                        image_specific_longitude = None
-
-                        if current_exif_lat is not None and current_exif_lng is not None:
-                            image_specific_latitude = current_exif_lat
-                            image_specific_longitude = current_exif_lng
-                            app_logger.info(
-                                f"Using EXIF GPS data for '{original_filename}': lat={image_specific_latitude}, lng={image_specific_longitude}")
-                        else:
-                            app_logger.info(
-                                f"No EXIF GPS data for image '{original_filename}'. Attempting to parse from subject: '{subject}'")
-                            subject_lat, subject_lng = utils.parse_location_from_subject(subject)
-                            if subject_lat is not None and subject_lng is not None:
-                                image_specific_latitude = subject_lat
-                                image_specific_longitude = subject_lng
+        pending_notifications = []
+        uploaded_image_urls = []
+        # The posts of this email, the photo counter increments and the notification records are
+        # collected and committed in one batch when the block exits (see unit_of_work).
+        try:
+            with unit_of_work.begin(db_client) as writes:
+                if attachments:
+                    app_logger.info("Processing %s attachments for email from %s.", len(attachments), from_email)
+
+                    # Считаем количество изображений в attachments
+                    image_attachments = [att for att in attachments if att.get('ContentType', '').startswith('image/')]
+                    app_logger.info("Found %s image attachments to process.", len(image_attachments))
+
+                    for i, attachment in enumerate(attachments):
+                        # Reset per-image variables
+                        current_image_url = None
+                        current_exif_lat = None
+                        current_exif_lng = None
+
+                        content_type = attachment.get('ContentType', '')
+                        original_filename = attachment.get('Name', '')
+                        content_base64 = attachment.get('Content', '')
+
+                        app_logger.debug("Attachment %d: Name='%s', ContentType='%s', HasContent=%s",
+                                         i + 1, original_filename, content_type, bool(content_base64))
+
+                        if not content_type.startswith('image/'):
+                            app_logger.debug("Attachment '%s' is not an image. Skipping.", original_filename)
+                            continue
+                        if not original_filename:
+                            app_logger.debug("Attachment %d has no filename. Skipping.", i + 1)
+                            continue
+
+                        # ПРОВЕРКА ЛИМИТА ДЛЯ КАЖДОГО ИЗОБРАЖЕНИЯ
+                        if user_id_for_content and photo_limit > 0:
+                            if current_photo_count >= photo_limit:
+                                app_logger.warning(
+                                    "User %s has reached photo upload limit (%s/%s). Skipping image '%s'.",
+                                    user_id_for_content, current_photo_count, photo_limit, original_filename
+                                )
+                                skipped_due_to_limit += 1
+                                continue  # Пропускаем это изображение, но продолжаем обработку других
+
+                        try:
+                            app_logger.debug("Decoding Base64 for attachment '%s'.", original_filename)
+                            image_bytes = base64.b64decode(content_base64)
+                            app_logger.debug("Decoded '%s'. Length: %d bytes.", original_filename, len(image_bytes))
+
+                            current_image_url, current_exif_lat, current_exif_lng = image_utils.process_uploaded_image(
+                                image_bytes=image_bytes,
+                                original_filename=original_filename,
+                                app_logger=app_logger,
+                                bucket=bucket,
+                                allowed_extensions=allowed_image_extensions_config,
+                                max_size=max_image_size_config
+                            )
+
+                            if current_image_url:
+                                uploaded_image_urls.append(current_image_url)
                                 app_logger.info(
-                                    f"Used coordinates from subject for '{original_filename}': lat={image_specific_latitude}, lng={image_specific_longitude}")
+                                    "Successfully processed image attachment '%s'. URL: %s",
+                                    original_filename, current_image_url
+                                )
 
-                        if image_specific_latitude is None or image_specific_longitude is None:
-                            app_logger.warning(
-                                f"Could not determine coordinates for post from image '{original_filename}' (email: {from_email}, subject: '{subject}'). Skipping this image.")
-                            continue
+                                # Определяем координаты для этого изображения
+                                image_specific_latitude = None
+                                image_specific_longitude = None
 
-                        content_data = {
-                            'text': text_body or html_body,
-                            'imageUrl': current_image_url,
-                            'latitude': image_specific_latitude,
-                            'longitude': image_specific_longitude,
-                            'status': 'published',
-                            'voteCount': 0,
-                            'reportedCount': 0,
-                            'subject': subject
-                        }
-                        if user_id_for_content:
-                            content_data['userId'] = user_id_for_content
-
-                        content_id = firestore_utils.save_content_item(content_data, app_logger)
-
-                        if content_id:
-                            processed_content_ids.append(content_id)
-                            app_logger.info(
-                                f"Content saved for image '{original_filename}' with ID: {content_id} from email by {from_email}")
-
-                            # ИНКРЕМЕНТИРУЕМ СЧЕТЧИК СРАЗУ ПОСЛЕ УСПЕШНОГО СОХРАНЕНИЯ
-                            if user_id_for_content:
-                                try:
-                                    user_ref = db_client.collection('users').document(user_id_for_content)
-                                    user_ref.update({
-                                        'photo_upload_count_current_month': firestore_utils.firestore.Increment(1)
-                                    })
-                                    # Обновляем локальный счетчик для следующих изображений в этом же письме
-                                    current_photo_count += 1
+                                if current_exif_lat is not None and current_exif_lng is not None:
+                                    image_specific_latitude = current_exif_lat
+                                    image_specific_longitude = current_exif_lng
                                     app_logger.info(
-                                        f"Incremented photo_upload_count_current_month for user {user_id_for_content} to {current_photo_count} for image {original_filename}.")
-                                except Exception as e_increment:
-                                    app_logger.error(
-                                        f"Failed to increment photo_upload_count_current_month for user {user_id_for_content}: {e_increment}",
-                                        exc_info=True)
-
-                            # Отправляем уведомление
-                            if from_email:
-                                notification_id = email_utils.create_email_notification_record(db_client, content_id,
-                                                                                               from_email)
-                                if notification_id:
-                                    email_sent_ok = email_utils.send_pending_notification(db_client, notification_id,
-                                                                                          app_context=app_context)
-                                    if email_sent_ok:
-                                        app_logger.info(
-                                            f'Notification email process initiated for notification_id {notification_id} (content: {content_id}).')
-                                    else:
-                                        app_logger.warning(
-                                            f'Notification email process failed for notification_id {notification_id} (content: {content_id}).')
+                                        "Using EXIF GPS data for '%s': lat=%s, lng=%s",
+                                        original_filename, image_specific_latitude, image_specific_longitude)
                                 else:
+                                    app_logger.info(
+                                        "No EXIF GPS data for image '%s'. Attempting to parse from subject: '%s'",
+                                        original_filename, subject)
+                                    subject_lat, subject_lng = utils.parse_location_from_subject(subject)
+                                    if subject_lat is not None and subject_lng is not None:
+                                        image_specific_latitude = subject_lat
+                                        image_specific_longitude = subject_lng
+                                        app_logger.info(
+                                            "Used coordinates from subject for '%s': lat=%s, lng=%s",
+                                            original_filename, image_specific_latitude, image_specific_longitude)
+
+                                if image_specific_latitude is None or image_specific_longitude is None:
                                     app_logger.warning(
-                                        f"Failed to create email notification record for content {content_id}")
-                        else:
-                            app_logger.error(
-                                f"Failed to save content for image '{original_filename}' from email by {from_email}, subject: '{subject}'.")
+                                        "Could not determine coordinates for post from image '%s' "
+                                        "(email: %s, subject: '%s'). Skipping this image.",
+                                        original_filename, from_email, subject)
+                                    continue
+
+                                content_data = {
+                                    'text': text_body or html_body,
+                                    'imageUrl': current_image_url,
+                                    'latitude': image_specific_latitude,
+                                    'longitude': image_specific_longitude,
+                                    'status': 'published',
+                                    'voteCount': 0,
+                                    'reportedCount': 0,
+                                    'subject': subject
+                                }
+                                if user_id_for_content:
+                                    content_data['userId'] = user_id_for_content
+
+                                content_id = firestore_utils.save_content_item(content_data, app_logger)
+
+                                if content_id:
+                                    processed_content_ids.append(content_id)
+                                    app_logger.info(
+                                        "Content saved for image '%s' with ID: %s from email by %s",
+                                        original_filename, content_id, from_email)
+
+                                    # ИНКРЕМЕНТИРУЕМ СЧЕТЧИК СРАЗУ ПОСЛЕ УСПЕШНОГО СОХРАНЕНИЯ
+                                    if user_id_for_content:
+                                        try:
+                                            user_ref = db_client.collection('users').document(user_id_for_content)
+                                            # Increments of several images merge into one write
+                                            writes.update(user_ref, {
+                                                'photo_upload_count_current_month':
+                                                    firestore_utils.firestore.Increment(1)
+                                            })
+                                            # Обновляем локальный счетчик для следующих изображений в этом же письме
+                                            current_photo_count += 1
+                                            app_logger.info(
+                                                "Incremented photo_upload_count_current_month for user %s to %s "
+                                                "for image %s.",
+                                                user_id_for_content, current_photo_count, original_filename)
+                                        except Exception as e_increment:
+                                            app_logger.error(
+                                                "Failed to increment photo_upload_count_current_month for user %s: %s",
+                                                user_id_for_content, e_increment,
+                                                exc_info=True)
+
+                                    # Создаём запись уведомления; письмо отправляется после коммита (см. ниже)
+                                    if from_email:
+                                        notification_id = email_utils.create_email_notification_record(
+                                            db_client, content_id, from_email)
+                                        if notification_id:
+                                            pending_notifications.append((content_id, notification_id))
+                                        else:
+                                            app_logger.warning(
+                                                "Failed to create email notification record for content %s", content_id)
+                                else:
+                                    app_logger.error(
+                                        "Failed to save content for image '%s' from email by %s, subject: '%s'.",
+                                        original_filename, from_email, subject)
+                                    continue
+                            else:
+                                app_logger.warning("Failed to process image attachment '%s'.", original_filename)
+                                continue
+
+                        except base64.binascii.Error as b64_error:
+                            app_logger.error("Base64 decoding error for attachment '%s': %s",
+                                             original_filename, b64_error, exc_info=True)
                             continue
-                    else:
-                        app_logger.warning(f"Failed to process image attachment '{original_filename}'.")
-                        continue
-
-                except base64.binascii.Error as b64_error:
-                    app_logger.error(f"Base64 decoding error for attachment '{original_filename}': {b64_error}",
-                                     exc_info=True)
-                    continue
-                except Exception as e_proc:
-                    app_logger.error(f"Error processing attachment '{original_filename}': {e_proc}", exc_info=True)
-                    continue
-        else:
-            app_logger.info("No attachments found in the email.")
+                        except Exception as e_proc:
+                            app_logger.error("Error processing attachment '%s': %s",
+                                             original_filename, e_proc, exc_info=True)
+                            continue
+                else:
+                    app_logger.info("No attachments found in the email.")
+        except Exception as e_commit:
+            # Nothing of this email was written, so the images uploaded for it would be orphaned
+            app_logger.error("Failed to commit posts from email by %s: %s", from_email, e_commit, exc_info=True)
+            image_utils.delete_images_from_gcs(uploaded_image_urls, app_logger, bucket)
+            return {'status': 'error', 'message': 'Failed to save content', 'http_status_code': 500}
+
+        # Notifications are sent once their records have been committed
+        for content_id, notification_id in pending_notifications:
+            email_sent_ok = email_utils.send_pending_notification(db_client, notification_id, app_context=app_context)
+            if email_sent_ok:
+                app_logger.info(
+                    'Notification email process initiated for notification_id %s (content: %s).',
+                    notification_id, content_id)
+            else:
+                app_logger.warning(
+                    'Notification email process failed for notification_id %s (content: %s).',
+                    notification_id, content_id)
 
         # Формируем ответ с учетом пропущенных изображений
         if not processed_content_ids and not skipped_due_to_limit:
             app_logger.warning(
-                f"No suitable images found or processed from attachments for email by {from_email}, subject: '{subject}'.")
+                "No suitable images found or processed from attachments for email by %s, subject: '%s'.",
+                from_email, subject)
             return {'status': 'error', 'message': 'No valid images found in attachments', 'http_status_code': 200}
 
         # Если есть обработанный контент
@@ -278,5 +315,5 @@ def handle_postmark_webhook_request(
         }
 
     except Exception as e:
-        app_logger.error(f"Critical error in handle_postmark_webhook_request: {e}", exc_info=True)
+        app_logger.error("Critical error in handle_postmark_webhook_request: %s", e, exc_info=True)
         return {'status': 'error', 'message': f'Internal server error: {str(e)}', 'http_status_code': 500}
\ No newline at end of file